@@ -1,20 +1,48 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
 
-import RPi.GPIO as GPIO
+from gpio_backend import GPIO
 import time
+import math
 import logging
+import sys
+import ranging
+import sampler
+import filters
+import scanner
+import telemetry
+import spool
+import leds
+import flame
+import motors
+import logpipe
+import recorder
+import mapping
+import planner
+import metrics
+import spans
 import paho.mqtt.client as mqtt
-import json
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
 MQTT_BROKER = "broker.emqx.io"
 MQTT_PORT = 1883
-MQTT_CLIENT_ID = "Rover_Fisica"
-MQTT_TOPIC_DISTANCES = "distances"
-MQTT_TOPIC_FLAME = "flame"
+# Topic sotto rover/<ROVER_ID>/, cosi' piu' rover possono usare lo stesso
+# broker (ROVER_ID dall'ambiente, se manca il nome host)
+ROVER_ID = telemetry.rover_id()
+MQTT_CLIENT_ID = "Rover_" + ROVER_ID
+MQTT_TOPIC_DISTANCES = telemetry.topic(ROVER_ID, "distances")
+MQTT_TOPIC_FLAME = telemetry.topic(ROVER_ID, "flame")
+MQTT_TOPIC_METRICS = telemetry.topic(ROVER_ID, metrics.TOPIC)
+# Lotti di campioni per messaggio; telemetry.BINARY per il formato compatto
+MQTT_ENCODING = telemetry.JSON
+# Telemetria salvata su disco quando il broker non e' raggiungibile
+SPOOL_DIR = "telemetry_spool"
+# Metriche su http://localhost:METRICS_PORT/metrics (None = niente server) e
+# ogni METRICS_INTERVAL s su MQTT_TOPIC_METRICS
+METRICS_PORT = metrics.PORT
+METRICS_INTERVAL = metrics.INTERVAL
 
 # Motor pins
 ENA = 13
@@ -31,6 +59,9 @@ IR_R = 18
 TRIG = 17
 ECHO = 4
 
+# Servo pins (SER8 di wifirobots.py: il pin 6 di SER7 qui e' il sensore di fiamma)
+SER_SCAN = 12
+
 # LED pins
 LED0 = 10
 LED1 = 9
@@ -43,66 +74,137 @@ SOGLIA_CAMBIAMENTO = 0.05
 MAX_SPEED = 100
 MEDIUM_SPEED = 50
 
-pwm_ENA = None
-pwm_ENB = None
-
-logging.basicConfig(
-    filename='rover_patrol.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Scansione: True = servo del sensore, False = rotazione del rover
+SERVO_SCAN = True
+FRONT_SECTOR = 20  # gradi attorno al centro considerati "davanti"
+
+# Mappa della pattuglia, salvata all'arresto (.npz e immagine .pgm)
+MAP_FILE = "mappa_pattuglia"
+# True = verso le zone inesplorate della mappa (planner.py), False = solo la
+# distanza massima tra sinistra, centro e destra. La posa viene solo dai
+# comandi ai motori: con le ruote che slittano l'errore cresce con le curve
+# e i metri percorsi, e oltre PLANNER_MAX_DISTANCE la mappa non e' piu'
+# allineata al mondo (si torna al massimo); vedi bench_planner.py
+PLANNER = False
+PLANNER_MAX_DISTANCE = 10.0  # m stimati percorsi
+TURN_TIMEOUT = 3.0  # s massimi per una curva verso il percorso
+
+# Tracciamento delle fasi (spans.py), da aprire in ui.perfetto.dev: None =
+# spento, le funzioni restano quelle e non costa nulla; con un file le fasi
+# sotto vengono avvolte all'avvio e la traccia si scrive all'arresto
+SPANS_FILE = None
+SPAN_STAGES = ("get_distance", "collision_avoidance", "check_distance_change", "servo_scan", "map_front",
+               "where_to_go", "turn_by", "piroettonj", "motor_forward", "motor_backward", "motor_turn_left",
+               "motor_turn_right", "motor_stop", "publish_distances", "check_flame", "led_sirena")
+
+motor_driver = None
+motion = None
+ranger = None
+distance_sampler = None
+front_filter = filters.Pipeline()
+last_sample_ns = 0
+sweep_scanner = None
+led_engine = None
+flame_detector = None
+
+# Log e terminale passano da una coda scritta in background (logpipe): nel
+# loop di controllo costano un inserimento. La scatola nera tiene gli ultimi
+# secondi di distanze, motori e fiamma e si salva all'allarme o a un crash.
+log_pipeline = None
+flight = recorder.FlightRecorder()
+
+# Ogni lettura dell'ultrasuono finisce anche nella mappa di occupazione,
+# con la posa stimata dai comandi ai motori
+dead_reckoning = mapping.DeadReckoning()
+occupancy = mapping.OccupancyGrid()
+path_planner = planner.Planner(occupancy)
 
 # pip3 install paho-mqtt
 mqtt_client = None
+telemetry_publisher = None
+
+# Metriche (metrics.py): nei punti caldi solo contatori e istogrammi; i
+# contatori che ranger, telemetria e log tengono gia' si leggono quando le
+# metriche vengono chieste
+metrics_server = None
+metrics_publisher = None
+tracer = None
+distance_calls = metrics.REGISTRY.counter("rover_get_distance_total", "Chiamate a get_distance")
+distance_timeouts = metrics.REGISTRY.counter(
+    "rover_get_distance_timeouts_total", "get_distance senza distanza valida (TIMEOUT)")
+decision_seconds = metrics.REGISTRY.histogram(
+    "rover_decision_seconds", "Calcolo della direzione in where_to_go (mappa e percorso), s")
+where_to_go_seconds = metrics.REGISTRY.histogram(
+    "rover_where_to_go_seconds", "Durata di un giro di where_to_go, curve e avanzamento compresi, s",
+    buckets=(0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 7.5, 10.0))
+metrics.REGISTRY.counter("rover_log_dropped_total", "Messaggi di log persi a coda piena",
+                         fn=lambda: log_pipeline.dropped if log_pipeline else 0)
+
+# Avvolge le fasi prima di setup_gpio (check_flame va al rilevatore di
+# fiamma), e anche l'inserimento dei log nella coda se c'e' logpipe
+def enable_spans(path):
+    global SPANS_FILE, tracer
+    SPANS_FILE = path
+    tracer = spans.Tracer().instrument(sys.modules[__name__], SPAN_STAGES)
+    if log_pipeline:
+        tracer.instrument(log_pipeline.handler, ("emit",), prefix="log.")
 
 def setup_mqtt():
     print("Inizializzazione MQTT...")
-    global mqtt_client
+    global mqtt_client, telemetry_publisher, metrics_publisher
     mqtt_client = mqtt.Client(MQTT_CLIENT_ID)
+    telemetry_publisher = telemetry.TelemetryPublisher(
+        mqtt_client,
+        encoding=MQTT_ENCODING,
+        topics={telemetry.KIND_DISTANCES: MQTT_TOPIC_DISTANCES, telemetry.KIND_FLAME: MQTT_TOPIC_FLAME},
+        spool=spool.Spool(SPOOL_DIR)
+    )
+    telemetry_publisher.start()
+    for key, description in telemetry.STATS.items():
+        metrics.REGISTRY.counter("rover_telemetry_{}_total".format(key), "Telemetria: " + description,
+                                 fn=lambda key=key: telemetry_publisher.stats[key])
+    metrics.REGISTRY.gauge("rover_mqtt_connected", "1 se il client MQTT e' connesso al broker",
+                           fn=lambda: int(mqtt_client.is_connected()))
+    metrics_publisher = metrics.MetricsPublisher(metrics.REGISTRY, mqtt_client, MQTT_TOPIC_METRICS,
+                                                 METRICS_INTERVAL).start()
     
+    # connect_async: se il broker non risponde subito il loop di paho
+    # continua a riprovare, e riconnette da solo se il collegamento cade
     try:
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
         mqtt_client.loop_start()
         logging.info("Avvio connessione MQTT a {}:{}".format(MQTT_BROKER, MQTT_PORT))
     except Exception as e:
         logging.error("Errore connessione MQTT: {}".format(e))
 
+# Accodano i campioni al publisher e tornano subito: la codifica e l'invio
+# avvengono nel thread della telemetria
 def publish_distances(d_l, d_c, d_r):
-    print("Invio distanze: Sinistra={:.2f}m Centro={:.2f}m Destra={:.2f}m".format(d_l, d_c, d_r))
-    if mqtt_client and mqtt_client.is_connected():
-        payload = {
-            "timestamp": time.time(),
-            "left": round(d_l, 3),
-            "center": round(d_c, 3),
-            "right": round(d_r, 3)
-        }
-        mqtt_client.publish(MQTT_TOPIC_DISTANCES, json.dumps(payload))
-
-def publish_flame_detected():
-    print("Invio allarme fiamma")
-    if mqtt_client and mqtt_client.is_connected():
-        payload = {
-            "timestamp": time.time(),
-            "flame_detected": True,
-            "status": "ALERT"
-        }
-        mqtt_client.publish(MQTT_TOPIC_FLAME, json.dumps(payload))
+    logpipe.console.info("Invio distanze: Sinistra=%sm Centro=%sm Destra=%sm",
+                         *[round(d, 3) if d is not None else None for d in (d_l, d_c, d_r)])
+    if telemetry_publisher:
+        telemetry_publisher.publish_distances(d_l, d_c, d_r)
+
+FLAME_STATUS = {
+    flame.STARTED: telemetry.FLAME_ALERT,
+    flame.ONGOING: telemetry.FLAME_ONGOING,
+    flame.CLEARED: telemetry.FLAME_CLEAR,
+}
+
+def publish_flame_detected(event):
+    logpipe.console.info("Invio evento fiamma: %s", event.kind)
+    if telemetry_publisher:
+        telemetry_publisher.publish_flame(FLAME_STATUS[event.kind], count=event.count, duration=event.duration)
 
 def setup_gpio():
-    global pwm_ENA, pwm_ENB
+    global motor_driver, motion, ranger, distance_sampler, sweep_scanner, led_engine, flame_detector
     print("Configurazione GPIO...")
     # Motor setup
-    GPIO.setup(ENA, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(ENB, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN1, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN2, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN3, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN4, GPIO.OUT, initial=GPIO.LOW)
-
-    pwm_ENA = GPIO.PWM(ENA, 1000)
-    pwm_ENB = GPIO.PWM(ENB, 1000)
-    pwm_ENA.start(0)
-    pwm_ENB.start(0)
+    motor_driver = motors.MotorDriver(GPIO, ENA, IN1, IN2, ENB, IN3, IN4)
+    motor_driver.setup()
+    motor_driver.on_drive(lambda left, right: flight.record(recorder.MOTOR, a=left, b=right))
+    motor_driver.on_drive(dead_reckoning.command)
+    motion = motors.MotionProfile(motor_driver).start()
 
     # Sensor setup
     GPIO.setup(FLAME, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -110,119 +212,162 @@ def setup_gpio():
     GPIO.setup(IR_R, GPIO.IN, pull_up_down=GPIO.PUD_UP)
     GPIO.setup(TRIG, GPIO.OUT, initial=GPIO.LOW)
     GPIO.setup(ECHO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    ranger = ranging.UltrasonicRanger(GPIO, TRIG, ECHO)
+    ranger.start()
+    metrics.REGISTRY.counter("rover_ranging_readings_total", "Ping con eco valido", fn=lambda: ranger.readings)
+    metrics.REGISTRY.counter("rover_ranging_timeouts_total", "Ping senza eco o con eco troppo lungo",
+                             fn=lambda: ranger.timeouts)
+    distance_sampler = sampler.DistanceSampler(ranger)
+    distance_sampler.start()
+    if SERVO_SCAN:
+        sweep_scanner = scanner.SweepScanner(GPIO, SER_SCAN, distance_sampler)
 
     # LED setup
     GPIO.setup(LED0, GPIO.OUT, initial=GPIO.HIGH)
     GPIO.setup(LED1, GPIO.OUT, initial=GPIO.HIGH)
     GPIO.setup(LED2, GPIO.OUT, initial=GPIO.HIGH)
+    led_engine = leds.LedEngine(GPIO, (LED0, LED1, LED2))
+    led_engine.start()
+
+    # La fiamma arriva dal callback dei fronti, anche durante scansioni e curve
+    flame_detector = flame.FlameDetector(GPIO, FLAME, on_event=check_flame)
+    flame_detector.start()
 
+# Partenze e cambi di verso a rampa (motors.MotionProfile), per non far
+# slittare le ruote e non far calare l'alimentazione del Pi; tornano subito.
+# Il driver scrive solo i pin che cambiano.
 def motor_forward(speed=MAX_SPEED):
-    pwm_ENA.ChangeDutyCycle(speed)
-    pwm_ENB.ChangeDutyCycle(speed)
-    GPIO.output(IN1, True)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, True)
-    GPIO.output(IN4, False)
+    motion.forward(speed)
 
 def motor_backward(speed=MAX_SPEED):
-    pwm_ENA.ChangeDutyCycle(speed)
-    pwm_ENB.ChangeDutyCycle(speed)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, True)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, True)
+    motion.backward(speed)
 
 def motor_turn_left():
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, True)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, True)
+    motion.turn_left(MAX_SPEED)
 
 def motor_turn_right():
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, True)
-    GPIO.output(IN3, True)
-    GPIO.output(IN4, False)
+    motion.turn_right(MAX_SPEED)
 
+# Fermata immediata, anche a rampa in corso: e' la reazione agli ostacoli
 def motor_stop():
-    pwm_ENA.ChangeDutyCycle(0)
-    pwm_ENB.ChangeDutyCycle(0)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, False)
+    motion.emergency_stop()
 
 def piroettonj():
-    print("Cambio direzione per ostacolo")
+    logpipe.console.info("Cambio direzione per ostacolo")
     motor_turn_left()
     time.sleep(2)
     motor_stop()
 
-def led_sirena():
-    print("Sirena LED attiva")
-    GPIO.output(LED0, GPIO.HIGH)
-    GPIO.output(LED2, GPIO.LOW)
-    time.sleep(0.5)
-    GPIO.output(LED2, GPIO.HIGH)
-    GPIO.output(LED0, GPIO.LOW)
-    time.sleep(0.5)
+# La sirena la suona il thread dei LED: si torna subito al controllo.
+# Chiamate ripetute mentre suona la prolungano senza farla ripartire.
+def led_sirena(repeat=1):
+    logpipe.console.info("Sirena LED attiva")
+    led_engine.play("siren", repeat)
 
 def collision_avoidance():
     distance = get_distance()
-    
-    if distance > SAFE_DISTANCE:
+
+    # Senza una stima valida si procede con cautela, non a tutta velocita'
+    if distance is None:
+        return MEDIUM_SPEED, False
+    elif distance > SAFE_DISTANCE:
         return MAX_SPEED, False
     elif distance > DANGER_DISTANCE:
         return MEDIUM_SPEED, False
     else:
         return 0, True
 
-def check_flame():
-    if (GPIO.input(FLAME) == GPIO.LOW):
-        print(">>> FIAMMA RILEVATA <<<")
-        led_sirena()
+# Eventi della fiamma (thread di flame.FlameDetector): un solo allarme
+# all'inizio, aggiornamenti periodici mentre dura e la fine
+def check_flame(event):
+    flight.record(recorder.FLAME, recorder.FLAME_CODES[event.kind], a=event.duration or 0.0, b=event.count)
+    if event.kind == flame.STARTED:
+        logpipe.console.info(">>> FIAMMA RILEVATA <<<")
+        led_sirena(None)
         logging.info("ALLERTA: Rilevata fiamma.")
-        publish_flame_detected()
+        flight.dump("fiamma", background=True)
+    elif event.kind == flame.CLEARED:
+        logpipe.console.info("Fiamma spenta dopo %.1fs", event.duration)
+        led_engine.stop_alert()
+        logging.info("Fiamma spenta: durata %.1fs, %d accensioni", event.duration, event.count)
+    publish_flame_detected(event)
 
 def check_distance_change():
     distance1 = get_distance()
     time.sleep(0.1)
     distance2 = get_distance()
 
+    if distance1 is None or distance2 is None:
+        return False
     return (distance2 - distance1) < SOGLIA_CAMBIAMENTO
 
+# Porta il filtro al passo con i campioni arrivati dall'ultima chiamata.
+# Restituisce la distanza filtrata, None se non c'e' una stima valida
+# (timeout ripetuti o sensore fermo), invece del vecchio valore 999.
 def get_distance():
-    GPIO.output(TRIG, GPIO.HIGH)
-    time.sleep(0.000015)
-    GPIO.output(TRIG, GPIO.LOW)
-    
-    timeout = time.time() + 0.5
-    while not GPIO.input(ECHO):
-        if time.time() > timeout:
-            print("TIMEOUT: Echo non ricevuto")
-            return 999
-    t1 = time.time()
-    
-    timeout = time.time() + 0.5
-    while GPIO.input(ECHO):
-        if time.time() > timeout:
-            print("TIMEOUT: Echo troppo lungo")
-            return 999
-    t2 = time.time()
-    
-    distance = (t2 - t1) * 340 / 2
-    print("Distanza rilevata: {:.2f}m".format(distance))
-    return distance
+    global last_sample_ns
+    distance_calls.inc()
+    for reading in distance_sampler.since(last_sample_ns):
+        front_filter.update_reading(reading)
+        last_sample_ns = reading.t_ns
+        flight.record(recorder.DISTANCE, a=reading.distance if reading.distance is not None else math.nan)
+
+    estimate = front_filter.estimate
+    if not estimate.valid or time.monotonic_ns() - estimate.t_ns > front_filter.max_age_ns:
+        logpipe.console.info("TIMEOUT: nessuna distanza valida")
+        distance_timeouts.inc()
+        return None
+
+    logpipe.console.info("Distanza rilevata: %.2fm", estimate.distance)
+    return estimate.distance
+
+# Lettura frontale (servo al centro) aggiunta alla mappa
+def map_front(distance):
+    occupancy.integrate([mapping.reading(dead_reckoning.pose(), scanner.SERVO_CENTER, distance)])
+
+# Gira sul posto di angle radianti (positivo = sinistra), fermandosi quando
+# la rotta stimata dalla posa ci arriva
+def turn_by(angle):
+    target = dead_reckoning.pose()[2] + angle
+    if angle > 0:
+        motor_turn_left()
+    else:
+        motor_turn_right()
+    deadline = time.time() + TURN_TIMEOUT
+    while time.time() < deadline:
+        remaining = math.atan2(math.sin(target - dead_reckoning.pose()[2]), math.cos(target - dead_reckoning.pose()[2]))
+        if remaining * angle <= 0:
+            break
+        time.sleep(0.02)
 
 def where_to_go(d_l, d_c, d_r):
+    # Una direzione senza stima valida usa lo spazio che la mappa da' per
+    # libero da quella parte (0 se non si sa nulla): non viene preferita
+    # alla cieca
+    start = time.perf_counter()
+    pose = dead_reckoning.pose()
+    d_l, d_c, d_r = [d if d is not None else occupancy.clearance(pose, angle)
+                     for d, angle in zip((d_l, d_c, d_r), MAP_ANGLES)]
     max_distance = max(d_l, d_c, d_r)
-    logging.info("Valutazione - L:{:.2f}m C:{:.2f}m R:{:.2f}m".format(d_l, d_c, d_r))
-
-    if (max_distance == d_c):
+    logging.info("Valutazione - L:%.2fm C:%.2fm R:%.2fm", d_l, d_c, d_r)
+
+    # Il percorso verso la frontiera si segue se il sonar da quella parte
+    # non vede un ostacolo vicino; senza percorso (ancora da calcolare,
+    # esplorazione finita o posa troppo incerta) si va dove c'e' piu' spazio
+    steer = PLANNER and dead_reckoning.distance <= PLANNER_MAX_DISTANCE
+    turn = path_planner.plan(pose) if steer else None
+    front = math.radians(FRONT_SECTOR)
+    if turn is not None and (d_c if abs(turn) <= front else d_l if turn > 0 else d_r) <= DANGER_DISTANCE:
+        turn = None
+    decision_seconds.observe(time.perf_counter() - start)
+    if turn is not None:
+        logging.info("Percorso verso la frontiera: svolta di %.0f gradi", math.degrees(turn))
+        if abs(turn) <= front:
+            logging.info("Direzione presa: AVANTI")
+        else:
+            logging.info("Direzione presa: %s", "SINISTRA" if turn > 0 else "DESTRA")
+            turn_by(turn)
+    elif (max_distance == d_c):
         logging.info("Direzione presa: AVANTI")
     elif (max_distance == d_r):
         logging.info("Direzione presa: DESTRA")
@@ -261,24 +406,98 @@ def where_to_go(d_l, d_c, d_r):
             motor_forward(new_speed)
             current_speed = new_speed
 
-        check_flame()
         time.sleep(0.1)
+    where_to_go_seconds.observe(time.perf_counter() - start)
+
+# Scansione col servo mentre il rover continua a muoversi: si ferma subito
+# se un ostacolo davanti e' entro la distanza di pericolo.
+# Riduce la scansione polare ai tre settori sinistra/centro/destra.
+def servo_scan():
+    global last_sample_ns
+    readings = []
+
+    def on_reading(angle, distance):
+        readings.append(mapping.reading(dead_reckoning.pose(), angle, distance))
+        if distance is not None and distance < DANGER_DISTANCE and abs(angle - scanner.SERVO_CENTER) <= FRONT_SECTOR:
+            motor_stop()
+
+    scan = sweep_scanner.scan(on_reading)
+    logpipe.console.info("Scansione servo in %.2fs: %s", scan.duration, scan.distances)
+    occupancy.integrate(readings)
+
+    # I campioni presi durante la scansione non sono frontali
+    front_filter.reset()
+    last_sample_ns = scan.t_ns
+
+    return scanner.sectors(scan, FRONT_SECTOR)
+
+# Angoli del servo al centro dei settori sinistra/centro/destra, per
+# interrogare la mappa
+MAP_ANGLES = ((180 + scanner.SERVO_CENTER + FRONT_SECTOR) // 2, scanner.SERVO_CENTER,
+              (scanner.SERVO_CENTER - FRONT_SECTOR) // 2)
+
+def shutdown():
+    if metrics_server:
+        metrics_server.stop()
+    if metrics_publisher:
+        metrics_publisher.stop()
+    if sweep_scanner:
+        sweep_scanner.stop()
+    if distance_sampler:
+        distance_sampler.stop()
+    if flame_detector:
+        flame_detector.stop()
+    if led_engine:
+        led_engine.stop()
+    if motion:
+        motor_stop()
+        motion.close()
+    if motor_driver:
+        motor_driver.close()
+    if telemetry_publisher:
+        telemetry_publisher.stop()
+    if mqtt_client:
+        mqtt_client.loop_stop()
+        mqtt_client.disconnect()
+    GPIO.output(LED0, GPIO.HIGH)
+    GPIO.output(LED1, GPIO.HIGH)
+    GPIO.output(LED2, GPIO.HIGH)
+    GPIO.cleanup()
+    if occupancy.readings:
+        occupancy.save(MAP_FILE + ".npz", dead_reckoning.trail)
+        occupancy.to_pgm(MAP_FILE + ".pgm", dead_reckoning.trail)
+        logging.info("Mappa salvata: %d letture, %.1fm percorsi", occupancy.readings, dead_reckoning.distance)
+    if tracer:
+        tracer.export(SPANS_FILE)
+        logging.info("Traccia delle fasi salvata: %s (%d intervalli)", SPANS_FILE, len(tracer))
+    logging.info("Rover arrestato")
+    if log_pipeline:
+        log_pipeline.stop()
 
 def loop_rover():
     print("Avvio pattugliamento...")
     while True:
-        print("\n--- Scansione SINISTRA ---")
+        if SERVO_SCAN:
+            distance_left, distance_center, distance_right = servo_scan()
+            publish_distances(distance_left, distance_center, distance_right)
+            where_to_go(distance_left, distance_center, distance_right)
+            continue
+
+        logpipe.console.info("\n--- Scansione SINISTRA ---")
         motor_turn_left()
         time.sleep(1)
         distance_left = get_distance()
-        print("--- Scansione CENTRO ---")
+        map_front(distance_left)
+        logpipe.console.info("--- Scansione CENTRO ---")
         motor_turn_right()
         time.sleep(1)
         distance_center = get_distance()
-        print("--- Scansione DESTRA ---")
+        map_front(distance_center)
+        logpipe.console.info("--- Scansione DESTRA ---")
         motor_turn_right()
         time.sleep(1)
         distance_right = get_distance()
+        map_front(distance_right)
         motor_turn_left()
         time.sleep(1)
         
@@ -289,7 +508,13 @@ def loop_rover():
 
 if __name__ == '__main__':
     print("=== AVVIO ROVER ===")
+    log_pipeline = logpipe.setup('rover_patrol.log')
+    flight.install_crash_hooks()
+    if SPANS_FILE:
+        enable_spans(SPANS_FILE)
     try:
+        if METRICS_PORT is not None:
+            metrics_server = metrics.MetricsServer(metrics.REGISTRY, port=METRICS_PORT).start()
         setup_gpio()
         setup_mqtt()
         time.sleep(2)
@@ -298,16 +523,4 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         print("\n=== ARRESTO ROVER ===")
     finally:
-        motor_stop()
-        if pwm_ENA:
-            pwm_ENA.stop()
-        if pwm_ENB:
-            pwm_ENB.stop()
-        if mqtt_client:
-            mqtt_client.loop_stop()
-            mqtt_client.disconnect()
-        GPIO.output(LED0, GPIO.HIGH)
-        GPIO.output(LED1, GPIO.HIGH)
-        GPIO.output(LED2, GPIO.HIGH)
-        GPIO.cleanup()
-        logging.info("Rover arrestato")
\ No newline at end of file
+        shutdown()
\ No newline at end of file
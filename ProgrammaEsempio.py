@@ -24,9 +24,11 @@
 
 # Gestione errori: KeyboardInterrupt per stop sicuro
 
-import RPi.GPIO as GPIO
+from gpio_backend import GPIO
 import time
 import random
+import leds
+import motors
 
 # Pin Configuration
 GPIO.setmode(GPIO.BCM)
@@ -53,12 +55,9 @@ LED1 = 9     # Status LED 1
 LED2 = 25    # Status LED 2
 
 ######## Motor Setup #################
-GPIO.setup(ENA, GPIO.OUT, initial=GPIO.LOW)
-GPIO.setup(ENB, GPIO.OUT, initial=GPIO.LOW)
-GPIO.setup(IN1, GPIO.OUT, initial=GPIO.LOW)
-GPIO.setup(IN2, GPIO.OUT, initial=GPIO.LOW)
-GPIO.setup(IN3, GPIO.OUT, initial=GPIO.LOW)
-GPIO.setup(IN4, GPIO.OUT, initial=GPIO.LOW)
+# Enable digitali (senza PWM); il driver scrive solo i pin che cambiano
+motor_driver = motors.MotorDriver(GPIO, ENA, IN1, IN2, ENB, IN3, IN4, frequency=None)
+motor_driver.setup()
 
 ######## Sensor Setup #################
 GPIO.setup(IR_M, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -71,60 +70,37 @@ GPIO.setup(ECHO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 GPIO.setup(LED0, GPIO.OUT, initial=GPIO.HIGH)
 GPIO.setup(LED1, GPIO.OUT, initial=GPIO.HIGH)
 GPIO.setup(LED2, GPIO.OUT, initial=GPIO.HIGH)
+led_engine = leds.LedEngine(GPIO, (LED0, LED1, LED2))
 
 # Constants
 SAFE_DISTANCE = 0.30  # 30cm safe distance
 DANGER_DISTANCE = 0.15  # 15cm danger zone
 
+# Smart_Patrol le chiama ad ogni giro: si stampa solo quando il moto cambia
 def Motor_Forward():
     """Move robot forward"""
-    print('Moving Forward')
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, True)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, True)
-    GPIO.output(IN4, False)
+    if motor_driver.forward():
+        print('Moving Forward')
 
 def Motor_Backward():
     """Move robot backward"""
-    print('Moving Backward')
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, True)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, True)
+    if motor_driver.backward():
+        print('Moving Backward')
 
 def Motor_TurnLeft():
     """Turn robot left"""
-    print('Turning Left')
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, True)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, True)
+    if motor_driver.turn_left():
+        print('Turning Left')
 
 def Motor_TurnRight():
     """Turn robot right"""
-    print('Turning Right')
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, True)
-    GPIO.output(IN3, True)
-    GPIO.output(IN4, False)
+    if motor_driver.turn_right():
+        print('Turning Right')
 
 def Motor_Stop():
     """Stop all motors"""
-    print('Stopping')
-    GPIO.output(ENA, False)
-    GPIO.output(ENB, False)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, False)
+    if motor_driver.stop():
+        print('Stopping')
 
 def Get_Distance():
     """Measure distance using ultrasonic sensor"""
@@ -149,23 +125,9 @@ def LED_Status(status):
     1 = Warning (LED1 ON)
     2 = Danger (LED1 + LED2 ON)
     3 = Obstacle detected (All ON)
+    Called every loop: the LED thread writes the pins only on changes
     """
-    if status == 0:  # All clear
-        GPIO.output(LED0, GPIO.HIGH)
-        GPIO.output(LED1, GPIO.HIGH)
-        GPIO.output(LED2, GPIO.HIGH)
-    elif status == 1:  # Warning
-        GPIO.output(LED0, GPIO.LOW)
-        GPIO.output(LED1, GPIO.LOW)
-        GPIO.output(LED2, GPIO.HIGH)
-    elif status == 2:  # Danger
-        GPIO.output(LED0, GPIO.LOW)
-        GPIO.output(LED1, GPIO.LOW)
-        GPIO.output(LED2, GPIO.LOW)
-    elif status == 3:  # Obstacle IR detected
-        GPIO.output(LED0, GPIO.HIGH)
-        GPIO.output(LED1, GPIO.LOW)
-        GPIO.output(LED2, GPIO.HIGH)
+    led_engine.set_status(status)
 
 def Smart_Patrol():
     """
@@ -270,6 +232,7 @@ if __name__ == '__main__':
     try:
         # Turn on headlight
         GPIO.output(LED0, GPIO.LOW)
+        led_engine.start()
         print('Initializing Smart Patrol System...')
         time.sleep(2)
         
@@ -278,6 +241,7 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         print('\n\nProgram stopped by user')
         Motor_Stop()
+        led_engine.stop()
         GPIO.output(LED0, GPIO.HIGH)
         GPIO.output(LED1, GPIO.HIGH)
         GPIO.output(LED2, GPIO.HIGH)
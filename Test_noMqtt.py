@@ -1,9 +1,18 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
 
-import RPi.GPIO as GPIO
+from gpio_backend import GPIO
 import time
+import math
 import logging
+import ranging
+import sampler
+import filters
+import leds
+import flame
+import motors
+import logpipe
+import recorder
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
@@ -37,32 +46,30 @@ SOGLIA_CAMBIAMENTO = 0.05
 MAX_SPEED = 100
 MEDIUM_SPEED = 50
 
-pwm_ENA = None
-pwm_ENB = None
+motor_driver = None
+motion = None
+ranger = None
+distance_sampler = None
+front_filter = filters.Pipeline()
+last_sample_ns = 0
+led_engine = None
+flame_detector = None
 
 # Check flame
 flame_detected = False
 
-logging.basicConfig(
-    filename='rover_patrol.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Log e terminale dalla coda di logpipe; scatola nera salvata all'allarme
+# fiamma o a un crash
+log_pipeline = None
+flight = recorder.FlightRecorder()
 
 def setup_gpio():
-    global pwm_ENA, pwm_ENB
+    global motor_driver, motion, ranger, distance_sampler, led_engine, flame_detector
     # Motor setup
-    GPIO.setup(ENA, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(ENB, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN1, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN2, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN3, GPIO.OUT, initial=GPIO.LOW)
-    GPIO.setup(IN4, GPIO.OUT, initial=GPIO.LOW)
-
-    pwm_ENA = GPIO.PWM(ENA, 1000)
-    pwm_ENB = GPIO.PWM(ENB, 1000)
-    pwm_ENA.start(0)
-    pwm_ENB.start(0)
+    motor_driver = motors.MotorDriver(GPIO, ENA, IN1, IN2, ENB, IN3, IN4)
+    motor_driver.setup()
+    motor_driver.on_drive(lambda left, right: flight.record(recorder.MOTOR, a=left, b=right))
+    motion = motors.MotionProfile(motor_driver).start()
 
     # Sensor setup
     GPIO.setup(FLAME, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -70,54 +77,42 @@ def setup_gpio():
     GPIO.setup(IR_R, GPIO.IN, pull_up_down=GPIO.PUD_UP)
     GPIO.setup(TRIG, GPIO.OUT, initial=GPIO.LOW)
     GPIO.setup(ECHO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    ranger = ranging.UltrasonicRanger(GPIO, TRIG, ECHO)
+    ranger.start()
+    distance_sampler = sampler.DistanceSampler(ranger)
+    distance_sampler.start()
 
     # LED setup
     GPIO.setup(LED0, GPIO.OUT, initial=GPIO.HIGH)
     GPIO.setup(LED1, GPIO.OUT, initial=GPIO.HIGH)
     GPIO.setup(LED2, GPIO.OUT, initial=GPIO.HIGH)
+    led_engine = leds.LedEngine(GPIO, (LED0, LED1, LED2))
+    led_engine.start()
 
+    flame_detector = flame.FlameDetector(GPIO, FLAME, on_event=on_flame)
+    flame_detector.start()
+
+# Partenze e cambi di verso a rampa (motors.MotionProfile), per non far
+# slittare le ruote e non far calare l'alimentazione del Pi; tornano subito.
+# Il driver scrive solo i pin che cambiano.
 def motor_forward(speed=MAX_SPEED):
-    pwm_ENA.ChangeDutyCycle(speed)
-    pwm_ENB.ChangeDutyCycle(speed)
-    GPIO.output(IN1, True)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, True)
-    GPIO.output(IN4, False)
+    motion.forward(speed)
 
 def motor_backward(speed=MAX_SPEED):
-    pwm_ENA.ChangeDutyCycle(speed)
-    pwm_ENB.ChangeDutyCycle(speed)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, True)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, True)
+    motion.backward(speed)
 
 def motor_turn_left():
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, True)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, True)
+    motion.turn_left(MAX_SPEED)
 
 def motor_turn_right():
-    GPIO.output(ENA, True)
-    GPIO.output(ENB, True)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, True)
-    GPIO.output(IN3, True)
-    GPIO.output(IN4, False)
+    motion.turn_right(MAX_SPEED)
 
+# Fermata immediata, anche a rampa in corso: e' la reazione agli ostacoli
 def motor_stop():
-    pwm_ENA.ChangeDutyCycle(0)
-    pwm_ENB.ChangeDutyCycle(0)
-    GPIO.output(IN1, False)
-    GPIO.output(IN2, False)
-    GPIO.output(IN3, False)
-    GPIO.output(IN4, False)
+    motion.emergency_stop()
 
 def piroettonj():
-    print("Cambio direzione per ostacolo")
+    logpipe.console.info("Cambio direzione per ostacolo")
     motor_turn_left()
     time.sleep(2)
     motor_stop()
@@ -125,14 +120,11 @@ def piroettonj():
 def ir_sensor_check(ir_input):
     return GPIO.input(ir_input) == False
 
-def led_sirena():
-    print("Sirena LED attiva")
-    GPIO.output(LED0, GPIO.HIGH)
-    GPIO.output(LED2, GPIO.LOW)
-    time.sleep(0.5)
-    GPIO.output(LED2, GPIO.HIGH)
-    GPIO.output(LED0, GPIO.LOW)
-    time.sleep(0.5)
+# La sirena la suona il thread dei LED: si torna subito al controllo.
+# Chiamate ripetute mentre suona la prolungano senza farla ripartire.
+def led_sirena(repeat=1):
+    logpipe.console.info("Sirena LED attiva")
+    led_engine.play("siren", repeat)
 
 # Evita le collisioni.
 # Dopo un check preventivo dei sensori infrarossi laterali, calcola la distanza di fronte e seleziona una velocità di crociera.
@@ -145,72 +137,81 @@ def collision_avoidance():
         time.sleep(0.5)
 
     distance = get_distance()
-    
-    if distance > SAFE_DISTANCE:
+
+    # Senza una stima valida si procede con cautela, non a tutta velocita'
+    if distance is None:
+        return MEDIUM_SPEED, False
+    elif distance > SAFE_DISTANCE:
         return MAX_SPEED, False
     elif distance > DANGER_DISTANCE:
         return MEDIUM_SPEED, False
     else:
         return 0, True
 
-def check_flame():
+# Eventi della fiamma dal thread di flame.FlameDetector: alla prima
+# rilevazione si ferma il rover, poi la sirena suona in background
+def on_flame(event):
     global flame_detected
-    if (GPIO.input(FLAME) == GPIO.LOW):
-        print(">>> FIAMMA RILEVATA <<<")
+    flight.record(recorder.FLAME, recorder.FLAME_CODES[event.kind], a=event.duration or 0.0, b=event.count)
+    if event.kind == flame.STARTED:
+        logpipe.console.info(">>> FIAMMA RILEVATA <<<")
         flame_detected = True
+        motor_stop()
         logging.info("ALLERTA: Rilevata fiamma.")
-        for _ in range(10):
-            led_sirena()
-        return True
-    return False
+        led_sirena(10)
+        flight.dump("fiamma", background=True)
+    elif event.kind == flame.CLEARED:
+        logging.info("Fiamma spenta: durata %.1fs, %d accensioni", event.duration, event.count)
+
+def check_flame():
+    return flame_detected
 
 def check_distance_change():
     distance1 = get_distance()
     time.sleep(0.1)
     distance2 = get_distance()
 
+    if distance1 is None or distance2 is None:
+        return False
     return (distance2 - distance1) < SOGLIA_CAMBIAMENTO
 
+# Porta il filtro al passo con i campioni arrivati dall'ultima chiamata.
+# Restituisce la distanza filtrata, None se non c'e' una stima valida
+# (timeout ripetuti o sensore fermo), invece del vecchio valore 999.
 def get_distance():
-    GPIO.output(TRIG, GPIO.HIGH)
-    time.sleep(0.000015)
-    GPIO.output(TRIG, GPIO.LOW)
-    
-    timeout = time.time() + 0.5
-    while not GPIO.input(ECHO):
-        if time.time() > timeout:
-            print("TIMEOUT: Echo non ricevuto")
-            return 999
-    t1 = time.time()
-    
-    timeout = time.time() + 0.5
-    while GPIO.input(ECHO):
-        if time.time() > timeout:
-            print("TIMEOUT: Echo troppo lungo")
-            return 999
-    t2 = time.time()
-    
-    distance = (t2 - t1) * 340 / 2
-    print("Distanza rilevata: {:.2f}m".format(distance))
-    return distance
+    global last_sample_ns
+    for reading in distance_sampler.since(last_sample_ns):
+        front_filter.update_reading(reading)
+        last_sample_ns = reading.t_ns
+        flight.record(recorder.DISTANCE, a=reading.distance if reading.distance is not None else math.nan)
+
+    estimate = front_filter.estimate
+    if not estimate.valid or time.monotonic_ns() - estimate.t_ns > front_filter.max_age_ns:
+        logpipe.console.info("TIMEOUT: nessuna distanza valida")
+        return None
+
+    logpipe.console.info("Distanza rilevata: %.2fm", estimate.distance)
+    return estimate.distance
 
 # Funzione che sbroglia il rover dal trovarsi bloccato in un angolo
 def untanglement():
     if (check_distance_change()):
         motor_stop()
         if (ir_sensor_check(IR_L)):
-            print("Ostacolo trovato dal sensore sinistro.")
+            logpipe.console.info("Ostacolo trovato dal sensore sinistro.")
             motor_turn_left()
             time.sleep(0.5)
         elif (ir_sensor_check(IR_R)):
-            print("Ostacolo trovato dal sensore destro.")
+            logpipe.console.info("Ostacolo trovato dal sensore destro.")
             motor_turn_right()
             time.sleep(0.5)
     motor_backward(MEDIUM_SPEED)
 
 def where_to_go(d_l, d_c, d_r):
+    # Una direzione senza stima valida non viene mai preferita
+    d_l, d_c, d_r = [d if d is not None else 0.0 for d in (d_l, d_c, d_r)]
     max_distance = max(d_l, d_c, d_r)
-    logging.info("Valutazione - L:{:.2f}m C:{:.2f}m R:{:.2f}m".format(d_l, d_c, d_r))
+    logging.info("Valutazione - L:%.2fm C:%.2fm R:%.2fm", d_l, d_c, d_r)
 
     if max_distance < DANGER_DISTANCE:
         motor_backward(MEDIUM_SPEED)
@@ -256,19 +257,19 @@ def loop_rover():
     global flame_detected
     print("Avvio pattugliamento...")
     while not flame_detected:
-        print("\n--- Scansione SINISTRA ---")
+        logpipe.console.info("\n--- Scansione SINISTRA ---")
         motor_turn_left()
         time.sleep(1)
         if check_flame():
             break
         distance_left = get_distance()
-        print("--- Scansione CENTRO ---")
+        logpipe.console.info("--- Scansione CENTRO ---")
         motor_turn_right()
         time.sleep(1)
         if check_flame():
             break
         distance_center = get_distance()
-        print("--- Scansione DESTRA ---")
+        logpipe.console.info("--- Scansione DESTRA ---")
         motor_turn_right()
         time.sleep(1)
         if check_flame():
@@ -282,21 +283,32 @@ def loop_rover():
 
 if __name__ == '__main__':
     print("=== AVVIO ROVER ===")
+    log_pipeline = logpipe.setup('rover_patrol.log')
+    flight.install_crash_hooks()
     try:
         setup_gpio()
         time.sleep(2)
         loop_rover()
+        # La sirena della fiamma finisce di suonare prima di spegnere tutto
+        led_engine.wait()
         
     except KeyboardInterrupt:
         print("\n=== ARRESTO ROVER ===")
     finally:
-        motor_stop()
-        if pwm_ENA:
-            pwm_ENA.stop()
-        if pwm_ENB:
-            pwm_ENB.stop()
+        if distance_sampler:
+            distance_sampler.stop()
+        if flame_detector:
+            flame_detector.stop()
+        if led_engine:
+            led_engine.stop()
+        if motion:
+            motor_stop()
+            motion.close()
+        if motor_driver:
+            motor_driver.close()
         GPIO.output(LED0, GPIO.HIGH)
         GPIO.output(LED1, GPIO.HIGH)
         GPIO.output(LED2, GPIO.HIGH)
         GPIO.cleanup()
-        logging.info("Rover arrestato")
\ No newline at end of file
+        logging.info("Rover arrestato")
+        log_pipeline.stop()
\ No newline at end of file
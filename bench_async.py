@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark della latenza di reazione su GPIO finto: runtime asyncio
+# (rover_async.py) contro il loop attuale di ProgettoRover.py.
+#   ostacolo: mentre il rover avanza compare un ostacolo davanti a 0.30 m;
+#             latenza = istante in cui i motori smettono di andare avanti
+#   fiamma:   il sensore di fiamma va basso; latenza = primo lampeggio della
+#             sirena (LED2 acceso)
+# Gli eventi arrivano in istanti casuali del ciclo di pattugliamento; si
+# riportano media, mediana e caso peggiore.
+#
+# Uso: python3 bench_async.py [prove]
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import scanner
+from fake_gpio import FakeGPIO, EchoResponder
+
+IN1 = 19
+IN2 = 16
+IN3 = 21
+IN4 = 26
+FLAME = 6
+TRIG = 17
+ECHO = 4
+SER_SCAN = 12
+LED2 = 25
+
+TIMEOUT = 6.0
+
+
+class World:
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.obstacle = False
+        self.forward = threading.Event()
+        self.reacted = threading.Event()
+        self.reaction_ns = None
+        self._watch = None
+        EchoResponder(gpio, TRIG, ECHO, self.distance)
+        for pin in (IN1, IN2, IN3, IN4):
+            gpio.on_output(pin, self._on_bridge)
+        gpio.on_output(LED2, self._on_led)
+
+    # Centro libero e lati piu' vicini: senza ostacoli si va sempre avanti
+    def distance(self):
+        pwm = self.gpio.pwms.get(SER_SCAN)
+        angle = (pwm.duty - 2.5) * 180 / 10 if pwm and pwm.duty else scanner.SERVO_CENTER
+        front = abs(angle - scanner.SERVO_CENTER) <= 20
+        if self.obstacle and front:
+            return 0.30
+        return 3.0 if front else 2.0
+
+    def _moving_forward(self):
+        levels = self.gpio.levels
+        return levels.get(IN1) and levels.get(IN3) and not levels.get(IN2) and not levels.get(IN4)
+
+    def _on_bridge(self, channel, value):
+        if self._moving_forward():
+            self.forward.set()
+        else:
+            self.forward.clear()
+            if self._watch == 'obstacle':
+                self._react()
+
+    def _on_led(self, channel, value):
+        if value == self.gpio.LOW and self._watch == 'flame':
+            self._react()
+
+    def _react(self):
+        if not self.reacted.is_set():
+            self.reaction_ns = time.monotonic_ns()
+            self.reacted.set()
+
+    def _arm(self, kind):
+        self.reacted.clear()
+        self.reaction_ns = None
+        self._watch = kind
+        return time.monotonic_ns()
+
+    def obstacle_trial(self):
+        if not self.forward.wait(TIMEOUT):
+            return None
+        time.sleep(random.uniform(0, 0.5))
+        if not self.forward.is_set():
+            return None
+        start = self._arm('obstacle')
+        self.obstacle = True
+        ok = self.reacted.wait(TIMEOUT)
+        self._watch = None
+        self.obstacle = False
+        return (self.reaction_ns - start) / 1e9 if ok else TIMEOUT
+
+    def flame_trial(self):
+        time.sleep(random.uniform(0, 1.0))
+        start = self._arm('flame')
+        self.gpio.inject(FLAME, self.gpio.LOW)
+        ok = self.reacted.wait(TIMEOUT)
+        self._watch = None
+        self.gpio.inject(FLAME, self.gpio.HIGH)
+        time.sleep(1.2)
+        return (self.reaction_ns - start) / 1e9 if ok else TIMEOUT
+
+
+def run_trials(world, trials):
+    obstacle = []
+    while len(obstacle) < trials:
+        latency = world.obstacle_trial()
+        if latency is not None:
+            obstacle.append(latency)
+    flame = [world.flame_trial() for _ in range(trials)]
+    return obstacle, flame
+
+
+def async_runtime(trials):
+    import rover_async
+    gpio = FakeGPIO()
+    gpio.setup(FLAME, gpio.IN, pull_up_down=gpio.PUD_UP)
+    world = World(gpio)
+    runtime = rover_async.RoverRuntime(gpio)
+    runtime.setup()
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(runtime.run())
+
+    def run_loop():
+        with contextlib.suppress(asyncio.CancelledError):
+            loop.run_until_complete(task)
+
+    thread = threading.Thread(target=run_loop, daemon=True)
+    thread.start()
+    try:
+        return run_trials(world, trials)
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        runtime.cleanup()
+        gpio.stop()
+
+
+# Il programma attuale importa RPi.GPIO: si registra il GPIO finto al suo
+# posto e si lancia loop_rover in un thread (che resta vivo fino all'uscita)
+def current_loop(trials):
+    gpio = FakeGPIO()
+    gpio.setup(FLAME, gpio.IN, pull_up_down=gpio.PUD_UP)
+    world = World(gpio)
+    sys.modules['RPi'] = types.SimpleNamespace(GPIO=gpio)
+    sys.modules['RPi.GPIO'] = gpio
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, cwd)
+    import ProgettoRover
+    ProgettoRover.setup_gpio()
+    threading.Thread(target=ProgettoRover.loop_rover, daemon=True).start()
+    return run_trials(world, trials)
+
+
+def report(name, obstacle, flame):
+    for kind, values in (("ostacolo", obstacle), ("fiamma", flame)):
+        print("{:<16} {:<9} media {:6.0f} ms  mediana {:6.0f} ms  peggiore {:6.0f} ms".format(
+            name, kind, statistics.mean(values) * 1e3, statistics.median(values) * 1e3, max(values) * 1e3))
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    random.seed(1)
+    out = sys.stdout
+    # I due programmi stampano ad ogni misura
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [("asyncio", async_runtime(trials)), ("loop attuale", current_loop(trials))]
+    for name, (obstacle, flame) in results:
+        report(name, obstacle, flame)
+    out.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Microbenchmark della decodifica e dell'esecuzione di una trama.
+#   originale: Communication_Decode di wifirobots.py portata in Python 3,
+#              con la conversione b2a_hex di ogni byte fatta dal loop di
+#              ricezione e l'eval dell'angolo dei servo
+#   tabella:   commands.CommandTable
+# I gestori non fanno nulla, si misura solo il costo del protocollo.
+# Le trame sono un miscuglio di comandi come arrivano dall'app: motori,
+# servo, modi di crociera e luci. Le due versioni devono chiamare gli
+# stessi gestori con gli stessi argomenti, altrimenti l'uscita e' 1.
+#
+# Uso: python3 bench_commands.py [trame]
+
+import binascii
+import random
+import sys
+import time
+
+import commands
+
+FRAMES = 200000
+ROUNDS = 5
+
+MIX = [bytes([0x00, cmd, 0x00]) for cmd in (0x01, 0x02, 0x03, 0x04, 0x00)] * 4 + \
+      [bytes([0x01, servo, 0x5A]) for servo in (0x07, 0x08)] * 4 + \
+      [bytes([0x13, mode, 0x00]) for mode in (0x00, 0x02, 0x03, 0x04)] + \
+      [bytes([0x05, 0x00, 0x00]), bytes([0x05, 0x01, 0x00])]
+
+
+def legacy_decoder(calls):
+    def SetServo7Angle(angle_from_protocol):
+        angle = hex(eval('0x' + angle_from_protocol))
+        angle = int(angle, 16)
+        calls.append(('servo7', angle))
+
+    def SetServo8Angle(angle_from_protocol):
+        angle = hex(eval('0x' + angle_from_protocol))
+        angle = int(angle, 16)
+        calls.append(('servo8', angle))
+
+    def Communication_Decode(buffer):
+        if buffer[0] == '00':
+            if buffer[1] == '01':
+                calls.append(('forward',))
+            elif buffer[1] == '02':
+                calls.append(('backward',))
+            elif buffer[1] == '03':
+                calls.append(('left',))
+            elif buffer[1] == '04':
+                calls.append(('right',))
+            elif buffer[1] == '00':
+                calls.append(('stop',))
+            else:
+                calls.append(('stop',))
+        elif buffer[0] == '01':
+            if buffer[1] == '07':
+                SetServo7Angle(buffer[2])
+            elif buffer[1] == '08':
+                SetServo8Angle(buffer[2])
+        elif buffer[0] == '13':
+            if buffer[1] == '02':
+                calls.append(('mode', 2))
+            elif buffer[1] == '03':
+                calls.append(('mode', 3))
+            elif buffer[1] == '04':
+                calls.append(('mode', 4))
+            elif buffer[1] == '00':
+                calls.append(('mode', 0))
+        elif buffer[0] == '05':
+            if buffer[1] == '00':
+                calls.append(('light_on',))
+            elif buffer[1] == '01':
+                calls.append(('light_off',))
+
+    def decode(frame):
+        buffer = [binascii.b2a_hex(frame[i:i + 1]).decode() for i in range(3)]
+        Communication_Decode(buffer)
+
+    return decode
+
+
+def table_decoder(calls):
+    table = commands.CommandTable()
+    table.register(commands.MOTOR, commands.FORWARD, lambda: calls.append(('forward',)))
+    table.register(commands.MOTOR, commands.BACKWARD, lambda: calls.append(('backward',)))
+    table.register(commands.MOTOR, commands.TURN_LEFT, lambda: calls.append(('left',)))
+    table.register(commands.MOTOR, commands.TURN_RIGHT, lambda: calls.append(('right',)))
+    table.register(commands.MOTOR, commands.STOP, lambda: calls.append(('stop',)))
+    table.register_default(commands.MOTOR, lambda: calls.append(('stop',)))
+    table.register(commands.SERVO, 0x07, lambda angle: calls.append(('servo7', angle)), decode=commands.angle)
+    table.register(commands.SERVO, 0x08, lambda angle: calls.append(('servo8', angle)), decode=commands.angle)
+    for mode in (0, 2, 3, 4):
+        table.register(commands.CRUISE, mode, lambda mode=mode: calls.append(('mode', mode)))
+    table.register(commands.LIGHT, commands.LIGHT_ON, lambda: calls.append(('light_on',)))
+    table.register(commands.LIGHT, commands.LIGHT_OFF, lambda: calls.append(('light_off',)))
+    return table.dispatch
+
+
+def measure(make_decoder, frames):
+    best = None
+    for _ in range(ROUNDS):
+        calls = []
+        decode = make_decoder(calls)
+        start = time.perf_counter_ns()
+        for frame in frames:
+            decode(frame)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(frames), calls
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+    rng = random.Random(1)
+    frames = [rng.choice(MIX) for _ in range(count)]
+
+    legacy_ns, legacy_calls = measure(legacy_decoder, frames)
+    table_ns, table_calls = measure(table_decoder, frames)
+    print("decodifica + esecuzione per trama: originale {:6.0f} ns   tabella {:6.0f} ns   ({:.1f}x)".format(
+        legacy_ns, table_ns, legacy_ns / table_ns))
+    same = legacy_calls == table_calls
+    print("stessi gestori e argomenti: {}".format("si" if same else "NO"))
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
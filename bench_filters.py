@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark e prova di replay dei filtri di distanza.
+# - costo per campione di ogni stadio e della pipeline completa
+# - replay delle letture registrate in un rover_patrol.log (default
+#   esempio_rover_patrol.log): ogni bearing L/C/R e' una traccia a parte
+# - traccia sintetica con rumore, picchi e timeout (999) con verità nota
+# Esce con codice 1 se una delle verifiche fallisce.
+#
+# Uso: python3 bench_filters.py [file.log]
+
+import math
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+import filters
+
+LINE = re.compile(r'^(\S+ \S+) - \w+ - Valutazione - L:([\d.]+)m C:([\d.]+)m R:([\d.]+)m')
+TIMEOUT_VALUE = 999
+
+
+def cost_per_sample(stage, samples):
+    start = time.perf_counter()
+    for t_ns, z in samples:
+        stage.update(t_ns, z)
+    return (time.perf_counter() - start) / len(samples) * 1e6
+
+
+def load_log(path):
+    traces = {'L': [], 'C': [], 'R': []}
+    with open(path) as f:
+        for line in f:
+            m = LINE.match(line)
+            if m is None:
+                continue
+            t = datetime.strptime(m.group(1), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+            t_ns = int(t * 1e9)
+            for key, value in zip('LCR', m.groups()[1:]):
+                traces[key].append((t_ns, float(value)))
+    return traces
+
+
+def replay(trace):
+    pipeline = filters.Pipeline(max_age=5.0)
+    out = []
+    for t_ns, z in trace:
+        out.append(pipeline.update(t_ns, None if z >= TIMEOUT_VALUE else z))
+    return pipeline, out
+
+
+def synthetic(n=2000, period=0.06):
+    random.seed(1)
+    samples = []
+    truth = []
+    d = 2.0
+    for i in range(n):
+        t_ns = int(i * period * 1e9)
+        d = max(0.1, d - 0.3 * period) if (i // 500) % 2 == 0 else min(3.0, d + 0.3 * period)
+        z = d + random.gauss(0, 0.01)
+        r = random.random()
+        if r < 0.05:
+            z = TIMEOUT_VALUE
+        elif r < 0.10:
+            z = random.uniform(0.05, 20.0)
+        samples.append((t_ns, z))
+        truth.append(d)
+    return samples, truth
+
+
+def main():
+    failures = 0
+
+    samples, truth = synthetic()
+    clean = [(t, None if z >= TIMEOUT_VALUE else z) for t, z in samples]
+    print('--- Costo per campione ---')
+    for name, stage in [('outlier', filters.OutlierRejector()),
+                        ('mediana', filters.RollingMedian()),
+                        ('kalman', filters.Kalman1D()),
+                        ('pipeline', filters.Pipeline())]:
+        print('{:<10} {:6.2f} us'.format(name, cost_per_sample(stage, clean)))
+
+    print('\n--- Traccia sintetica (5% timeout, 5% picchi) ---')
+    pipeline = filters.Pipeline()
+    raw_err = []
+    filt_err = []
+    for (t_ns, z), d in zip(samples, truth):
+        estimate = pipeline.update(t_ns, None if z >= TIMEOUT_VALUE else z)
+        raw_err.append((min(z, 4.0) - d) ** 2)
+        if estimate.valid:
+            filt_err.append((estimate.distance - d) ** 2)
+            if estimate.distance > filters.MAX_RANGE:
+                failures += 1
+    raw_rms = math.sqrt(sum(raw_err) / len(raw_err))
+    filt_rms = math.sqrt(sum(filt_err) / len(filt_err))
+    print('RMS grezzo {:.3f} m   RMS filtrato {:.3f} m   stime valide {}/{}'.format(
+        raw_rms, filt_rms, len(filt_err), len(samples)))
+    if filt_rms >= raw_rms / 5:
+        print('FAIL: il filtro non riduce abbastanza l\'errore')
+        failures += 1
+
+    path = sys.argv[1] if len(sys.argv) > 1 else 'esempio_rover_patrol.log'
+    print('\n--- Replay {} ---'.format(path))
+    for key, trace in sorted(load_log(path).items()):
+        pipeline, out = replay(trace)
+        spikes = sum(1 for _, z in trace if z > filters.MAX_RANGE)
+        passed = sum(1 for e in out if e.valid and e.distance > filters.MAX_RANGE)
+        print('{}: letture {:3d}  fuori portata {:2d}  scartate {:3d}  fuori portata passate {}'.format(
+            key, len(trace), spikes, pipeline.stages[0].rejected_total, passed))
+        if passed:
+            failures += 1
+
+    print('\n{}'.format('OK' if failures == 0 else 'FALLITO ({} verifiche)'.format(failures)))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
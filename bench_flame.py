@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark della rilevazione fiamma su GPIO finto.
+# Ogni prova e' una fiamma che all'accensione rimbalza per qualche decina
+# di ms, poi resta accesa FLAME_TIME secondi con brevi spegnimenti (la
+# fiamma tremola) e infine si spegne.
+#   polling:  la vecchia check_flame, letta ad ogni giro da 0.1 s di
+#             where_to_go (1 s di guida ogni 1.8 s di ciclo, niente durante
+#             la scansione) e un allarme per ogni giro con la fiamma
+#   fronti:   flame.FlameDetector con TelemetryPublisher e broker finto;
+#             latenza fino al messaggio arrivato al broker
+#
+# Uso: python3 bench_flame.py [prove]
+
+import random
+import statistics
+import sys
+import time
+
+import flame
+import telemetry
+from fake_gpio import FakeGPIO
+from fake_mqtt import FakeBroker, FakeMqttClient
+
+FLAME = 6
+FLAME_TIME = 3.0
+CYCLE = 1.8       # scansione col servo + 1 s di where_to_go
+DRIVE = 1.0
+TICK = 0.1
+
+
+# Fronti della fiamma (istante in s, livello) a partire da 0
+def flame_edges(rng):
+    edges = []
+    t = 0.0
+    for _ in range(rng.randint(2, 5)):
+        edges.append((t, 0))
+        t += rng.uniform(0.002, 0.02)
+        edges.append((t, 1))
+        t += rng.uniform(0.002, 0.02)
+    edges.append((t, 0))
+    end = t + FLAME_TIME
+    t += rng.uniform(0.3, 0.8)
+    while t < end - 0.3:
+        edges.append((t, 1))
+        t += rng.uniform(0.05, 0.2)
+        edges.append((t, 0))
+        t += rng.uniform(0.3, 0.8)
+    edges.append((end, 1))
+    return edges, end
+
+
+def level_at(edges, t):
+    level = 1
+    for at, value in edges:
+        if at > t:
+            break
+        level = value
+    return level
+
+
+def polling(trials, rng):
+    latencies = []
+    alerts = []
+    for _ in range(trials):
+        edges, end = flame_edges(rng)
+        phase = rng.uniform(0, CYCLE)
+        first = None
+        count = 0
+        t = 0.0
+        while t < end + CYCLE:
+            in_drive = (t + phase) % CYCLE >= CYCLE - DRIVE
+            if in_drive and level_at(edges, t) == 0:
+                count += 1
+                if first is None:
+                    first = t
+                # led_sirena bloccante: 1 s senza altri controlli
+                t += 1.0
+            t += TICK
+        if first is not None:
+            latencies.append(first)
+        alerts.append(count)
+    return latencies, alerts, trials - len(latencies)
+
+
+def edges_detector(trials, rng):
+    gpio = FakeGPIO()
+    gpio.setup(FLAME, gpio.IN, pull_up_down=gpio.PUD_UP)
+    broker = FakeBroker()
+    arrivals = []
+    broker.subscribe('flame', lambda topic, payload: arrivals.append((time.monotonic_ns(), telemetry.decode(payload)[1])))
+    client = FakeMqttClient(broker, "Rover_Fisica")
+    client.connect("localhost")
+    publisher = telemetry.TelemetryPublisher(client)
+    publisher.start()
+    status = {flame.STARTED: telemetry.FLAME_ALERT, flame.ONGOING: telemetry.FLAME_ONGOING,
+              flame.CLEARED: telemetry.FLAME_CLEAR}
+
+    def on_event(event):
+        publisher.publish_flame(status[event.kind], count=event.count, duration=event.duration)
+
+    detector = flame.FlameDetector(gpio, FLAME, on_event=on_event)
+    detector.start()
+    latencies = []
+    messages = []
+    for _ in range(trials):
+        edges, end = flame_edges(rng)
+        del arrivals[:]
+        start = gpio.clock() + 10000000
+        for at, level in edges:
+            gpio.inject(FLAME, level, start + int(at * 1e9))
+        time.sleep(end + flame.CLEAR_HOLD + 0.3)
+        records = [r for _, batch in arrivals for r in batch]
+        alerts = [t for t, batch in arrivals if any(r["status"] == "ALERT" for r in batch)]
+        if alerts:
+            latencies.append((alerts[0] - start) / 1e9)
+        messages.append(len(records))
+    detector.stop()
+    publisher.stop()
+    gpio.stop()
+    return latencies, messages, detector
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rng = random.Random(1)
+    latencies, alerts, missed = polling(trials, rng)
+    print("polling: latenza media {:6.0f} ms  peggiore {:6.0f} ms  allarmi per fiamma {:.1f}  fiamme perse {}".format(
+        statistics.mean(latencies) * 1e3, max(latencies) * 1e3, statistics.mean(alerts), missed))
+
+    rng = random.Random(1)
+    latencies, messages, detector = edges_detector(trials, rng)
+    stats = detector.latency_stats()
+    print("fronti:  latenza media {:6.0f} ms  peggiore {:6.0f} ms  eventi per fiamma {:.1f}  fiamme perse {}".format(
+        statistics.mean(latencies) * 1e3, max(latencies) * 1e3, statistics.mean(messages), trials - len(latencies)))
+    print("         rilevazione->accodamento: media {mean:.1f} ms  p95 {p95:.1f} ms  max {max:.1f} ms "
+          "(antirimbalzo {0:.0f} ms)".format(flame.DEBOUNCE * 1e3, **stats))
+    print("         fronti visti {}  eventi {}".format(detector.edges, detector.events))
+
+
+if __name__ == '__main__':
+    main()
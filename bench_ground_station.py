@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Prova di carico della stazione a terra (ground_station.py) con una flotta
+# di rover simulati sul broker finto in-process (fake_mqtt.py).
+# Misure:
+#   - portata sostenuta (campioni/s fino all'ultima scrittura su disco) con
+#     --rovers rover che pubblicano lotti gia' codificati da PUBLISHERS
+#     thread, tutti in JSON e tutti in binario (BINARY_SCALE volte i
+#     campioni); i publisher girano nello stesso processo e si contendono
+#     il GIL con la stazione
+#   - la stessa portata con la coda gia' piena (solo la stazione)
+#   - una flotta di TelemetryPublisher veri, uno per rover con i suoi
+#     topic, a RATE campioni/s ciascuno per --seconds s
+# Verifiche (uscita 1 se falliscono):
+#   - nessun campione perso o scartato, tutti scritti su disco
+#   - rilette dal disco, le colonne di ogni rover sono esattamente i suoi
+#     campioni, in ordine (nessun rover mescolato con un altro)
+#   - piu' scritture periodiche durante la prova
+#   - portata in binario sopra MIN_RATE campioni/s
+#   - topic piatti o con id non valido e payload rotti scartati e contati
+#   - colonne di lunghezze diverse (crash a meta' scrittura): load() tiene
+#     le righe complete
+#
+# Uso: python3 bench_ground_station.py [--rovers 60] [--samples 10000] [--seconds 5]
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import ground_station
+import telemetry
+from fake_mqtt import FakeBroker, FakeMqttClient
+
+PUBLISHERS = 4          # thread che pubblicano per la flotta
+BATCH = telemetry.MAX_BATCH
+FLAME_EVERY = 10        # un messaggio fiamma ogni FLAME_EVERY lotti di distanze
+FLUSH = 0.25            # s tra due scritture della stazione nella prova
+RATE = 20               # campioni/s di distanze per rover con i publisher veri
+MIN_RATE = 200000       # campioni/s in binario (su un PC; sul Pi circa 5-10 volte di meno)
+BINARY_SCALE = 5        # il binario va circa 5 volte piu' veloce: piu' campioni, prova di durata simile
+T0 = 1.7e9
+
+
+def rover_name(index):
+    return "rover{:02d}".format(index)
+
+
+# Campione seq del rover index: l'indice e' nella colonna left, cosi' un
+# campione finito nel rover sbagliato si vede
+def distance(index, seq):
+    return (T0 + seq * 0.05, float(index), float(seq % 4096), None if seq % 7 == 0 else 0.5)
+
+
+def flame_record(index, seq):
+    return (T0 + seq * 0.05, telemetry.FLAME_ALERT, index, 0.25)
+
+
+def expected(index, samples):
+    seq = np.arange(samples)
+    distances = {"timestamp": T0 + seq * 0.05, "left": np.full(samples, index, np.float32),
+                 "center": (seq % 4096).astype(np.float32),
+                 "right": np.where(seq % 7 == 0, np.nan, 0.5).astype(np.float32)}
+    flames = np.arange(0, samples, BATCH * FLAME_EVERY)
+    flame = {"timestamp": T0 + flames * 0.05, "status": np.full(len(flames), telemetry.FLAME_ALERT, np.uint8),
+             "count": np.full(len(flames), index, np.uint32), "duration": np.full(len(flames), 0.25, np.float32)}
+    return {"distances": distances, "flame": flame}
+
+
+# Messaggi di un rover: lotti di BATCH distanze e ogni FLAME_EVERY lotti
+# una fiamma
+def encode_rover(index, samples, encoding):
+    topics = telemetry.rover_topics(rover_name(index))
+    messages = []
+    for start in range(0, samples, BATCH):
+        if start % (BATCH * FLAME_EVERY) == 0:
+            messages.append((topics[telemetry.KIND_FLAME],
+                             telemetry.encode(telemetry.KIND_FLAME, [flame_record(index, start)], encoding)))
+        records = [distance(index, seq) for seq in range(start, min(start + BATCH, samples))]
+        messages.append((topics[telemetry.KIND_DISTANCES],
+                         telemetry.encode(telemetry.KIND_DISTANCES, records, encoding)))
+    return messages
+
+
+def same(columns, truth):
+    return all(len(columns[name]) == len(values) and
+               np.array_equal(columns[name], values, equal_nan=values.dtype.kind == 'f')
+               for name, values in truth.items())
+
+
+# Rover i cui dati su disco non sono quelli attesi
+def wrong_rovers(directory, rovers, samples):
+    wrong = []
+    for index in range(rovers):
+        truth = expected(index, samples)
+        if not all(same(ground_station.load(directory, rover_name(index), name), truth[name]) for name in truth):
+            wrong.append(rover_name(index))
+    if ground_station.rovers(directory) != [rover_name(index) for index in range(rovers)]:
+        wrong.append("cartelle in piu' o in meno")
+    return wrong
+
+
+# La stazione in asyncio nel thread principale, la flotta in PUBLISHERS
+# thread; prefilled: tutti i messaggi in coda prima di avviare la stazione
+def saturate(rovers, samples, encoding, prefilled):
+    messages = [encode_rover(index, samples, encoding) for index in range(rovers)]
+    total = sum(len(m) for m in messages)
+    broker = FakeBroker()
+    with tempfile.TemporaryDirectory() as directory:
+        station = ground_station.GroundStation(directory, flush_interval=FLUSH, max_pending=total)
+        for topic_filter in ground_station.SUBSCRIPTIONS:
+            broker.subscribe(topic_filter, station.receive)
+        clients = []
+        for index in range(rovers):
+            client = FakeMqttClient(broker, "Rover_" + rover_name(index))
+            client.connect("localhost")
+            clients.append(client)
+
+        def publish(first):
+            own = range(first, rovers, PUBLISHERS)
+            for step in range(max(len(messages[index]) for index in own)):
+                for index in own:
+                    if step < len(messages[index]):
+                        clients[index].publish(*messages[index][step])
+
+        def fleet():
+            threads = [threading.Thread(target=publish, args=(first,)) for first in range(PUBLISHERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            station.stop()
+
+        if prefilled:
+            fleet()
+        start = time.perf_counter()
+        if not prefilled:
+            threading.Thread(target=fleet).start()
+        asyncio.run(station.run())
+        elapsed = time.perf_counter() - start
+        wrong = wrong_rovers(directory, rovers, samples)
+    stored = station.stats["samples"]
+    distances = rovers * samples
+    lost = (stored != distances + rovers * len(expected(0, samples)["flame"]["timestamp"]) or
+            station.stats["written"] != stored or station.stats["messages"] != total or
+            station.stats["dropped"] or station.stats["invalid"] or station.stats["rejected"])
+    return {"rate": stored / elapsed, "messages": total / elapsed, "elapsed": elapsed,
+            "flushes": station.stats["flushes"], "lost": bool(lost), "wrong": wrong}
+
+
+# Flotta di TelemetryPublisher veri, ognuno con i topic del suo rover;
+# un thread li alimenta tutti a RATE campioni/s
+def fleet_publishers(rovers, seconds):
+    broker = FakeBroker()
+    with tempfile.TemporaryDirectory() as directory:
+        station = ground_station.GroundStation(directory, flush_interval=FLUSH)
+        for topic_filter in ground_station.SUBSCRIPTIONS:
+            broker.subscribe(topic_filter, station.receive)
+        publishers = []
+        for index in range(rovers):
+            client = FakeMqttClient(broker, "Rover_" + rover_name(index))
+            client.connect("localhost")
+            publisher = telemetry.TelemetryPublisher(
+                client, encoding=(telemetry.BINARY, telemetry.JSON)[index % 2],
+                topics=telemetry.rover_topics(rover_name(index)))
+            publisher.start()
+            publishers.append(publisher)
+        ticks = int(seconds * RATE)
+
+        def drive():
+            start = time.monotonic()
+            for seq in range(ticks):
+                time.sleep(max(0.0, start + seq / RATE - time.monotonic()))
+                for index, publisher in enumerate(publishers):
+                    publisher.publish_distances(*distance(index, seq)[1:], timestamp=distance(index, seq)[0])
+            for publisher in publishers:
+                publisher.stop()
+            station.stop()
+
+        threading.Thread(target=drive).start()
+        asyncio.run(station.run())
+        wrong = [rover_name(index) for index in range(rovers)
+                 if not same(ground_station.load(directory, rover_name(index), "distances"),
+                             expected(index, ticks)["distances"])]
+    published = sum(publisher.stats["samples"] for publisher in publishers)
+    return published, station.stats["samples"], wrong
+
+
+def bad_input():
+    with tempfile.TemporaryDirectory() as directory:
+        station = ground_station.GroundStation(directory)
+        good = telemetry.encode(telemetry.KIND_DISTANCES, [distance(1, 0)])
+        station.receive("distances", good)                              # topic piatto di prima
+        station.receive("rover/../distances", good)                     # id non valido
+        station.receive("rover/rover01/sconosciuto", good)
+        station.receive("rover/rover01/distances", good[:-3])           # binario troncato
+        station.receive("rover/rover01/distances", b"[{\"timestamp\": 1")
+        station.receive("rover/rover01/flame", good)                    # tipo diverso dal topic
+        station.receive("rover/rover01/distances", good)
+        station.stop()
+        asyncio.run(station.run())
+        stored = ground_station.load(directory, "rover01", "distances")
+        ok = (station.stats["rejected"] == 3 and station.stats["invalid"] == 3 and
+              len(stored["timestamp"]) == 1 and ground_station.rovers(directory) == ["rover01"])
+
+        # Crash a meta' scrittura: una colonna con un campione e mezzo in piu'
+        with open(os.path.join(directory, "rover01", "distances", "left.bin"), "ab") as f:
+            f.write(b"\0" * 6)
+        truncated = {name: len(column) for name, column in ground_station.load(directory, "rover01", "distances").items()}
+    return ok, set(truncated.values()) == {1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico della stazione a terra con una flotta di rover")
+    parser.add_argument("--rovers", type=int, default=60)
+    parser.add_argument("--samples", type=int, default=10000, help="campioni di distanze per rover in JSON")
+    parser.add_argument("--seconds", type=float, default=5.0, help="durata della prova con i publisher veri (s)")
+    args = parser.parse_args()
+
+    print("{} rover, {} campioni di distanze ciascuno in JSON e {} in binario, lotti da {}, {} thread di publisher".format(
+        args.rovers, args.samples, args.samples * BINARY_SCALE, BATCH, PUBLISHERS))
+    print("prova                            campioni/s   messaggi/s   durata s  scritture")
+    runs = {}
+    binary_samples = args.samples * BINARY_SCALE
+    for name, encoding, prefilled in (("JSON, flotta che pubblica", telemetry.JSON, False),
+                                      ("binario, flotta che pubblica", telemetry.BINARY, False),
+                                      ("JSON, coda gia' piena", telemetry.JSON, True),
+                                      ("binario, coda gia' piena", telemetry.BINARY, True)):
+        samples = binary_samples if encoding == telemetry.BINARY else args.samples
+        result = runs[name] = saturate(args.rovers, samples, encoding, prefilled)
+        print("  {:<30} {:10.0f} {:12.0f} {:10.2f} {:10d}".format(
+            name, result["rate"], result["messages"], result["elapsed"], result["flushes"]))
+        for rover in result["wrong"][:5]:
+            print("    dati diversi dall'atteso: " + rover)
+
+    published, stored, wrong = fleet_publishers(args.rovers, args.seconds)
+    print("TelemetryPublisher veri: {} rover a {} campioni/s per {:.0f} s: {} pubblicati, {} archiviati".format(
+        args.rovers, RATE, args.seconds, published, stored))
+    rejected_ok, truncated_ok = bad_input()
+
+    checks = [
+        ("nessun campione perso, tutti su disco", not any(r["lost"] for r in runs.values())),
+        ("dati di ogni rover esatti e separati", not any(r["wrong"] for r in runs.values())),
+        ("scritture periodiche durante la prova", all(r["flushes"] >= 2 for r in runs.values())),
+        ("binario sopra {} campioni/s".format(MIN_RATE), runs["binario, flotta che pubblica"]["rate"] > MIN_RATE),
+        ("publisher veri: tutto archiviato, per rover", published == stored and not wrong),
+        ("topic e payload non validi scartati", rejected_ok),
+        ("colonne troncate: solo righe complete", truncated_ok),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
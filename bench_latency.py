@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Suite di benchmark della latenza sensore -> motori di tutti i programmi
+# di pattugliamento, eseguiti nel simulatore in tempo virtuale (simulate.py).
+#
+# Scenario di ogni prova: mentre il rover avanza compare un pannello a
+# DISTANCE m davanti ai sensori; latenza = tempo fino a quando i motori
+# smettono di portarlo avanti. Per i line follower il pannello e' una linea
+# di stop trasversale appena davanti ai sensori e la latenza arriva fino ai
+# motori fermi. Dopo HOLD s l'ostacolo sparisce e, qualche istante dopo che
+# il rover e' ripartito, si ripete.
+# Per ogni programma si misurano anche:
+#   - frequenza del loop: letture del sensore che decide (o ping del sonar);
+#     letture entro MERGE s l'una dall'altra contano come un giro solo
+#   - percentili del periodo e jitter (scarto dalla mediana, p99)
+#   - CPU usata dal processo per secondo virtuale
+# Ogni programma gira in un processo a parte (i programmi hanno stato
+# globale); i risultati vanno in un rapporto JSON e, con --baseline, si
+# confrontano con quelli di una versione precedente: in caso di regressione
+# l'uscita e' 1.
+#
+# Uso: python3 bench_latency.py [--seconds S] [--json rapporto.json]
+#                               [--baseline vecchio.json] [programmi...]
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import simulate
+import simulator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DISTANCE = 0.30    # m tra i sensori e l'ostacolo che compare
+LINE_AHEAD = 0.02  # m tra i sensori e la linea di stop
+PANEL = 0.50       # m, larghezza dell'ostacolo
+WARMUP = 3.0       # s prima della prima prova (i programmi attendono 2 s all'avvio)
+TICK = 0.01        # s tra due controlli dello scenario
+HOLD = 1.0         # s di permanenza dell'ostacolo dopo la reazione
+TIMEOUT = 5.0      # s senza reazione: prova persa
+MERGE = 0.0005     # s, letture piu' vicine appartengono allo stesso giro
+
+# Sensore che scandisce il loop di ogni programma: 'trig' per i ping del
+# sonar, altrimenti il pin letto ad ogni giro
+MARKERS = {
+    "loop_rover": "trig",
+    "test_nomqtt": 27,
+    "smart_patrol": 22,
+    "avoiding": 22,
+    "avoid_wave": "trig",
+    "follow_line": 27,
+    "cruising_line": 27,
+    "cruising_ir": 22,
+    "cruising_wave": "trig",
+}
+
+# Soglie per il confronto con --baseline
+TOLERANCE = 0.20   # peggioramento relativo ammesso
+SLACK_MS = 20.0    # peggioramento assoluto sempre ammesso (rumore)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# Stanza vuota di 40 x 40 m: in un minuto il rover non arriva alle pareti
+def arena_world(size=40.0):
+    world = simulator.World()
+    world.add_box(0.0, 0.0, size, size)
+    return world
+
+
+class Probe:
+    def __init__(self, sim, marker, line, distance, rng):
+        self.sim = sim
+        self.line = line
+        self.distance = LINE_AHEAD if line else distance
+        self.rng = rng
+        self.latencies = []
+        self.clearances = []
+        self.missed = 0
+        self.collisions = 0
+        self.samples = []
+        self._t0 = None
+        self._next_ns = None
+        self._object = None
+        self._collisions0 = 0
+        self._marker = marker
+        sim.on_motion(self._on_motion)
+        if marker == "trig":
+            sim.gpio.on_output(simulator.TRIG, self._on_trig)
+        else:
+            sim.gpio.on_input(self._on_input)
+
+    def start(self):
+        sched = self.sim.scheduler
+        self._next_ns = sched.now_ns + int(WARMUP * 1e9)
+        sched.at(self._next_ns, self._tick)
+
+    def _sample(self):
+        now = self.sim.scheduler.now_ns
+        if now < self._next_ns and not self.latencies and not self.missed:
+            return
+        if self.samples and now - self.samples[-1] < MERGE * 1e9:
+            return
+        self.samples.append(now)
+
+    def _on_trig(self, channel, value):
+        if not value:
+            self._sample()
+
+    def _on_input(self, channel, value):
+        if channel == self._marker:
+            self._sample()
+
+    def _advancing(self):
+        v_left, v_right = self.sim.wheel_speeds()
+        return v_left > 0 and v_right > 0
+
+    def _stopped(self, v_left, v_right):
+        if self.line:
+            return v_left == 0 and v_right == 0
+        return v_left + v_right <= 0
+
+    def _free_ahead(self):
+        if self.line:
+            return True
+        x, y = self.sim.sensor_origin()
+        hit = self.sim.world.ray(x, y, self.sim.heading)
+        return hit is None or hit > self.distance + 1.0
+
+    def _place(self):
+        x, y = self.sim.sensor_origin()
+        heading = self.sim.heading
+        cx = x + self.distance * math.cos(heading)
+        cy = y + self.distance * math.sin(heading)
+        half = 0.10 if self.line else PANEL / 2
+        dx, dy = -math.sin(heading) * half, math.cos(heading) * half
+        self._object = (cx - dx, cy - dy, cx + dx, cy + dy)
+        if self.line:
+            self.sim.world.marks.append(self._object)
+        else:
+            self.sim.world.walls.append(self._object)
+        self._collisions0 = self.sim.stats["collisions"]
+
+    def _remove(self, item):
+        target = self.sim.world.marks if self.line else self.sim.world.walls
+        if item in target:
+            target.remove(item)
+        self.collisions += self.sim.stats["collisions"] - self._collisions0
+
+    def _finish(self, now):
+        sched = self.sim.scheduler
+        item = self._object
+        sched.at(now + int(HOLD * 1e9), lambda: self._remove(item))
+        self._t0 = None
+        self._next_ns = now + int((HOLD + self.rng.uniform(0.5, 2.0)) * 1e9)
+
+    def _tick(self):
+        sched = self.sim.scheduler
+        now = sched.now_ns
+        if self._t0 is None:
+            if now >= self._next_ns and self._advancing() and self._free_ahead():
+                self._place()
+                self._t0 = now
+        elif now - self._t0 > TIMEOUT * 1e9:
+            self.missed += 1
+            self._finish(now)
+        sched.at(now + int(TICK * 1e9), self._tick)
+
+    def _on_motion(self, v_left, v_right):
+        if self._t0 is None or not self._stopped(v_left, v_right):
+            return
+        now = self.sim.scheduler.now_ns
+        self.latencies.append((now - self._t0) / 1e6)
+        self.clearances.append(self.sim.world.clearance(self.sim.x, self.sim.y) - simulator.RADIUS)
+        self._finish(now)
+
+    def result(self, virtual):
+        periods = [(b - a) / 1e6 for a, b in zip(self.samples, self.samples[1:])]
+        result = {
+            "virtual_s": virtual,
+            "trials": len(self.latencies) + self.missed,
+            "missed": self.missed,
+            "collisions": self.collisions,
+            "latency_ms": None,
+            "loop": None,
+        }
+        if self.latencies:
+            result["latency_ms"] = {
+                "mean": statistics.mean(self.latencies),
+                "p50": percentile(self.latencies, 0.50),
+                "p95": percentile(self.latencies, 0.95),
+                "max": max(self.latencies),
+            }
+            result["min_clearance_m"] = min(self.clearances)
+        if periods:
+            median = percentile(periods, 0.50)
+            result["loop"] = {
+                "hz": len(periods) / ((self.samples[-1] - self.samples[0]) / 1e9),
+                "period_ms": {
+                    "p50": median,
+                    "p95": percentile(periods, 0.95),
+                    "p99": percentile(periods, 0.99),
+                    "max": max(periods),
+                },
+                "jitter_p99_ms": percentile([abs(p - median) for p in periods], 0.99),
+            }
+        return result
+
+
+# Eseguito nel processo figlio: un programma, risultato in JSON su stdout
+def run_child(name, seconds, distance, seed):
+    random.seed(seed)
+    line = name in simulate.LINE_PROGRAMS
+    if line:
+        sim = simulate.make_simulator(name)
+    else:
+        sim = simulator.Simulator(arena_world(), pose=(20.0, 20.0, 0.0))
+    simulate.attach(sim)
+    probe = Probe(sim, MARKERS[name], line, distance, random.Random(seed))
+
+    cpu_start = time.process_time()
+    real_start = time.perf_counter()
+    sim.start(seconds)
+    probe.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                simulate.run_program(name)
+            except SystemExit:
+                pass
+        virtual = sim.elapsed()
+    finally:
+        sim.stop()
+    real = time.perf_counter() - real_start
+    result = probe.result(virtual)
+    result["cpu_s"] = time.process_time() - cpu_start
+    result["cpu_per_virtual_s"] = result["cpu_s"] / virtual
+    result["speedup"] = virtual / real
+    sys.stdout.write("RESULT " + json.dumps(result) + "\n")
+    sys.stdout.flush()
+    # I thread dei programmi restano fermi nelle attese virtuali
+    os._exit(0)
+
+
+def run_program(name, args):
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--seconds", str(args.seconds),
+               "--distance", str(args.distance), "--seed", str(args.seed)]
+    try:
+        done = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": "timeout dopo {:.0f} s".format(args.timeout)}
+    for line in reversed(done.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    return {"error": (done.stderr.strip().splitlines() or ["uscita {}".format(done.returncode)])[-1]}
+
+
+def version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_row(name, result):
+    if "error" in result:
+        print("{:<14} ERRORE: {}".format(name, result["error"]))
+        return
+    latency = result["latency_ms"]
+    loop = result["loop"]
+    print("{:<14} {:>3}/{:<3} {:>7} {:>7} {:>7} {:>5} {:>7} {:>7} {:>7} {:>7} {:>6.3f}".format(
+        name, result["trials"] - result["missed"], result["trials"],
+        "{:.0f}".format(latency["mean"]) if latency else "-",
+        "{:.0f}".format(latency["p95"]) if latency else "-",
+        "{:.0f}".format(latency["max"]) if latency else "-",
+        result["collisions"],
+        "{:.1f}".format(loop["hz"]) if loop else "-",
+        "{:.1f}".format(loop["period_ms"]["p50"]) if loop else "-",
+        "{:.1f}".format(loop["period_ms"]["p99"]) if loop else "-",
+        "{:.1f}".format(loop["jitter_p99_ms"]) if loop else "-",
+        result["cpu_per_virtual_s"]))
+
+
+# Regressioni rispetto a un rapporto precedente
+def compare(report, baseline):
+    problems = []
+    for name, result in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or "error" in old:
+            continue
+        if "error" in result:
+            problems.append("{}: {}".format(name, result["error"]))
+            continue
+        if result["missed"] > old["missed"]:
+            problems.append("{}: prove perse {} -> {}".format(name, old["missed"], result["missed"]))
+        if result["latency_ms"] and old["latency_ms"]:
+            before, after = old["latency_ms"]["p95"], result["latency_ms"]["p95"]
+            if after > before * (1 + TOLERANCE) and after - before > SLACK_MS:
+                problems.append("{}: latenza p95 {:.0f} -> {:.0f} ms".format(name, before, after))
+        if result["loop"] and old["loop"]:
+            before, after = old["loop"]["hz"], result["loop"]["hz"]
+            if after < before * (1 - TOLERANCE):
+                problems.append("{}: frequenza del loop {:.1f} -> {:.1f} Hz".format(name, before, after))
+            before, after = old["loop"]["jitter_p99_ms"], result["loop"]["jitter_p99_ms"]
+            if after > before * (1 + TOLERANCE) and after - before > SLACK_MS:
+                problems.append("{}: jitter p99 {:.1f} -> {:.1f} ms".format(name, before, after))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza sensore -> motori dei programmi del rover")
+    parser.add_argument("programs", nargs="*", help="programmi da provare (predefinito: tutti)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="durata virtuale per programma (s)")
+    parser.add_argument("--distance", type=float, default=DISTANCE, help="distanza dell'ostacolo (m)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=300.0, help="tempo reale massimo per programma (s)")
+    parser.add_argument("--json", help="scrive il rapporto in questo file")
+    parser.add_argument("--baseline", help="rapporto di una versione precedente da confrontare")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.seconds, args.distance, args.seed)
+        return
+
+    programs = args.programs or list(MARKERS)
+    unknown = [name for name in programs if name not in MARKERS]
+    if unknown:
+        parser.error("programmi sconosciuti: {}".format(", ".join(unknown)))
+
+    report = {
+        "version": version(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenario": {"distance_m": args.distance, "seconds": args.seconds, "seed": args.seed},
+        "results": {},
+    }
+    print("ostacolo a {:.2f} m, {:.0f} s virtuali per programma".format(args.distance, args.seconds))
+    print("{:<14} {:>7} {:>7} {:>7} {:>7} {:>5} {:>7} {:>7} {:>7} {:>7} {:>6}".format(
+        "programma", "prove", "media", "p95", "max", "urti", "loop", "per50", "per99", "jit99", "CPU/s"))
+    print("{:<14} {:>7} {:>7} {:>7} {:>7} {:>5} {:>7} {:>7} {:>7} {:>7} {:>6}".format(
+        "", "ok/tot", "ms", "ms", "ms", "", "Hz", "ms", "ms", "ms", ""))
+    for name in programs:
+        result = run_program(name, args)
+        report["results"][name] = result
+        print_row(name, result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("rapporto: {}".format(args.json))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline)
+        print("confronto con {} ({}):".format(args.baseline, baseline.get("version")))
+        for problem in problems:
+            print("  REGRESSIONE " + problem)
+        if not problems:
+            print("  nessuna regressione")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark degli effetti LED su GPIO finto.
+#   sirena: tempo per cui il loop di controllo resta fermo quando rileva una
+#           fiamma (10 lampeggi come in Test_noMqtt.py), con la vecchia
+#           led_sirena bloccante e con LedEngine
+#   stato:  scritture sui pin chiamando LED_Status ad ogni giro del loop
+#           (ogni 0.1 s) con stato che cambia raramente
+#
+# Uso: python3 bench_leds.py
+
+import time
+
+import leds
+from fake_gpio import FakeGPIO
+
+LED0 = 10
+LED1 = 9
+LED2 = 25
+
+OLD_STATUS = {
+    0: (1, 1, 1),
+    1: (0, 0, 1),
+    2: (0, 0, 0),
+    3: (1, 0, 1),
+}
+
+
+def make_gpio():
+    gpio = FakeGPIO()
+    for pin in (LED0, LED1, LED2):
+        gpio.setup(pin, gpio.OUT, initial=gpio.HIGH)
+    return gpio
+
+
+def old_siren(gpio):
+    gpio.output(LED0, gpio.HIGH)
+    gpio.output(LED2, gpio.LOW)
+    time.sleep(0.5)
+    gpio.output(LED2, gpio.HIGH)
+    gpio.output(LED0, gpio.LOW)
+    time.sleep(0.5)
+
+
+def main():
+    gpio = make_gpio()
+    start = time.perf_counter()
+    for _ in range(10):
+        old_siren(gpio)
+    print("Sirena bloccante:   loop fermo {:8.3f} s".format(time.perf_counter() - start))
+
+    gpio = make_gpio()
+    engine = leds.LedEngine(gpio, (LED0, LED1, LED2))
+    engine.start()
+    start = time.perf_counter()
+    engine.play("siren", 10)
+    blocked = time.perf_counter() - start
+    engine.wait()
+    print("Sirena LedEngine:   loop fermo {:8.3f} s  (durata sirena {:.2f} s, {} scritture)".format(
+        blocked, time.perf_counter() - start, engine.writes))
+    engine.stop()
+
+    # 200 giri del loop (20 s a 10 Hz), lo stato cambia ogni 50 giri
+    statuses = [(i // 50) % 4 for i in range(200)]
+    gpio = make_gpio()
+    for status in statuses:
+        for pin, level in zip((LED0, LED1, LED2), OLD_STATUS[status]):
+            gpio.output(pin, level)
+    print("LED_Status diretto: {:4d} scritture".format(gpio.output_calls))
+
+    gpio = make_gpio()
+    engine = leds.LedEngine(gpio, (LED0, LED1, LED2))
+    engine.start()
+    for status in statuses:
+        engine.set_status(status)
+        time.sleep(0.001)
+    engine.stop()
+    print("LED_Status engine:  {:4d} scritture".format(gpio.output_calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark dei tempi sul giro del segui linea, nel simulatore (anello
+# ovale di 2.4 x 1.4 m, simulator.line_world), a piu' velocita' massime
+# dei motori (m/s con PWM al 100%, simulator.WHEEL_SPEED): serve a vedere
+# fino a che velocita' di pattugliamento la linea non si perde.
+#   follow_line:   FollowLine.py originale (controllo ogni 100 ms, avanti a
+#                  tutta o rotazione sul posto)
+#   cruising_line: Cruising_Mod di wifirobots.py in modo 2 (stessa logica,
+#                  giro da ~1 ms)
+#   pid_NN:        line_follower.LineFollower con duty base NN% nel modo 2
+#                  di modes.ModeManager, tick da 10 ms e fronti dei sensori
+# Per ogni prova: giri completati, tempo medio sul giro (dal secondo giro),
+# scostamento dei sensori dalla linea (medio e massimo), linea persa
+# (scostamento finale oltre LOST m), inversioni di marcia delle ruote e
+# letture dei pin al secondo. Ogni prova gira in un processo a parte.
+#
+# Uso: python3 bench_line.py [--seconds S] [--speeds 0.3,0.6] [prove...]
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import line_follower
+import modes
+import simulate
+import simulator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CENTER = (1.4, 0.9)    # centro dell'ovale
+LOST = 0.15            # m dalla linea: linea persa
+SPEEDS = (0.3, 0.6, 1.0)
+TRIALS = ["follow_line", "cruising_line", "pid_60", "pid_100"]
+
+IR_L = 27
+IR_R = 18
+TICK = 0.01
+
+
+def run_pid(sim, duty, seconds):
+    gpio = sim.gpio
+    gpio.setmode(gpio.BCM)
+    for pin in (simulator.IN1, simulator.IN2, simulator.IN3, simulator.IN4):
+        gpio.setup(pin, gpio.OUT, initial=gpio.LOW)
+    for pin in (IR_L, IR_R):
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+    pwm_right = gpio.PWM(simulator.ENA, 1000)
+    pwm_left = gpio.PWM(simulator.ENB, 1000)
+    pwm_right.start(0)
+    pwm_left.start(0)
+
+    def drive(left, right):
+        gpio.output(simulator.IN1, True)
+        gpio.output(simulator.IN2, False)
+        gpio.output(simulator.IN3, True)
+        gpio.output(simulator.IN4, False)
+        pwm_left.ChangeDutyCycle(left)
+        pwm_right.ChangeDutyCycle(right)
+
+    follower = line_follower.LineFollower(gpio, IR_L, IR_R, drive, base=duty)
+    manager = modes.ModeManager()
+    manager.register(2, modes.Behavior("segui linea", follower.update, TICK,
+                                       on_enter=follower.start, on_exit=follower.stop))
+    manager.start()
+    manager.set_mode(2)
+    try:
+        time.sleep(seconds + 1)
+    except KeyboardInterrupt:
+        pass
+
+
+def laps(sim):
+    angle = None
+    total = 0.0
+    times = []
+    deviations = []
+    for t, x, y, heading in sim.trace:
+        sx = x + simulator.SENSOR_OFFSET * math.cos(heading)
+        sy = y + simulator.SENSOR_OFFSET * math.sin(heading)
+        deviations.append(sim.world.line_distance(sx, sy))
+        a = math.atan2(y - CENTER[1], x - CENTER[0])
+        if angle is not None:
+            total += (a - angle + math.pi) % (2 * math.pi) - math.pi
+            if abs(total) >= 2 * math.pi * (len(times) + 1):
+                times.append(t)
+        angle = a
+    lap_times = [b - a for a, b in zip([0.0] + times, times)]
+    return lap_times, deviations
+
+
+# Conta le volte in cui una ruota passa da avanti a indietro o viceversa
+# (anche con una fermata in mezzo)
+class Reversals:
+    def __init__(self):
+        self.count = 0
+        self._signs = [0, 0]
+
+    def __call__(self, v_left, v_right):
+        for wheel, speed in enumerate((v_left, v_right)):
+            sign = (speed > 0) - (speed < 0)
+            if sign and sign != self._signs[wheel]:
+                if self._signs[wheel]:
+                    self.count += 1
+                self._signs[wheel] = sign
+
+
+def run_child(name, seconds, speed):
+    simulator.WHEEL_SPEED = speed
+    sim = simulate.make_simulator("follow_line")
+    simulate.attach(sim)
+    reversals = Reversals()
+    sim.on_motion(reversals)
+    sim.start(seconds)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if name.startswith("pid_"):
+                run_pid(sim, int(name[4:]), seconds)
+            else:
+                simulate.run_program(name)
+    finally:
+        sim.stop()
+    lap_times, deviations = laps(sim)
+    # Il primo giro parte da fermo: nelle medie si usano i successivi
+    steady = lap_times[1:] or lap_times
+    result = {
+        "laps": len(lap_times),
+        "lap_mean_s": statistics.mean(steady) if steady else None,
+        "deviation_mean_m": statistics.mean(deviations),
+        "deviation_max_m": max(deviations),
+        "lost": deviations[-1] > LOST,
+        "distance_m": sim.stats["distance"],
+        "reversals_per_s": reversals.count / seconds,
+        "reads_per_s": sim.gpio.input_calls / seconds,
+    }
+    sys.stdout.write("RESULT " + json.dumps(result) + "\n")
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempi sul giro del segui linea nel simulatore")
+    parser.add_argument("trials", nargs="*", help="prove (predefinito: tutte)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="durata virtuale di ogni prova (s)")
+    parser.add_argument("--speeds", default=",".join(str(speed) for speed in SPEEDS),
+                        help="velocita' delle ruote al 100%% (m/s), separate da virgole")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    speeds = [float(speed) for speed in args.speeds.split(",")]
+    if args.child:
+        run_child(args.child, args.seconds, speeds[0])
+        return
+
+    track = simulator.line_world().line
+    print("anello di {:.1f} m, {:.0f} s virtuali per prova".format(
+        sum(math.dist(a, b) for a, b in zip(track, track[1:])), args.seconds))
+    print("{:<6} {:<14} {:>5} {:>8} {:>9} {:>9} {:>6} {:>10} {:>10}".format(
+        "m/s", "prova", "giri", "giro s", "scost. m", "max m", "persa", "invers./s", "letture/s"))
+    for speed in speeds:
+        for name in args.trials or TRIALS:
+            done = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, "--seconds",
+                                   str(args.seconds), "--speeds", str(speed)], capture_output=True, text=True,
+                                  timeout=600)
+            lines = [line for line in done.stdout.splitlines() if line.startswith("RESULT ")]
+            if not lines:
+                print("{:<6} {:<14} ERRORE: {}".format(
+                    speed, name, (done.stderr.strip().splitlines() or ["?"])[-1]))
+                continue
+            r = json.loads(lines[-1][len("RESULT "):])
+            print("{:<6} {:<14} {:>5} {:>8} {:>9.3f} {:>9.3f} {:>6} {:>10.1f} {:>10.0f}".format(
+                speed, name, r["laps"], "{:.1f}".format(r["lap_mean_s"]) if r["lap_mean_s"] else "-",
+                r["deviation_mean_m"], r["deviation_max_m"], "si" if r["lost"] else "no",
+                r["reversals_per_s"], r["reads_per_s"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Costo dei log nel loop di controllo e scatola nera.
+# Il file di log e il terminale sono lenti come sul rover: ogni scrittura
+# costa WRITE_COST e ogni STALL_EVERY scritture la SD (o la sessione SSH)
+# si ferma per STALL.
+#   diretto: logging.basicConfig su file e print, come prima
+#   coda:    logpipe.setup, con il file e il terminale scritti dal thread
+# Per ogni giro del loop: un logging.info della valutazione e una stampa
+# della distanza. Si misura quanto resta fermo il loop per giro (p50, p99,
+# max) e quanti messaggi vanno persi con la coda piena.
+# Scatola nera: costo di record(), tempo del dump, e verifiche (uscita 1 se
+# falliscono):
+#   - il dump contiene solo gli ultimi seconds secondi, nell'ordine giusto
+#   - un'eccezione non gestita in un thread salva la scatola nera
+#
+# Uso: python3 bench_logging.py [giri]
+
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import logpipe
+import recorder
+
+TICKS = 1000
+TICK = 0.002            # s tra due giri del loop
+WRITE_COST = 0.0003     # s per scrittura
+STALL_EVERY = 100
+STALL = 0.03            # s di blocco della SD
+RECORDS = 200000
+
+
+class SlowStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        time.sleep(STALL if self.writes % STALL_EVERY == 0 else WRITE_COST)
+        return super().write(text)
+
+    def lines(self):
+        return self.getvalue().count("\n")
+
+
+def control_loop(ticks, say):
+    costs = []
+    for tick in range(ticks):
+        d_l, d_c, d_r = 1.0 + tick % 7 / 10, 2.0, 0.5
+        start = time.perf_counter()
+        logging.info("Valutazione - L:%.2fm C:%.2fm R:%.2fm", d_l, d_c, d_r)
+        say("Distanza rilevata: %.2fm", d_c)
+        costs.append(time.perf_counter() - start)
+        time.sleep(TICK)
+    costs.sort()
+    return [costs[len(costs) // 2] * 1e3, costs[int(len(costs) * 0.99)] * 1e3, costs[-1] * 1e3]
+
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+
+def direct(ticks):
+    log = SlowStream()
+    terminal = SlowStream()
+    reset_logging()
+    logging.basicConfig(stream=log, level=logging.INFO, format=logpipe.FORMAT)
+
+    def say(message, *args):
+        print(message % args, file=terminal)
+
+    stats = control_loop(ticks, say)
+    reset_logging()
+    return stats, log.lines(), terminal.lines(), 0
+
+
+def queued(ticks):
+    log = SlowStream()
+    terminal = SlowStream()
+    reset_logging()
+    pipeline = logpipe.setup(stream=terminal, handlers=[logging.StreamHandler(log)])
+    stats = control_loop(ticks, logpipe.console.info)
+    pipeline.stop()
+    return stats, log.lines(), terminal.lines(), pipeline.dropped
+
+
+def recorder_checks(directory):
+    checks = []
+    flight = recorder.FlightRecorder(seconds=0.2, rate=5000, directory=directory)
+    start = time.perf_counter()
+    for i in range(RECORDS):
+        flight.record(recorder.DISTANCE, a=i)
+    record_ns = (time.perf_counter() - start) / RECORDS * 1e9
+    time.sleep(0.1)
+    recent = time.monotonic_ns()
+    for i in range(100):
+        flight.record(recorder.MOTOR, a=i, b=-i)
+    start = time.perf_counter()
+    dump = recorder.load(flight.dump("prova"))
+    dump_ms = (time.perf_counter() - start) * 1e3
+    oldest = dump.mono_ns - int(flight.seconds * 1e9)
+    ordered = all(a.t_ns <= b.t_ns for a, b in zip(dump.events, dump.events[1:]))
+    checks.append(("dump: solo gli ultimi secondi, in ordine",
+                   ordered and dump.events and dump.events[0].t_ns >= oldest and
+                   dump.events[-1].kind == recorder.MOTOR and dump.events[-1].a == 99 and
+                   sum(1 for e in dump.events if e.t_ns >= recent) == 100 and dump.reason == "prova"))
+
+    # Il traceback del thread non si stampa: l'hook precedente non fa nulla
+    crash = recorder.FlightRecorder(directory=directory)
+    crash.record(recorder.MARK, 7)
+    previous, threading.excepthook = threading.excepthook, lambda args: None
+    previous_sys = sys.excepthook
+    crash.install_crash_hooks()
+    thread = threading.Thread(target=lambda: 1 / 0)
+    thread.start()
+    thread.join()
+    threading.excepthook, sys.excepthook = previous, previous_sys
+    saved = [recorder.load(path) for path in crash.dumps]
+    checks.append(("crash in un thread: scatola nera salvata",
+                   len(saved) == 1 and saved[0].reason == "crash" and saved[0].events[0].code == 7))
+    return record_ns, dump_ms, len(dump.events), checks
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else TICKS
+
+    print("loop fermo per giro (ms)   p50      p99      max   righe log/terminale  perse")
+    for name, run in (("diretto", direct), ("coda", queued)):
+        (p50, p99, worst), log_lines, terminal_lines, dropped = run(ticks)
+        print("  {:<20} {:7.3f}  {:7.3f}  {:7.3f}   {:6d} / {:<6d}     {}".format(
+            name, p50, p99, worst, log_lines, terminal_lines, dropped))
+
+    with tempfile.TemporaryDirectory() as directory:
+        record_ns, dump_ms, events, checks = recorder_checks(os.path.join(directory, "flight"))
+    print("scatola nera: record() {:.0f} ns, dump di {} eventi in {:.2f} ms".format(record_ns, events, dump_ms))
+
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# logscan.py su log sintetici grandi, ruotati in ROTATED file come fa
+# RotatingFileHandler (rover_patrol.log.3 il piu' vecchio ... rover_patrol.log).
+# Ogni ora di log e' la stessa ora modello (valutazioni ogni 1-3.5 s, due
+# sessioni con "Rover arrestato", qualche valutazione con tre distanze
+# uguali, righe non interessanti e traceback in mezzo), cosi' i conteggi attesi sono
+# noti esattamente.
+# Misure (MB/s e secondi):
+#   - riga per riga con strptime, come uno script fatto a mano (solo sul
+#     primo file, e' lento)
+#   - logscan completo, e la costruzione dell'indice (comando index)
+#   - un minuto a meta' dei log: con l'indice e senza
+# Verifiche (uscita 1 se falliscono):
+#   - direzioni, valutazioni uguali, intervalli e sessioni come attesi
+#   - la ricerca per tempo con l'indice da' lo stesso risultato della
+#     lettura completa
+#   - un .gz da' le stesse statistiche del file non compresso
+#   - un log che comincia con "Rover arrestato" (come esempio_rover_patrol.log)
+#     non ha una sessione vuota in piu'
+#   - stats non scrive l'indice accanto ai log
+#
+# Uso: python3 bench_logscan.py [--mb 256] [--dir cartella]
+
+import argparse
+import datetime
+import gzip
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import logscan
+
+ROTATED = 4
+SEED = 1
+START = datetime.datetime(2018, 5, 20, 0)
+DIRECTIONS = ("AVANTI", "DESTRA", "SINISTRA")
+NOISE = ("Avvio connessione MQTT a broker.hivemq.com:1883",
+         "Fiamma spenta: durata 2.3s, 4 accensioni",
+         "Errore connessione MQTT: [Errno 111] Connection refused\nTraceback (most recent call last):\n"
+         "  File \"ProgettoRover.py\", line 106, in connect_mqtt\nConnectionRefusedError: Direzione presa: AVANTI")
+
+
+# Un'ora di log con "@HOUR@" al posto di "AAAA-MM-GG HH", e i conteggi
+def model_hour(rng):
+    lines = []
+    expected = {"directions": {}, "equal": 0, "intervals": 0, "stops": 0, "alerts": 0}
+    for first, last in ((0.5, 1790.0), (1850.0, 3590.0)):
+        t = first
+        previous = None
+        while t < last:
+            if rng.random() < 0.02:
+                left = center = right = rng.uniform(0.05, 2.0)
+                expected["equal"] += 1
+            else:
+                left, center, right = (rng.uniform(0.05, 2.0) for _ in range(3))
+            stamp = "@HOUR@:{:02d}:{:02d},{:03d}".format(int(t // 60), int(t % 60), int(t * 1000 % 1000))
+            lines.append("{} - INFO - Valutazione - L:{:.2f}m C:{:.2f}m R:{:.2f}m".format(stamp, left, center, right))
+            direction = rng.choice(DIRECTIONS)
+            lines.append("{} - INFO - Direzione presa: {}".format(stamp, direction))
+            expected["directions"][direction] = expected["directions"].get(direction, 0) + 1
+            if rng.random() < 0.05:
+                noise = rng.choice(NOISE)
+                lines.append("{} - {} - {}".format(stamp, "ERROR" if "Errore" in noise else "INFO", noise))
+            if rng.random() < 0.002:
+                lines.append("{} - INFO - ALLERTA: Rilevata fiamma.".format(stamp))
+                expected["alerts"] += 1
+            if previous is not None:
+                expected["intervals"] += 1
+            previous = t
+            t += rng.uniform(1.0, 3.5)
+        lines.append("@HOUR@:{:02d}:{:02d},000 - INFO - Rover arrestato".format(int(last // 60), int(last % 60)))
+        expected["stops"] += 1
+    return ("\n".join(lines) + "\n").encode("ascii"), expected
+
+
+def generate(directory, megabytes):
+    template, per_hour = model_hour(random.Random(SEED))
+    hours = max(ROTATED, int(megabytes * (1 << 20) / (len(template) + template.count(b"@HOUR@") * 7)))
+    paths = [os.path.join(directory, "rover_patrol.log" + ("" if n == 0 else ".{}".format(n)))
+             for n in range(ROTATED - 1, -1, -1)]
+    hour = 0
+    for number, path in enumerate(paths):
+        with open(path, "wb") as f:
+            for _ in range(hours * (number + 1) // ROTATED - hour):
+                stamp = (START + datetime.timedelta(hours=hour)).strftime("%Y-%m-%d %H").encode("ascii")
+                f.write(template.replace(b"@HOUR@", stamp))
+                hour += 1
+    expected = {key: ({name: n * hours for name, n in value.items()} if isinstance(value, dict) else value * hours)
+                for key, value in per_hour.items()}
+    return paths, expected, hours, template
+
+
+# Lo script fatto a mano: riga per riga, regex str e strptime
+def naive(path):
+    pattern = re.compile(r"^(\S+ \S+) - \w+ - Direzione presa: (\w+)")
+    directions = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = pattern.match(line)
+            if match:
+                datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S,%f")
+                directions[match.group(2)] = directions.get(match.group(2), 0) + 1
+    return directions
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def summary(stats):
+    return (stats.lines, stats.scans, dict(stats.directions), stats.equal, stats.alerts,
+            stats.intervals(), stats.closed_sessions())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="logscan.py su log sintetici grandi")
+    parser.add_argument("--mb", type=float, default=256.0, help="dimensione totale dei log (MB)")
+    parser.add_argument("--dir", help="cartella per i log (predefinito: temporanea, poi cancellata)")
+    args = parser.parse_args()
+
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+    directory = args.dir or tempfile.mkdtemp(prefix="logscan-")
+    try:
+        (paths, expected, hours, template), seconds = timed(generate, directory, args.mb)
+        total = sum(os.path.getsize(path) for path in paths) / (1 << 20)
+        print("{} file, {:.0f} MB, {} ore di log, generati in {:.1f}s".format(len(paths), total, hours, seconds))
+
+        first = os.path.getsize(paths[0]) / (1 << 20)
+        _, naive_seconds = timed(naive, paths[0])
+        stats, full_seconds = timed(logscan.analyze, paths)
+        no_index = not any(os.path.exists(logscan.index_path(path)) for path in paths)
+        index_seconds = 0.0
+        for path in paths:
+            index_seconds += timed(logscan.scan_file, path, logscan.LogStats(), None, None, True)[1]
+        print("lettura completa                  MB/s       s")
+        print("  riga per riga + strptime     {:7.0f}  {:6.1f}  (solo {:.0f} MB)".format(
+            first / naive_seconds, naive_seconds, first))
+        print("  logscan                      {:7.0f}  {:6.1f}".format(total / full_seconds, full_seconds))
+        print("  logscan index                {:7.0f}  {:6.1f}".format(total / index_seconds, index_seconds))
+
+        # Un minuto a meta'
+        middle = logscan.parse_time((START + datetime.timedelta(hours=hours // 2, minutes=20)).strftime("%Y-%m-%d %H:%M"))
+        end = middle + 60000 - 1
+        indexed, indexed_seconds = timed(logscan.analyze, paths, middle, end)
+        for path in paths:
+            os.remove(logscan.index_path(path))
+        unindexed, unindexed_seconds = timed(logscan.analyze, paths, middle, end)
+        print("un minuto a meta' ({} righe)   con indice {:.3f}s, senza {:.1f}s".format(
+            indexed.lines, indexed_seconds, unindexed_seconds))
+
+        with tempfile.TemporaryDirectory() as small:
+            plain = os.path.join(small, "rover_patrol.log")
+            with open(plain, "wb") as f:
+                f.write(template.replace(b"@HOUR@", b"2018-05-20 01"))
+            with open(plain, "rb") as f, gzip.open(plain + ".1.gz", "wb") as g:
+                shutil.copyfileobj(f, g)
+            same_gzip = summary(logscan.analyze([plain])) == summary(logscan.analyze([plain + ".1.gz"]))
+            # Arresto in testa al log, prima della prima sessione
+            stopped_first = os.path.join(small, "arresto_in_testa.log")
+            with open(stopped_first, "wb") as f:
+                f.write(b"2018-05-20 00:59:59,000 - INFO - Rover arrestato\n")
+                f.write(template.replace(b"@HOUR@", b"2018-05-20 01"))
+            leading = logscan.analyze([stopped_first]).closed_sessions()
+
+        sessions = stats.closed_sessions()
+        checks = [
+            ("direzioni come attese", stats.directions == expected["directions"]),
+            ("valutazioni uguali e allarmi come attesi",
+             stats.equal == expected["equal"] and stats.alerts == expected["alerts"]),
+            ("intervalli e sessioni come attesi",
+             stats.intervals()[0] == expected["intervals"] and len(sessions) == expected["stops"] and
+             all(stopped for _, _, stopped in sessions)),
+            ("ricerca per tempo: indice = lettura completa", summary(indexed) == summary(unindexed) and indexed.lines > 0),
+            (".gz come il file non compresso", same_gzip),
+            ("arresto in testa: nessuna sessione vuota",
+             len(leading) == expected["stops"] // hours and all(end > start for start, end, _ in leading)),
+            ("stats non scrive l'indice", no_index),
+        ]
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Costo delle metriche (metrics.py) nei punti caldi e verifica di quello
+# che espongono.
+# Misure:
+#   - ns per chiamata, al netto di una chiamata vuota: Counter.inc,
+#     Histogram.observe, e la strumentazione di un giro di where_to_go
+#     (tre perf_counter e due observe) rispetto alla durata del giro
+#   - tempo per comporre il testo Prometheus e per uno scrape HTTP
+# Poi ProgettoRover.py gira nel simulatore (tempo virtuale) e si leggono le
+# sue metriche: chiamate e TIMEOUT di get_distance, durata di where_to_go,
+# ping del sonar.
+# Verifiche (uscita 1 se falliscono):
+#   - Counter.inc e Histogram.observe sotto MAX_CALL_NS
+#   - formato testo: HELP e TYPE per ogni metrica, bucket cumulativi e
+#     +Inf = _count; GET /metrics uguale al testo, altri percorsi 404
+#   - messaggio MQTT in JSON con il client connesso, saltato senza
+#   - dopo la pattuglia le metriche di ProgettoRover sono coerenti con la
+#     simulazione
+#
+# Uso: python3 bench_metrics.py [--seconds 120]
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import math
+import re
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import metrics
+import simulate
+import simulator
+from fake_mqtt import FakeBroker, FakeMqttClient
+
+CALLS = 500000
+MAX_CALL_NS = 1000      # ns di strumentazione per chiamata (su un PC; sul Pi circa 5-10 volte di piu')
+SCRAPES = 200
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{le="([^"]+)"\})? (\S+)$')
+
+
+def per_call_ns(fn):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        fn()
+    return (time.perf_counter() - start) / CALLS * 1e9
+
+
+def call_costs():
+    registry = metrics.Registry()
+    counter = registry.counter("c_total", "c")
+    histogram = registry.histogram("h_seconds", "h")
+    perf_counter = time.perf_counter
+
+    def empty():
+        pass
+
+    def observed():
+        start = perf_counter()
+        histogram.observe(perf_counter() - start)
+        histogram.observe(perf_counter() - start)
+
+    base = per_call_ns(empty)
+    return [
+        ("Counter.inc", per_call_ns(counter.inc) - base),
+        ("Histogram.observe", per_call_ns(functools.partial(histogram.observe, 0.003)) - base),
+    ], per_call_ns(observed) - base
+
+
+# Controlli del formato testo: restituisce i campioni {nome: valore}
+# ({nome: {le: valore}} per i bucket) e l'elenco dei problemi
+def parse(text):
+    samples, problems = {}, []
+    declared = set()
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            declared.add((line[2:6], line.split()[2]))
+            continue
+        match = SAMPLE.match(line)
+        if not match:
+            problems.append("riga non valida: " + line)
+            continue
+        name, _, le, value = match.groups()
+        value = float(value)
+        if le is None:
+            samples[name] = value
+        else:
+            samples.setdefault(name, {})[le] = value
+    for name, value in samples.items():
+        base = name
+        suffix = re.search(r'_(bucket|sum|count)$', name)
+        if suffix and name[:suffix.start()] + "_bucket" in samples:
+            base = name[:suffix.start()]
+        if ("HELP", base) not in declared or ("TYPE", base) not in declared:
+            problems.append("HELP o TYPE mancante: " + base)
+        if isinstance(value, dict):
+            counts = list(value.values())
+            if counts != sorted(counts) or "+Inf" not in value or value["+Inf"] != samples.get(base + "_count"):
+                problems.append("bucket non cumulativi o +Inf diverso da _count: " + base)
+    return samples, problems
+
+
+def format_checks():
+    registry = metrics.Registry()
+    registry.counter("prova_total", "contatore").inc(3)
+    registry.gauge("prova_valore", "valore letto", fn=lambda: 2.5)
+    histogram = registry.histogram("prova_seconds", "istogramma")
+    for value in (0.0001, 0.003, 0.003, 0.2, 7.0):
+        histogram.observe(value)
+    text = registry.exposition()
+    samples, problems = parse(text)
+    ok = (not problems and samples["prova_total"] == 3 and samples["prova_valore"] == 2.5 and
+          samples["prova_seconds_count"] == 5 and samples["prova_seconds_bucket"]["0.005"] == 3 and
+          math.isclose(samples["prova_seconds_sum"], 7.2061))
+
+    start = time.perf_counter()
+    for _ in range(SCRAPES):
+        registry.exposition()
+    compose_ms = (time.perf_counter() - start) / SCRAPES * 1e3
+
+    server = metrics.MetricsServer(registry, port=0).start()
+    url = "http://127.0.0.1:{}".format(server.port)
+    try:
+        start = time.perf_counter()
+        for _ in range(SCRAPES):
+            with urllib.request.urlopen(url + metrics.PATH) as response:
+                body = response.read().decode("utf-8")
+                content_type = response.headers["Content-Type"]
+        scrape_ms = (time.perf_counter() - start) / SCRAPES * 1e3
+        try:
+            urllib.request.urlopen(url + "/altro")
+            missing = False
+        except urllib.error.HTTPError as e:
+            missing = e.code == 404
+    finally:
+        server.stop()
+    http_ok = body == text and content_type == metrics.CONTENT_TYPE and missing
+
+    broker = FakeBroker()
+    received = []
+    broker.subscribe(metrics.TOPIC, lambda topic, payload: received.append(json.loads(payload)))
+    client = FakeMqttClient(broker)
+    publisher = metrics.MetricsPublisher(registry, client)
+    offline = publisher.publish()
+    client.connect("localhost")
+    online = publisher.publish()
+    mqtt_ok = (not offline and online and publisher.skipped == 1 and len(received) == 1 and
+               received[0]["prova_total"] == 3 and received[0]["prova_seconds"]["count"] == 5)
+    return ok, problems, compose_ms, scrape_ms, http_ok, mqtt_ok
+
+
+def patrol(seconds):
+    sys.path.insert(0, simulate.HERE)
+    sim = simulator.Simulator()
+    simulate.attach(sim)
+    sim.start(seconds)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulate.run_program("loop_rover")
+    finally:
+        sim.stop()
+    samples, problems = parse(metrics.REGISTRY.exposition())
+    return sim, samples, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo e contenuto delle metriche del rover")
+    parser.add_argument("--seconds", type=float, default=120.0, help="durata virtuale della pattuglia (s)")
+    args = parser.parse_args()
+
+    costs, round_ns = call_costs()
+    format_ok, problems, compose_ms, scrape_ms, http_ok, mqtt_ok = format_checks()
+    sim, samples, patrol_problems = patrol(args.seconds)
+
+    print("strumentazione per chiamata (al netto di una chiamata vuota):")
+    for name, ns in costs:
+        print("  {:<50} {:6.0f} ns".format(name, ns))
+    print("testo Prometheus composto in {:.3f} ms, scrape HTTP in {:.3f} ms".format(compose_ms, scrape_ms))
+    for problem in problems + patrol_problems:
+        print("  " + problem)
+
+    calls = samples.get("rover_get_distance_total", 0)
+    timeouts = samples.get("rover_get_distance_timeouts_total", 0)
+    rounds = samples.get("rover_where_to_go_seconds_count", 0)
+    total = samples.get("rover_where_to_go_seconds_sum", 0.0)
+    pings = samples.get("rover_ranging_readings_total", 0) + samples.get("rover_ranging_timeouts_total", 0)
+    print("pattuglia di {:.0f} s virtuali:".format(args.seconds))
+    print("  get_distance {:.0f} chiamate, {:.0f} TIMEOUT".format(calls, timeouts))
+    print("  where_to_go {:.0f} giri, {:.2f} s in media: strumentazione {:.0f} ns per giro ({:.1g} del tempo)".format(
+        rounds, total / rounds if rounds else 0.0, round_ns, round_ns * 1e-9 * rounds / total if rounds else 0.0))
+    print("  ping {:.0f} nelle metriche, {} nel simulatore".format(pings, sim.stats["pings"]))
+
+    checks = [
+        ("inc e observe sotto {} ns per chiamata".format(MAX_CALL_NS), max(ns for _, ns in costs) < MAX_CALL_NS),
+        ("formato testo Prometheus", format_ok and not patrol_problems),
+        ("GET /metrics e 404", http_ok),
+        ("MQTT: JSON se connesso, saltato se no", mqtt_ok),
+        ("pattuglia: get_distance e TIMEOUT contati", calls > 0 and 0 <= timeouts <= calls),
+        ("pattuglia: where_to_go misurato", rounds > 0 and 1.0 <= total / rounds <= args.seconds),
+        ("pattuglia: ping come nel simulatore", abs(pings - sim.stats["pings"]) <= 1),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark del cambio dei modi di crociera.
+#   polling: Cruising_Mod di wifirobots.py portato in Python 3, con il
+#            controllo di Cruising_Flag e lo sleep di 1 ms ad ogni giro
+#   eventi:  modes.ModeManager con i periodi di wifi_rover.py
+# I comportamenti sono finti: ogni tick costa TICK_COST s di CPU (lettura
+# dei sensori e scrittura dei pin sul Pi).
+# Misure:
+#   - CPU e risvegli al secondo a riposo (modo 0)
+#   - CPU con il segui linea attivo
+#   - latenza del cambio di modo: da quando il server dei comandi cambia
+#     modo al primo tick del nuovo comportamento
+#
+# Uso: python3 bench_modes.py [secondi]
+
+import random
+import statistics
+import sys
+import threading
+import time
+
+import modes
+
+TICK_COST = 0.00005
+SWITCHES = 50
+LINE_PERIOD = 0.005
+IR_PERIOD = 0.01
+WAVE_PERIOD = 0.1
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class Recorder:
+    def __init__(self):
+        self.pending = None
+        self.latencies = []
+        self.wakeups = 0
+
+    def behavior(self, mode):
+        def tick():
+            if self.pending is not None and self.pending[0] == mode:
+                self.latencies.append(time.monotonic_ns() - self.pending[1])
+                self.pending = None
+            busy(TICK_COST)
+        return tick
+
+    def changed(self, mode):
+        self.pending = (mode, time.monotonic_ns())
+
+
+class Polling:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.flag = 0
+        self.running = True
+        self.ticks = {2: recorder.behavior(2), 3: recorder.behavior(3), 4: recorder.behavior(4)}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        previous = 0
+        while self.running:
+            self.recorder.wakeups += 1
+            if previous != self.flag:
+                previous = self.flag
+            tick = self.ticks.get(self.flag)
+            if tick is not None:
+                tick()
+            else:
+                time.sleep(0.001)
+            time.sleep(0.001)
+
+    def set_mode(self, mode):
+        self.recorder.changed(mode)
+        self.flag = mode
+
+    def mode(self):
+        return self.flag
+
+    def wakeups(self):
+        return self.recorder.wakeups
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class Events:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.manager = modes.ModeManager()
+        for mode, period in ((2, LINE_PERIOD), (3, IR_PERIOD), (4, WAVE_PERIOD)):
+            self.manager.register(mode, modes.Behavior(str(mode), recorder.behavior(mode), period))
+        self.manager.start()
+
+    def set_mode(self, mode):
+        self.recorder.changed(mode)
+        self.manager.set_mode(mode)
+
+    def mode(self):
+        return self.manager.mode
+
+    def wakeups(self):
+        return self.manager.wakeups
+
+    def stop(self):
+        self.manager.stop()
+
+
+def cpu_over(seconds):
+    start = time.process_time()
+    time.sleep(seconds)
+    return (time.process_time() - start) / seconds
+
+
+def run(kind, seconds, rng):
+    recorder = Recorder()
+    runner = kind(recorder)
+    time.sleep(0.1)
+    wakeups = runner.wakeups()
+    idle_cpu = cpu_over(seconds)
+    idle_wakeups = (runner.wakeups() - wakeups) / seconds
+    runner.set_mode(2)
+    time.sleep(0.1)
+    line_cpu = cpu_over(seconds)
+    for _ in range(SWITCHES):
+        mode = rng.choice([m for m in (0, 2, 3, 4) if m != runner.mode()])
+        runner.set_mode(mode)
+        time.sleep(rng.uniform(0.02, 0.06))
+    runner.set_mode(0)
+    runner.stop()
+    return idle_cpu, idle_wakeups, line_cpu, [v / 1e6 for v in recorder.latencies]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    for name, kind in (("polling", Polling), ("eventi ", Events)):
+        idle_cpu, idle_wakeups, line_cpu, latencies = run(kind, seconds, random.Random(1))
+        print("{}: a riposo CPU {:5.1f}% ({:6.0f} risvegli/s)   segui linea CPU {:5.1f}%   "
+              "cambio modo media {:.2f} ms  max {:.2f} ms".format(
+                  name, idle_cpu * 100, idle_wakeups, line_cpu * 100,
+                  statistics.mean(latencies), max(latencies)))
+
+
+if __name__ == '__main__':
+    main()
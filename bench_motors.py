@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Costo in chiamate GPIO dei comandi ai motori, su GPIO finto.
+#   originale: motor_forward/motor_stop di ProgettoRover.py e i Motor_* di
+#              wifirobots.py (sei pin del ponte, piu' LED e print), scritti
+#              ad ogni chiamata
+#   driver:    motors.MotorDriver, che scrive solo i pin che cambiano
+# Scenari:
+#   - pattugliamento: i giri di Smart_Patrol (ogni 0.1 s), quasi sempre
+#     "via libera" con Motor_Forward, ogni tanto rallentamenti e manovre
+#   - crociera IR: Avoiding di wifirobots ogni 10 ms, avanti o fermo
+# Per ogni scenario: chiamate GPIO per giro e tempo per giro. Sul GPIO finto
+# una chiamata costa poco; sul Raspberry il tempo segue le chiamate.
+# Verifiche (uscita 1 se falliscono):
+#   - dopo ogni comando i pin sono uguali a quelli dell'originale
+#   - nei cambi di direzione nessuna ruota ha duty > 0 con un verso
+#     diverso da quello finale, e i due IN di una ruota non sono mai alti
+#     insieme
+#
+# Uso: python3 bench_motors.py [giri]
+
+import contextlib
+import io
+import random
+import sys
+import time
+
+import motors
+from fake_gpio import FakeGPIO
+
+TICKS = 20000
+SEED = 1
+
+ENA, IN1, IN2 = motors.ENA, motors.IN1, motors.IN2
+ENB, IN3, IN4 = motors.ENB, motors.IN3, motors.IN4
+LED1 = 9
+LED2 = 25
+
+# (IN1, IN2, IN3, IN4), duty: come nei Motor_* originali
+LEGACY = {
+    "forward": ((1, 0, 1, 0), 100),
+    "backward": ((0, 1, 0, 1), 100),
+    "turn_left": ((1, 0, 0, 1), 100),
+    "turn_right": ((0, 1, 1, 0), 100),
+    "stop": ((0, 0, 0, 0), 0),
+}
+
+# LED1, LED2 di wifirobots.py per comando
+LEGACY_LEDS = {
+    "forward": (0, 0),
+    "backward": (1, 0),
+    "turn_left": (0, 1),
+    "turn_right": (0, 1),
+    "stop": (1, 1),
+}
+
+
+class Counter:
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.pwm_calls = 0
+        gpio.on_pwm(self._on_pwm)
+
+    def _on_pwm(self, channel, duty):
+        self.pwm_calls += 1
+
+    def calls(self):
+        return self.gpio.output_calls + self.pwm_calls
+
+
+def make_gpio(leds=False):
+    gpio = FakeGPIO()
+    for pin in (ENA, IN1, IN2, ENB, IN3, IN4):
+        gpio.setup(pin, gpio.OUT, initial=gpio.LOW)
+    if leds:
+        for pin in (LED1, LED2):
+            gpio.setup(pin, gpio.OUT, initial=gpio.HIGH)
+    return gpio
+
+
+class Legacy:
+    def __init__(self, gpio, leds=False):
+        self.gpio = gpio
+        self.leds = leds
+        self.pwm_ENA = gpio.PWM(ENA, 1000)
+        self.pwm_ENB = gpio.PWM(ENB, 1000)
+        self.pwm_ENA.start(0)
+        self.pwm_ENB.start(0)
+
+    def command(self, name):
+        levels, duty = LEGACY[name]
+        if self.leds:
+            print('motor ' + name)
+        self.pwm_ENA.ChangeDutyCycle(duty)
+        self.pwm_ENB.ChangeDutyCycle(duty)
+        for pin, level in zip((IN1, IN2, IN3, IN4), levels):
+            self.gpio.output(pin, level)
+        if self.leds:
+            led1, led2 = LEGACY_LEDS[name]
+            self.gpio.output(LED1, led1)
+            self.gpio.output(LED2, led2)
+
+
+class Driven:
+    def __init__(self, gpio, leds=False):
+        self.gpio = gpio
+        self.leds = leds
+        self.driver = motors.MotorDriver(gpio)
+        self.driver.setup()
+        self.led_pins = motors.PinShadow(gpio)
+        for pin in (LED1, LED2):
+            self.led_pins.assume(pin, gpio.HIGH)
+
+    def command(self, name):
+        if getattr(self.driver, name)() and self.leds:
+            print('motor ' + name)
+        if self.leds:
+            led1, led2 = LEGACY_LEDS[name]
+            self.led_pins.output(LED1, led1)
+            self.led_pins.output(LED2, led2)
+
+
+# Comandi per giro di Smart_Patrol
+def patrol(ticks, rng):
+    for _ in range(ticks):
+        roll = rng.random()
+        if roll < 0.85:
+            yield ("forward",)
+        elif roll < 0.95:
+            yield (rng.choice(("forward", "turn_left", "turn_right")), "stop")
+        else:
+            yield ("stop", "backward", "stop", rng.choice(("turn_left", "turn_right")), "stop")
+
+
+# Avoiding ogni 10 ms: tratti lunghi avanti, brevi soste davanti all'ostacolo
+def cruising(ticks, rng):
+    blocked = False
+    for _ in range(ticks):
+        if rng.random() < 0.01:
+            blocked = not blocked
+        yield ("stop",) if blocked else ("forward",)
+
+
+def run(rover_class, scenario, ticks, leds):
+    gpio = make_gpio(leds)
+    rover = rover_class(gpio, leds)
+    counter = Counter(gpio)
+    start_calls = counter.calls()
+    sink = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for tick in scenario(ticks, random.Random(SEED)):
+            for name in tick:
+                rover.command(name)
+    elapsed = time.perf_counter() - start
+    return (counter.calls() - start_calls) / ticks, elapsed / ticks * 1e6, sink.getvalue().count('\n') / ticks
+
+
+def pins(gpio):
+    levels = tuple(gpio.levels[pin] for pin in (IN1, IN2, IN3, IN4))
+    return levels, gpio.pwms[ENA].duty, gpio.pwms[ENB].duty
+
+
+# Stesso stato finale dell'originale dopo ogni coppia di comandi
+def check_same_state():
+    for first in LEGACY:
+        for second in LEGACY:
+            results = []
+            for rover_class in (Legacy, Driven):
+                gpio = make_gpio()
+                rover = rover_class(gpio)
+                rover.command(first)
+                rover.command(second)
+                results.append(pins(gpio))
+            if results[0] != results[1]:
+                return False
+    return True
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+# Controlla lo stato del ponte dopo ogni singola scrittura
+def check_glitches():
+    commands = [(100, 100), (-100, -100), (-100, 100), (100, -100), (0, 0), (60, 30), (-40, 80)]
+    for first in commands:
+        for second in commands:
+            gpio = FakeGPIO()
+            driver = motors.MotorDriver(gpio)
+            driver.setup()
+            driver.drive(*first)
+            bad = []
+
+            # Con duty > 0 il verso e' quello finale, oppure ancora quello
+            # iniziale con un duty non piu' alto di prima
+            def check(channel, value):
+                wheels = ((first[0], second[0], ENB, IN3, IN4), (first[1], second[1], ENA, IN1, IN2))
+                for before, after, enable, forward, backward in wheels:
+                    fwd, back = gpio.levels[forward], gpio.levels[backward]
+                    direction = fwd - back
+                    duty = gpio.pwms[enable].duty
+                    allowed = direction == sign(after) or (direction == sign(before) and duty <= abs(before))
+                    if (fwd and back) or (duty > 0 and not allowed):
+                        bad.append((first, second, channel, value))
+
+            for pin in (IN1, IN2, IN3, IN4):
+                gpio.on_output(pin, check)
+            gpio.on_pwm(check)
+            driver.drive(*second)
+            if bad:
+                return False
+    return True
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else TICKS
+
+    print("chiamate GPIO e tempo per giro      originale            driver       risparmio")
+    for title, scenario, leds in (("pattugliamento (ProgettoRover)", patrol, False),
+                                  ("pattugliamento (wifirobots)", patrol, True),
+                                  ("crociera IR (wifirobots)", cruising, True)):
+        old_calls, old_us, old_prints = run(Legacy, scenario, ticks, leds)
+        new_calls, new_us, new_prints = run(Driven, scenario, ticks, leds)
+        print("  {:<31} {:5.2f} {:6.2f} us   {:5.2f} {:6.2f} us   {:5.1f}%".format(
+            title, old_calls, old_us, new_calls, new_us, 100 * (1 - new_calls / old_calls)))
+        if leds:
+            print("  {:<31} {:5.2f} print/giro   {:5.2f} print/giro".format("", old_prints, new_prints))
+
+    failed = False
+    for name, ok in (("stesso stato dell'originale", check_same_state()),
+                     ("nessun verso sbagliato con duty > 0", check_glitches())):
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# ProgettoRover.py nel simulatore (appartamento di tre stanze, tempo
+# virtuale) con due regole per where_to_go:
+#   massimo:   la direzione con la distanza maggiore tra sinistra, centro e
+#              destra (PLANNER = False, il default)
+#   frontiere: il percorso di planner.py verso le zone inesplorate, finche'
+#              la posa stimata ha percorso PLANNER_MAX_DISTANCE
+# Ogni modo parte da POSES, con l'odometria esatta e con le ruote che
+# slittano (traction come in bench_mapping.py: la posa stimata dai comandi
+# ai motori deriva). Ogni corsa gira in un processo a parte (lo stato di
+# ProgettoRover e' nel modulo).
+# Misure, sommate o mediate sulle partenze: parte dell'appartamento vista
+# a meta' e alla fine (letture messe in una mappa con la posa vera: con la
+# deriva la mappa del rover e' storta), deriva finale della posa, curve
+# DESTRA/SINISTRA alternate senza spostarsi (tentennamenti), urti, CPU di
+# plan() per giro.
+# Verifiche (uscita 1 se falliscono):
+#   - la trasformata di distanza troncata coincide con il calcolo diretto
+#   - a fine prova i dati aggiornati a pezzi coincidono con un ricalcolo
+#     completo della mappa
+#   - plan() resta nel budget di CPU per giro (p99)
+#   - con le frontiere si vede almeno tanto quanto col massimo, con e senza
+#     slittamento, senza piu' tentennamenti e senza piu' urti
+#
+# Uso: python3 bench_planner.py [--seconds 600]
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import bench_mapping
+import mapping
+import planner
+import simulate
+import simulator
+
+MODES = ("massimo", "frontiere")
+ODOMETRY = (("esatta", None), ("slittamento", bench_mapping.TRACTION))
+POSES = ((1.0, 0.6, 0.0), (6.0, 5.0, math.pi), (2.0, 3.0, math.pi / 2), (6.0, 2.5, 0.0))
+BUDGET_SLACK = 1.5      # plan() puo' superare il budget dell'aggiornamento della mappa, non interrompibile
+SEED = 1
+STILL = 0.15            # m percorsi tra due decisioni sotto cui il rover e' rimasto fermo
+
+
+# Direzioni prese, dai log di where_to_go, con i metri percorsi fino a li'
+class Directions(logging.Handler):
+    def __init__(self, sim):
+        super().__init__()
+        self.sim = sim
+        self.taken = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("Direzione presa: "):
+            self.sim.update()
+            self.taken.append((message[len("Direzione presa: "):], self.sim.stats["distance"]))
+
+    # Curve nel verso opposto alla precedente senza essersi spostati: il
+    # rover tentenna sul posto
+    def dithering(self):
+        turns = [(direction, travelled) for direction, travelled in self.taken if direction != "AVANTI"]
+        return sum(1 for (a, da), (b, db) in zip(turns, turns[1:]) if a != b and db - da < STILL)
+
+
+# Parte delle celle della stanza (fuori dagli ostacoli) gia' viste nella mappa
+def coverage(grid, world, start):
+    x0, y0, h0 = start
+    columns, rows = np.meshgrid(np.arange(grid.cells), np.arange(grid.cells))
+    mx = grid.origin[0] + (columns + 0.5) * grid.resolution
+    my = grid.origin[1] + (rows + 0.5) * grid.resolution
+    xs = x0 + mx * np.cos(h0) - my * np.sin(h0)
+    ys = y0 + mx * np.sin(h0) + my * np.cos(h0)
+    xa, ya, xb, yb = 0.0, 0.0, 8.0, 6.0
+    inside = (xs > xa) & (xs < xb) & (ys > ya) & (ys < yb)
+    room = [(r, c) for r, c in zip(*np.nonzero(inside)) if world.clearance(xs[r, c], ys[r, c]) > grid.resolution]
+    threshold = np.log(mapping.OCCUPIED / (1 - mapping.OCCUPIED))
+    known = np.abs(grid.log_odds) >= threshold
+    return sum(1 for r, c in room if known[r, c]) / len(room)
+
+
+# Appartamento 8 x 6 m: tre stanze con porte da 0.9 m, tavolo e pilastri.
+# Il sonar (4 m) non vede tutto da un punto solo: bisogna esplorare.
+def apartment():
+    world = simulator.World()
+    world.add_box(0.0, 0.0, 8.0, 6.0)
+    world.walls += [(4.0, 0.0, 4.0, 2.0), (4.0, 2.9, 4.0, 6.0),
+                    (4.0, 3.5, 5.5, 3.5), (6.4, 3.5, 8.0, 3.5)]
+    world.add_box(1.6, 1.2, 2.2, 1.6)
+    world.pillars += [(0.8, 4.2, 0.10), (6.5, 1.2, 0.15), (2.5, 4.8, 0.15)]
+    return world
+
+
+def run_child(mode, seconds, pose, traction):
+    sim = simulator.Simulator(apartment(), pose=pose, traction=traction)
+    start = (sim.x, sim.y, sim.heading)
+    simulate.attach(sim)
+    directions = Directions(sim)
+    logging.getLogger().addHandler(directions)
+    logging.getLogger().setLevel(logging.INFO)
+    costs = []
+    halfway = []
+
+    # Ogni lettura anche con la posa vera, per la parte vista davvero
+    true_readings = []
+    estimated = mapping.reading
+
+    def reading(estimate, angle, distance):
+        true_readings.append(estimated(bench_mapping.to_map(start, sim.x, sim.y, sim.heading), angle, distance))
+        return estimated(estimate, angle, distance)
+
+    mapping.reading = reading
+    sim.start(seconds)
+    try:
+        import ProgettoRover
+        ProgettoRover.PLANNER = mode == "frontiere"
+        plan = ProgettoRover.path_planner.plan
+
+        def timed(pose):
+            turn = plan(pose)
+            costs.append(ProgettoRover.path_planner.last_cost * 1e3)
+            return turn
+
+        ProgettoRover.path_planner.plan = timed
+        sim.scheduler.at(sim.scheduler.now_ns + int(seconds / 2 * 1e9),
+                         lambda: halfway.append(len(true_readings)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulate.run_program("loop_rover")
+        final = ProgettoRover.dead_reckoning.pose()
+    finally:
+        sim.stop()
+        mapping.reading = estimated
+
+    grid = ProgettoRover.occupancy
+    path_planner = ProgettoRover.path_planner
+    half = mapping.OccupancyGrid()
+    half.integrate(true_readings[:halfway[0] if halfway else 0])
+    seen = mapping.OccupancyGrid()
+    seen.integrate(true_readings)
+    path_planner.update()
+    full = planner.Planner(grid)
+    same = all(np.array_equal(getattr(path_planner, name), getattr(full, name))
+               for name in ("occupied", "free", "clearance", "cost", "frontier"))
+    true_final = bench_mapping.to_map(start, sim.x, sim.y, sim.heading)
+    result = {
+        "coverage_half": coverage(half, sim.world, start),
+        "coverage": coverage(seen, sim.world, start),
+        "drift": math.hypot(final[0] - true_final[0], final[1] - true_final[1]),
+        "flips": directions.dithering(),
+        "decisions": len(directions.taken),
+        "collisions": sim.stats["collisions"],
+        "distance": sim.stats["distance"],
+        "plan_ms": sorted(costs),
+        "incremental_same": same,
+    }
+    sys.stdout.write("RESULT " + json.dumps(result) + "\n")
+    sys.stdout.flush()
+    # I thread del programma restano fermi nelle attese virtuali
+    os._exit(0)
+
+
+def run_once(mode, seconds, pose, traction):
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--seconds", str(seconds),
+               "--pose", ",".join(map(str, pose))]
+    if traction is not None:
+        command += ["--traction", str(traction)]
+    done = subprocess.run(command, capture_output=True, text=True)
+    for line in reversed(done.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError((done.stderr.strip().splitlines() or ["uscita {}".format(done.returncode)])[-1])
+
+
+# Un modo da tutte le partenze: aree e deriva medie, conteggi sommati
+def run_mode(mode, seconds, traction):
+    runs = [run_once(mode, seconds, pose, traction) for pose in POSES]
+    result = {name: sum(r[name] for r in runs) / len(runs) for name in ("coverage_half", "coverage", "drift")}
+    result.update({name: sum(r[name] for r in runs) for name in ("flips", "decisions", "collisions", "distance")})
+    result["plan_ms"] = sorted(cost for r in runs for cost in r["plan_ms"])
+    result["incremental_same"] = all(r["incremental_same"] for r in runs)
+    return result
+
+
+# Trasformata troncata contro la distanza diretta da ogni ostacolo
+def distance_exact():
+    rng = np.random.default_rng(SEED)
+    grid = mapping.OccupancyGrid(size=3.0)
+    grid.log_odds[rng.random(grid.log_odds.shape) < 0.01] = mapping.L_LIMIT
+    grid.log_odds[20:22, 10:40] = mapping.L_LIMIT
+    path_planner = planner.Planner(grid)
+    rows, columns = np.nonzero(grid.log_odds > 0)
+    r, c = np.mgrid[0:grid.cells, 0:grid.cells]
+    exact = np.min(np.hypot(r[..., None] - rows, c[..., None] - columns), axis=-1)
+    exact = np.minimum(exact, planner.REACH + 1) * grid.resolution
+    empty = planner.Planner(mapping.OccupancyGrid())
+    start = time.perf_counter()
+    empty.update((0, empty.grid.cells, 0, empty.grid.cells))
+    full_ms = (time.perf_counter() - start) * 1e3
+    return np.allclose(path_planner.clearance, exact, atol=1e-5), full_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esplorazione per frontiere contro la regola del massimo")
+    parser.add_argument("--seconds", type=float, default=600.0, help="durata virtuale per modo (s)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--pose", help=argparse.SUPPRESS)
+    parser.add_argument("--traction", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.seconds, tuple(map(float, args.pose.split(","))), args.traction)
+        return
+
+    exact, full_ms = distance_exact()
+    results = {(odometry, mode): run_mode(mode, args.seconds, traction)
+               for odometry, traction in ODOMETRY for mode in MODES}
+    print("{:.0f} s virtuali per corsa, {} partenze; mappa intera ricalcolata in {:.1f} ms".format(
+        args.seconds, len(POSES), full_ms))
+    print("odometria    modo         area vista   deriva  tentennamenti  urti  percorso   plan() ms per giro")
+    print("                          meta'   fine      m    /decisioni           m      p50    p99    max")
+    for (odometry, mode), r in results.items():
+        costs = r["plan_ms"]
+        timing = "{:6.2f} {:6.2f} {:6.2f}".format(
+            costs[len(costs) // 2], costs[int(len(costs) * 0.99)], costs[-1]) if costs else "     -"
+        print("  {:<11} {:<10} {:5.0%}  {:5.0%}  {:6.2f}    {:4d} / {:<4d}   {:4d}  {:6.1f}   {}".format(
+            odometry, mode, r["coverage_half"], r["coverage"], r["drift"], r["flips"], r["decisions"],
+            r["collisions"], r["distance"], timing))
+
+    plain, frontier = results["esatta", "massimo"], results["esatta", "frontiere"]
+    slip_plain, slip_frontier = results["slittamento", "massimo"], results["slittamento", "frontiere"]
+    costs = frontier["plan_ms"] + slip_frontier["plan_ms"]
+    costs.sort()
+    checks = [
+        ("trasformata di distanza esatta", exact),
+        ("aggiornamento a pezzi = ricalcolo completo", frontier["incremental_same"] and slip_frontier["incremental_same"]),
+        ("plan() nel budget di CPU (p99)", costs[int(len(costs) * 0.99)] <= planner.BUDGET * 1e3 * BUDGET_SLACK),
+        ("frontiere: area vista almeno come massimo", frontier["coverage"] >= plain["coverage"]),
+        ("slittamento: area vista almeno come massimo", slip_frontier["coverage"] >= slip_plain["coverage"]),
+        ("frontiere: non piu' tentennamenti", frontier["flips"] / frontier["decisions"] <= plain["flips"] / plain["decisions"]),
+        ("frontiere: non piu' urti", frontier["collisions"] <= plain["collisions"]),
+        ("slittamento: non piu' urti", slip_frontier["collisions"] <= slip_plain["collisions"]),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Rampe dei motori nel simulatore, con ruote ad aderenza limitata
+# (simulator.Simulator(traction=...)).
+#   gradino: motors.MotorDriver comandato direttamente, come motor_forward
+#            e motor_backward prima delle rampe
+#   rampa:   motors.MotionProfile sopra lo stesso driver
+# Sequenza: quella di emergenza di where_to_go in ProgettoRover.py, avanti a
+# tutta, motor_stop, pochi ms dopo indietro al 50%, poi rotazione e stop.
+# motor_stop con il profilo e' emergency_stop (immediato), le partenze sono
+# a rampa.
+# Misure:
+#   - tempo di slittamento delle ruote (il motore chiede piu' dell'aderenza)
+#   - salto massimo di duty in salita o con cambio di verso tra due
+#     scritture (picco di corrente; scendere a 0 lascia la ruota in folle)
+#   - spazio di arresto da avanti a tutta: stop del driver, stop a rampa e
+#     emergency_stop del profilo
+# Il grafico in testo mostra il duty comandato (.) e quello della rampa (*)
+# della ruota sinistra; con --csv si salvano i campioni per un grafico vero.
+# Verifiche (uscita 1 se falliscono): nessuno slittamento con la rampa,
+# emergency_stop non piu' lungo dello stop diretto.
+#
+# Uso: python3 bench_profile.py [--csv file.csv]
+
+import argparse
+import csv
+import sys
+
+import motors
+import simulator
+
+TRACTION = 1.5        # m/s^2 di aderenza delle ruote
+SAMPLE = 0.01         # s tra due campioni
+PLOT_WIDTH = 72
+PLOT_ROWS = 11
+
+# (s di attesa dopo il comando, metodo, argomenti)
+SEQUENCE = [
+    (1.5, "forward", (100,)),
+    (0.005, "emergency_stop", ()),
+    (1.0, "backward", (50,)),
+    (0.8, "turn_left", (100,)),
+    (0.7, "emergency_stop", ()),
+]
+
+# Duty comandati (sinistra, destra)
+TARGETS = {
+    "forward": lambda speed: (speed, speed),
+    "backward": lambda speed: (-speed, -speed),
+    "turn_left": lambda speed: (-speed, speed),
+    "turn_right": lambda speed: (speed, -speed),
+    "stop": lambda: (0, 0),
+    "emergency_stop": lambda: (0, 0),
+}
+
+
+class Run:
+    def __init__(self, profiled):
+        self.sim = simulator.Simulator(world=simulator.World(), pose=(0.0, 0.0, 0.0), traction=TRACTION)
+        self.sim.start()
+        self.gpio = self.sim.gpio
+        self.driver = motors.MotorDriver(self.gpio)
+        self.driver.setup()
+        self.profile = motors.MotionProfile(self.driver).start() if profiled else None
+        self.target = (0, 0)
+        self.samples = []
+        self.jump = 0.0
+        self._duty = {}
+        self.gpio.on_pwm(self._on_pwm)
+
+    # Duty con segno scritto sul ponte, per ruota
+    def _on_pwm(self, channel, duty):
+        levels = self.gpio.levels
+        for enable, forward, backward in self.driver.wheels.values():
+            if channel == enable:
+                signed = duty * ((1 if levels.get(forward) else 0) - (1 if levels.get(backward) else 0))
+                old = self._duty.get(enable, 0)
+                # Conta la spinta in piu': il duty che sale o il cambio di verso
+                rise = abs(signed) if signed * old < 0 else abs(signed) - abs(old)
+                self.jump = max(self.jump, rise)
+                self._duty[enable] = signed
+
+    # motor_stop dei programmi e' emergency_stop con il profilo
+    def command(self, method, *args):
+        if self.profile is None:
+            getattr(self.driver, "stop" if method == "emergency_stop" else method)(*args)
+        else:
+            getattr(self.profile, method)(*args)
+        self.target = TARGETS[method](*args)
+
+    # Aspetta seconds s virtuali campionando
+    def hold(self, seconds):
+        end = self.sim.elapsed() + seconds
+        while self.sim.elapsed() < end - 1e-9:
+            step = min(SAMPLE, end - self.sim.elapsed())
+            simulator._sleep(step)
+            left, right = self.sim.wheel_speeds()
+            duty = self.profile.speeds()[0][0] if self.profile else self.target[0]
+            self.samples.append((self.sim.elapsed(), self.target[0], duty, left))
+
+    def settle(self, limit=5.0):
+        end = self.sim.elapsed() + limit
+        while self.sim.elapsed() < end and any(abs(v) > 1e-9 for v in self.sim.wheel_speeds()):
+            self.hold(SAMPLE)
+
+    def close(self):
+        if self.profile:
+            self.profile.close()
+        self.sim.stop()
+
+
+def sequence(profiled):
+    run = Run(profiled)
+    try:
+        for seconds, method, args in SEQUENCE:
+            run.command(method, *args)
+            run.hold(seconds)
+    finally:
+        run.close()
+    return run
+
+
+# Spazio percorso dal comando di arresto alle ruote ferme
+def stopping_distance(profiled, method):
+    run = Run(profiled)
+    try:
+        run.command("forward", 100)
+        run.hold(1.5)
+        start = (run.sim.x, run.sim.y)
+        run.command(method)
+        run.settle()
+        return ((run.sim.x - start[0]) ** 2 + (run.sim.y - start[1]) ** 2) ** 0.5
+    finally:
+        run.close()
+
+
+def plot(samples):
+    columns = [samples[int(i * len(samples) / PLOT_WIDTH)] for i in range(PLOT_WIDTH)]
+    rows = []
+    for row in range(PLOT_ROWS):
+        level = 100 - row * 200 / (PLOT_ROWS - 1)
+        line = ""
+        for _, target, duty, _ in columns:
+            near = lambda value: abs(value - level) <= 100 / (PLOT_ROWS - 1)
+            line += "*" if near(duty) else "." if near(target) else " "
+        rows.append("  {:5.0f} |{}".format(level, line))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--csv", help="scrive i campioni della sequenza (t, comando, rampa, m/s) in CSV")
+    args = parser.parse_args()
+
+    step = sequence(False)
+    ramp = sequence(True)
+    print("aderenza {} m/s^2, rampa {:.0f} %/s, jerk {:.0f} %/s^2".format(TRACTION, motors.ACCEL, motors.JERK))
+    print("sequenza di emergenza           gradino      rampa")
+    print("  slittamento (s)               {:7.3f}    {:7.3f}".format(step.sim.stats["slip"], ramp.sim.stats["slip"]))
+    print("  salto di duty in salita (%)   {:7.1f}    {:7.1f}".format(step.jump, ramp.jump))
+
+    distances = {
+        "stop del driver": stopping_distance(False, "emergency_stop"),
+        "stop a rampa": stopping_distance(True, "stop"),
+        "emergency_stop": stopping_distance(True, "emergency_stop"),
+    }
+    print("spazio di arresto da avanti a tutta:")
+    for name, distance in distances.items():
+        print("  {:<28} {:7.1f} cm".format(name, distance * 100))
+
+    print("duty ruota sinistra, rampa (. comando, * rampa), {:.1f} s:".format(ramp.samples[-1][0]))
+    for row in plot(ramp.samples):
+        print(row)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["t", "comando", "rampa", "ruota_m_s", "gradino_ruota_m_s"])
+            for (t, target, duty, speed), (_, _, _, step_speed) in zip(ramp.samples, step.samples):
+                writer.writerow(["{:.3f}".format(t), target, "{:.1f}".format(duty),
+                                 "{:.4f}".format(speed), "{:.4f}".format(step_speed)])
+
+    failed = False
+    for name, ok in (("nessuno slittamento con la rampa", ramp.sim.stats["slip"] == 0),
+                     ("emergency_stop corto come lo stop diretto",
+                      distances["emergency_stop"] <= distances["stop del driver"] + 1e-3)):
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
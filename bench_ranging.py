@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark della misura ultrasonica su GPIO finto: confronta il vecchio
+# ciclo di attesa attiva su GPIO.input(ECHO) con il ranger a interrupt.
+# Per ogni metodo riporta latenza (fine echo -> distanza disponibile),
+# tempo CPU per misura ed errore, con echo normali e con echo persi.
+# Verifiche (uscita 1 se falliscono):
+#   - con ECHO rimasto alto dal ping prima, la sua discesa dopo il trigger
+#     non viene presa per l'inizio dell'echo
+#   - con i callback in ritardo di LATE (piu' dell'echo di un ostacolo a
+#     NEAR) tutte le misure escono lo stesso, con la mediana giusta
+#
+# Uso: python3 bench_ranging.py [numero_misure]
+
+import queue
+import sys
+import threading
+import time
+
+import ranging
+from fake_gpio import FakeGPIO, EchoResponder
+
+TRIG = 17
+ECHO = 4
+DISTANCE = 0.80
+SPURIOUS_FALL = 100000   # ns dopo il trigger
+SPURIOUS_RUNS = 5
+NEAR = 0.03              # m, echo di circa 180us
+LATE = 0.001             # s di ritardo dei callback dei fronti
+TOLERANCE = 0.05         # m, con i thread di Python su una CPU sola il ritardo dei callback varia
+
+
+# Copia della vecchia get_distance di ProgettoRover.py
+def busy_wait_distance(gpio):
+    gpio.output(TRIG, gpio.HIGH)
+    time.sleep(0.000015)
+    gpio.output(TRIG, gpio.LOW)
+
+    timeout = time.time() + 0.5
+    while not gpio.input(ECHO):
+        if time.time() > timeout:
+            return 999
+    t1 = time.time()
+
+    timeout = time.time() + 0.5
+    while gpio.input(ECHO):
+        if time.time() > timeout:
+            return 999
+    t2 = time.time()
+
+    return (t2 - t1) * 340 / 2
+
+
+def make_gpio(distance):
+    gpio = FakeGPIO()
+    gpio.setup(TRIG, gpio.OUT, initial=gpio.LOW)
+    gpio.setup(ECHO, gpio.IN)
+    responder = EchoResponder(gpio, TRIG, ECHO, lambda: distance)
+    return gpio, responder
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(name, measure, responder, samples):
+    latencies = []
+    errors = []
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    for _ in range(samples):
+        distance = measure()
+        done = time.monotonic_ns()
+        if responder.last_fall_ns is not None and distance != 999:
+            latencies.append((done - responder.last_fall_ns) / 1000)
+            errors.append(abs(distance - DISTANCE) * 100)
+        time.sleep(0.005)
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start - samples * 0.005
+    if not latencies:
+        # Con l'attesa attiva il thread del GPIO finto puo' non riuscire a girare
+        print("{:<12} nessuna misura riuscita su {}".format(name, samples))
+        return
+    print("{:<12} lat p50 {:8.1f}us p99 {:8.1f}us  err p50 {:5.2f}cm  CPU {:6.2f}ms/misura ({:5.1f}% del tempo di misura)".format(
+        name, percentile(latencies, 50), percentile(latencies, 99), percentile(errors, 50),
+        cpu * 1000 / samples, 100 * cpu / max(wall, 1e-9)))
+
+
+def run_lost(name, measure):
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    measure()
+    print("{:<12} echo perso: bloccato {:6.1f}ms, CPU {:6.1f}ms".format(
+        name, (time.monotonic() - wall_start) * 1000, (time.process_time() - cpu_start) * 1000))
+
+
+# ECHO alto prima del trigger (coda del ping precedente) che scende
+# SPURIOUS_FALL dopo il trigger, prima dell'echo vero; SPURIOUS_RUNS volte
+def spurious_edge():
+    gpio, responder = make_gpio(DISTANCE)
+    ranger = ranging.UltrasonicRanger(gpio, TRIG, ECHO)
+    ranger.start()
+    gpio.on_output(TRIG, lambda channel, level: None if level else
+                   gpio.inject(ECHO, gpio.LOW, gpio.clock() + SPURIOUS_FALL))
+    readings = []
+    for _ in range(SPURIOUS_RUNS):
+        gpio.inject(ECHO, gpio.HIGH)
+        time.sleep(0.01)
+        readings.append(ranger.measure())
+    gpio.stop()
+    return readings, ranger.spurious
+
+
+# GPIO con i callback dei fronti consegnati in ritardo da un thread, in
+# ordine, come il thread degli eventi di RPi.GPIO sotto carico
+class LateGPIO:
+    def __init__(self, gpio, delay):
+        self._gpio = gpio
+        self._delay = delay
+        self._queue = queue.Queue()
+        threading.Thread(target=self._deliver, daemon=True).start()
+
+    def __getattr__(self, name):
+        return getattr(self._gpio, name)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        def late(channel):
+            self._queue.put((time.monotonic() + self._delay, callback, channel))
+        self._gpio.add_event_detect(channel, edge, callback=late)
+
+    def _deliver(self):
+        while True:
+            due, callback, channel = self._queue.get()
+            time.sleep(max(0.0, due - time.monotonic()))
+            callback(channel)
+
+
+# Ostacolo vicino con i callback in ritardo: al callback della salita ECHO
+# e' gia' di nuovo basso
+def late_callbacks():
+    gpio, responder = make_gpio(NEAR)
+    ranger = ranging.UltrasonicRanger(LateGPIO(gpio, LATE), TRIG, ECHO)
+    ranger.start()
+    readings = [ranger.measure() for _ in range(20)]
+    gpio.stop()
+    return readings
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print("Misure: {}  distanza simulata: {:.2f}m\n".format(samples, DISTANCE))
+
+    gpio, responder = make_gpio(DISTANCE)
+    run("busy-wait", lambda: busy_wait_distance(gpio), responder, samples)
+    gpio.stop()
+
+    gpio, responder = make_gpio(DISTANCE)
+    ranger = ranging.UltrasonicRanger(gpio, TRIG, ECHO)
+    ranger.start()
+
+    def interrupt_distance():
+        reading = ranger.measure()
+        return 999 if reading.status != ranging.OK else reading.distance
+
+    run("interrupt", interrupt_distance, responder, samples)
+    gpio.stop()
+
+    print("")
+    gpio, responder = make_gpio(None)
+    run_lost("busy-wait", lambda: busy_wait_distance(gpio))
+    gpio.stop()
+
+    gpio, responder = make_gpio(None)
+    ranger = ranging.UltrasonicRanger(gpio, TRIG, ECHO)
+    ranger.start()
+    run_lost("interrupt", ranger.measure)
+    ranger.trigger()
+    start = time.monotonic()
+    ranger.poll()
+    print("{:<12} echo perso, poll() non bloccante: {:6.1f}us".format("interrupt", (time.monotonic() - start) * 1e6))
+    gpio.stop()
+
+    readings, spurious = spurious_edge()
+    distances = [r.distance for r in readings if r.status == ranging.OK]
+    print("")
+    print("discesa spuria dopo il trigger: {} fronti scartati su {} misure, mediana {}".format(
+        spurious, len(readings), "n/d" if not distances else "{:.3f}m".format(percentile(distances, 50))))
+    late = late_callbacks()
+    measured = [r.distance for r in late if r.status == ranging.OK]
+    print("callback in ritardo di {:.1f}ms, ostacolo a {:.2f}m: {} misure su {}, mediana {}".format(
+        LATE * 1e3, NEAR, len(measured), len(late),
+        "n/d" if not measured else "{:.3f}m".format(percentile(measured, 50))))
+
+    checks = [
+        ("discesa spuria ignorata",
+         len(distances) == len(readings) and abs(percentile(distances, 50) - DISTANCE) < TOLERANCE and
+         spurious == len(readings)),
+        ("callback in ritardo: ostacolo vicino misurato",
+         len(measured) == len(late) and abs(percentile(measured, 50) - NEAR) < TOLERANCE),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
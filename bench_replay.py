@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Registrazione e riesecuzione delle tracce dei sensori (replay.py).
+# Si registra una pattuglia di ProgettoRover.py nel simulatore (ROVER_TRACE,
+# come sul rover) e la si riesegue:
+#   - veloce, con il codice invariato: le uscite devono coincidere tutte
+#   - veloce, con DANGER_DISTANCE cambiata: la differenza va trovata
+#   - in tempo reale (primi REALTIME s): deve durare quanto la traccia e
+#     le uscite devono coincidere tutte come nella corsa veloce
+# Misure: secondi di traccia per secondo reale, byte di traccia per secondo
+# di pattuglia, costo di una lettura e di una scrittura sul GPIO registrato
+# rispetto al GPIO nudo.
+# Ogni corsa gira in un processo a parte (i programmi hanno stato globale).
+# Verifiche (uscita 1 se falliscono): quelle sopra, riesecuzione veloce
+# almeno MIN_SPEEDUP volte il tempo reale, registrazione sotto MAX_CALL_US
+# in piu' per chiamata.
+#
+# Uso: python3 bench_replay.py [--seconds 300] [--program loop_rover]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import replay
+import simulate
+from fake_gpio import FakeGPIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+REALTIME = 10.0         # s di traccia rieseguiti in tempo reale
+REALTIME_SLACK = 0.5    # s di scarto ammessi sulla durata in tempo reale
+MIN_SPEEDUP = 20        # volte il tempo reale, riesecuzione veloce
+MAX_CALL_US = 5.0       # us in piu' per chiamata GPIO registrata
+CHANGE = 0.10           # m aggiunti a DANGER_DISTANCE nella corsa modificata
+CALLS = 200000
+
+
+def run_child(path, program, mode):
+    trace = replay.load(path)
+    if mode == "modificato":
+        run_program = simulate.run_program
+
+        def changed(name):
+            import ProgettoRover
+            ProgettoRover.DANGER_DISTANCE += CHANGE
+            run_program(name)
+
+        simulate.run_program = changed
+    realtime = mode == "tempo reale"
+    seconds = REALTIME if realtime else None
+    gpio, real = replay.run(trace, program, realtime=realtime, seconds=seconds)
+    length = replay.duration(trace) if seconds is None else min(replay.duration(trace), seconds)
+    result = replay.compare(replay.actions(trace), gpio.actions, int((length - replay.TAIL) * 1e9))
+    result.update({"seconds": length, "real": real})
+    sys.stdout.write("RESULT " + json.dumps(result) + "\n")
+    sys.stdout.flush()
+    # I thread del programma restano fermi nelle attese virtuali
+    os._exit(0)
+
+
+def run_mode(path, program, mode):
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--trace", path, "--program", program]
+    done = subprocess.run(command, capture_output=True, text=True)
+    for line in reversed(done.stdout.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError((done.stderr.strip().splitlines() or ["uscita {}".format(done.returncode)])[-1])
+
+
+# Pattuglia nel simulatore registrata come sul rover, con ROVER_TRACE
+def record(path, program, seconds):
+    env = dict(os.environ, ROVER_TRACE=path)
+    subprocess.run([sys.executable, os.path.join(HERE, "simulate.py"), program, "--seconds", str(seconds)],
+                   env=env, check=True, capture_output=True)
+
+
+# us per chiamata di input/output, GPIO nudo e registrato
+def call_cost(directory):
+    costs = []
+    for recorded in (False, True):
+        gpio = FakeGPIO()
+        if recorded:
+            gpio = replay.RecordingGPIO(gpio, replay.TraceWriter(os.path.join(directory, "costo.rvt")))
+        gpio.setup(27, gpio.IN)
+        gpio.setup(21, gpio.OUT)
+        start = time.perf_counter()
+        for i in range(CALLS):
+            gpio.input(27)
+            gpio.output(21, i & 1)
+        costs.append((time.perf_counter() - start) / (2 * CALLS) * 1e6)
+        gpio.cleanup()
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registrazione e riesecuzione delle tracce dei sensori")
+    parser.add_argument("--seconds", type=float, default=300.0, help="durata virtuale della pattuglia registrata (s)")
+    parser.add_argument("--program", default="loop_rover", choices=("loop_rover", "test_nomqtt"))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--trace", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.trace, args.program, args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "pattuglia.rvt")
+        record(path, args.program, args.seconds)
+        trace = replay.load(path)
+        size = os.path.getsize(path)
+        results = {mode: run_mode(path, args.program, mode) for mode in ("invariato", "modificato", "tempo reale")}
+        bare_us, recorded_us = call_cost(directory)
+
+    length = replay.duration(trace)
+    print("{}: {:.0f} s registrati, {} record, {:.1f} kB ({:.0f} byte/s), {} ping".format(
+        args.program, length, len(trace.records), size / 1e3, size / length, len(replay.pings(trace))))
+    print("chiamata GPIO: nuda {:.2f} us, registrata {:.2f} us".format(bare_us, recorded_us))
+    print("corsa          traccia s   reali s   velocita'   uscite uguali      prima differenza")
+    for mode, r in results.items():
+        print("  {:<12} {:9.1f} {:9.2f} {:9.0f}x   {:6d} / {:<6d}   {}".format(
+            mode, r["seconds"], r["real"], r["seconds"] / r["real"], r["matched"], r["recorded"],
+            "-" if r["divergence_s"] is None else "{:.3f} s".format(r["divergence_s"])))
+
+    same, changed, realtime = results["invariato"], results["modificato"], results["tempo reale"]
+    checks = [
+        ("codice invariato: uscite tutte uguali", same["divergence_s"] is None and same["matched"] > 0),
+        ("DANGER_DISTANCE cambiata: differenza trovata", changed["divergence_s"] is not None),
+        ("riesecuzione veloce almeno {}x".format(MIN_SPEEDUP), same["seconds"] / same["real"] >= MIN_SPEEDUP),
+        ("tempo reale: dura quanto la traccia", abs(realtime["real"] - realtime["seconds"]) <= REALTIME_SLACK),
+        ("tempo reale: uscite tutte uguali", realtime["divergence_s"] is None and realtime["matched"] > 0),
+        ("registrazione sotto {} us per chiamata".format(MAX_CALL_US), recorded_us - bare_us <= MAX_CALL_US),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark del campionamento in background su GPIO finto: costo di una
+# lettura dal buffer circolare rispetto a un ping bloccante, e contatori
+# del campionatore dopo qualche secondo di funzionamento.
+# Verifiche (uscita 1 se falliscono): un lettore lento doppiato dallo
+# scrittore non restituisce record a meta' scrittura, ne' a passi
+# (scrittore fermo dentro la copia) ne' con un thread che scrive di
+# continuo.
+#
+# Uso: python3 bench_sampler.py [secondi]
+
+import sys
+import threading
+import time
+
+import ranging
+import sampler
+from fake_gpio import FakeGPIO, EchoResponder
+
+TRIG = 17
+ECHO = 4
+LAP_CAPACITY = 8        # slot del buffer nelle prove col lettore doppiato
+LAP_READS = 20000
+
+
+# Record k coerente: t_ns, distanza ed esito derivano tutti da k
+def lap_record(k):
+    return k, float(k), k % 100
+
+
+def torn(records):
+    return sum(1 for r in records if (r.t_ns, r.distance, r.status) != lap_record(r.t_ns))
+
+
+# Array dei tempi che prima di ogni lettura fa avanzare lo scrittore di un
+# passo: il lettore viene doppiato a meta' copia, in modo ripetibile
+class _LappingArray:
+    def __init__(self, values, step):
+        self._values = values
+        self._step = step
+
+    def __getitem__(self, i):
+        self._step()
+        return self._values[i]
+
+    def __setitem__(self, i, value):
+        self._values[i] = value
+
+
+# Lo scrittore scrive i tre campi di un record e poi il contatore, un
+# passo per ogni record copiato dal lettore, e si ferma dopo steps passi
+# (come un thread interrotto a meta' scrittura): si prova ogni punto di
+# arresto fino a un giro intero del buffer. Restituisce i record
+# incoerenti su tutte le letture.
+def lapped_in_steps():
+    bad = 0
+    for steps in range(1, 4 * (LAP_CAPACITY + 1)):
+        for n in range(1, LAP_CAPACITY + 1):
+            buffer = sampler.RingBuffer(LAP_CAPACITY)
+            for k in range(LAP_CAPACITY):
+                buffer.write(*lap_record(k))
+            times = buffer._t_ns
+            pending = []
+            left = [steps]
+
+            def step():
+                if not left[0]:
+                    return
+                left[0] -= 1
+                if not pending:
+                    k = buffer.count
+                    t_ns, distance, status = lap_record(k)
+                    i = k % buffer.capacity
+                    pending.extend([lambda: times.__setitem__(i, t_ns),
+                                    lambda: buffer._distance.__setitem__(i, distance),
+                                    lambda: buffer._status.__setitem__(i, status),
+                                    lambda: setattr(buffer, 'count', k + 1)])
+                pending.pop(0)()
+
+            buffer._t_ns = _LappingArray(times, step)
+            bad += torn(buffer.last(n))
+    return bad
+
+
+# Un thread scrive senza pause, il lettore chiede sempre tutto il buffer
+def lapped_by_thread():
+    buffer = sampler.RingBuffer(LAP_CAPACITY)
+    stop = threading.Event()
+
+    def writer():
+        k = 0
+        while not stop.is_set():
+            buffer.write(*lap_record(k))
+            k += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    bad = 0
+    try:
+        for _ in range(LAP_READS):
+            bad += torn(buffer.last(LAP_CAPACITY))
+    finally:
+        stop.set()
+        thread.join()
+    return bad
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    gpio = FakeGPIO()
+    gpio.setup(TRIG, gpio.OUT, initial=gpio.LOW)
+    gpio.setup(ECHO, gpio.IN)
+    EchoResponder(gpio, TRIG, ECHO, lambda: 0.8)
+    ranger = ranging.UltrasonicRanger(gpio, TRIG, ECHO)
+    ranger.start()
+
+    start = time.perf_counter()
+    for _ in range(20):
+        ranger.measure()
+    ping_us = (time.perf_counter() - start) / 20 * 1e6
+
+    distance_sampler = sampler.DistanceSampler(ranger)
+    distance_sampler.start()
+    running_since = time.monotonic()
+    time.sleep(seconds)
+
+    n = 100000
+    start = time.perf_counter()
+    for _ in range(n):
+        distance_sampler.latest()
+    latest_us = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    for _ in range(n // 100):
+        distance_sampler.last(16)
+    last_us = (time.perf_counter() - start) / (n // 100) * 1e6
+
+    distance_sampler.stop()
+    running = time.monotonic() - running_since
+    gpio.stop()
+    buffer = distance_sampler.buffer
+    print("ping bloccante:     {:10.1f}us".format(ping_us))
+    print("latest():           {:10.2f}us".format(latest_us))
+    print("last(16):           {:10.2f}us".format(last_us))
+    print("campioni: {}  (attesi ~{:.0f})  dropped: {}  overruns: {}  overwritten: {}".format(
+        buffer.count, running / sampler.PERIOD, buffer.dropped, distance_sampler.overruns, buffer.overwritten))
+
+    stepped, threaded = lapped_in_steps(), lapped_by_thread()
+    print("lettore doppiato: {} record a meta' scrittura a passi, {} con lo scrittore in un thread".format(
+        stepped, threaded))
+    checks = [
+        ("doppiato a meta' copia: nessun record rotto", stepped == 0),
+        ("doppiato da un thread: nessun record rotto", threaded == 0),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
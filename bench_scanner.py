@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark della scansione col servo su GPIO finto: durata di un ciclo di
+# scansione con 7 e 15 angoli, confrontata con la scansione a rotazione del
+# rover di loop_rover (4 rotazioni da 1 s). L'ambiente simulato ha un
+# ostacolo vicino a destra e spazio libero a sinistra.
+# Verifica (uscita 1 se fallisce): con un ping ogni SPURIOUS_EVERY che torna
+# corto (SPURIOUS_DISTANCE, eco spurio) i settori restano quelli veri, perche'
+# ogni angolo e' la mediana dei suoi ping.
+#
+# Uso: python3 bench_scanner.py [passate]
+
+import sys
+
+import ranging
+import sampler
+import scanner
+from fake_gpio import FakeGPIO, EchoResponder
+
+TRIG = 17
+ECHO = 4
+SER_SCAN = 12
+SPURIOUS_EVERY = 3
+SPURIOUS_DISTANCE = 0.10  # m, piu' vicino di qualunque ostacolo vero
+FRONT_SECTOR = 20
+
+
+def main():
+    passes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    gpio = FakeGPIO()
+    gpio.setup(TRIG, gpio.OUT, initial=gpio.LOW)
+    gpio.setup(ECHO, gpio.IN)
+
+    pings = [0]
+    spurious = [False]
+
+    def distance_at_servo():
+        pwm = gpio.pwms.get(SER_SCAN)
+        angle = (pwm.duty - 2.5) * 180 / 10 if pwm else scanner.SERVO_CENTER
+        pings[0] += 1
+        if spurious[0] and pings[0] % SPURIOUS_EVERY == 0:
+            return SPURIOUS_DISTANCE
+        return 0.30 if angle < 60 else 0.3 + angle / 60
+
+    EchoResponder(gpio, TRIG, ECHO, distance_at_servo)
+    ranger = ranging.UltrasonicRanger(gpio, TRIG, ECHO)
+    ranger.start()
+    distance_sampler = sampler.DistanceSampler(ranger)
+    distance_sampler.start()
+
+    print("Scansione a rotazione del rover: >= 4.00 s per 3 angoli")
+    for angles in (scanner.SCAN_ANGLES, tuple(range(20, 161, 10))):
+        sweep = scanner.SweepScanner(gpio, SER_SCAN, distance_sampler, angles)
+        durations = []
+        for _ in range(passes):
+            scan = sweep.scan()
+            durations.append(scan.duration)
+        print("Scansione servo: {:2d} angoli  media {:.2f} s  max {:.2f} s".format(
+            len(angles), sum(durations) / len(durations), max(durations)))
+        print("  " + " ".join("{}:{:.2f}".format(a, d) if d is not None else "{}:--".format(a)
+                             for a, d in zip(scan.angles, scan.distances)))
+
+    sweep = scanner.SweepScanner(gpio, SER_SCAN, distance_sampler)
+    clean = scanner.sectors(sweep.scan(), FRONT_SECTOR)
+    spurious[0] = True
+    noisy = scanner.sectors(sweep.scan(), FRONT_SECTOR)
+    print("settori sx/centro/dx: puliti {}  con ping spuri {}".format(
+        " ".join("{:.2f}".format(d) if d is not None else "--" for d in clean),
+        " ".join("{:.2f}".format(d) if d is not None else "--" for d in noisy)))
+
+    distance_sampler.stop()
+    gpio.stop()
+
+    ok = all(d is not None and d > SPURIOUS_DISTANCE for d in noisy)
+    print("  {:<44} {}".format("ping spurio corto ignorato nei settori", "ok" if ok else "FALLITO"))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Tracciamento delle fasi (spans.py): costo, attribuzione attesa/calcolo e
+# traccia di ProgettoRover.py nel simulatore.
+# Misure:
+#   - ns in piu' per chiamata di una funzione avvolta; spento le funzioni
+#     restano quelle originali (costo zero)
+#   - col tempo reale: una fase che dorme e una che calcola per WORK s,
+#     attesa e CPU attribuite a ciascuna (la migliore di ATTEMPTS prove)
+#   - ProgettoRover nel simulatore (tempo virtuale) vicino alla fiamma, con
+#     le fasi di SPAN_STAGES: riepilogo per fase e stima della CPU spesa
+#     a tracciare
+# Verifiche (uscita 1 se falliscono):
+#   - spento: nessun costo; acceso: sotto MAX_SPAN_US per intervallo
+#   - attesa e CPU attribuite alla fase giusta (entro ATTRIBUTION_ERROR)
+#   - tempo proprio = totale - fasi annidate; buffer circolare
+#   - JSON di Chrome valido, fasi annidate dentro la genitrice, tutte le
+#     fasi richieste presenti nella pattuglia
+#
+# Uso: python3 bench_spans.py [--seconds 120]
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import types
+
+import simulate
+import simulator
+import spans
+
+CALLS = 200000
+MAX_SPAN_US = 5.0           # us per intervallo su un PC (sul Pi circa 5-10 volte di piu')
+WORK = 0.05                 # s di attesa o di calcolo delle fasi di prova
+ATTRIBUTION_ERROR = 0.25    # parte del tempo di una fase ammessa dalla parte sbagliata
+ATTEMPTS = 3
+# Fasi che la pattuglia deve attraversare (la sirena parte con la fiamma)
+REQUIRED = ("get_distance", "where_to_go", "publish_distances", "check_flame", "led_sirena",
+            "motor_forward", "motor_stop", "motor_turn_left", "motor_turn_right")
+
+
+def call_cost():
+    module = types.ModuleType("prova")
+
+    def stage():
+        pass
+
+    module.stage = stage
+    costs = []
+    for traced in (False, True):
+        tracer = spans.Tracer(capacity=1024)
+        if traced:
+            tracer.instrument(module, ("stage",))
+        call = module.stage
+        start = time.perf_counter()
+        for _ in range(CALLS):
+            call()
+        costs.append((time.perf_counter() - start) / CALLS * 1e6)
+        tracer.uninstrument()
+    restored = module.stage is stage
+    return costs[1] - costs[0], restored, len(tracer), tracer.overwritten
+
+
+def attribution():
+    module = types.ModuleType("prova")
+
+    def sleeping():
+        time.sleep(WORK)
+
+    def computing():
+        end = time.perf_counter() + WORK
+        while time.perf_counter() < end:
+            pass
+
+    def outer():
+        sleeping()
+        computing()
+
+    module.sleeping, module.computing = sleeping, computing
+    tracer = spans.Tracer()
+    tracer.instrument(module, ("sleeping", "computing"))
+    # outer chiama le fasi dal modulo, come ProgettoRover dai suoi globali
+    outer = tracer.wrap(lambda: (module.sleeping(), module.computing()), "outer")
+    outer()
+    stats = spans.summary(tracer.spans())
+    sleep, work, whole = stats["sleeping"], stats["computing"], stats["outer"]
+
+    # Il calcolo puo' perdere la CPU per altri processi: conta come attesa
+    ok = (sleep["blocked_ns"] >= sleep["wall_ns"] * (1 - ATTRIBUTION_ERROR) and
+          work["cpu_ns"] >= work["wall_ns"] * (1 - ATTRIBUTION_ERROR) and
+          whole["self_ns"] <= whole["wall_ns"] * ATTRIBUTION_ERROR and
+          abs(whole["wall_ns"] / 1e9 - 2 * WORK) <= WORK * ATTRIBUTION_ERROR)
+    return ok, sleep, work
+
+
+# Ogni fase annidata sta dentro un intervallo un livello sopra dello
+# stesso thread
+def nested(loaded):
+    by_thread = {}
+    for span in loaded:
+        by_thread.setdefault(span.thread, []).append(span)
+    for thread_spans in by_thread.values():
+        parents = {}
+        for span in sorted(thread_spans, key=lambda s: (s.start_ns, s.depth)):
+            parents[span.depth] = span
+            if span.depth:
+                parent = parents.get(span.depth - 1)
+                # JSON in microsecondi con 3 decimali: 1 ns di tolleranza
+                if parent is None or span.start_ns < parent.start_ns - 1 or \
+                        span.start_ns + span.wall_ns > parent.start_ns + parent.wall_ns + 1:
+                    return False
+    return True
+
+
+def patrol(seconds, path):
+    sys.path.insert(0, simulate.HERE)
+    # Di fronte alla fiamma del mondo predefinito
+    sim = simulator.Simulator(pose=(3.0, 2.0, math.atan2(0.6, 0.6)))
+    simulate.attach(sim)
+    sim.start(seconds)
+    try:
+        import ProgettoRover
+        ProgettoRover.enable_spans(path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulate.run_program("loop_rover")
+    finally:
+        sim.stop()
+    return ProgettoRover.tracer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo e contenuto del tracciamento delle fasi")
+    parser.add_argument("--seconds", type=float, default=120.0, help="durata virtuale della pattuglia (s)")
+    args = parser.parse_args()
+
+    span_us, restored, kept, overwritten = call_cost()
+    # Su una macchina carica il calcolo puo' perdere la CPU: si ripete
+    for _ in range(ATTEMPTS):
+        attribution_ok, sleep, work = attribution()
+        if attribution_ok:
+            break
+    print("intervallo tracciato: {:.2f} us in piu' per chiamata; spento: funzioni originali {}".format(
+        span_us, "si'" if restored else "NO"))
+    print("fase che dorme {:.0f} ms:   attesa {:6.1f} ms  CPU {:6.1f} ms".format(
+        WORK * 1e3, sleep["blocked_ns"] / 1e6, sleep["cpu_ns"] / 1e6))
+    print("fase che calcola {:.0f} ms: attesa {:6.1f} ms  CPU {:6.1f} ms".format(
+        WORK * 1e3, work["blocked_ns"] / 1e6, work["cpu_ns"] / 1e6))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "spans.json")
+        tracer = patrol(args.seconds, path)
+        with open(path) as f:
+            document = json.load(f)
+        loaded = spans.load(path)
+    events = document["traceEvents"]
+    valid = all({"name", "ph", "pid", "tid"} <= set(event) for event in events) and \
+        all(event["dur"] >= 0 and "ts" in event for event in events if event["ph"] == "X")
+    stats = spans.summary(loaded)
+    print("pattuglia di {:.0f} s virtuali: {} intervalli, {:.1f} al secondo: tracciare costa {:.4%} di un core".format(
+        args.seconds, len(loaded), len(loaded) / args.seconds, len(loaded) / args.seconds * span_us * 1e-6))
+    print("fase                          chiamate    totale s   propri s     CPU s   attesa s")
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]["self_ns"])[:8]:
+        print("  {:<28} {:8d} {:10.3f} {:10.3f} {:9.3f} {:10.3f}".format(
+            name, s["calls"], s["wall_ns"] / 1e9, s["self_ns"] / 1e9, s["cpu_ns"] / 1e9, s["blocked_ns"] / 1e9))
+    missing = [name for name in REQUIRED if name not in stats]
+    if missing:
+        print("fasi mancanti: " + ", ".join(missing))
+
+    checks = [
+        ("spento: nessun costo", restored),
+        ("acceso: sotto {} us per intervallo".format(MAX_SPAN_US), span_us < MAX_SPAN_US),
+        ("attesa e CPU attribuite alla fase giusta", attribution_ok),
+        ("buffer circolare", kept == 1024 and overwritten == CALLS - 1024),
+        ("JSON di Chrome valido", valid and len(loaded) == len(tracer)),
+        ("fasi annidate dentro la genitrice", nested(loaded)),
+        ("pattuglia: tutte le fasi richieste", not missing),
+    ]
+    failed = False
+    for name, ok in checks:
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Prova e benchmark dello spool su disco della telemetria, con il broker
+# finto in-process:
+# - blackout: il client e' scollegato, i lotti vanno su disco e alla
+#   riconnessione arrivano tutti, in ordine e al ritmo REPLAY_RATE
+# - crash: lo spool viene riaperto senza close(), si rimanda solo quello
+#   che segue l'ultimo checkpoint
+# - limite di spazio: con max_bytes piccolo lo spool non cresce oltre
+# Esce con codice 1 se una delle verifiche fallisce.
+#
+# Uso: python3 bench_spool.py
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import spool
+import telemetry
+from fake_mqtt import FakeBroker, FakeMqttClient
+
+
+def check(failures, condition, message):
+    print('{} {}'.format('ok  ' if condition else 'FAIL', message))
+    return failures + (0 if condition else 1)
+
+
+def blackout(directory, failures):
+    broker = FakeBroker()
+    received = []
+    broker.subscribe('#', lambda topic, payload: received.extend(telemetry.decode(payload)[1]))
+    client = FakeMqttClient(broker, "Rover_Fisica")
+    publisher = telemetry.TelemetryPublisher(client, max_batch=10, max_delay=0.05,
+                                             spool=spool.Spool(directory), replay_rate=200)
+    publisher.start()
+    samples = 500
+    for i in range(samples):
+        publisher.publish_distances(float(i), 1.0, 1.0, timestamp=1000.0 + i)
+    time.sleep(0.2)
+    failures = check(failures, publisher.stats["spooled"] == samples,
+                     "blackout: {} campioni su disco".format(publisher.stats["spooled"]))
+    client.connect("localhost")
+    start = time.monotonic()
+    while len(received) < samples and time.monotonic() - start < 5:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    publisher.stop()
+    order = [r["timestamp"] for r in received]
+    failures = check(failures, order == sorted(order) and len(order) == samples,
+                     "replay: {} campioni in ordine in {:.2f}s ({:.0f} messaggi/s)".format(
+                         len(order), elapsed, publisher.stats["replayed"] / elapsed))
+    return failures
+
+
+def crash(directory, failures):
+    s = spool.Spool(directory)
+    for i in range(100):
+        s.append("distances", str(i))
+    for _ in range(55):
+        s.peek()
+        s.advance()
+    # crash: nessuna close(), si riapre la cartella
+    s = spool.Spool(directory)
+    first = int(s.peek()[1])
+    resent = 55 - first
+    failures = check(failures, 0 <= resent < spool.CHECKPOINT_EVERY,
+                     "crash: dopo 55 inviati si riparte da {} ({} rimandati)".format(first, resent))
+    count = 0
+    while s.peek() is not None:
+        s.advance()
+        count += 1
+    failures = check(failures, count == 100 - first, "crash: {} record ancora da inviare".format(count))
+    s.close()
+    return failures
+
+
+def disk_limit(directory, failures):
+    s = spool.Spool(directory, segment_size=4096, max_bytes=32768)
+    payload = b'x' * 100
+    start = time.perf_counter()
+    n = 5000
+    for _ in range(n):
+        s.append("distances", payload)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory) if f.endswith('.seg'))
+    failures = check(failures, size <= 32768 + 4096,
+                     "limite: {} byte su disco, {} byte scartati".format(size, s.stats["discarded_bytes"]))
+    print("     append: {:.0f} messaggi/s".format(n / elapsed))
+    s.close()
+    return failures
+
+
+def main():
+    failures = 0
+    for test in (blackout, crash, disk_limit):
+        directory = tempfile.mkdtemp(prefix='spool_')
+        try:
+            failures = test(directory, failures)
+        finally:
+            shutil.rmtree(directory)
+    print('\n{}'.format('OK' if failures == 0 else 'FALLITO ({} verifiche)'.format(failures)))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Benchmark della telemetria contro il broker finto in-process.
+# Confronta la vecchia pubblicazione in linea (json.dumps + publish per ogni
+# campione, sul thread di controllo) con il TelemetryPublisher a lotti in
+# JSON e in binario; la coda e' grande quanto la prova, cosi' si misura
+# la portata del publisher e non le perdite. Ogni messaggio costa PER_MESSAGE secondi al broker,
+# per simulare la scrittura sul socket.
+#
+# Uso: python3 bench_telemetry.py [campioni]
+
+import json
+import sys
+import time
+
+import telemetry
+from fake_mqtt import FakeBroker, FakeMqttClient
+
+PER_MESSAGE = 0.0002
+
+
+def make_client():
+    broker = FakeBroker()
+    broker.subscribe('#', lambda topic, payload: time.sleep(PER_MESSAGE))
+    client = FakeMqttClient(broker, "Rover_Fisica")
+    client.connect("localhost")
+    return broker, client
+
+
+def report(name, samples, control, wall, broker):
+    print("{:<14} controllo {:6.2f}us/campione  {:8.0f} campioni/s  {:6.0f} msg/s  {:6.1f} byte/campione  {:5d} messaggi".format(
+        name, control / samples * 1e6, samples / wall, broker.messages / wall,
+        broker.bytes / samples, broker.messages))
+
+
+def inline(samples):
+    broker, client = make_client()
+    start = time.perf_counter()
+    for i in range(samples):
+        payload = {
+            "timestamp": time.time(),
+            "left": round(0.5 + i % 7 * 0.1, 3),
+            "center": round(1.2, 3),
+            "right": round(0.8, 3)
+        }
+        client.publish("distances", json.dumps(payload))
+    elapsed = time.perf_counter() - start
+    report("in linea", samples, elapsed, elapsed, broker)
+
+
+def batched(name, encoding, samples):
+    broker, client = make_client()
+    publisher = telemetry.TelemetryPublisher(client, encoding=encoding, queue_size=samples)
+    publisher.start()
+    start = time.perf_counter()
+    control = 0.0
+    for i in range(samples):
+        t = time.perf_counter()
+        publisher.publish_distances(0.5 + i % 7 * 0.1, 1.2, 0.8)
+        control += time.perf_counter() - t
+    publisher.stop()
+    wall = time.perf_counter() - start
+    report(name, samples, control, wall, broker)
+    if publisher.stats["dropped"]:
+        print("{:<14} campioni persi a coda piena: {}".format("", publisher.stats["dropped"]))
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print("Campioni: {}  costo per messaggio al broker: {:.1f}ms\n".format(samples, PER_MESSAGE * 1000))
+    inline(samples)
+    batched("lotti JSON", telemetry.JSON, samples)
+    batched("lotti binari", telemetry.BINARY, samples)
+
+    records = [(time.time(), 0.5, None, 0.8)] * 3
+    kind, decoded = telemetry.decode(telemetry.encode(telemetry.KIND_DISTANCES, records))
+    assert kind == telemetry.KIND_DISTANCES and decoded[0]["center"] is None and len(decoded) == 3
+
+
+if __name__ == '__main__':
+    main()
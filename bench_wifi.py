@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Generatore di carico per la porta di controllo di wifirobots su localhost.
+#   originale: il loop di wifirobots.py portato in Python 3 cosi' com'e'
+#              (recv di 1 byte, b2a_hex, confronti tra stringhe, un client
+#              alla volta)
+#   selectors: wifi_server.ControlServer
+# Misure:
+#   - trame/s con un client che manda le trame una dopo l'altra, una
+#     sendall per trama come l'app del telefono
+#   - trame/s con CLIENTS controller insieme (solo selectors)
+#   - latenza per comando: dalla sendall alla chiamata del gestore, per
+#     motori, servo e modo di crociera (p50/p99 in microsecondi)
+#   - politica di controllo: un secondo controller viene rifiutato, uno
+#     con priorita' piu' alta (da 127.0.0.2) prende il controllo, lo stop
+#     vale da chiunque
+#   - gestore che solleva un'eccezione: l'errore si conta e il server
+#     continua a servire lo stesso client e i nuovi
+# Se un controllo fallisce l'uscita e' 1
+#
+# Uso: python3 bench_wifi.py [trame]
+
+import binascii
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from wifi_server import ControlServer
+
+FRAMES = 20000
+LATENCY_FRAMES = 2000
+CLIENTS = 4
+
+COMMANDS = {
+    "motori": bytes([0xFF, 0x00, 0x01, 0x00, 0xFF]),
+    "servo": bytes([0xFF, 0x01, 0x07, 0x5A, 0xFF]),
+    "modo": bytes([0xFF, 0x13, 0x02, 0x00, 0xFF]),
+}
+
+
+# Il server originale, con lo stesso parser a stringhe esadecimali
+class LegacyServer:
+    def __init__(self, on_frame):
+        self.on_frame = on_frame
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            rec_flag = 0
+            i = 0
+            buffer = []
+            while True:
+                try:
+                    data = client.recv(1)
+                    data = binascii.b2a_hex(data).decode()
+                except OSError:
+                    break
+                if not data:
+                    break
+                if rec_flag == 0:
+                    if data == 'ff':
+                        buffer[:] = []
+                        rec_flag = 1
+                        i = 0
+                else:
+                    if data == 'ff':
+                        rec_flag = 0
+                        if i == 3:
+                            self.on_frame(buffer, None)
+                        i = 0
+                    else:
+                        buffer.append(data)
+                        i += 1
+            client.close()
+
+    def stop(self):
+        self.sock.close()
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+        self.last_ns = 0
+        self.cond = threading.Condition()
+
+    def __call__(self, frame, client):
+        with self.cond:
+            self.count += 1
+            self.last_ns = time.perf_counter_ns()
+            self.cond.notify()
+
+    def wait_for(self, count, timeout=30.0):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.count >= count, timeout)
+
+
+def connect(port, source='127.0.0.1'):
+    sock = socket.create_connection(('127.0.0.1', port), source_address=(source, 0))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+# Con piu' client conta le trame lette dal server: quelle dei controller
+# che non hanno il controllo vengono rifiutate e non arrivano al gestore
+def throughput(port, counter, frames, clients=1, server=None):
+    frame = COMMANDS["motori"]
+    socks = [connect(port) for _ in range(clients)]
+    per_client = frames // clients
+    start_count = counter.count
+    start = time.perf_counter_ns()
+
+    def send(sock):
+        for _ in range(per_client):
+            sock.sendall(frame)
+
+    threads = [threading.Thread(target=send, args=(sock,)) for sock in socks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if server is None:
+        ok = counter.wait_for(start_count + per_client * clients)
+        end = counter.last_ns
+    else:
+        ok = wait_until(lambda: sum(c.parser.frames for c in server.clients) >= per_client * clients)
+        end = time.perf_counter_ns()
+    elapsed = (end - start) / 1e9
+    for sock in socks:
+        sock.close()
+    if not ok:
+        return None
+    return per_client * clients / elapsed
+
+
+def latencies(port, counter, frames):
+    sock = connect(port)
+    results = {}
+    for name, frame in COMMANDS.items():
+        values = []
+        for _ in range(frames):
+            expected = counter.count + 1
+            sent = time.perf_counter_ns()
+            sock.sendall(frame)
+            counter.wait_for(expected)
+            values.append((counter.last_ns - sent) / 1e3)
+        values.sort()
+        results[name] = (statistics.median(values), values[int(len(values) * 0.99)])
+    sock.close()
+    return results
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+# Verifica della politica di controllo con tre controller
+def ownership():
+    received = []
+    server = ControlServer(lambda frame, client: received.append((frame, client)), host='127.0.0.1',
+                           port=0, priorities={'127.0.0.2': 5}).start()
+    checks = []
+    first = connect(server.port)
+    second = connect(server.port)
+    first.sendall(COMMANDS["motori"])
+    wait_until(lambda: len(received) == 1)
+    second.sendall(COMMANDS["servo"])
+    wait_until(lambda: sum(c.rejected for c in server.clients) == 1)
+    checks.append(("secondo controller rifiutato", len(received) == 1))
+    second.sendall(bytes([0xFF, 0x00, 0x00, 0x00, 0xFF]))
+    wait_until(lambda: len(received) == 2)
+    checks.append(("stop accettato da chiunque", len(received) == 2 and server.owner.address == first.getsockname()))
+    boss = connect(server.port, '127.0.0.2')
+    boss.sendall(COMMANDS["modo"])
+    wait_until(lambda: len(received) == 3)
+    checks.append(("priorita' piu' alta prende il controllo",
+                   len(received) == 3 and server.owner is not None and server.owner.priority == 5))
+    boss.close()
+    wait_until(lambda: len(received) == 4)
+    checks.append(("stop alla disconnessione del proprietario",
+                   len(received) == 4 and received[-1][1] is None and received[-1][0] == b'\x00\x00\x00'))
+    first.close()
+    second.close()
+    server.stop()
+    return checks
+
+
+# Gestore che solleva su un comando: il server deve contare l'errore e
+# continuare a servire
+def faulty_handler():
+    received = []
+
+    def handler(frame, client):
+        if frame == COMMANDS["servo"][1:-1]:
+            raise ValueError("servo guasto")
+        received.append(frame)
+
+    server = ControlServer(handler, host='127.0.0.1', port=0).start()
+    checks = []
+    first = connect(server.port)
+    first.sendall(COMMANDS["servo"])
+    first.sendall(COMMANDS["motori"])
+    wait_until(lambda: len(received) == 1)
+    checks.append(("gestore che solleva: errore contato", server.errors == 1))
+    checks.append(("gestore che solleva: client ancora servito", received == [COMMANDS["motori"][1:-1]]))
+    # La disconnessione del proprietario manda lo stop al gestore
+    first.close()
+    wait_until(lambda: len(received) == 2)
+    second = connect(server.port)
+    second.sendall(COMMANDS["modo"])
+    wait_until(lambda: len(received) == 3)
+    checks.append(("gestore che solleva: nuovo client servito", received[2:] == [COMMANDS["modo"][1:-1]]))
+    second.close()
+    server.stop()
+    return checks
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+
+    counter = Counter()
+    legacy = LegacyServer(counter)
+    legacy_rate = throughput(legacy.port, counter, frames)
+    legacy_latency = latencies(legacy.port, counter, LATENCY_FRAMES)
+    legacy.stop()
+
+    counter = Counter()
+    server = ControlServer(counter, host='127.0.0.1', port=0).start()
+    rate = throughput(server.port, counter, frames)
+    multi_rate = throughput(server.port, counter, frames, CLIENTS, server)
+    latency = latencies(server.port, counter, LATENCY_FRAMES)
+    reads = server.reads
+    received = server.bytes_received
+    server.stop()
+
+    print("trame/s, un client:      originale {:9.0f}   selectors {:9.0f}".format(legacy_rate, rate))
+    print("trame/s, {} client:       originale {:>9}   selectors {:9.0f}".format(CLIENTS, "-", multi_rate))
+    print("byte per recv (selectors): {:.1f}  (originale: 1)".format(received / reads))
+    print("latenza per comando (us)   originale p50/p99      selectors p50/p99")
+    for name in COMMANDS:
+        print("  {:<8}                 {:7.1f} / {:7.1f}      {:7.1f} / {:7.1f}".format(
+            name, legacy_latency[name][0], legacy_latency[name][1], latency[name][0], latency[name][1]))
+
+    failed = False
+    print("politica di controllo ed errori del gestore:")
+    for name, ok in ownership() + faulty_handler():
+        print("  {:<44} {}".format(name, "ok" if ok else "FALLITO"))
+        failed = failed or not ok
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
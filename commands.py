@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Decodifica dei comandi del protocollo wifirobots con una tabella.
+# Una trama ha 3 byte: tipo, comando, argomento. La tabella associa la
+# coppia (tipo, comando) dei byte ricevuti a un gestore e a una funzione
+# che converte l'argomento; non ci sono conversioni in stringhe
+# esadecimali ne' eval.
+#
+# Esempio:
+#   table = CommandTable()
+#   table.register(SERVO, 0x07, set_servo7, decode=angle)
+#   table.register_default(MOTOR, Motor_Stop)
+#   table.dispatch(b'\x01\x07\x5a')      # set_servo7(90)
+
+# Tipi di comando (primo byte)
+MOTOR = 0x00
+SERVO = 0x01
+LIGHT = 0x05
+CRUISE = 0x13
+
+# Comandi di MOTOR
+FORWARD = 0x01
+BACKWARD = 0x02
+TURN_LEFT = 0x03
+TURN_RIGHT = 0x04
+STOP = 0x00
+
+# Comandi di LIGHT
+LIGHT_ON = 0x00
+LIGHT_OFF = 0x01
+
+
+# --- Conversioni dell'argomento ---
+
+def byte(value):
+    return value
+
+
+# Angolo del servo in gradi (l'app manda 0-180)
+def angle(value):
+    return min(value, 180)
+
+
+class CommandTable:
+    def __init__(self):
+        self._table = {}
+        self._defaults = {}
+        self.unknown = 0
+
+    # Il gestore riceve l'argomento convertito con decode, o niente se
+    # decode e' None
+    def register(self, kind, command, handler, decode=None):
+        key = (kind, command)
+        if key in self._table:
+            raise ValueError("comando gia' registrato: {:02x} {:02x}".format(kind, command))
+        self._table[key] = (handler, decode)
+
+    # Gestore per i comandi non registrati di un tipo, chiamato senza
+    # argomenti
+    def register_default(self, kind, handler):
+        self._defaults[kind] = handler
+
+    def unregister(self, kind, command):
+        del self._table[(kind, command)]
+
+    def commands(self):
+        return sorted(self._table)
+
+    # Esegue una trama di 3 byte; False se nessun gestore la conosce
+    def dispatch(self, frame):
+        entry = self._table.get((frame[0], frame[1]))
+        if entry is None:
+            handler = self._defaults.get(frame[0])
+            if handler is None:
+                self.unknown += 1
+                return False
+            handler()
+            return True
+        handler, decode = entry
+        if decode is None:
+            handler()
+        else:
+            handler(decode(frame[2]))
+        return True
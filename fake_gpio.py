@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# GPIO finto, compatibile con le chiamate di RPi.GPIO usate nel progetto.
+# Permette di iniettare fronti sui pin di ingresso a istanti scelti, cosi'
+# la misura ultrasonica e i loop di controllo si possono provare e misurare
+# su un normale PC Linux, senza il robot.
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class FakePWM:
+    def __init__(self, gpio, channel, frequency):
+        self.gpio = gpio
+        self.channel = channel
+        self.frequency = frequency
+        self.duty = 0
+        self.running = False
+
+    def start(self, duty):
+        self.running = True
+        self.ChangeDutyCycle(duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+        self.gpio._notify_pwm(self.channel, duty)
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.running = False
+        self.duty = 0
+        self.gpio._notify_pwm(self.channel, 0)
+
+
+class FakeGPIO:
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self.modes = {}
+        self.pwms = {}
+        self._callbacks = {}
+        self._output_hooks = {}
+        self._pwm_hooks = []
+        self._input_hooks = []
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.output_calls = 0
+        self.input_calls = 0
+
+    # Orologio usato per i fronti iniettati (stessa base di time.monotonic_ns)
+    def clock(self):
+        return time.monotonic_ns()
+
+    # --- API di RPi.GPIO ---
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=None, initial=None):
+        self.modes[channel] = direction
+        if direction == self.OUT:
+            self.levels[channel] = int(bool(initial)) if initial is not None else self.LOW
+        else:
+            self.levels.setdefault(channel, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def output(self, channel, value):
+        self.output_calls += 1
+        value = int(bool(value))
+        old = self.levels.get(channel, self.LOW)
+        self.levels[channel] = value
+        if old != value:
+            for hook in self._output_hooks.get(channel, ()):
+                hook(channel, value)
+
+    def input(self, channel):
+        self.input_calls += 1
+        value = self.levels.get(channel, self.LOW)
+        for hook in self._input_hooks:
+            hook(channel, value)
+        return value
+
+    def PWM(self, channel, frequency):
+        pwm = FakePWM(self, channel, frequency)
+        self.pwms[channel] = pwm
+        return pwm
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        if channel in self._callbacks:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self._callbacks[channel] = [edge, []]
+        if callback is not None:
+            self._callbacks[channel][1].append(callback)
+        self._ensure_thread()
+
+    def add_event_callback(self, channel, callback):
+        self._callbacks[channel][1].append(callback)
+
+    def remove_event_detect(self, channel):
+        self._callbacks.pop(channel, None)
+
+    def cleanup(self, channel=None):
+        if channel is None:
+            self._callbacks.clear()
+            self.stop()
+        else:
+            self._callbacks.pop(channel, None)
+
+    # --- Estensioni per test e benchmark ---
+
+    # Registra una funzione chiamata ad ogni cambio di livello di un'uscita
+    def on_output(self, channel, hook):
+        self._output_hooks.setdefault(channel, []).append(hook)
+
+    def on_pwm(self, hook):
+        self._pwm_hooks.append(hook)
+
+    # Registra una funzione chiamata ad ogni lettura di un ingresso
+    def on_input(self, hook):
+        self._input_hooks.append(hook)
+
+    def _notify_pwm(self, channel, duty):
+        for hook in self._pwm_hooks:
+            hook(channel, duty)
+
+    # Porta il pin al livello dato all'istante at_ns (None = subito)
+    def inject(self, channel, level, at_ns=None):
+        if at_ns is None:
+            at_ns = self.clock()
+        with self._cond:
+            heapq.heappush(self._queue, (at_ns, next(self._seq), channel, int(bool(level))))
+            self._cond.notify()
+        self._ensure_thread()
+
+    # Impulso alto sul pin tra start_ns e start_ns + width_ns
+    def inject_pulse(self, channel, start_ns, width_ns):
+        self.inject(channel, self.HIGH, start_ns)
+        self.inject(channel, self.LOW, start_ns + width_ns)
+
+    def _apply(self, channel, level):
+        old = self.levels.get(channel, self.LOW)
+        self.levels[channel] = level
+        if old == level:
+            return
+        entry = self._callbacks.get(channel)
+        if entry is None:
+            return
+        edge, callbacks = entry
+        if edge == self.BOTH or (edge == self.RISING) == bool(level):
+            for callback in callbacks:
+                callback(channel)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._dispatch, name="fake-gpio", daemon=True)
+            self._thread.start()
+
+    # Thread che applica i fronti iniettati al momento giusto, come farebbe
+    # il thread degli eventi di RPi.GPIO
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                at_ns, _, channel, level = self._queue[0]
+                delay = (at_ns - self.clock()) / 1e9
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+            self._apply(channel, level)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# Simula un HC-SR04: alla discesa di TRIG genera l'impulso su ECHO la cui
+# durata corrisponde alla distanza restituita da distance_fn (None = echo perso)
+class EchoResponder:
+    def __init__(self, gpio, trig, echo, distance_fn, delay_ns=450000, speed=340):
+        self.gpio = gpio
+        self.echo = echo
+        self.distance_fn = distance_fn
+        self.delay_ns = delay_ns
+        self.speed = speed
+        self.last_fall_ns = None
+        gpio.on_output(trig, self._on_trig)
+
+    def _on_trig(self, channel, level):
+        if level:
+            return
+        distance = self.distance_fn()
+        if distance is None:
+            return
+        start = self.gpio.clock() + self.delay_ns
+        width = int(distance * 2 / self.speed * 1e9)
+        self.last_fall_ns = start + width
+        self.gpio.inject_pulse(self.echo, start, width)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Broker MQTT finto in-process e client con la stessa interfaccia del
+# paho.mqtt.client.Client usato nel progetto, per provare e misurare la
+# telemetria senza rete.
+
+import threading
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+
+class FakeMessageInfo:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+    def is_published(self):
+        return self.rc == MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+# Verifica un topic contro un filtro con i caratteri jolly + e #
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class FakeBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self.messages = 0
+        self.bytes = 0
+
+    def subscribe(self, topic_filter, callback):
+        with self._lock:
+            self._subscriptions.append((topic_filter, callback))
+
+    def deliver(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            self.messages += 1
+            self.bytes += len(payload)
+            callbacks = [cb for f, cb in self._subscriptions if topic_matches(f, topic)]
+        for callback in callbacks:
+            callback(topic, payload)
+
+
+class FakeMqttClient:
+    def __init__(self, broker, client_id=''):
+        self.broker = broker
+        self.client_id = client_id
+        self.connected = False
+        self.reachable = True  # False = broker irraggiungibile
+        self.on_connect = None
+        self.on_disconnect = None
+        self._mid = 0
+
+    def connect(self, host, port=1883, keepalive=60):
+        if not self.reachable:
+            raise OSError("broker non raggiungibile")
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+        return MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        return self.connect(None)
+
+    def disconnect(self):
+        self.connected = False
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self._mid += 1
+        if not self.connected:
+            return FakeMessageInfo(MQTT_ERR_NO_CONN, self._mid)
+        self.broker.deliver(topic, payload)
+        return FakeMessageInfo(MQTT_ERR_SUCCESS, self._mid)
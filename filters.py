@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Filtri incrementali per le letture ultrasoniche.
+# Ogni stadio riceve (t_ns, distanza) con distanza None per le letture non
+# valide e restituisce la distanza filtrata o None; l'aggiornamento ha costo
+# costante per campione. La Pipeline li mette in fila:
+#   scarto timeout/outlier -> mediana mobile -> Kalman 1-D a velocita' costante
+# e produce una stima con un flag di validita', al posto del valore 999.
+
+import bisect
+from collections import deque, namedtuple
+
+import ranging
+
+MIN_RANGE = 0.02  # m, sotto e' rumore del sensore
+MAX_RANGE = 4.00  # m, portata dichiarata dell'HC-SR04
+
+Estimate = namedtuple('Estimate', ['t_ns', 'distance', 'velocity', 'valid'])
+
+
+# Scarta letture fuori portata e salti incompatibili con la velocita' del
+# rover. Dopo `relock` scarti consecutivi accetta il nuovo livello
+# (l'ostacolo e' cambiato davvero) e segnala il salto con `jumped`.
+class OutlierRejector:
+    def __init__(self, max_jump=0.30, max_speed=1.5, relock=3):
+        self.max_jump = max_jump
+        self.max_speed = max_speed
+        self.relock = relock
+        self.reset()
+
+    def reset(self):
+        self._last = None
+        self._last_t = 0
+        self._rejected = 0
+        self.jumped = False
+        self.rejected_total = 0
+
+    def update(self, t_ns, z):
+        self.jumped = False
+        if z is None or not MIN_RANGE <= z <= MAX_RANGE:
+            self.rejected_total += 1
+            return None
+        if self._last is not None:
+            limit = self.max_jump + self.max_speed * (t_ns - self._last_t) / 1e9
+            if abs(z - self._last) > limit:
+                self._rejected += 1
+                if self._rejected < self.relock:
+                    self.rejected_total += 1
+                    return None
+                self.jumped = True
+        self._rejected = 0
+        self._last = z
+        self._last_t = t_ns
+        return z
+
+
+class RollingMedian:
+    def __init__(self, size=5):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self._window = deque()
+        self._sorted = []
+
+    def update(self, t_ns, z):
+        if z is None:
+            return None
+        self._window.append(z)
+        bisect.insort(self._sorted, z)
+        if len(self._window) > self.size:
+            self._sorted.pop(bisect.bisect_left(self._sorted, self._window.popleft()))
+        return self._sorted[len(self._sorted) // 2]
+
+
+# Kalman con stato [distanza, velocita'] e covarianza 2x2 tenuta in scalari.
+# Con z None fa solo la predizione.
+class Kalman1D:
+    def __init__(self, accel_noise=2.0, meas_noise=0.02):
+        self.q = accel_noise ** 2
+        self.r = meas_noise ** 2
+        self.reset()
+
+    def reset(self):
+        self.d = None
+        self.v = 0.0
+        self._t = 0
+        self._p00 = self._p01 = self._p11 = 0.0
+
+    def update(self, t_ns, z):
+        if self.d is None:
+            if z is None:
+                return None
+            self.d = z
+            self.v = 0.0
+            self._t = t_ns
+            self._p00 = self.r
+            self._p01 = 0.0
+            self._p11 = 1.0
+            return z
+
+        dt = (t_ns - self._t) / 1e9
+        self._t = t_ns
+        if dt > 0:
+            q = self.q
+            self.d += self.v * dt
+            self._p00 += dt * (2 * self._p01 + dt * self._p11) + q * dt ** 4 / 4
+            self._p01 += dt * self._p11 + q * dt ** 3 / 2
+            self._p11 += q * dt ** 2
+        if z is None:
+            return self.d
+
+        s = self._p00 + self.r
+        k0 = self._p00 / s
+        k1 = self._p01 / s
+        y = z - self.d
+        self.d += k0 * y
+        self.v += k1 * y
+        p01 = self._p01
+        self._p11 -= k1 * p01
+        self._p01 -= k0 * p01
+        self._p00 -= k0 * self._p00
+        return self.d
+
+
+class Pipeline:
+    def __init__(self, stages=None, max_age=0.5):
+        if stages is None:
+            stages = [OutlierRejector(), RollingMedian(), Kalman1D()]
+        self.stages = stages
+        self.max_age_ns = int(max_age * 1e9)
+        self._last_valid = None
+        self.estimate = Estimate(0, None, 0.0, False)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+        self._last_valid = None
+        self.estimate = Estimate(0, None, 0.0, False)
+
+    def update(self, t_ns, z):
+        accepted = False
+        for i, stage in enumerate(self.stages):
+            z = stage.update(t_ns, z)
+            if getattr(stage, 'jumped', False):
+                for later in self.stages[i + 1:]:
+                    later.reset()
+            if i == 0:
+                accepted = z is not None
+        if accepted:
+            self._last_valid = t_ns
+        valid = z is not None and self._last_valid is not None and t_ns - self._last_valid <= self.max_age_ns
+        velocity = getattr(self.stages[-1], 'v', 0.0)
+        self.estimate = Estimate(t_ns, z if valid else None, velocity, valid)
+        return self.estimate
+
+    # Passa un Reading del ranger (gli esiti di timeout diventano None)
+    def update_reading(self, reading):
+        return self.update(reading.t_ns, reading.distance if reading.status == ranging.OK else None)
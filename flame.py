@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Rilevazione della fiamma sui fronti del pin FLAME invece che leggendolo
+# una volta per giro del loop.
+# Il callback dei fronti registra solo livello e istante; un thread applica
+# l'antirimbalzo e l'isteresi:
+#   - la fiamma e' confermata quando il pin resta attivo per debounce secondi
+#   - e' spenta quando il pin resta a riposo per clear_hold secondi (piu'
+#     lungo, cosi' una fiamma che tremola non genera una raffica di allarmi)
+# Gli allarmi ripetuti vengono accorpati in una sola sequenza di eventi:
+# STARTED, ONGOING ogni ongoing_every secondi finche' dura, CLEARED alla fine,
+# con il numero di accensioni grezze viste e la durata.
+
+import threading
+import time
+from collections import deque, namedtuple
+
+DEBOUNCE = 0.05        # s di pin attivo per confermare la fiamma
+CLEAR_HOLD = 1.0       # s di pin a riposo per dichiararla spenta
+ONGOING_EVERY = 5.0    # s tra due eventi ONGOING
+LATENCY_SAMPLES = 100
+
+STARTED = "started"
+ONGOING = "ongoing"
+CLEARED = "cleared"
+
+# t_ns: istante dell'evento; count: accensioni del sensore accorpate finora;
+# duration: s dal primo fronte della fiamma
+FlameEvent = namedtuple('FlameEvent', ['kind', 't_ns', 'count', 'duration'])
+
+
+class FlameDetector:
+    def __init__(self, gpio, pin, on_event=None, debounce=DEBOUNCE, clear_hold=CLEAR_HOLD,
+                 ongoing_every=ONGOING_EVERY, active_level=None, clock=None):
+        self.gpio = gpio
+        self.pin = pin
+        self.on_event = on_event
+        self.debounce_ns = int(debounce * 1e9)
+        self.clear_hold_ns = int(clear_hold * 1e9)
+        self.ongoing_ns = int(ongoing_every * 1e9)
+        # Il sensore del robot porta il pin basso quando vede la fiamma
+        self.active_level = gpio.LOW if active_level is None else active_level
+        self.clock = clock or time.monotonic_ns
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._raw = False
+        self._raw_ns = 0
+        self._start_ns = 0
+        self._next_ongoing = 0
+        self.active = False
+        self.count = 0
+        self.edges = 0
+        self.events = {STARTED: 0, ONGOING: 0, CLEARED: 0}
+        # Ritardo tra il primo fronte e la fine di on_event di STARTED
+        # (cioe' l'allarme accodato per la pubblicazione), in ns
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="flame", daemon=True)
+        self._thread.start()
+        self.gpio.add_event_detect(self.pin, self.gpio.BOTH, callback=self._on_edge)
+        # Fiamma gia' presente all'avvio
+        self._on_edge(self.pin)
+
+    def stop(self):
+        self.gpio.remove_event_detect(self.pin)
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _on_edge(self, channel):
+        now = self.clock()
+        raw = self.gpio.input(self.pin) == self.active_level
+        with self._cond:
+            self.edges += 1
+            if raw == self._raw:
+                return
+            self._raw = raw
+            self._raw_ns = now
+            if raw and self.active:
+                self.count += 1
+            self._cond.notify()
+
+    # Prossimo evento possibile e il suo istante, (None, None) se nessuno
+    def _pending(self):
+        if not self.active:
+            if self._raw:
+                return STARTED, self._raw_ns + self.debounce_ns
+            return None, None
+        if not self._raw and self._raw_ns + self.clear_hold_ns <= self._next_ongoing:
+            return CLEARED, self._raw_ns + self.clear_hold_ns
+        return ONGOING, self._next_ongoing
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                kind, at_ns = self._pending()
+                now = self.clock()
+                if kind is None or now < at_ns:
+                    self._cond.wait(None if kind is None else (at_ns - now) / 1e9)
+                    continue
+                if kind == STARTED:
+                    self.active = True
+                    self.count = 1
+                    self._start_ns = self._raw_ns
+                    event = FlameEvent(STARTED, now, 1, (now - self._start_ns) / 1e9)
+                    self._next_ongoing = now + self.ongoing_ns
+                elif kind == CLEARED:
+                    self.active = False
+                    event = FlameEvent(CLEARED, now, self.count, (self._raw_ns - self._start_ns) / 1e9)
+                else:
+                    event = FlameEvent(ONGOING, now, self.count, (now - self._start_ns) / 1e9)
+                    self._next_ongoing += self.ongoing_ns
+                self.events[kind] += 1
+                first_edge = self._start_ns
+            if self.on_event is not None:
+                self.on_event(event)
+            if kind == STARTED:
+                self.latencies.append(self.clock() - first_edge)
+
+    # Statistiche della latenza di rilevazione in ms
+    def latency_stats(self):
+        values = sorted(self.latencies)
+        if not values:
+            return None
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values) / 1e6,
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))] / 1e6,
+            "max": values[-1] / 1e6,
+        }
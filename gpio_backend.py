@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Scelta del backend GPIO per i programmi del rover.
+# Sul robot si usa RPi.GPIO; altrove si puo' scegliere con la variabile
+# d'ambiente ROVER_GPIO:
+#   rpi   RPi.GPIO (predefinito)
+#   fake  fake_gpio.FakeGPIO: pin in memoria, nessun modello del robot
+#   sim   il GPIO del simulatore installato (simulator.py, vedi simulate.py)
+#   replay  una traccia registrata rimessa nei pin (replay.py)
+# Con ROVER_TRACE=percorso il backend scelto registra letture, fronti e
+# uscite in una traccia binaria (replay.RecordingGPIO).
+#
+# Un backend deve offrire le chiamate di RPi.GPIO usate nel progetto:
+# BACKEND_API e i livelli/modi in BACKEND_CONSTANTS.
+#
+# Uso nei programmi:  from gpio_backend import GPIO
+
+import os
+
+BACKEND_API = ('setmode', 'setwarnings', 'setup', 'output', 'input', 'PWM',
+               'add_event_detect', 'remove_event_detect', 'cleanup')
+BACKEND_CONSTANTS = ('BCM', 'OUT', 'IN', 'LOW', 'HIGH', 'PUD_UP', 'PUD_DOWN', 'BOTH', 'RISING', 'FALLING')
+
+_active = None
+
+
+def check(backend):
+    missing = [name for name in BACKEND_API + BACKEND_CONSTANTS if not hasattr(backend, name)]
+    if missing:
+        raise TypeError("backend GPIO incompleto, mancano: {}".format(", ".join(missing)))
+    return backend
+
+
+def load(name=None):
+    name = name or os.environ.get('ROVER_GPIO', 'rpi')
+    if name == 'rpi':
+        import RPi.GPIO as backend
+    elif name == 'fake':
+        from fake_gpio import FakeGPIO
+        backend = FakeGPIO()
+    elif name == 'sim':
+        import simulator
+        sim = simulator.current()
+        if sim is None:
+            raise RuntimeError("ROVER_GPIO=sim: nessun simulatore attivo, lanciare il programma con simulate.py")
+        backend = sim.gpio
+    elif name == 'replay':
+        import replay
+        backend = replay.current()
+        if backend is None:
+            raise RuntimeError("ROVER_GPIO=replay: nessuna traccia attiva, lanciare il programma con replay.py")
+    else:
+        raise ValueError("ROVER_GPIO sconosciuto: {}".format(name))
+    path = os.environ.get('ROVER_TRACE')
+    if path:
+        import replay
+        backend = replay.recording(backend, path)
+    return check(backend)
+
+
+# Backend del processo, scelto al primo import
+def get():
+    global _active
+    if _active is None:
+        _active = load()
+    return _active
+
+
+GPIO = get()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Stazione a terra: raccoglie la telemetria di una flotta di rover.
+# Ogni rover pubblica sotto rover/<id>/ (telemetry.topic); la stazione si
+# abbona a rover/+/distances e rover/+/flame e tiene, per ogni rover e
+# tipo, un archivio a colonne su disco.
+#   - il callback MQTT (thread di rete di paho) aggiunge solo (topic,
+#     payload) a una deque e sveglia il loop asyncio al primo messaggio di
+#     una raffica: con molti rover non c'e' un call_soon_threadsafe per
+#     messaggio
+#   - il loop prende fino a MAX_DRAIN messaggi, li raggruppa per rover e
+#     tipo e decodifica ogni gruppo in un colpo: i payload binari si
+#     concatenano e diventano un array numpy strutturato con un solo
+#     frombuffer, quelli JSON passano per json.loads
+#   - le righe si accodano a colonne numpy in memoria (una per campo) che
+#     ogni flush_interval s finiscono in fondo a un file per colonna
+#     (<cartella>/<rover>/<tipo>/<campo>.bin, little endian, solo
+#     aggiunte); la scrittura avviene in un thread dell'executor mentre il
+#     loop continua a ricevere
+#   - un crash durante la scrittura puo' lasciare colonne di lunghezze
+#     diverse: load() tiene le righe presenti in tutte
+# Topic che non sono di un rover (id non valido, tipo sconosciuto) e
+# payload illeggibili si contano e si scartano.
+#
+# Esempio:
+#   station = GroundStation("flotta")
+#   station.attach(mqtt_client)         # o broker.subscribe(filtro, station.receive)
+#   asyncio.run(station.run())          # fino a station.stop()
+#   columns = ground_station.load("flotta", "rover01", "distances")
+#
+# Uso: python3 ground_station.py run flotta [--broker broker.emqx.io] [--flush 5]
+#      python3 ground_station.py info flotta
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+import telemetry
+
+FLUSH_INTERVAL = 5.0     # s tra due scritture su disco
+MAX_PENDING = 100000     # messaggi in attesa del loop, oltre si scartano
+MAX_DRAIN = 5000         # messaggi decodificati per giro del loop
+CAPACITY = 4096          # righe iniziali delle colonne in memoria (poi raddoppiano)
+
+# Stessi campi e layout dei record binari di telemetry.py
+DTYPES = {
+    telemetry.KIND_DISTANCES: np.dtype([("timestamp", "<f8"), ("left", "<f4"), ("center", "<f4"),
+                                        ("right", "<f4")]),
+    telemetry.KIND_FLAME: np.dtype([("timestamp", "<f8"), ("status", "u1"), ("count", "<u4"),
+                                    ("duration", "<f4")]),
+}
+KINDS = {name: kind for kind, name in telemetry.TOPICS.items()}
+SUBSCRIPTIONS = [telemetry.topic("+", name) for name in telemetry.TOPICS.values()]
+
+_HEADER = struct.Struct('<BBH')     # intestazione dei lotti binari di telemetry.py
+_STATUS = {"CLEAR": telemetry.FLAME_CLEAR, "ALERT": telemetry.FLAME_ALERT, "ONGOING": telemetry.FLAME_ONGOING}
+
+# Contatori di GroundStation.stats
+STATS = {
+    "messages": "messaggi decodificati",
+    "samples": "campioni accodati alle colonne",
+    "rejected": "messaggi con topic non di un rover",
+    "invalid": "messaggi con payload illeggibile",
+    "dropped": "messaggi persi a coda piena",
+    "flushes": "scritture su disco",
+    "written": "campioni scritti su disco",
+}
+
+
+def _nan(value):
+    return np.nan if value is None else value
+
+
+# Righe di un lotto JSON (lista di oggetti, o un oggetto solo)
+def _json_rows(kind, payload):
+    data = json.loads(payload)
+    if not isinstance(data, list):
+        data = [data]
+    if kind == telemetry.KIND_DISTANCES:
+        rows = [(d["timestamp"], _nan(d["left"]), _nan(d["center"]), _nan(d["right"])) for d in data]
+    else:
+        rows = [(d["timestamp"], _STATUS[d["status"]], d["count"], d["duration"]) for d in data]
+    return np.array(rows, DTYPES[kind])
+
+
+# Corpo dei record di un lotto binario, dopo i controlli dell'intestazione
+def _binary_body(kind, payload):
+    version, payload_kind, count = _HEADER.unpack_from(payload, 0)
+    end = _HEADER.size + count * DTYPES[kind].itemsize
+    if payload_kind != kind or len(payload) < end:
+        raise ValueError("lotto binario non valido")
+    return memoryview(payload)[_HEADER.size:end]
+
+
+# Decodifica i payload di un rover e tipo, nell'ordine di arrivo: i binari
+# consecutivi diventano un solo frombuffer. Restituisce l'array e quanti
+# payload erano illeggibili.
+def decode_batch(kind, payloads):
+    dtype = DTYPES[kind]
+    parts, bodies, invalid = [], [], 0
+    for payload in payloads:
+        try:
+            if payload[:1] == bytes([telemetry.BINARY_VERSION]):
+                bodies.append(_binary_body(kind, payload))
+                continue
+            rows = _json_rows(kind, payload)
+        except (ValueError, KeyError, TypeError, OverflowError, struct.error):
+            invalid += 1
+            continue
+        if bodies:
+            parts.append(np.frombuffer(b"".join(bodies), dtype))
+            bodies = []
+        parts.append(rows)
+    if bodies:
+        parts.append(np.frombuffer(b"".join(bodies), dtype))
+    if not parts:
+        return np.empty(0, dtype), invalid
+    return (parts[0] if len(parts) == 1 else np.concatenate(parts)), invalid
+
+
+class ColumnStore:
+    # Righe di un tipo di un rover: una colonna numpy per campo, in memoria
+    # fino alla prossima take()
+    def __init__(self, directory, dtype, capacity=CAPACITY):
+        self.directory = directory
+        self.dtype = dtype
+        self.length = 0
+        self._columns = {name: np.empty(capacity, dtype[name]) for name in dtype.names}
+
+    def append(self, rows):
+        end = self.length + len(rows)
+        for name, column in self._columns.items():
+            if end > len(column):
+                grown = np.empty(max(end, 2 * len(column)), column.dtype)
+                grown[:self.length] = column[:self.length]
+                self._columns[name] = column = grown
+            column[self.length:end] = rows[name]
+        self.length = end
+
+    # Le righe in memoria da scrivere; le colonne ripartono vuote (nuovi
+    # array, quelli restituiti non si toccano piu')
+    def take(self):
+        chunk = {name: column[:self.length] for name, column in self._columns.items()}
+        self._columns = {name: np.empty(len(column), column.dtype) for name, column in self._columns.items()}
+        self.length = 0
+        return chunk
+
+
+# Aggiunge le colonne in fondo ai file (nel thread dell'executor)
+def write_chunk(directory, chunk):
+    os.makedirs(directory, exist_ok=True)
+    for name, column in chunk.items():
+        with open(os.path.join(directory, name + ".bin"), "ab") as f:
+            column.tofile(f)
+
+
+class GroundStation:
+    def __init__(self, directory, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stats = dict.fromkeys(STATS, 0)
+        self.stores = {}
+        self._inbox = deque()
+        self._loop = None
+        self._wakeup = None
+        self._signalled = False
+        self._stopping = False
+        self._writing = None
+
+    # Callback dei messaggi, da qualsiasi thread: non decodifica nulla
+    def receive(self, topic, payload):
+        if len(self._inbox) >= self.max_pending:
+            self.stats["dropped"] += 1
+            return
+        self._inbox.append((topic, payload))
+        # Un solo risveglio per raffica: il loop azzera _signalled prima di
+        # svuotare la coda, quindi nessun messaggio resta senza risveglio
+        if not self._signalled and self._loop is not None:
+            self._signalled = True
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # Client paho: abbonamenti a ogni (ri)connessione e messaggi a receive
+    def attach(self, client):
+        def on_connect(client, userdata, flags, rc):
+            for topic_filter in SUBSCRIPTIONS:
+                client.subscribe(topic_filter)
+            logging.info("Stazione a terra connessa (rc=%s)", rc)
+
+        client.on_connect = on_connect
+        client.on_message = lambda client, userdata, message: self.receive(message.topic, message.payload)
+
+    def stop(self):
+        self._stopping = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _store(self, rover, kind):
+        store = self.stores.get((rover, kind))
+        if store is None:
+            store = self.stores[rover, kind] = ColumnStore(
+                os.path.join(self.directory, rover, telemetry.TOPICS[kind]), DTYPES[kind])
+        return store
+
+    # Svuota fino a MAX_DRAIN messaggi dalla coda nelle colonne
+    def _ingest(self):
+        groups = {}
+        inbox = self._inbox
+        for _ in range(min(len(inbox), MAX_DRAIN)):
+            topic, payload = inbox.popleft()
+            parsed = telemetry.parse_topic(topic)
+            kind = KINDS.get(parsed[1]) if parsed else None
+            if kind is None:
+                self.stats["rejected"] += 1
+                continue
+            groups.setdefault((parsed[0], kind), []).append(payload)
+        for (rover, kind), payloads in groups.items():
+            rows, invalid = decode_batch(kind, payloads)
+            self.stats["messages"] += len(payloads) - invalid
+            self.stats["invalid"] += invalid
+            if len(rows):
+                self._store(rover, kind).append(rows)
+                self.stats["samples"] += len(rows)
+
+    # Passa le colonne in memoria all'executor; una scrittura alla volta,
+    # cosi' i file crescono nell'ordine di arrivo
+    async def flush(self):
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        chunks = [(store.directory, store.take()) for store in self.stores.values() if store.length]
+        if not chunks:
+            return
+        self.stats["flushes"] += 1
+        self.stats["written"] += sum(len(next(iter(chunk.values()))) for _, chunk in chunks)
+        self._writing = self._loop.run_in_executor(
+            None, lambda: [write_chunk(directory, chunk) for directory, chunk in chunks])
+
+    # Riceve fino a stop(); poi svuota la coda e aspetta l'ultima scrittura
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if self._inbox:
+            self._wakeup.set()
+        next_flush = self._loop.time() + self.flush_interval
+        while True:
+            if not self._inbox and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(0.0, next_flush - self._loop.time()))
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            self._signalled = False
+            self._ingest()
+            if self._stopping and not self._inbox:
+                break
+            if self._loop.time() >= next_flush:
+                await self.flush()
+                next_flush = self._loop.time() + self.flush_interval
+            elif self._inbox:
+                # Lascia girare gli altri task tra due blocchi
+                await asyncio.sleep(0)
+        await self.flush()
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        self._loop = None
+
+
+def rovers(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if telemetry.ROVER_ID_PATTERN.match(name))
+
+
+# Colonne di un rover e tipo ("distances" o "flame"), troncate alle righe
+# presenti in tutte
+def load(directory, rover, name):
+    dtype = DTYPES[KINDS[name]]
+    path = os.path.join(directory, rover, name)
+    columns = {}
+    for field in dtype.names:
+        file = os.path.join(path, field + ".bin")
+        columns[field] = np.fromfile(file, dtype[field]) if os.path.exists(file) else np.empty(0, dtype[field])
+    rows = min(len(column) for column in columns.values())
+    return {field: column[:rows] for field, column in columns.items()}
+
+
+def print_info(directory):
+    for rover in rovers(directory):
+        for name in telemetry.TOPICS.values():
+            columns = load(directory, rover, name)
+            timestamps = columns["timestamp"]
+            if not len(timestamps):
+                continue
+            print("{:<20} {:<10} {:9d} campioni  dal {} al {}".format(
+                rover, name, len(timestamps),
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamps.min())),
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamps.max()))))
+
+
+async def serve(station):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, station.stop)
+    await station.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stazione a terra per la telemetria di piu' rover")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="riceve la telemetria e la archivia")
+    run.add_argument("directory")
+    run.add_argument("--broker", default="broker.emqx.io")
+    run.add_argument("--port", type=int, default=1883)
+    run.add_argument("--flush", type=float, default=FLUSH_INTERVAL, help="s tra due scritture su disco")
+    info = sub.add_parser("info", help="rover e campioni archiviati")
+    info.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        print_info(args.directory)
+        return
+    import paho.mqtt.client as mqtt
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    station = GroundStation(args.directory, flush_interval=args.flush)
+    client = mqtt.Client("Stazione_Terra")
+    station.attach(client)
+    client.connect_async(args.broker, args.port, 60)
+    client.loop_start()
+    try:
+        asyncio.run(serve(station))
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    for key, description in STATS.items():
+        print("{:>10}  {}".format(station.stats[key], description))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Effetti LED in background.
+# Le sequenze sono dichiarate come liste di passi (LED accesi, durata) e le
+# suona un thread con il suo timer, cosi' sirena e segnalazioni non fermano
+# mai il loop di controllo. I pin vengono scritti solo quando cambiano.
+#
+# Ci sono due livelli: lo stato (come LED_Status di ProgrammaEsempio.py),
+# che resta finche' non lo si cambia, e l'allarme (es. la sirena), che
+# passa sopra allo stato per un certo numero di ripetizioni o finche' non
+# lo si ferma, poi si torna allo stato.
+
+import threading
+import time
+
+# Pin dei LED del robot (accesi con il pin LOW)
+LED0 = 10
+LED1 = 9
+LED2 = 25
+
+# Passi: (LED0, LED1, LED2 accesi, durata in s); durata None = fisso
+PATTERNS = {
+    "off":      (((0, 0, 0), None),),
+    "warning":  (((1, 1, 0), None),),
+    "danger":   (((1, 1, 1), None),),
+    "obstacle": (((0, 1, 0), None),),
+    "siren":    (((0, 0, 1), 0.5), ((1, 0, 0), 0.5)),
+}
+
+# Codici di LED_Status
+STATUS = ("off", "warning", "danger", "obstacle")
+
+
+class LedEngine:
+    def __init__(self, gpio, pins=(LED0, LED1, LED2), patterns=PATTERNS):
+        self.gpio = gpio
+        self.pins = pins
+        self.patterns = dict(patterns)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._status = "off"
+        self._alert = None
+        self._repeat = None
+        self._cycles = 0
+        self._changed = True
+        self._levels = [None] * len(pins)
+        self.writes = 0
+
+    # Stato di base, mostrato quando non c'e' un allarme
+    def set_status(self, name):
+        if name not in self.patterns:
+            name = STATUS[name]
+        with self._cond:
+            if name != self._status:
+                self._status = name
+                if self._alert is None:
+                    self._changed = True
+                    self._cond.notify_all()
+
+    # Allarme sopra lo stato: repeat cicli della sequenza, None = finche'
+    # non si chiama stop_alert(). Ritorna subito; se lo stesso allarme e'
+    # gia' in corso lo prolunga senza farlo ripartire da capo.
+    def play(self, name, repeat=1):
+        with self._cond:
+            self._repeat = repeat
+            self._cycles = 0
+            if name != self._alert:
+                self._alert = name
+                self._changed = True
+                self._cond.notify_all()
+
+    def stop_alert(self):
+        with self._cond:
+            if self._alert is not None:
+                self._alert = None
+                self._changed = True
+                self._cond.notify_all()
+
+    def alerting(self):
+        return self._alert is not None
+
+    # Aspetta la fine dell'allarme in corso (es. prima di spegnere tutto)
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._alert is None, timeout)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="leds", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _write(self, leds):
+        for i, on in enumerate(leds):
+            level = self.gpio.LOW if on else self.gpio.HIGH
+            if self._levels[i] != level:
+                self.gpio.output(self.pins[i], level)
+                self._levels[i] = level
+                self.writes += 1
+
+    def _run(self):
+        deadline = None
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                if self._changed:
+                    self._changed = False
+                    steps = self.patterns[self._alert or self._status]
+                    step = 0
+                    self._cycles = 0
+                    deadline = now
+                elif deadline is not None and now >= deadline:
+                    step += 1
+                    if step == len(steps):
+                        step = 0
+                        self._cycles += 1
+                        if self._alert is not None and self._repeat is not None and self._cycles >= self._repeat:
+                            self._alert = None
+                            self._changed = True
+                            self._cond.notify_all()
+                            continue
+                else:
+                    self._cond.wait(None if deadline is None else deadline - now)
+                    continue
+                leds, duration = steps[step]
+                self._write(leds)
+                # Scadenze a passo fisso, senza accumulare ritardo
+                deadline = None if duration is None else deadline + duration
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Segui linea proporzionale con i due infrarossi IR_L e IR_R.
+# Invece di alternare avanti a tutta e rotazioni sul posto, le due ruote
+# vanno sempre avanti con duty diversi (PWM su ENA/ENB) in funzione della
+# posizione stimata della linea:
+#   - errore e: +1 linea sotto il sensore sinistro, -1 sotto il destro,
+#     0 tra i due (nessun sensore sulla linea)
+#   - i fronti dei sensori arrivano dal callback (add_event_detect) e
+#     ricalcolano subito la sterzata; la storia degli ultimi fronti da' la
+#     velocita' con cui la linea si sposta (quanto in fretta e' passata da
+#     un sensore all'altro)
+#   - l'integrale dell'errore (limitato) tiene la sterzata nelle curve e,
+#     persa la linea oltre un sensore, continua a girare dal lato dove e'
+#     sparita
+#   - u = kp * e + ki * integrale + kd * velocita'
+#     ruota sinistra = base - u, ruota destra = base + u (0-100)
+# Con entrambi i sensori sulla linea (linea di stop) il rover si ferma,
+# come nel FollowLine originale.
+# update() va chiamato periodicamente (es. come tick di modes.Behavior),
+# per far crescere l'integrale anche senza fronti.
+
+import threading
+import time
+from collections import deque
+
+BASE_DUTY = 60      # % delle ruote in rettilineo
+KP = 40.0
+KI = 60.0           # per secondo di errore
+KD = 0.5            # per unita' di errore al secondo
+I_LIMIT = 1.0       # limite dell'integrale (s di errore)
+RATE_WINDOW = 0.15  # s di validita' della velocita' dopo l'ultimo fronte
+RATE_LIMIT = 10.0   # unita' di errore al secondo (fronti ravvicinati sono rumore)
+HISTORY = 8
+
+
+class LineFollower:
+    # drive(sinistra, destra): duty 0-100 delle ruote, in avanti
+    def __init__(self, gpio, left_pin, right_pin, drive, base=BASE_DUTY, kp=KP, ki=KI, kd=KD,
+                 active_level=None, clock=None):
+        self.gpio = gpio
+        self.left_pin = left_pin
+        self.right_pin = right_pin
+        self.drive = drive
+        self.base = base
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        # Il sensore sulla linea nera porta il pin alto
+        self.active_level = gpio.HIGH if active_level is None else active_level
+        self.clock = clock or time.monotonic_ns
+        self._lock = threading.Lock()
+        self.history = deque(maxlen=HISTORY)   # (t_ns, errore), None = linea di stop
+        self._integral = 0.0
+        self._error = 0
+        self._last_ns = None
+        self._output = None
+        self.edges = 0
+        self.updates = 0
+
+    def start(self):
+        with self._lock:
+            self.history.clear()
+            self._integral = 0.0
+            self._error = 0
+            self._last_ns = None
+            self._output = None
+        for pin in (self.left_pin, self.right_pin):
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._on_edge)
+        self._on_edge(None)
+
+    def stop(self):
+        for pin in (self.left_pin, self.right_pin):
+            self.gpio.remove_event_detect(pin)
+        with self._lock:
+            self._output = None
+        self.drive(0, 0)
+
+    def _read(self):
+        left = self.gpio.input(self.left_pin) == self.active_level
+        right = self.gpio.input(self.right_pin) == self.active_level
+        if left and right:
+            return None
+        return 1 if left else -1 if right else 0
+
+    def _on_edge(self, channel):
+        now = self.clock()
+        error = self._read()
+        with self._lock:
+            self.edges += 1
+            if not self.history or self.history[-1][1] != error:
+                self.history.append((now, error))
+        self.update()
+
+    # Velocita' della linea (unita' di errore al secondo) dagli ultimi due fronti
+    def _rate(self, now):
+        if len(self.history) < 2:
+            return 0.0
+        (t0, e0), (t1, e1) = self.history[-2], self.history[-1]
+        if e0 is None or e1 is None or now - t1 > RATE_WINDOW * 1e9:
+            return 0.0
+        rate = (e1 - e0) / max((t1 - t0) / 1e9, 1e-3)
+        return max(-RATE_LIMIT, min(RATE_LIMIT, rate))
+
+    def update(self):
+        with self._lock:
+            now = self.clock()
+            if not self.history:
+                return
+            error = self.history[-1][1]
+            dt = 0.0 if self._last_ns is None else (now - self._last_ns) / 1e9
+            self._last_ns = now
+            self.updates += 1
+            # L'errore precedente e' rimasto tale fino a adesso
+            if self._error is not None:
+                self._integral = max(-I_LIMIT, min(I_LIMIT, self._integral + self._error * dt))
+            self._error = error
+            if error is None:
+                output = (0, 0)
+            else:
+                u = self.kp * error + self.ki * self._integral + self.kd * self._rate(now)
+                # Oltre il 100% si toglie l'eccesso a entrambe le ruote, cosi'
+                # la differenza (la sterzata) resta anche con base alta
+                excess = max(0.0, self.base + abs(u) - 100)
+                left = self.base - u - excess
+                right = self.base + u - excess
+                output = (int(max(0, min(100, left))), int(max(0, min(100, right))))
+            if output == self._output:
+                return
+            self._output = output
+        self.drive(*output)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Log senza attese nel loop di controllo.
+# logging.info e le stampe a terminale dei punti caldi (distanze, motori)
+# diventano un inserimento in una coda limitata; la formattazione e la
+# scrittura su file (la SD del Pi) o sul terminale (spesso una sessione SSH
+# lenta) le fa un thread in background (logging.handlers.QueueListener).
+#   - coda piena: il messaggio si perde e si conta in dropped, il chiamante
+#     non aspetta mai
+#   - il messaggio si formatta nel thread di scrittura: chi chiama paga solo
+#     la creazione del LogRecord, purche' usi gli argomenti di logging
+#     (logging.info("d=%.2f", d)) e non una stringa gia' formattata
+#   - i messaggi del logger "console" vanno sul terminale e non nel file
+#
+# Esempio:
+#   pipeline = logpipe.setup('rover_patrol.log')
+#   logpipe.console.info("Distanza rilevata: %.2fm", distance)
+#   ...
+#   pipeline.stop()      # scrive quello che e' rimasto in coda
+
+import logging
+import logging.handlers
+import queue
+import sys
+
+QUEUE_SIZE = 1000
+FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CONSOLE = "console"
+
+# Stampe a terminale dei punti caldi, al posto di print
+console = logging.getLogger(CONSOLE)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    # Il record resta com'e' (stesso processo): niente format nel chiamante
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _OnlyConsole(logging.Filter):
+    def filter(self, record):
+        return record.name == CONSOLE
+
+
+class _NoConsole(logging.Filter):
+    def filter(self, record):
+        return record.name != CONSOLE
+
+
+class Pipeline:
+    def __init__(self, handler, listener):
+        self.handler = handler
+        self.listener = listener
+
+    @property
+    def dropped(self):
+        return self.handler.dropped
+
+    def pending(self):
+        return self.handler.queue.qsize()
+
+    # Scrive quello che e' rimasto in coda e chiude file e terminale
+    def stop(self):
+        logging.getLogger().removeHandler(self.handler)
+        console.removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+# Al posto di logging.basicConfig: filename None = niente file, stream
+# None = niente terminale; handlers sono altri handler per il file di log
+# (es. un RotatingFileHandler), anche loro scritti dal thread
+def setup(filename=None, level=logging.INFO, stream=sys.stdout, fmt=FORMAT, maxsize=QUEUE_SIZE, handlers=()):
+    handlers = list(handlers)
+    for handler in handlers:
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter(fmt))
+        handler.addFilter(_NoConsole())
+    if filename is not None:
+        file_handler = logging.FileHandler(filename)
+        file_handler.setFormatter(logging.Formatter(fmt))
+        file_handler.addFilter(_NoConsole())
+        handlers.append(file_handler)
+    if stream is not None:
+        stream_handler = logging.StreamHandler(stream)
+        stream_handler.setFormatter(logging.Formatter('%(message)s'))
+        stream_handler.addFilter(_OnlyConsole())
+        handlers.append(stream_handler)
+    handler = DroppingQueueHandler(queue.Queue(maxsize))
+    listener = logging.handlers.QueueListener(handler.queue, *handlers)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    # Il terminale non passa dal logger radice: niente doppioni nel file
+    console.setLevel(logging.INFO)
+    console.propagate = False
+    console.addHandler(handler)
+    listener.start()
+    return Pipeline(handler, listener)
@@ -0,0 +1,573 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Analisi dei rover_patrol.log (anche grandi o ruotati, .1 .2 ... e .gz).
+# Il file si legge con mmap a blocchi di BLOCK byte, visti da numpy senza
+# copie: le righe si trovano dai '\n', il tipo di riga (Valutazione,
+# Direzione presa, Rover arrestato, ALLERTA) dai primi byte del messaggio e
+# l'istante dalle cifre in posizione fissa, tutto a vettori sull'intero
+# blocco, senza un giro Python per riga. Le righe con un altro formato
+# (traceback, messaggi su piu' righe) si ignorano.
+# Statistiche:
+#   - istogramma delle direzioni prese
+#   - intervallo tra due valutazioni (media, p50, p95, max), senza le pause
+#     piu' lunghe di SESSION_GAP e senza quelle dopo un arresto
+#   - valutazioni con le tre distanze uguali (sensore bloccato o eco falsa)
+#   - sessioni: dalla prima riga dopo un arresto (o dopo una pausa) a
+#     "Rover arrestato", con la durata; un arresto senza righe prima (in
+#     testa al log o subito dopo un altro arresto) non e' una sessione
+# Indice dei tempi: il comando index salva accanto al log <log>.idx con
+# l'istante e l'offset di una riga utile ogni INDEX_STEP byte. Con
+# --from/--to stats e grep usano l'indice, se c'e' ed e' ancora valido
+# (stessa dimensione e data del log), e leggono solo il tratto richiesto;
+# senza indice leggono tutto. Solo index scrive file.
+# Gli istanti del log sono ora locale senza fuso: si trattano come UTC per
+# fare i conti e si stampano nello stesso formato.
+#
+# Uso: python3 logscan.py stats log... [--from "2018-05-20 01:42"] [--to ...]
+#      python3 logscan.py grep log... --from ... --to ...
+#      python3 logscan.py index log...
+
+import argparse
+import calendar
+import gzip
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+BLOCK = 4 << 20             # byte di log per blocco
+INDEX_STEP = 64 << 10       # byte di log tra due voci dell'indice
+INDEX_VERSION = 1
+SESSION_GAP = 60.0          # s senza righe utili = sessione nuova
+INTERVAL_BUCKET = 0.01      # s, risoluzione dei percentili degli intervalli
+DISORDER = 1.0              # s di righe fuori ordine tollerate (thread diversi)
+ANOMALIES_SHOWN = 10
+
+_INDEX_HEADER = struct.Struct("<4sHqqqq")
+_INDEX_MAGIC = b"RVLX"
+
+# Tipi di riga utile
+SCAN = 1        # Valutazione - L:..m C:..m R:..m
+DIRECTION = 2   # Direzione presa: ...
+STOP = 3        # Rover arrestato
+ALERT = 4       # ALLERTA: Rilevata fiamma.
+
+STAMP = re.compile(rb"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} ")
+STAMP_SIZE = 23
+NAME_SIZE = 16
+VALUE_SIZE = 12         # caratteri massimi di una distanza
+PADDING = 64
+
+# Inizio del messaggio per tipo (si confrontano i primi 8 byte); il
+# messaggio comincia dopo "AAAA-MM-GG hh:mm:ss,mmm - LIVELLO - "
+_PREFIXES = ((SCAN, b"Valutazione - L:"), (DIRECTION, b"Direzione presa:"),
+             (STOP, b"Rover arrestato"), (ALERT, b"ALLERTA: Rilevata fiamma"))
+_SCAN_HEAD = 16         # len("Valutazione - L:")
+_DIRECTION_HEAD = 17    # len("Direzione presa: ")
+_WORDS = {code: np.frombuffer(text[:8], "<u8")[0] for code, text in _PREFIXES}
+# (colonna, carattere) fissi dell'istante e del " - " che lo segue
+_SEPARATORS = [(column, ord(char)) for column, char in enumerate("0000-00-00 00:00:00,000 - ") if char != "0"]
+_LEVELS = {b"I": 4, b"W": 7, b"E": 5, b"D": 5, b"C": 8}
+_level_size = np.zeros(256, np.int64)
+for _initial, _size in _LEVELS.items():
+    _level_size[ord(_initial)] = _size
+
+# Righe utili di un blocco, un vettore per campo
+Rows = namedtuple('Rows', ['t', 'kind', 'name', 'equal', 'value', 'offset'])
+
+
+def _take(rows, mask):
+    return Rows(*(field[mask] for field in rows))
+
+
+# Byte buf[position + 0 .. width-1] per ogni posizione, come righe di una
+# matrice (buf ha PADDING zeri in fondo)
+def _gather(buf, positions, width):
+    return np.lib.stride_tricks.sliding_window_view(buf, width)[positions]
+
+
+def _as_bytes(matrix):
+    return np.ascontiguousarray(matrix).view("S{}".format(matrix.shape[1])).ravel()
+
+
+# Pesi delle cifre di "AAAA-MM-GG hh:mm:ss,mmm": la data come AAAAMMGG e
+# l'ora come ms dalla mezzanotte, ciascuna con un solo prodotto (in
+# float64, esatto sotto 2**53 e molto piu' veloce del prodotto tra interi)
+_DATE_WEIGHTS = np.zeros(STAMP_SIZE)
+_DATE_WEIGHTS[[0, 1, 2, 3, 5, 6, 8, 9]] = [10000000, 1000000, 100000, 10000, 1000, 100, 10, 1]
+_TIME_WEIGHTS = np.zeros(STAMP_SIZE)
+_TIME_WEIGHTS[[11, 12, 14, 15, 17, 18, 20, 21, 22]] = [36000000, 3600000, 600000, 60000, 10000, 1000, 100, 10, 1]
+
+
+# Istanti (una riga di byte per istante) in ms dal 1970; i giorni con la
+# formula dei giorni civili
+def _millis(stamps):
+    stamps = stamps.astype(np.float64)
+    date = (stamps @ _DATE_WEIGHTS - 48 * _DATE_WEIGHTS.sum()).astype(np.int64)
+    of_day = (stamps @ _TIME_WEIGHTS - 48 * _TIME_WEIGHTS.sum()).astype(np.int64)
+    year, month, day = date // 10000, date // 100 % 100, date % 100
+    year = year - (month <= 2)
+    era = year // 400
+    of_era = year - era * 400
+    of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    days = era * 146097 + of_era * 365 + of_era // 4 - of_era // 100 + of_year - 719468
+    return days * 86400000 + of_day
+
+
+def line_time(line):
+    return int(_millis(np.frombuffer(line[:STAMP_SIZE], np.uint8)[None, :])[0])
+
+
+# Righe utili di un blocco di byte che comincia a inizio riga
+def parse_block(data):
+    if not len(data):
+        return Rows(*(np.zeros(0, dtype) for dtype in (np.int64, np.int8, "S1", bool, float, np.int64)))
+    buf = np.zeros(len(data) + PADDING, np.uint8)
+    buf[:len(data)] = np.frombuffer(data, np.uint8)
+    ends = np.flatnonzero(buf[:len(data)] == 10)
+    if data[-1] != 10:
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    ends = ends - (buf[np.maximum(ends - 1, 0)] == 13)     # \r\n
+    head = _gather(buf, starts, STAMP_SIZE + 4)
+    message = starts + STAMP_SIZE + 6 + _level_size[head[:, STAMP_SIZE + 3]]
+    valid = ends - starts >= STAMP_SIZE + 4
+    for column, char in _SEPARATORS:
+        valid &= head[:, column] == char
+    for offset, char in enumerate(b" - ", -3):
+        valid &= buf[message + offset] == char
+    # Tipo dai primi 8 byte del messaggio, letti come un intero
+    words = np.ascontiguousarray(_gather(buf, message, 8)).view("<u8").ravel()
+    kind = np.zeros(len(starts), np.int8)
+    for code, text in _PREFIXES:
+        kind[words == _WORDS[code]] = code
+    useful = np.flatnonzero(valid & (kind > 0) & (message < ends))
+    starts, ends, message, kind = starts[useful], ends[useful], message[useful], kind[useful]
+    t = _millis(head[useful, :STAMP_SIZE])
+
+    # Nome della direzione fino a fine riga
+    name = np.zeros(len(useful), "S{}".format(NAME_SIZE))
+    rows = np.flatnonzero(kind == DIRECTION)
+    if len(rows):
+        first = message[rows] + _DIRECTION_HEAD
+        letters = _gather(buf, first, NAME_SIZE)
+        letters[np.arange(NAME_SIZE) >= (ends[rows] - first)[:, None]] = 0
+        name[rows] = _as_bytes(letters)
+
+    # Valutazioni con tre distanze scritte uguali: "L:Xm C:Xm R:Xm" con X
+    # di k caratteri, quindi messaggio lungo 25 + 3k
+    equal = np.zeros(len(useful), bool)
+    value = np.full(len(useful), np.nan)
+    rows = np.flatnonzero(kind == SCAN)
+    size = ends[rows] - message[rows] - (_SCAN_HEAD + 9)
+    candidates = (size > 0) & (size % 3 == 0) & (size <= 3 * VALUE_SIZE)
+    rows, size = rows[candidates], size[candidates] // 3
+    for k in np.unique(size):
+        group = rows[size == k]
+        first = message[group] + _SCAN_HEAD
+        left = _gather(buf, first, k)
+        match = (np.all(left == _gather(buf, first + k + 4, k), axis=1) &
+                 np.all(left == _gather(buf, first + 2 * k + 8, k), axis=1) &
+                 np.all(_gather(buf, first + k, 4) == np.frombuffer(b"m C:", np.uint8), axis=1) &
+                 np.all(_gather(buf, first + 2 * k + 4, 4) == np.frombuffer(b"m R:", np.uint8), axis=1))
+        equal[group[match]] = True
+        value[group[match]] = _as_bytes(left[match]).astype(float)
+    return Rows(t, kind, name, equal, value, starts)
+
+
+def parse_time(text):
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d %H", "%Y-%m-%d"):
+        try:
+            return calendar.timegm(time.strptime(text, fmt)) * 1000
+        except ValueError:
+            pass
+    raise ValueError("istante non valido: {!r} (es. \"2018-05-20 01:42:30\")".format(text))
+
+
+def format_time(ms):
+    return "{},{:03d}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ms // 1000)), ms % 1000)
+
+
+class LogStats:
+    def __init__(self):
+        self.lines = 0
+        self.scans = 0
+        self.directions = {}
+        self.equal = 0
+        self.anomalies = []
+        self.alerts = 0
+        self.first = None
+        self.last = None
+        self.sessions = []
+        self._session_start = None
+        self._stopped = True        # l'ultima riga era un arresto (o non ce n'e')
+        self._last_scan = None      # None dopo un arresto
+        self._intervals = np.zeros(int(SESSION_GAP / INTERVAL_BUCKET) + 2, np.int64)
+        self._interval_sum = 0
+        self._interval_max = 0
+
+    # Le righe utili di un blocco (Rows), in ordine di file
+    def add(self, rows):
+        t = rows.t
+        count = len(t)
+        if not count:
+            return
+        scan = rows.kind == SCAN
+        stop = rows.kind == STOP
+
+        named, counts = np.unique(rows.name[rows.kind == DIRECTION], return_counts=True)
+        for name, n in zip(named, counts):
+            name = name.decode("ascii", "replace")
+            self.directions[name] = self.directions.get(name, 0) + int(n)
+        self.alerts += int(np.count_nonzero(rows.kind == ALERT))
+        self.scans += int(np.count_nonzero(scan))
+        self.equal += int(np.count_nonzero(rows.equal))
+        for row in np.flatnonzero(rows.equal)[:ANOMALIES_SHOWN - len(self.anomalies)]:
+            self.anomalies.append((int(t[row]), float(rows.value[row])))
+
+        # Intervalli tra valutazioni senza arresti in mezzo
+        stops_before = np.cumsum(stop) - stop
+        scan_rows = np.flatnonzero(scan)
+        if len(scan_rows):
+            times = t[scan_rows]
+            gaps = np.diff(times)
+            valid = stops_before[scan_rows][1:] == stops_before[scan_rows][:-1]
+            if self._last_scan is not None and stops_before[scan_rows[0]] == 0:
+                gaps = np.concatenate(([times[0] - self._last_scan], gaps))
+                valid = np.concatenate(([True], valid))
+            gaps = gaps[valid & (gaps >= 0) & (gaps <= SESSION_GAP * 1000)]
+            if len(gaps):
+                buckets = np.minimum(gaps // int(INTERVAL_BUCKET * 1000), len(self._intervals) - 1)
+                self._intervals += np.bincount(buckets, minlength=len(self._intervals))
+                self._interval_sum += int(gaps.sum())
+                self._interval_max = max(self._interval_max, int(gaps.max()))
+            self._last_scan = int(times[-1]) if stops_before[-1] + stop[-1] == stops_before[scan_rows[-1]] else None
+        elif stop.any():
+            self._last_scan = None
+
+        # Sessioni: comincia una sessione la prima riga che non e' un arresto
+        # dopo un arresto o dopo una pausa; la pausa chiude quella aperta
+        # senza arresto, un arresto chiude quella aperta se c'e'
+        rows_index = np.arange(count)
+        previous = np.concatenate(([t[0] if self.last is None else self.last], t[:-1]))
+        after_stop = np.concatenate(([self._stopped], stop[:-1]))
+        pause = (t - previous > SESSION_GAP * 1000) & ~after_stop
+        latest = np.maximum.accumulate(np.where((after_stop | pause) & ~stop, rows_index, -1))
+        last_stop = np.maximum.accumulate(np.where(stop, rows_index, -1))
+        stop_before = np.concatenate(([-1], last_stop[:-1]))
+
+        def started(row):
+            return int(t[latest[row]]) if row >= 0 and latest[row] >= 0 else self._session_start
+
+        def opened(row):
+            if latest[row] >= 0:
+                return latest[row] > stop_before[row]
+            return stop_before[row] < 0 and self._session_start is not None
+
+        for row in np.flatnonzero(pause | stop):
+            if pause[row]:
+                self.sessions.append((started(row - 1), int(previous[row]), False))
+            elif stop[row] and opened(row):
+                self.sessions.append((started(row), int(t[row]), True))
+        self._stopped = bool(stop[-1])
+        self._session_start = None if self._stopped else started(count - 1)
+
+        if self.first is None:
+            self.first = int(t[0])
+        self.last = int(t[-1])
+        self.lines += count
+
+    def intervals(self):
+        count = int(self._intervals.sum())
+        return count, (self._interval_sum / count / 1000 if count else 0.0)
+
+    def percentile(self, fraction):
+        count = self._intervals.sum()
+        if not count:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self._intervals), fraction * count))
+        return (bucket + 1) * INTERVAL_BUCKET
+
+    def closed_sessions(self):
+        sessions = list(self.sessions)
+        if self._session_start is not None:
+            sessions.append((self._session_start, self.last, False))
+        return sessions
+
+    def report(self):
+        rows = ["righe utili {}  da {} a {}".format(
+            self.lines, format_time(self.first) if self.first is not None else "-",
+            format_time(self.last) if self.last is not None else "-")]
+        decisions = sum(self.directions.values())
+        rows.append("direzioni ({}):".format(decisions))
+        for name, n in sorted(self.directions.items(), key=lambda item: -item[1]):
+            rows.append("  {:<10} {:8d}  {:5.1f}%".format(name, n, 100 * n / decisions))
+        count, mean = self.intervals()
+        rows.append("intervallo tra valutazioni ({}): media {:.2f}s  p50 {:.2f}s  p95 {:.2f}s  max {:.2f}s".format(
+            count, mean, self.percentile(0.5), self.percentile(0.95), self._interval_max / 1000))
+        rows.append("distanze tutte uguali: {} su {} valutazioni ({:.1f}%)".format(
+            self.equal, self.scans, 100 * self.equal / self.scans if self.scans else 0.0))
+        for ms, value in self.anomalies:
+            rows.append("  {}  {:.2f}m".format(format_time(ms), value))
+        if self.equal > len(self.anomalies):
+            rows.append("  ...")
+        if self.alerts:
+            rows.append("allarmi fiamma: {}".format(self.alerts))
+        sessions = self.closed_sessions()
+        durations = [(end - start) / 1000 for start, end, _ in sessions]
+        rows.append("sessioni: {} (arrestate {}), durata media {:.1f}s, max {:.1f}s".format(
+            len(sessions), sum(1 for _, _, stopped in sessions if stopped),
+            sum(durations) / len(durations) if durations else 0.0, max(durations, default=0.0)))
+        for start, end, stopped in sessions[:ANOMALIES_SHOWN]:
+            rows.append("  {} -> {}  {:8.1f}s{}".format(
+                format_time(start), format_time(end), (end - start) / 1000, "" if stopped else "  (senza arresto)"))
+        if len(sessions) > ANOMALIES_SHOWN:
+            rows.append("  ...")
+        return rows
+
+
+# Indice: istante e offset della prima riga utile ogni INDEX_STEP byte
+# e primo e ultimo istante del file, per saltare i log fuori dal tratto
+class TimeIndex:
+    def __init__(self, size=0, mtime_ns=0, first=None, last=None, times=(), offsets=()):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.first = first
+        self.last = last
+        self.times = list(times)
+        self.offsets = list(offsets)
+
+    def add(self, ms, offset):
+        self.times.append(ms)
+        self.offsets.append(offset)
+
+    def span(self, first, last):
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+
+    def overlaps(self, start, end):
+        return (self.first is not None and (start is None or self.last >= start) and
+                (end is None or self.first <= end))
+
+    # Offset da cui leggere per trovare tutte le righe da start in poi
+    def seek(self, start):
+        position = int(np.searchsorted(self.times, start - int(DISORDER * 1000))) - 1
+        return self.offsets[position] if position >= 0 else 0
+
+    def save(self, path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, INDEX_VERSION, self.size, self.mtime_ns,
+                                       -1 if self.first is None else self.first, -1 if self.last is None else self.last))
+            f.write(np.array([self.times, self.offsets], "<i8").reshape(2, -1).tobytes())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, size, mtime_ns, first, last = _INDEX_HEADER.unpack_from(data)
+        if magic != _INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("{}: indice non valido".format(path))
+        times, offsets = np.frombuffer(data, "<i8", offset=_INDEX_HEADER.size).reshape(2, -1)
+        if first < 0:
+            first = last = None
+        return cls(size, mtime_ns, first, last, times.tolist(), offsets.tolist())
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+# L'indice salvato se corrisponde ancora al log, altrimenti None
+def load_index(path):
+    try:
+        index = TimeIndex.load(index_path(path))
+        info = os.stat(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if (index.size, index.mtime_ns) != (info.st_size, info.st_mtime_ns):
+        return None
+    return index
+
+
+# Righe utili entro [start, end]; None se il blocco e' gia' oltre end (di
+# piu' di DISORDER)
+def _select(rows, start, end):
+    if not len(rows.t) or (start is None and end is None):
+        return rows
+    if end is not None and rows.t.min() > end + DISORDER * 1000:
+        return None
+    keep = np.ones(len(rows.t), bool)
+    if start is not None:
+        keep &= rows.t >= start
+    if end is not None:
+        keep &= rows.t <= end
+    return rows if keep.all() else _take(rows, keep)
+
+
+# Blocchi di data da offset in poi, tagliati a fine riga
+def _blocks(data, offset=0, block=BLOCK):
+    size = len(data)
+    while offset < size:
+        end = data.find(b"\n", min(offset + block, size) - 1)
+        end = size if end < 0 else end + 1
+        yield offset, end
+        offset = end
+
+
+# Partendo da un indice (block=INDEX_STEP) si legge a blocchi piccoli: il
+# tratto cercato e' di solito breve
+def _scan_mapped(data, offset, stats, start, end, index, block=BLOCK):
+    view = memoryview(data)
+    try:
+        for first, last in _blocks(data, offset, block):
+            rows = parse_block(view[first:last])
+            if index is not None and len(rows.t):
+                # Prima riga utile dopo ogni multiplo di INDEX_STEP
+                marks = np.unique(np.searchsorted(rows.offset, np.arange(0, last - first, INDEX_STEP)))
+                for row in marks[marks < len(rows.t)]:
+                    index.add(int(rows.t[row]), first + int(rows.offset[row]))
+                index.span(int(rows.t.min()), int(rows.t.max()))
+            rows = _select(rows, start, end)
+            if rows is None:
+                # Oltre end: si continua solo per finire l'indice
+                if index is None:
+                    return
+                continue
+            stats.add(rows)
+    finally:
+        view.release()
+
+
+def _scan_gzip(path, stats, start, end):
+    with gzip.open(path, "rb") as f:
+        tail = b""
+        while True:
+            block = f.read(BLOCK)
+            data = tail + block
+            cut = data.rfind(b"\n") + 1 if block else len(data)
+            data, tail = data[:cut], data[cut:]
+            rows = _select(parse_block(data), start, end)
+            if rows is None:
+                return
+            stats.add(rows)
+            if not block:
+                return
+
+
+# Aggiunge a stats le righe di un log; con start/end (ms) e un indice valido
+# legge solo il tratto richiesto. Con build_index (comando index) legge
+# tutto e scrive l'indice; ritorna True se l'ha scritto.
+def scan_file(path, stats, start=None, end=None, build_index=False):
+    if path.endswith(".gz"):
+        _scan_gzip(path, stats, start, end)
+        return False
+    info = os.stat(path)
+    if info.st_size == 0:
+        return False
+    ranged = start is not None or end is not None
+    index = load_index(path) if ranged and not build_index else None
+    if index is not None and not index.overlaps(start, end):
+        return False
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if index is not None:
+            _scan_mapped(data, 0 if start is None else index.seek(start), stats, start, end, None, INDEX_STEP)
+            return False
+        fresh = TimeIndex(info.st_size, info.st_mtime_ns) if build_index else None
+        _scan_mapped(data, 0, stats, start, end, fresh)
+    if fresh is None:
+        return False
+    try:
+        fresh.save(index_path(path))
+    except OSError:
+        return False
+    return True
+
+
+def first_time(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            if STAMP.match(line):
+                return line_time(line)
+    return None
+
+
+# I log ruotati si leggono dal piu' vecchio, in base alla prima riga
+def ordered(paths):
+    stamped = [(first_time(path), path) for path in paths]
+    return [path for stamp, path in sorted(stamped, key=lambda item: (item[0] is None, item[0] or 0))]
+
+
+def analyze(paths, start=None, end=None):
+    stats = LogStats()
+    for path in ordered(paths):
+        scan_file(path, stats, start, end)
+    return stats
+
+
+# Righe del log (tutte, non solo quelle utili) nel tratto [start, end]
+def grep(path, start, end, out):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            _grep_lines(f, start, end, out)
+        return
+    index = load_index(path)
+    with open(path, "rb") as f:
+        if index is not None and start is not None:
+            f.seek(index.seek(start))
+        _grep_lines(f, start, end, out)
+
+
+def _grep_lines(lines, start, end, out):
+    inside = False
+    for line in lines:
+        if STAMP.match(line):
+            ms = line_time(line)
+            if end is not None and ms > end + DISORDER * 1000:
+                return
+            inside = (start is None or ms >= start) and (end is None or ms <= end)
+        if inside:
+            out.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analisi dei rover_patrol.log")
+    parser.add_argument("command", choices=("stats", "grep", "index"))
+    parser.add_argument("logs", nargs="+", help="file di log, anche ruotati o .gz")
+    parser.add_argument("--from", dest="start", help="istante iniziale, es. \"2018-05-20 01:42\"")
+    parser.add_argument("--to", dest="end", help="istante finale (compreso)")
+    args = parser.parse_args()
+    try:
+        start = parse_time(args.start) if args.start else None
+        end = parse_time(args.end) if args.end else None
+    except ValueError as e:
+        parser.error(str(e))
+    if end is not None and args.end.count(":") < 2:
+        # "01:42" comprende tutto il minuto, "2018-05-20" tutto il giorno
+        end += (60000 if ":" in args.end else 3600000 if len(args.end) > 10 else 86400000) - 1
+
+    if args.command == "index":
+        for path in args.logs:
+            began = time.perf_counter()
+            built = scan_file(path, LogStats(), build_index=True)
+            index = load_index(path)
+            print("{}: {} voci{} in {:.2f}s".format(path, len(index.times) if index else 0,
+                                                    "" if built else " (non scritto)", time.perf_counter() - began))
+    elif args.command == "grep":
+        out = sys.stdout.buffer
+        for path in ordered(args.logs):
+            grep(path, start, end, out)
+        out.flush()
+    else:
+        for row in analyze(args.logs, start, end).report():
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Mappa di occupazione della zona pattugliata.
+# Ogni lettura dell'ultrasuono, invece di servire solo alla scelta della
+# direzione, aggiorna una griglia numpy di log-odds: le celle nel cono del
+# sensore prima della distanza letta diventano piu' libere, quelle sull'arco
+# alla distanza letta piu' occupate. L'aggiornamento e' a vettori sulle sole
+# celle attorno al cono (qualche migliaio), senza giri Python per cella.
+# La posa del rover si stima a dead reckoning dai comandi ai motori: il
+# driver chiama DeadReckoning.command ad ogni cambio di duty (anche nelle
+# rampe) e tra due comandi si integra l'arco percorso a velocita' costante.
+# WHEEL_SPEED e TRACK vanno misurati sul rover; la posa deriva col tempo
+# (slittamenti, urti), quindi la mappa e' buona per la stanza, non per ore.
+#
+# Coordinate: metri, x in avanti alla partenza, y a sinistra, heading in
+# radianti in senso antiorario; la partenza e' (0, 0, 0) e sta al centro
+# della mappa. Cella [riga, colonna] = [y, x].
+#
+# Esempio:
+#   pose = DeadReckoning()
+#   motor_driver.on_drive(pose.command)
+#   grid = OccupancyGrid()
+#   grid.integrate([reading(pose.pose(), angle, distance) for angle, distance in ...])
+#   grid.clearance(pose.pose(), scanner.SERVO_CENTER)   # m liberi noti davanti
+#   grid.save("mappa.npz", pose.trail)
+#   grid.to_pgm("mappa.pgm", pose.trail)
+
+import math
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+import scanner
+
+RESOLUTION = 0.05       # m per cella
+SIZE = 12.0             # m di lato della mappa
+WHEEL_SPEED = 0.30      # m/s di una ruota con PWM al 100%
+TRACK = 0.30            # m, carreggiata efficace
+SENSOR_OFFSET = 0.10    # m, sensore davanti al centro del rover
+BEAM = math.radians(7.5)    # semiapertura del cono dell'HC-SR04
+MAX_RANGE = 4.0         # m, oltre la lettura non si usa
+HIT_DEPTH = 0.05        # m, spessore dell'arco occupato dietro la distanza letta
+L_FREE = -0.4           # log-odds per lettura di una cella libera
+L_OCCUPIED = 0.85       # log-odds per lettura di una cella occupata
+L_LIMIT = 5.0           # i log-odds restano in [-L_LIMIT, L_LIMIT]
+OCCUPIED = 0.65         # probabilita' oltre cui una cella e' un ostacolo
+TRAIL = 100000          # pose tenute per l'esportazione
+
+# Lettura dal sensore: origine e direzione del cono, distanza (m)
+Reading = namedtuple('Reading', ['x', 'y', 'bearing', 'distance'])
+
+
+# Lettura con il servo ad angle (gradi, scanner.SERVO_CENTER = avanti) dalla
+# posa (x, y, heading) del centro del rover
+def reading(pose, angle, distance):
+    x, y, heading = pose
+    return Reading(x + SENSOR_OFFSET * math.cos(heading), y + SENSOR_OFFSET * math.sin(heading),
+                   heading + math.radians(angle - scanner.SERVO_CENTER), distance)
+
+
+class DeadReckoning:
+    def __init__(self, pose=(0.0, 0.0, 0.0), wheel_speed=WHEEL_SPEED, track=TRACK, clock=None):
+        self.wheel_speed = wheel_speed
+        self.track = track
+        self.clock = clock or time.monotonic_ns
+        self._lock = threading.Lock()
+        self._x, self._y, self._heading = pose
+        self._left = 0.0
+        self._right = 0.0
+        self._t_ns = self.clock()
+        self.distance = 0.0
+        self.trail = deque([(self._x, self._y)], maxlen=TRAIL)
+
+    # Da registrare con MotorDriver.on_drive: duty con segno delle ruote
+    def command(self, left, right):
+        with self._lock:
+            self._advance()
+            self._left = left / 100 * self.wheel_speed
+            self._right = right / 100 * self.wheel_speed
+
+    def pose(self):
+        with self._lock:
+            self._advance()
+            return self._x, self._y, self._heading
+
+    # Arco percorso dall'ultimo comando, a velocita' delle ruote costanti
+    def _advance(self):
+        now = self.clock()
+        dt = (now - self._t_ns) / 1e9
+        self._t_ns = now
+        if dt <= 0 or not (self._left or self._right):
+            return
+        v = (self._left + self._right) / 2
+        omega = (self._right - self._left) / self.track
+        heading = self._heading + omega * dt
+        if abs(omega) > 1e-9:
+            self._x += v / omega * (math.sin(heading) - math.sin(self._heading))
+            self._y -= v / omega * (math.cos(heading) - math.cos(self._heading))
+        else:
+            self._x += v * dt * math.cos(self._heading)
+            self._y += v * dt * math.sin(self._heading)
+        self._heading = math.atan2(math.sin(heading), math.cos(heading))
+        self.distance += abs(v) * dt
+        if v:
+            self.trail.append((self._x, self._y))
+
+
+class OccupancyGrid:
+    def __init__(self, size=SIZE, resolution=RESOLUTION, center=(0.0, 0.0)):
+        self.resolution = resolution
+        self.cells = int(round(size / resolution))
+        self.origin = (center[0] - self.cells * resolution / 2, center[1] - self.cells * resolution / 2)
+        self.log_odds = np.zeros((self.cells, self.cells), np.float32)
+        self._lock = threading.Lock()
+        self.readings = 0
+        self._changed = None
+
+    # Cella (riga, colonna) del punto, None se fuori mappa
+    def cell(self, x, y):
+        column = int((x - self.origin[0]) // self.resolution)
+        row = int((y - self.origin[1]) // self.resolution)
+        if 0 <= row < self.cells and 0 <= column < self.cells:
+            return row, column
+        return None
+
+    def probability(self):
+        with self._lock:
+            return 1 / (1 + np.exp(-self.log_odds))
+
+    # Aggiunge le letture (Reading); distance None = nessun eco, la lettura
+    # non dice nulla e si salta
+    def integrate(self, readings):
+        tangent = math.tan(BEAM)
+        with self._lock:
+            for x, y, bearing, distance in readings:
+                if distance is None or not 0 < distance <= MAX_RANGE:
+                    continue
+                self.readings += 1
+                reach = distance + HIT_DEPTH
+                c, s = math.cos(bearing), math.sin(bearing)
+                # Rettangolo che contiene il cono
+                xs = (x, x + reach * math.cos(bearing - BEAM), x + reach * math.cos(bearing + BEAM), x + reach * c)
+                ys = (y, y + reach * math.sin(bearing - BEAM), y + reach * math.sin(bearing + BEAM), y + reach * s)
+                c0 = max(int((min(xs) - self.origin[0]) // self.resolution), 0)
+                c1 = min(int((max(xs) - self.origin[0]) // self.resolution) + 1, self.cells)
+                r0 = max(int((min(ys) - self.origin[1]) // self.resolution), 0)
+                r1 = min(int((max(ys) - self.origin[1]) // self.resolution) + 1, self.cells)
+                if c0 >= c1 or r0 >= r1:
+                    continue
+                dx = (self.origin[0] + (np.arange(c0, c1, dtype=np.float32) + 0.5) * self.resolution - x)[None, :]
+                dy = (self.origin[1] + (np.arange(r0, r1, dtype=np.float32) + 0.5) * self.resolution - y)[:, None]
+                along = dx * c + dy * s
+                across = dy * c - dx * s
+                # Mezza cella di tolleranza: vicino al sensore il cono e'
+                # piu' stretto di una cella
+                inside = np.abs(across) <= along * tangent + self.resolution / 2
+                rng = np.hypot(dx, dy)
+                free = inside & (rng < distance - self.resolution / 2)
+                hit = inside & (rng >= distance - self.resolution / 2) & (rng <= reach)
+                window = self.log_odds[r0:r1, c0:c1]
+                window += free * np.float32(L_FREE) + hit * np.float32(L_OCCUPIED)
+                np.clip(window, -L_LIMIT, L_LIMIT, out=window)
+                if self._changed is None:
+                    self._changed = [r0, r1, c0, c1]
+                else:
+                    changed = self._changed
+                    changed[:] = min(changed[0], r0), max(changed[1], r1), min(changed[2], c0), max(changed[3], c1)
+
+    # Rettangolo di celle (r0, r1, c0, c1) cambiate dall'ultima chiamata,
+    # None se nessuna: chi tiene dati derivati dalla mappa (planner.py)
+    # ricalcola solo quello
+    def take_changes(self):
+        with self._lock:
+            changed, self._changed = self._changed, None
+            return None if changed is None else tuple(changed)
+
+    # Distanza dal sensore (posa del rover, servo ad angle) che la mappa da'
+    # per libera lungo l'asse del cono: si ferma alla prima cella occupata o
+    # mai vista, al massimo max_range. 0 se davanti non si sa nulla.
+    def clearance(self, pose, angle=scanner.SERVO_CENTER, max_range=MAX_RANGE):
+        x, y, bearing, _ = reading(pose, angle, None)
+        steps = np.arange(0.0, max_range, self.resolution / 2)
+        columns = ((x + steps * math.cos(bearing) - self.origin[0]) // self.resolution).astype(int)
+        rows = ((y + steps * math.sin(bearing) - self.origin[1]) // self.resolution).astype(int)
+        inside = (columns >= 0) & (columns < self.cells) & (rows >= 0) & (rows < self.cells)
+        threshold = math.log(OCCUPIED / (1 - OCCUPIED))
+        free = np.zeros(len(steps), bool)
+        with self._lock:
+            free[inside] = self.log_odds[rows[inside], columns[inside]] <= -threshold
+        stops = np.flatnonzero(~free)
+        return float(steps[stops[0]]) if len(stops) else max_range
+
+    # Archivio numpy da rileggere con load (mappa, risoluzione, origine, percorso)
+    def save(self, path, trail=()):
+        with self._lock:
+            np.savez_compressed(path, log_odds=self.log_odds, resolution=self.resolution,
+                                origin=np.array(self.origin), trail=np.array(list(trail), np.float32).reshape(-1, 2))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            grid = cls(size=data["log_odds"].shape[0] * float(data["resolution"]), resolution=float(data["resolution"]))
+            grid.origin = tuple(float(v) for v in data["origin"])
+            grid.log_odds[:] = data["log_odds"]
+            grid._changed = [0, grid.cells, 0, grid.cells]
+            return grid, [tuple(p) for p in data["trail"]]
+
+    # Immagine PGM in scala di grigi (nero occupato, bianco libero, grigio
+    # mai visto), con il nord (y) in alto e il percorso in grigio scuro
+    def to_pgm(self, path, trail=()):
+        image = (255 * (1 - self.probability())).astype(np.uint8)
+        for x, y in trail:
+            cell = self.cell(x, y)
+            if cell is not None:
+                image[cell] = 64
+        image = image[::-1]
+        with open(path, "wb") as f:
+            f.write("P5\n{} {}\n255\n".format(self.cells, self.cells).encode("ascii"))
+            f.write(image.tobytes())
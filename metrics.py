@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Metriche del rover: contatori, valori istantanei e istogrammi a bucket
+# fissi, esposti in formato testo Prometheus su un piccolo server HTTP
+# locale e, a richiesta, pubblicati periodicamente su un topic MQTT.
+#   - nei punti caldi un aggiornamento e' un'addizione su un attributo
+#     (Counter.inc) o una bisezione su una tupla e due addizioni
+#     (Histogram.observe): niente lock, niente allocazioni. Ogni metrica ha
+#     un solo thread che la aggiorna; chi la legge (HTTP, MQTT) vede al
+#     massimo un campione indietro
+#   - i contatori che il progetto tiene gia' (TelemetryPublisher.stats,
+#     UltrasonicRanger.timeouts...) non si duplicano: fn li legge solo
+#     quando le metriche vengono chieste
+#
+# Esempio:
+#   calls = metrics.REGISTRY.counter("rover_get_distance_total", "Chiamate a get_distance")
+#   seconds = metrics.REGISTRY.histogram("rover_where_to_go_seconds", "Durata di where_to_go")
+#   metrics.REGISTRY.counter("rover_ranging_timeouts_total", "Ping senza eco", fn=lambda: ranger.timeouts)
+#   calls.inc()
+#   seconds.observe(time.perf_counter() - start)
+#   server = metrics.MetricsServer(metrics.REGISTRY).start()   # curl localhost:9108/metrics
+#   publisher = metrics.MetricsPublisher(metrics.REGISTRY, mqtt_client).start()
+
+import bisect
+import http.server
+import json
+import math
+import threading
+
+HOST = "127.0.0.1"      # "0.0.0.0" per lo scrape da un'altra macchina
+PORT = 9108
+PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+TOPIC = "metrics"
+INTERVAL = 10.0         # s tra due messaggi MQTT delle metriche
+
+# Bucket (s) per i tempi di calcolo, da mezzo millisecondo a un secondo
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def samples(self):
+        yield self.name, "", self.get()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        # counts[i]: osservazioni in (bounds[i-1], bounds[i]]; l'ultimo oltre
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def count(self):
+        return sum(self.counts)
+
+    # Quantile stimato dai bucket (estremo superiore del bucket che lo
+    # contiene), None senza osservazioni
+    def quantile(self, q):
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        seen = 0
+        for bound, n in zip(self.bounds + (math.inf,), counts):
+            seen += n
+            if seen >= q * total:
+                return bound
+        return math.inf
+
+    def samples(self):
+        counts = list(self.counts)
+        seen = 0
+        for bound, n in zip(self.bounds + (math.inf,), counts):
+            seen += n
+            yield self.name + "_bucket", '{{le="{}"}}'.format(_format(float(bound))), seen
+        yield self.name + "_sum", "", self.sum
+        yield self.name + "_count", "", seen
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    # Stesso nome = stessa metrica: i moduli possono chiederla piu' volte.
+    # Un fn nuovo sostituisce il vecchio (es. dopo un nuovo setup).
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError("metrica {} gia' registrata come {}".format(name, metric.kind))
+            elif kwargs.get('fn') is not None:
+                metric.fn = kwargs['fn']
+            return metric
+
+    def counter(self, name, help, fn=None):
+        return self._get(Counter, name, help, fn=fn)
+
+    def gauge(self, name, help, fn=None):
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    # Formato testo di Prometheus (0.0.4)
+    def exposition(self):
+        lines = []
+        for metric in self.metrics():
+            lines.append("# HELP {} {}".format(metric.name, metric.help.replace("\\", "\\\\").replace("\n", "\\n")))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append("{}{} {}".format(name, labels, _format(value)))
+        return "\n".join(lines) + "\n"
+
+    # Valori correnti per il messaggio MQTT: numeri per contatori e valori
+    # istantanei, conteggio, somma e quantili per gli istogrammi
+    def snapshot(self):
+        values = {}
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                # None anche oltre l'ultimo bucket: JSON non ha l'infinito
+                p50, p99 = [q if q != math.inf else None for q in (metric.quantile(0.5), metric.quantile(0.99))]
+                values[metric.name] = {"count": metric.count(), "sum": metric.sum, "p50": p50, "p99": p99}
+            else:
+                values[metric.name] = metric.get()
+        return values
+
+
+# Registro del processo, usato dai programmi del rover
+REGISTRY = Registry()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != PATH:
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Le richieste non finiscono nel log del rover
+    def log_message(self, format, *args):
+        pass
+
+
+# GET /metrics in un thread a parte: il testo si compone solo quando
+# qualcuno lo chiede
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host=HOST, port=PORT):
+        handler = type("Handler", (_Handler,), {"registry": registry})
+        self._server = http.server.ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+
+# Ogni interval secondi le metriche in JSON (Registry.snapshot) sul topic;
+# senza connessione il messaggio si salta, come la telemetria senza spool
+class MetricsPublisher:
+    def __init__(self, registry, client, topic=TOPIC, interval=INTERVAL):
+        self.registry = registry
+        self.client = client
+        self.topic = topic
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.published = 0
+        self.skipped = 0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-mqtt", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def publish(self):
+        if self.client.is_connected():
+            payload = json.dumps(self.registry.snapshot(), separators=(",", ":"))
+            if self.client.publish(self.topic, payload).rc == 0:
+                self.published += 1
+                return True
+        self.skipped += 1
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
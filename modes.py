@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Gestione dei modi di crociera a eventi.
+# Al posto del thread che controlla Cruising_Flag ogni millisecondo, il
+# modo si cambia con set_mode(), che sveglia subito il thread dei modi:
+#   - a riposo (modo senza comportamento, es. 0) il thread resta fermo sulla
+#     condition, senza risvegli
+#   - ogni modo attivo e' un Behavior con la sua funzione tick chiamata ogni
+#     period secondi (a scadenze fisse, senza recuperare i giri persi)
+#   - al cambio di modo si chiamano on_exit del vecchio comportamento e
+#     on_enter del nuovo, poi subito il primo tick
+# Un tick in corso non viene interrotto: il cambio vale dal giro dopo, per
+# questo i tick devono essere brevi (niente sleep dentro).
+# switch_latencies raccoglie il ritardo tra set_mode() e l'inizio del primo
+# tick del nuovo modo, in ns.
+
+import threading
+import time
+from collections import deque, namedtuple
+
+IDLE = 0
+LATENCY_SAMPLES = 100
+
+# tick: funzione senza argomenti; period: s tra due tick
+Behavior = namedtuple('Behavior', ['name', 'tick', 'period', 'on_enter', 'on_exit'], defaults=(None, None))
+
+
+class ModeManager:
+    def __init__(self, clock=None):
+        self.clock = clock or time.monotonic_ns
+        self._cond = threading.Condition()
+        self._behaviors = {}
+        self._thread = None
+        self._running = False
+        self._changed_ns = 0
+        self.mode = IDLE
+        self.ticks = 0
+        self.wakeups = 0
+        self.switch_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def register(self, mode, behavior):
+        if mode == IDLE:
+            raise ValueError("il modo {} e' il riposo".format(IDLE))
+        self._behaviors[mode] = behavior
+
+    # Da qualsiasi thread (es. il server dei comandi); ritorna subito
+    def set_mode(self, mode):
+        with self._cond:
+            if mode == self.mode:
+                return
+            self.mode = mode
+            self._changed_ns = self.clock()
+            self._cond.notify_all()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="modes", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        active = IDLE
+        behavior = None
+        next_ns = 0
+        while True:
+            previous = None
+            with self._cond:
+                while self._running and self.mode == active:
+                    if behavior is None:
+                        self._cond.wait()
+                    else:
+                        now = self.clock()
+                        if now >= next_ns:
+                            break
+                        self._cond.wait((next_ns - now) / 1e9)
+                    self.wakeups += 1
+                if not self._running:
+                    if behavior is not None and behavior.on_exit is not None:
+                        behavior.on_exit()
+                    return
+                switched = self.mode != active
+                if switched:
+                    previous = behavior
+                    active = self.mode
+                    behavior = self._behaviors.get(active)
+                    changed_ns = self._changed_ns
+            if switched:
+                if previous is not None and previous.on_exit is not None:
+                    previous.on_exit()
+                if behavior is None:
+                    continue
+                if behavior.on_enter is not None:
+                    behavior.on_enter()
+                next_ns = self.clock()
+                self.switch_latencies.append(next_ns - changed_ns)
+            behavior.tick()
+            self.ticks += 1
+            next_ns += int(behavior.period * 1e9)
+            now = self.clock()
+            if next_ns < now:
+                next_ns = now
+
+    # Statistiche della latenza del cambio di modo in ms
+    def latency_stats(self):
+        values = sorted(self.switch_latencies)
+        if not values:
+            return None
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values) / 1e6,
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))] / 1e6,
+            "max": values[-1] / 1e6,
+        }
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Pilotaggio del ponte L298 con la copia dei livelli scritti.
+# Le vecchie motor_forward/motor_stop scrivevano sempre i sei pin (quattro
+# IN e i due duty), anche quando il rover stava gia' andando cosi' (es.
+# Smart_Patrol chiama Motor_Forward ad ogni giro). MotorDriver ricorda
+# livelli e duty e scrive solo quello che cambia:
+#   - writes: chiamate GPIO fatte (output e ChangeDutyCycle)
+#   - saved: chiamate evitate perche' il pin era gia' a quel valore
+# Un cambio di direzione avviene in tre passi, cosi' il ponte non vede mai
+# un verso sbagliato con la ruota alimentata:
+#   1. si abbassano i duty che scendono (a 0 per le ruote che invertono)
+#   2. si scrivono gli IN, prima quelli che vanno bassi e poi quelli alti
+#   3. si alzano i duty che salgono
+#
+# Esempio:
+#   motors = MotorDriver(GPIO)
+#   motors.setup()
+#   motors.forward(100)      # 4 scritture: IN2 e IN4 sono gia' bassi
+#   motors.forward(100)      # nessuna scrittura, saved += 6
+#   motors.drive(60, -60)    # ruota sinistra avanti, destra indietro
+
+import math
+import threading
+import time
+from collections import deque
+
+# Pin del ponte: ENA/IN1/IN2 ruota destra, ENB/IN3/IN4 ruota sinistra
+ENA = 13
+ENB = 20
+IN1 = 19
+IN2 = 16
+IN3 = 21
+IN4 = 26
+
+PWM_FREQUENCY = 1000
+MAX_SPEED = 100
+
+
+# Uscite digitali che vengono scritte solo quando il livello cambia
+class PinShadow:
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self._levels = {}
+        self.writes = 0
+        self.saved = 0
+
+    # Livello gia' presente sul pin (es. l'initial di GPIO.setup)
+    def assume(self, pin, level):
+        self._levels[pin] = bool(level)
+
+    def level(self, pin):
+        return self._levels.get(pin)
+
+    def output(self, pin, level):
+        level = bool(level)
+        if self._levels.get(pin) == level:
+            self.saved += 1
+            return False
+        self.gpio.output(pin, level)
+        self._levels[pin] = level
+        self.writes += 1
+        return True
+
+
+class MotorDriver:
+    # frequency None: enable digitali (come ProgrammaEsempio.py), una ruota
+    # con duty > 0 ha il pin di enable alto
+    def __init__(self, gpio, ena=ENA, in1=IN1, in2=IN2, enb=ENB, in3=IN3, in4=IN4,
+                 frequency=PWM_FREQUENCY):
+        self.gpio = gpio
+        self.frequency = frequency
+        # (enable, avanti, indietro) per ruota
+        self.wheels = {"left": (enb, in3, in4), "right": (ena, in1, in2)}
+        self.pins = PinShadow(gpio)
+        self._lock = threading.Lock()
+        self._pwm = {}
+        self._duty = {}
+        self._command = (0, 0)
+        self._drive_hooks = []
+        self.duty_writes = 0
+        self.duty_saved = 0
+        self.commands = 0
+
+    @property
+    def writes(self):
+        return self.pins.writes + self.duty_writes
+
+    @property
+    def saved(self):
+        return self.pins.saved + self.duty_saved
+
+    def setup(self):
+        GPIO = self.gpio
+        for enable, forward, backward in self.wheels.values():
+            for pin in (enable, forward, backward):
+                GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+            self.pins.assume(forward, False)
+            self.pins.assume(backward, False)
+            if self.frequency is None:
+                self.pins.assume(enable, False)
+            else:
+                self._pwm[enable] = GPIO.PWM(enable, self.frequency)
+                self._pwm[enable].start(0)
+            self._duty[enable] = 0
+
+    def close(self):
+        for pwm in self._pwm.values():
+            pwm.stop()
+        self._pwm.clear()
+
+    # Duty con segno per ruota: > 0 avanti, < 0 indietro, 0 ferma (IN bassi).
+    # Ritorna True se e' stato scritto almeno un pin.
+    def drive(self, left, right):
+        with self._lock:
+            self.commands += 1
+            # Stesso comando di prima: nessun pin da guardare
+            if (left, right) == self._command:
+                self.duty_saved += 2
+                self.pins.saved += 4
+                return False
+            self._command = (left, right)
+            targets = {"left": left, "right": right}
+            writes = self.writes
+            plan = []
+            for name, (enable, forward, backward) in self.wheels.items():
+                speed = max(-MAX_SPEED, min(MAX_SPEED, targets[name]))
+                duty = abs(speed)
+                if self.frequency is None and duty:
+                    duty = MAX_SPEED
+                levels = ((forward, speed > 0), (backward, speed < 0))
+                # Un IN che si alza vuol dire un verso nuovo
+                turning = any(level and not self.pins.level(pin) for pin, level in levels)
+                plan.append((enable, duty, levels, 0 if turning else duty))
+            # 1. duty che scendono, a zero per le ruote che cambiano verso
+            for enable, duty, levels, low in plan:
+                if low < self._duty[enable]:
+                    self._set_duty(enable, low)
+            # 2. IN: prima i livelli bassi, poi quelli alti
+            for high in (False, True):
+                for enable, duty, levels, low in plan:
+                    for pin, level in levels:
+                        if level == high:
+                            self.pins.output(pin, level)
+            # 3. duty che salgono
+            for enable, duty, levels, low in plan:
+                self._set_duty(enable, duty)
+            changed = self.writes != writes
+        if changed:
+            for hook in self._drive_hooks:
+                hook(left, right)
+        return changed
+
+    # Registra una funzione chiamata con (sinistra, destra) quando un
+    # comando cambia i pin (es. la scatola nera)
+    def on_drive(self, hook):
+        self._drive_hooks.append(hook)
+
+    def _set_duty(self, enable, duty):
+        if self._duty[enable] == duty:
+            self.duty_saved += 1
+            return
+        if self.frequency is None:
+            self.pins.output(enable, duty > 0)
+        else:
+            self._pwm[enable].ChangeDutyCycle(duty)
+            self.duty_writes += 1
+        self._duty[enable] = duty
+
+    def forward(self, speed=MAX_SPEED):
+        return self.drive(speed, speed)
+
+    def backward(self, speed=MAX_SPEED):
+        return self.drive(-speed, -speed)
+
+    # Rotazioni sul posto: a sinistra la ruota sinistra va indietro
+    def turn_left(self, speed=MAX_SPEED):
+        return self.drive(-speed, speed)
+
+    def turn_right(self, speed=MAX_SPEED):
+        return self.drive(speed, -speed)
+
+    def stop(self):
+        return self.drive(0, 0)
+
+    # Comandi ricevuti, chiamate GPIO fatte ed evitate
+    def stats(self):
+        return {"commands": self.commands, "writes": self.writes, "saved": self.saved}
+
+
+# Rampe di velocita' sopra un MotorDriver.
+# drive()/forward()/... impostano solo l'obiettivo e tornano subito; un
+# thread porta il duty di ogni ruota verso l'obiettivo ogni period secondi,
+# con accelerazione (duty %/s) e jerk (duty %/s^2) limitati, passando per
+# zero nelle inversioni. Cosi' niente salti 0 -> 100 o avanti -> indietro,
+# che fanno slittare le ruote e assorbono picchi di corrente.
+# emergency_stop() invece ferma subito (IN bassi e duty a 0, le ruote vanno
+# in folle) dal thread che la chiama, anche a rampa in corso. Senza encoder
+# la velocita' delle ruote in folle si stima con la decelerazione coast:
+# un comando nel verso opposto aspetta che la ruota sia ferma, uno nello
+# stesso verso riparte dalla velocita' stimata.
+# A riposo (ruote all'obiettivo) il thread resta fermo sulla condition.
+ACCEL = 400.0       # duty %/s: da fermo a tutta in 0.25 s
+JERK = 4000.0       # duty %/s^2, None = accelerazione a gradino
+COAST = 300.0       # duty %/s persi in folle (per difetto: meglio aspettare)
+RAMP_PERIOD = 0.01  # s tra due passi della rampa
+HISTORY = 2000
+
+
+class MotionProfile:
+    def __init__(self, driver, accel=ACCEL, jerk=JERK, coast=COAST, period=RAMP_PERIOD, clock=None):
+        self.driver = driver
+        self.accel = accel
+        self.jerk = jerk
+        self.coast = coast
+        self.period = period
+        self.clock = clock or time.monotonic_ns
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        # Per ruota: sinistra, destra
+        self._target = [0.0, 0.0]
+        self._speed = [0.0, 0.0]      # velocita' (in duty) stimata della ruota
+        self._rate = [0.0, 0.0]
+        self._coasting = [False, False]
+        self._last_ns = None
+        # (t_ns, obiettivo sinistra, destra, duty scritto sinistra, destra)
+        self.history = deque(maxlen=HISTORY)
+        self.steps = 0
+        self.emergency_stops = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="motion", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def drive(self, left, right):
+        with self._cond:
+            target = [max(-MAX_SPEED, min(MAX_SPEED, left)), max(-MAX_SPEED, min(MAX_SPEED, right))]
+            if target == self._target:
+                return
+            self._target = target
+            self._record(self.clock())
+            self._cond.notify_all()
+
+    def forward(self, speed=MAX_SPEED):
+        self.drive(speed, speed)
+
+    def backward(self, speed=MAX_SPEED):
+        self.drive(-speed, -speed)
+
+    def turn_left(self, speed=MAX_SPEED):
+        self.drive(-speed, speed)
+
+    def turn_right(self, speed=MAX_SPEED):
+        self.drive(speed, -speed)
+
+    # Fermata con la rampa di decelerazione
+    def stop(self):
+        self.drive(0, 0)
+
+    def emergency_stop(self):
+        with self._cond:
+            self.emergency_stops += 1
+            self.driver.stop()
+            self._target = [0.0, 0.0]
+            self._rate = [0.0, 0.0]
+            self._coasting = [speed != 0 for speed in self._speed]
+            self._record(self.clock())
+            self._cond.notify_all()
+
+    # Duty scritti sul ponte (sinistra, destra) e obiettivi
+    def speeds(self):
+        with self._cond:
+            return self._output(), tuple(self._target)
+
+    def settled(self):
+        return self._speed == self._target and not any(self._coasting)
+
+    # Aspetta che le ruote arrivino all'obiettivo
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(self.settled, timeout)
+
+    def _output(self):
+        return tuple(0.0 if coasting else round(speed, 1) for speed, coasting in zip(self._speed, self._coasting))
+
+    def _record(self, now):
+        self.history.append((now, self._target[0], self._target[1]) + self._output())
+
+    def _run(self):
+        with self._cond:
+            while True:
+                while self._running and self.settled():
+                    self._last_ns = None
+                    self._cond.wait()
+                if not self._running:
+                    return
+                now = self.clock()
+                dt = self.period if self._last_ns is None else (now - self._last_ns) / 1e9
+                self._last_ns = now
+                for wheel in (0, 1):
+                    if self._coasting[wheel]:
+                        self._coast(wheel, dt)
+                    else:
+                        self._step(wheel, dt)
+                self.steps += 1
+                self.driver.drive(*self._output())
+                self._record(now)
+                if self.settled():
+                    self._cond.notify_all()
+                else:
+                    self._cond.wait(self.period)
+
+    # Ruota in folle: la stima rallenta finche' non si ferma o finche'
+    # l'obiettivo non torna nel suo verso
+    def _coast(self, wheel, dt):
+        speed = self._speed[wheel]
+        target = self._target[wheel]
+        if target and (target > 0) == (speed > 0):
+            self._coasting[wheel] = False
+            return self._step(wheel, dt)
+        loss = self.coast * dt
+        self._speed[wheel] = 0.0 if abs(speed) <= loss else speed - loss * (1 if speed > 0 else -1)
+        if self._speed[wheel] == 0.0:
+            self._coasting[wheel] = False
+
+    # Un passo di dt secondi: l'accelerazione va verso +-accel con il
+    # jerk, ma non oltre quella da cui si riesce ancora a frenare (sempre
+    # con il jerk) sull'obiettivo senza superarlo
+    def _step(self, wheel, dt):
+        gap = self._target[wheel] - self._speed[wheel]
+        direction = 1 if gap > 0 else -1
+        # Un obiettivo cambiato a meta' rampa non deve allontanare la ruota
+        if self._rate[wheel] * direction < 0:
+            self._rate[wheel] = 0.0
+        if self.jerk is None:
+            rate = direction * self.accel
+        else:
+            limit = min(self.accel, math.sqrt(2 * self.jerk * abs(gap)))
+            wanted = direction * limit
+            change = self.jerk * dt
+            rate = self._rate[wheel] + max(-change, min(change, wanted - self._rate[wheel]))
+        speed = self._speed[wheel] + rate * dt
+        if (speed - self._target[wheel]) * direction >= 0 or abs(gap) < 0.05:
+            speed = self._target[wheel]
+            rate = 0.0
+        self._speed[wheel] = speed
+        self._rate[wheel] = rate
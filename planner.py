@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Pianificazione sulla mappa di occupazione (mapping.OccupancyGrid) ed
+# esplorazione per frontiere.
+# Invece di scegliere la direzione col massimo di tre letture del momento
+# (che davanti a distanze uguali oscilla tra DESTRA e SINISTRA e ripassa
+# sempre dagli stessi angoli), il rover va verso la frontiera: celle libere
+# della mappa che confinano con celle mai viste.
+#   - distanza dagli ostacoli: trasformata di distanza euclidea troncata a
+#     REACH, a vettori (per colonne con accumulate, poi per righe con
+#     2 * REACH spostamenti dell'array); costo di ogni cella cresce vicino
+#     agli ostacoli e nelle celle mai viste, le celle occupate non si
+#     attraversano
+#   - frontiera scelta a vettori tra le celle candidate (vicina, poco fuori
+#     dalla rotta attuale), poi A* fino a li'
+#   - incrementale: dopo una scansione si ricalcolano solo le celle
+#     cambiate (OccupancyGrid.take_changes) e i loro dintorni; il percorso
+#     si tiene finche' la frontiera esiste e le sue celle restano libere,
+#     cosi' la direzione non cambia ad ogni giro
+#   - budget di CPU per giro: A* si interrompe a budget esaurito e riprende
+#     al giro dopo; intanto plan() restituisce None e si decide come prima
+#
+# Esempio:
+#   path_planner = Planner(occupancy)
+#   turn = path_planner.plan(dead_reckoning.pose())   # ogni giro
+#   if turn is not None:
+#       ... gira di turn radianti (positivo = a sinistra), poi avanti
+
+import heapq
+import math
+import time
+
+import numpy as np
+
+import mapping
+
+ROBOT_RADIUS = 0.15     # m, sotto questa distanza da un ostacolo si passa solo se non c'e' altro
+SAFE_CLEARANCE = 0.40   # m, oltre questa distanza gli ostacoli non costano
+REACH = 12              # celle, distanza massima calcolata dalla trasformata
+UNKNOWN_COST = 2.0      # costo in piu' di una cella mai vista
+NEAR_COST = 4.0         # costo in piu' al bordo di ROBOT_RADIUS
+INFLATED_COST = 30.0    # costo in piu' entro ROBOT_RADIUS da un ostacolo
+MIN_GOAL = 0.50         # m, frontiere piu' vicine non sono una meta
+REACHED = 0.50          # m dalla meta: raggiunta (il sonar la vede gia')
+PATIENCE = 10           # giri verso la stessa meta prima di rinunciare
+OFF_PATH = 0.35         # m dal percorso oltre cui si ripianifica
+LOOKAHEAD = 1.20        # m lungo il percorso verso cui puntare (piu' di quanto si fa in un giro)
+HEADING_WEIGHT = 0.30   # m di distanza equivalenti a un radiante di curva
+BLACKLIST = 0.30        # m attorno a una meta abbandonata da non riprovare
+WEIGHT = 2.0            # A* pesato: percorsi al piu' WEIGHT volte il migliore, molte meno celle espanse
+BUDGET = 0.010          # s di CPU per giro
+CHECK_EVERY = 64        # celle espanse tra due controlli del budget
+
+# Vicini a 8: (riga, colonna, lunghezza del passo in celle)
+_NEIGHBOURS = tuple((dr, dc, math.hypot(dr, dc)) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc)
+
+
+class _Search:
+    def __init__(self, start, goal, cells):
+        self.goal = goal
+        self.cells = cells
+        self.g = {start: 0.0}
+        self.parent = {start: None}
+        self.heap = [(self._h(start), start)]
+        self.closed = set()
+        self.expanded = 0
+
+    # Distanza ottagonale in celle (ogni cella costa almeno 1), per WEIGHT
+    def _h(self, index):
+        dr = abs(index // self.cells - self.goal // self.cells)
+        dc = abs(index % self.cells - self.goal % self.cells)
+        return WEIGHT * (max(dr, dc) + (math.sqrt(2) - 1) * min(dr, dc))
+
+    # Espande celle fino a deadline; True = trovata, False = impossibile,
+    # None = da continuare
+    def step(self, cost, deadline, clock):
+        cost = cost.ravel()
+        cells = self.cells
+        g = self.g
+        heap = self.heap
+        closed = self.closed
+        while heap:
+            if self.expanded % CHECK_EVERY == 0 and clock() >= deadline:
+                return None
+            _, index = heapq.heappop(heap)
+            if index in closed:
+                continue
+            if index == self.goal:
+                return True
+            closed.add(index)
+            self.expanded += 1
+            row, column = divmod(index, cells)
+            base = g[index]
+            for dr, dc, length in _NEIGHBOURS:
+                r, c = row + dr, column + dc
+                if not (0 <= r < cells and 0 <= c < cells):
+                    continue
+                neighbour = r * cells + c
+                step = cost[neighbour]
+                if step == np.inf:
+                    continue
+                total = base + length * step
+                if total < g.get(neighbour, np.inf):
+                    g[neighbour] = total
+                    self.parent[neighbour] = index
+                    heapq.heappush(heap, (total + self._h(neighbour), neighbour))
+        return False
+
+    def path(self):
+        path = []
+        index = self.goal
+        while index is not None:
+            path.append(index)
+            index = self.parent[index]
+        return path[::-1]
+
+
+class Planner:
+    def __init__(self, grid, budget=BUDGET, clock=None):
+        self.grid = grid
+        self.budget = budget
+        self.clock = clock or time.thread_time
+        n = grid.cells
+        self.occupied = np.zeros((n, n), bool)
+        self.free = np.zeros((n, n), bool)
+        self.clearance = np.full((n, n), (REACH + 1) * grid.resolution, np.float32)
+        self.cost = np.full((n, n), 1 + UNKNOWN_COST, np.float32)
+        self.frontier = np.zeros((n, n), bool)
+        self.blacklist = np.zeros((n, n), bool)
+        self.goal = None
+        self.goal_ticks = 0
+        self.path = None
+        self._path_cells = None
+        self._search = None
+        self.expanded = 0
+        self.last_cost = 0.0
+        self.update((0, n, 0, n))
+
+    # Ricalcola le celle cambiate nella mappa (tutte se changed e' dato)
+    def update(self, changed=None):
+        changed = changed or self.grid.take_changes()
+        if changed is None:
+            return False
+        n = self.grid.cells
+        r0, r1, c0, c1 = changed
+        threshold = math.log(mapping.OCCUPIED / (1 - mapping.OCCUPIED))
+        log_odds = self.grid.log_odds[r0:r1, c0:c1]
+        self.occupied[r0:r1, c0:c1] = log_odds >= threshold
+        self.free[r0:r1, c0:c1] = log_odds <= -threshold
+        # La distanza dagli ostacoli cambia fino a REACH celle di distanza
+        window = max(r0 - REACH, 0), min(r1 + REACH, n), max(c0 - REACH, 0), min(c1 + REACH, n)
+        self._distance(*window)
+        self._cost(*window)
+        # La frontiera fino a una cella
+        self._frontier(max(r0 - 1, 0), min(r1 + 1, n), max(c0 - 1, 0), min(c1 + 1, n))
+        return True
+
+    # Trasformata di distanza euclidea troncata a REACH celle sulla finestra;
+    # servono gli ostacoli fino a REACH celle fuori dalla finestra
+    def _distance(self, r0, r1, c0, c1):
+        n = self.grid.cells
+        a0, a1, b0, b1 = max(r0 - REACH, 0), min(r1 + REACH, n), max(c0 - REACH, 0), min(c1 + REACH, n)
+        obstacle = self.occupied[a0:a1, b0:b1]
+        far = REACH + 1
+        rows = np.arange(a0, a1)[:, None]
+        # In colonna: righe dall'ostacolo piu' vicino sopra e sotto
+        above = np.maximum.accumulate(np.where(obstacle, rows, a0 - 2 * far), axis=0)
+        below = np.minimum.accumulate(np.where(obstacle, rows, a1 + 2 * far)[::-1], axis=0)[::-1]
+        column = np.minimum(np.minimum(rows - above, below - rows), far).astype(np.float32)
+        # Poi per righe: minimo di column^2 + dc^2 sulle colonne vicine
+        squared = column * column
+        best = squared.copy()
+        for dc in range(1, REACH + 1):
+            np.minimum(best[:, dc:], squared[:, :-dc] + dc * dc, out=best[:, dc:])
+            np.minimum(best[:, :-dc], squared[:, dc:] + dc * dc, out=best[:, :-dc])
+        distance = np.sqrt(np.minimum(best, far * far)) * self.grid.resolution
+        self.clearance[r0:r1, c0:c1] = distance[r0 - a0:r1 - a0, c0 - b0:c1 - b0]
+
+    def _cost(self, r0, r1, c0, c1):
+        clearance = self.clearance[r0:r1, c0:c1]
+        near = np.clip((SAFE_CLEARANCE - clearance) / (SAFE_CLEARANCE - ROBOT_RADIUS), 0, 1)
+        cost = 1 + NEAR_COST * near + INFLATED_COST * (clearance < ROBOT_RADIUS)
+        cost += UNKNOWN_COST * ~(self.free[r0:r1, c0:c1] | self.occupied[r0:r1, c0:c1])
+        cost[self.occupied[r0:r1, c0:c1]] = np.inf
+        self.cost[r0:r1, c0:c1] = cost
+
+    # Celle libere con un vicino (a 4) mai visto
+    def _frontier(self, r0, r1, c0, c1):
+        known = np.pad(self.free | self.occupied, 1, constant_values=True)[r0:r1 + 2, c0:c1 + 2]
+        unknown_near = ~known[:-2, 1:-1] | ~known[2:, 1:-1] | ~known[1:-1, :-2] | ~known[1:-1, 2:]
+        self.frontier[r0:r1, c0:c1] = self.free[r0:r1, c0:c1] & unknown_near
+
+    def _point(self, index):
+        row, column = divmod(index, self.grid.cells)
+        return (self.grid.origin[0] + (column + 0.5) * self.grid.resolution,
+                self.grid.origin[1] + (row + 0.5) * self.grid.resolution)
+
+    # Frontiera da raggiungere: vicina e poco fuori dalla rotta; None se
+    # la mappa non ne ha
+    def _choose_goal(self, pose):
+        candidates = self.frontier & ~self.blacklist & (self.clearance >= SAFE_CLEARANCE)
+        rows, columns = np.nonzero(candidates)
+        if not len(rows):
+            return None
+        x, y, heading = pose
+        dx = self.grid.origin[0] + (columns + 0.5) * self.grid.resolution - x
+        dy = self.grid.origin[1] + (rows + 0.5) * self.grid.resolution - y
+        distance = np.hypot(dx, dy)
+        turn = np.abs(np.angle(np.exp(1j * (np.arctan2(dy, dx) - heading))))
+        score = np.where(distance >= MIN_GOAL, distance + HEADING_WEIGHT * turn, np.inf)
+        best = int(np.argmin(score))
+        if score[best] == np.inf:
+            return None
+        return int(rows[best]) * self.grid.cells + int(columns[best])
+
+    # Il percorso attuale va ancora bene?
+    def _valid(self, pose):
+        if self.path is None or self.goal is None:
+            return False
+        goal = divmod(self.goal, self.grid.cells)
+        if not self.frontier[goal] or self.goal_ticks >= PATIENCE:
+            return False
+        rows, columns = self._path_cells
+        if np.any(self.cost[rows, columns] == np.inf):
+            return False
+        x, y, _ = pose
+        gap = np.hypot(self.path[:, 0] - x, self.path[:, 1] - y)
+        return gap.min() <= OFF_PATH and math.hypot(*(self.path[-1] - (x, y))) > REACHED
+
+    # Da chiamare ad ogni giro con la posa del rover: aggiorna la mappa
+    # derivata, pianifica entro il budget e restituisce di quanto girare
+    # (radianti, positivo = sinistra) per seguire il percorso; None se non
+    # c'e' ancora un percorso
+    def plan(self, pose):
+        start_time = self.clock()
+        deadline = start_time + self.budget
+        self.update()
+        if not self._valid(pose) and self._search is None:
+            if self.goal is not None and self.goal_ticks >= PATIENCE:
+                self._abandon()
+            self.path = self._path_cells = None
+            self.goal = self._choose_goal(pose)
+            self.goal_ticks = 0
+            start = self.grid.cell(pose[0], pose[1])
+            if self.goal is not None and start is not None:
+                self._search = _Search(start[0] * self.grid.cells + start[1], self.goal, self.grid.cells)
+        if self._search is not None:
+            found = self._search.step(self.cost, deadline, self.clock)
+            if found is not None:
+                self.expanded += self._search.expanded
+                if found:
+                    cells = self._search.path()
+                    self.path = np.array([self._point(index) for index in cells])
+                    self._path_cells = np.divmod(np.array(cells), self.grid.cells)
+                else:
+                    # Irraggiungibile: si prova un'altra frontiera al prossimo giro
+                    self._abandon()
+                self._search = None
+        self.goal_ticks += 1
+        self.last_cost = self.clock() - start_time
+        return self.steer(pose)
+
+    # Meta irraggiungibile o che non si riesce a vedere (es. dietro un
+    # pilastro): la zona attorno non si sceglie piu'
+    def _abandon(self):
+        radius = int(BLACKLIST / self.grid.resolution)
+        row, column = divmod(self.goal, self.grid.cells)
+        self.blacklist[max(row - radius, 0):row + radius + 1, max(column - radius, 0):column + radius + 1] = True
+        self.goal = None
+
+    # Angolo verso il punto del percorso LOOKAHEAD metri piu' avanti
+    def steer(self, pose):
+        if self.path is None:
+            return None
+        x, y, heading = pose
+        gap = np.hypot(self.path[:, 0] - x, self.path[:, 1] - y)
+        nearest = int(np.argmin(gap))
+        ahead = np.flatnonzero(gap[nearest:] >= LOOKAHEAD)
+        target = self.path[nearest + ahead[0]] if len(ahead) else self.path[-1]
+        turn = math.atan2(target[1] - y, target[0] - x) - heading
+        return math.atan2(math.sin(turn), math.cos(turn))
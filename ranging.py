@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Misura ultrasonica (HC-SR04) guidata dagli interrupt sul pin ECHO.
+# Invece di girare a vuoto su GPIO.input(ECHO), i fronti di salita e discesa
+# vengono marcati nel callback con un orologio monotono in nanosecondi e la
+# distanza viene letta senza bloccare il loop di controllo.
+
+import threading
+import time
+from collections import namedtuple
+
+SPEED_OF_SOUND = 340  # m/s
+TRIG_PULSE = 0.000015
+MAX_ECHO = 0.5  # s, come il timeout della vecchia get_distance
+
+# Esito di una misura
+OK = 0
+NO_ECHO = 1     # echo non ricevuto
+ECHO_LONG = 2   # echo troppo lungo
+
+# t_ns e' l'istante del trigger, cioe' quando e' partito il ping
+Reading = namedtuple('Reading', ['t_ns', 'distance', 'status'])
+
+_IDLE = 0
+_ARMED = 1
+_RISEN = 2
+
+
+class UltrasonicRanger:
+    def __init__(self, gpio, trig, echo, max_echo=MAX_ECHO, clock=None):
+        self.gpio = gpio
+        self.trig = trig
+        self.echo = echo
+        self.max_echo_ns = int(max_echo * 1e9)
+        # Letto qui e non come default, cosi' vale anche il tempo del simulatore
+        self.clock = clock or time.monotonic_ns
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._state = _IDLE
+        self._t_trig = 0
+        self._t_rise = 0
+        self._leftover = False
+        self._edges = 0
+        self._last = None
+        self.timeouts = 0
+        self.spurious = 0   # discese del ping prima scartate in attesa della salita
+        self.readings = 0
+
+    def start(self):
+        self.gpio.add_event_detect(self.echo, self.gpio.BOTH, callback=self._on_edge)
+
+    def stop(self):
+        self.gpio.remove_event_detect(self.echo)
+
+    # Callback dei fronti su ECHO: dopo il trigger si aspetta la salita, poi
+    # la discesa. Qui il pin non si rilegge: i callback di RPi.GPIO girano
+    # in un thread e arrivano anche 100us e piu' dopo il fronte, quanto dura
+    # l'echo di un ostacolo vicino, e il livello letto sarebbe gia' quello
+    # dopo la discesa. I callback arrivano in ordine e con ritardi simili,
+    # quindi la durata resta giusta. La discesa rimasta dal ping prima la
+    # segnala trigger() (_leftover) e si scarta.
+    def _on_edge(self, channel):
+        now = self.clock()
+        with self._lock:
+            self._edges += 1
+            if self._state == _ARMED:
+                if self._leftover:
+                    self._leftover = False
+                    self.spurious += 1
+                else:
+                    self._t_rise = now
+                    self._state = _RISEN
+            elif self._state == _RISEN:
+                distance = (now - self._t_rise) * SPEED_OF_SOUND / 2e9
+                self._finish(Reading(self._t_trig, distance, OK))
+
+    def _finish(self, reading):
+        self._last = reading
+        self._state = _IDLE
+        if reading.status == OK:
+            self.readings += 1
+        else:
+            self.timeouts += 1
+        self._done.set()
+
+    # Controlla se la misura in corso e' scaduta
+    def _check_timeout(self, now):
+        if self._state != _IDLE and now - self._t_trig > self.max_echo_ns:
+            status = NO_ECHO if self._state == _ARMED else ECHO_LONG
+            self._finish(Reading(self._t_trig, None, status))
+
+    # Invia l'impulso di trigger e ritorna subito. ECHO si legge qui, prima
+    # dell'impulso: nessun echo di questo ping puo' essere partito, quindi il
+    # livello e' fermo; se e' alto l'echo del ping prima non e' finito e il
+    # primo fronte sara' la sua discesa. Si legge fuori dal lock (col
+    # simulatore la lettura fa passare il tempo e arrivano i callback); se
+    # nel frattempo e' arrivato un fronte si rilegge.
+    def trigger(self):
+        while True:
+            edges = self._edges
+            echo_high = bool(self.gpio.input(self.echo))
+            with self._lock:
+                self._check_timeout(self.clock())
+                if self._state != _IDLE:
+                    return False
+                if self._edges != edges:
+                    continue
+                self._done.clear()
+                self._state = _ARMED
+                self._leftover = echo_high
+                self._t_trig = self.clock()
+                break
+        self.gpio.output(self.trig, self.gpio.HIGH)
+        time.sleep(TRIG_PULSE)
+        self.gpio.output(self.trig, self.gpio.LOW)
+        return True
+
+    # Non bloccante: Reading della misura appena conclusa, None se in corso
+    def poll(self):
+        with self._lock:
+            self._check_timeout(self.clock())
+            if self._state != _IDLE:
+                return None
+            return self._last
+
+    # Ultima misura conclusa (None se non ce ne sono ancora)
+    def latest(self):
+        return self._last
+
+    # Trigger e attesa del risultato senza consumare CPU
+    def measure(self, timeout=MAX_ECHO):
+        if not self.trigger():
+            return self.poll()
+        self._done.wait(timeout)
+        with self._lock:
+            self._check_timeout(self.clock())
+            if self._state != _IDLE:
+                self._finish(Reading(self._t_trig, None, NO_ECHO if self._state == _ARMED else ECHO_LONG))
+            return self._last
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Scatola nera del rover.
+# Gli eventi ad alta frequenza (distanze, comandi ai motori, fronti dei
+# sensori) si scrivono in un buffer circolare binario in memoria, di
+# dimensione fissa: record() e' un struct.pack_into, senza allocazioni ne'
+# I/O. Il buffer tiene circa gli ultimi seconds secondi; dump() lo salva su
+# disco (es. all'allarme fiamma o a un'eccezione) e load() lo rilegge.
+#
+# Un record sono 24 byte little-endian:
+#   t_ns (int64, time.monotonic_ns), kind (uint16), code (int16), a, b, c (float32)
+# Il file: MAGIC, versione, lunghezza del motivo, motivo (utf-8), istante
+# time.time() del dump e il monotonic_ns corrispondente, poi i record dal
+# piu' vecchio al piu' recente.
+#
+# Esempio:
+#   flight = FlightRecorder()
+#   flight.record(DISTANCE, a=0.42)
+#   flight.record(MOTOR, a=100, b=100)
+#   flight.install_crash_hooks()
+#   flight.dump("fiamma")       # -> flight/flight-20250101-120000-1-fiamma.bin
+
+import os
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import flame
+
+MAGIC = b"RVFR"
+VERSION = 1
+RECORD = struct.Struct("<qHhfff")
+HEADER = struct.Struct("<4sHH")
+STAMP = struct.Struct("<dq")
+
+RECORD_SECONDS = 30.0
+RATE = 200              # eventi al secondo previsti (dimensiona il buffer)
+DUMP_DIR = "flight"
+
+# Tipi di evento
+DISTANCE = 1    # a = distanza (m), NaN senza stima
+MOTOR = 2       # a, b = duty sinistra, destra con segno
+FLAME = 3       # code = FLAME_CODES[tipo di evento], a = durata, b = accensioni
+IR = 4          # code = pin, a = livello
+MODE = 5        # code = modo
+SCAN = 6        # a, b, c = distanze sinistra, centro, destra
+MARK = 7        # code libero, es. punti del programma
+
+KIND_NAMES = {DISTANCE: "distance", MOTOR: "motor", FLAME: "flame", IR: "ir",
+              MODE: "mode", SCAN: "scan", MARK: "mark"}
+
+FLAME_CODES = {flame.STARTED: 1, flame.ONGOING: 2, flame.CLEARED: 3}
+
+Event = namedtuple('Event', ['t_ns', 'kind', 'code', 'a', 'b', 'c'])
+Dump = namedtuple('Dump', ['reason', 'wall_time', 'mono_ns', 'events'])
+
+
+class FlightRecorder:
+    def __init__(self, seconds=RECORD_SECONDS, rate=RATE, directory=DUMP_DIR, clock=None):
+        self.seconds = seconds
+        self.capacity = int(seconds * rate)
+        self.directory = directory
+        self.clock = clock or time.monotonic_ns
+        self._buffer = bytearray(self.capacity * RECORD.size)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._dumps = 0
+        self.dumps = []
+
+    def record(self, kind, code=0, a=0.0, b=0.0, c=0.0):
+        with self._lock:
+            t_ns = self.clock()
+            RECORD.pack_into(self._buffer, (self._count % self.capacity) * RECORD.size, t_ns, kind, code, a, b, c)
+            self._count += 1
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def overwritten(self):
+        return max(0, self._count - self.capacity)
+
+    # Copia dei record dal piu' vecchio, solo quelli degli ultimi seconds s
+    def snapshot(self):
+        with self._lock:
+            data = bytes(self._buffer)
+            count = self._count
+        start = count % self.capacity if count > self.capacity else 0
+        ordered = data[start * RECORD.size:count * RECORD.size if count <= self.capacity else None]
+        if count > self.capacity:
+            ordered += data[:start * RECORD.size]
+        # Ricerca binaria del primo record abbastanza recente
+        oldest = self.clock() - int(self.seconds * 1e9)
+        low, high = 0, len(ordered) // RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(ordered, middle * RECORD.size)[0] < oldest:
+                low = middle + 1
+            else:
+                high = middle
+        return ordered[low * RECORD.size:]
+
+    # Salva su disco; con background=True la scrittura la fa un thread e
+    # si torna subito (il buffer si copia comunque adesso)
+    def dump(self, reason="", background=False):
+        records = self.snapshot()
+        wall, mono = time.time(), self.clock()
+        self._dumps += 1
+        name = "flight-{}-{}-{}.bin".format(time.strftime("%Y%m%d-%H%M%S", time.localtime(wall)), self._dumps,
+                                            "".join(ch if ch.isalnum() else "_" for ch in reason) or "dump")
+        path = os.path.join(self.directory, name)
+        if background:
+            threading.Thread(target=self._write, args=(path, reason, wall, mono, records),
+                             name="flight-dump", daemon=True).start()
+        else:
+            self._write(path, reason, wall, mono, records)
+        return path
+
+    def _write(self, path, reason, wall, mono, records):
+        os.makedirs(self.directory, exist_ok=True)
+        encoded = reason.encode("utf-8")
+        with open(path + ".tmp", "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(encoded)))
+            f.write(encoded)
+            f.write(STAMP.pack(wall, mono))
+            f.write(records)
+        os.replace(path + ".tmp", path)
+        self.dumps.append(path)
+
+    # Un'eccezione non gestita (nel thread principale o in un altro thread)
+    # salva la scatola nera prima del messaggio di errore
+    def install_crash_hooks(self):
+        previous_hook = sys.excepthook
+        previous_thread_hook = threading.excepthook
+
+        def excepthook(kind, value, traceback):
+            self._crash(kind)
+            previous_hook(kind, value, traceback)
+
+        def thread_excepthook(args):
+            self._crash(args.exc_type)
+            previous_thread_hook(args)
+
+        sys.excepthook = excepthook
+        threading.excepthook = thread_excepthook
+
+    def _crash(self, kind):
+        if kind is not None and issubclass(kind, (KeyboardInterrupt, SystemExit)):
+            return
+        try:
+            self.dump("crash")
+        except OSError:
+            pass
+
+
+def load(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{}: non e' una scatola nera (versione {})".format(path, VERSION))
+    offset = HEADER.size
+    reason = data[offset:offset + length].decode("utf-8")
+    offset += length
+    wall, mono = STAMP.unpack_from(data, offset)
+    offset += STAMP.size
+    events = [Event(*fields) for fields in RECORD.iter_unpack(data[offset:])]
+    return Dump(reason, wall, mono, events)
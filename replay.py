@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Tracce dei sensori e riesecuzione deterministica dei programmi del rover.
+#
+# Registrazione: RecordingGPIO avvolge il backend GPIO e scrive in un file
+# binario compatto (RECORD, 16 byte) con l'orologio monotono:
+#   - INPUT   le letture degli ingressi (IR, fiamma, ECHO...), solo quando
+#             il livello letto cambia
+#   - EDGE    i fronti consegnati ai callback, col livello del pin
+#   - OUTPUT  le scritture sulle uscite (motori, TRIG, LED), solo i cambi
+#   - PWM     i duty dei PWM (enable dei motori, servo)
+# Si attiva senza toccare i programmi: ROVER_TRACE=percorso.rvt (vedi
+# gpio_backend.py). Il chiamante paga un pack_into in un blocco in memoria;
+# i blocchi pieni li scrive un thread, e comunque ogni FLUSH secondi.
+#
+# Riesecuzione: ReplayGPIO rimette i livelli degli ingressi agli istanti
+# registrati e risponde ai trigger dell'ultrasuono con l'eco del ping
+# registrato piu' vicino (ritardo e durata): i programmi, non modificati,
+# rileggono i sensori come sul campo e prendono le stesse decisioni.
+# Gira sempre nel tempo virtuale del simulatore (simulator.install), cosi'
+# anche time.time() e time.sleep() delle funzioni di decisione seguono la
+# traccia:
+#   - veloce: ore di pattuglia in pochi secondi
+#   - tempo reale: stessi eventi, ma il tempo virtuale non supera quello
+#     vero; le uscite devono coincidere come nella corsa veloce
+# Le uscite della riesecuzione si confrontano con quelle registrate
+# (compare): con il codice invariato coincidono, dopo una modifica si vede
+# dove la decisione cambia.
+#
+# Uso: python3 replay.py info traccia.rvt
+#      python3 replay.py run traccia.rvt programma [--realtime] [--seconds S]
+#      (programmi di simulate.py: loop_rover, test_nomqtt, smart_patrol)
+
+import _thread
+import argparse
+import atexit
+import contextlib
+import io
+import os
+import queue
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fake_gpio import FakeGPIO
+
+MAGIC = b"RVTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHqqQ")    # magic, versione, time_ns e monotonic_ns all'avvio, seme di random
+RECORD = struct.Struct("<qBBxxf")    # t_ns, tipo, pin, valore
+DTYPE = np.dtype([("t_ns", "<i8"), ("kind", "u1"), ("channel", "u1"), ("pad", "V2"), ("value", "<f4")])
+CHUNK = 4096            # record per blocco scritto dal thread
+FLUSH = 1.0             # s massimi prima di scrivere un blocco non pieno
+
+INPUT = 1
+EDGE = 2
+OUTPUT = 3
+PWM = 4
+KIND_NAMES = {INPUT: "letture", EDGE: "fronti", OUTPUT: "uscite", PWM: "pwm"}
+
+# Pin dell'ultrasuono, come in tutti i programmi del rover
+TRIG = 17
+ECHO = 4
+
+# Come SimGPIO: costo virtuale di una lettura, letture uguali prima di
+# saltare al prossimo evento
+INPUT_COST = 0.00002
+SPIN_READS = 3
+TAIL = 1.0              # s finali della traccia esclusi dal confronto (arresto del programma)
+
+Trace = namedtuple('Trace', ['wall_ns', 'mono_ns', 'seed', 'records'])
+
+
+# Secondi dall'apertura della traccia all'ultimo record
+def duration(trace):
+    return (int(trace.records["t_ns"][-1]) - trace.mono_ns) / 1e9 if len(trace.records) else 0.0
+
+
+class TraceWriter:
+    def __init__(self, path, clock=None, seed=0):
+        self.path = path
+        self.clock = clock or time.monotonic_ns
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time_ns(), self.clock(), seed))
+        self._lock = threading.Lock()
+        self._chunk = bytearray(CHUNK * RECORD.size)
+        self._used = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self.records = 0
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, kind, channel, value):
+        with self._lock:
+            if self._closed:
+                return
+            RECORD.pack_into(self._chunk, self._used * RECORD.size, self.clock(), kind, channel, value)
+            self._used += 1
+            self.records += 1
+            if self._used == CHUNK:
+                self._queue.put(bytes(self._chunk))
+                self._used = 0
+
+    # Blocco in corso, anche se non pieno
+    def _take(self):
+        with self._lock:
+            data = bytes(self._chunk[:self._used * RECORD.size])
+            self._used = 0
+            return data
+
+    def _run(self):
+        while True:
+            try:
+                data = self._queue.get(timeout=FLUSH)
+            except queue.Empty:
+                data = self._take()
+            if data is None:
+                break
+            if data:
+                self._file.write(data)
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(self._take())
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+class _RecordingPWM:
+    def __init__(self, pwm, channel, writer):
+        self._pwm = pwm
+        self._channel = channel
+        self._writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self._pwm, name)
+
+    def start(self, duty):
+        self._pwm.start(duty)
+        self._writer.record(PWM, self._channel, duty)
+
+    def ChangeDutyCycle(self, duty):
+        self._pwm.ChangeDutyCycle(duty)
+        self._writer.record(PWM, self._channel, duty)
+
+    def stop(self):
+        self._pwm.stop()
+        self._writer.record(PWM, self._channel, 0)
+
+
+# Backend GPIO che registra la traccia; il resto dell'API passa al backend
+class RecordingGPIO:
+    def __init__(self, backend, writer):
+        self._backend = backend
+        self.writer = writer
+        self._inputs = {}
+        self._outputs = {}
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def input(self, channel):
+        value = self._backend.input(channel)
+        if self._inputs.get(channel) != value:
+            self._inputs[channel] = value
+            self.writer.record(INPUT, channel, value)
+        return value
+
+    def output(self, channel, value):
+        self._backend.output(channel, value)
+        value = int(bool(value))
+        if self._outputs.get(channel) != value:
+            self._outputs[channel] = value
+            self.writer.record(OUTPUT, channel, value)
+
+    def PWM(self, channel, frequency):
+        return _RecordingPWM(self._backend.PWM(channel, frequency), channel, self.writer)
+
+    def _edge(self, callback):
+        def recorded(channel):
+            self.writer.record(EDGE, channel, self._backend.input(channel))
+            callback(channel)
+        return recorded
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        if callback is not None:
+            callback = self._edge(callback)
+        if bouncetime is None:
+            self._backend.add_event_detect(channel, edge, callback=callback)
+        else:
+            self._backend.add_event_detect(channel, edge, callback=callback, bouncetime=bouncetime)
+        # Livello di partenza: poi cambia solo con i fronti
+        self.writer.record(INPUT, channel, self._backend.input(channel))
+
+    def add_event_callback(self, channel, callback):
+        self._backend.add_event_callback(channel, self._edge(callback))
+
+    def cleanup(self, *args):
+        self._backend.cleanup(*args)
+        if not args:
+            self.writer.close()
+
+
+# Backend registrato per la variabile ROVER_TRACE. Anche le scelte a caso
+# dei programmi (le svolte di Smart_Patrol) sono decisioni da rifare
+# uguali: si parte da un seme noto, salvato nella traccia.
+def recording(backend, path):
+    seed = int.from_bytes(os.urandom(8), 'little')
+    random.seed(seed)
+    writer = TraceWriter(path, seed=seed)
+    atexit.register(writer.close)
+    return RecordingGPIO(backend, writer)
+
+
+def load(path):
+    with open(path, "rb") as f:
+        magic, version, wall_ns, mono_ns, seed = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{}: non e' una traccia del rover (versione {})".format(path, VERSION))
+        data = f.read()
+    # Un blocco troncato (arresto brusco) perde solo l'ultimo record
+    usable = len(data) // RECORD.size * RECORD.size
+    return Trace(wall_ns, mono_ns, seed, np.frombuffer(data[:usable], DTYPE))
+
+
+# Ping registrati: per ogni discesa di TRIG l'istante (ns dall'apertura), il
+# ritardo della salita di ECHO e la durata dell'eco (-1 = eco perso)
+def pings(trace, trig=TRIG, echo=ECHO):
+    records = trace.records
+    t0 = trace.mono_ns
+    falls = []
+    rise = None
+    for t_ns, kind, channel, value in zip(records["t_ns"].tolist(), records["kind"].tolist(),
+                                          records["channel"].tolist(), records["value"].tolist()):
+        if channel == trig and kind == OUTPUT and not value:
+            falls.append([t_ns - t0, -1, -1])
+            rise = None
+        elif channel == echo and kind in (EDGE, INPUT) and falls and falls[-1][2] < 0:
+            if rise is None and (kind == EDGE or value):
+                rise = t_ns
+                falls[-1][1] = t_ns - t0 - falls[-1][0]
+            elif rise is not None and (kind == EDGE or not value):
+                falls[-1][2] = t_ns - rise
+    return np.array(falls, np.int64).reshape(-1, 3)
+
+
+# Livelli degli ingressi da rimettere nel tempo (ns dall'apertura della
+# traccia): tutto
+# tranne ECHO, che segue i trigger
+def levels(trace, echo=ECHO):
+    records = trace.records
+    mask = ((records["kind"] == INPUT) | (records["kind"] == EDGE)) & (records["channel"] != echo)
+    return records["t_ns"][mask] - trace.mono_ns, records["channel"][mask], records["value"][mask].astype(int)
+
+
+# Azionamenti registrati (ns dall'apertura, tipo, pin, valore), TRIG escluso
+def actions(trace, trig=TRIG):
+    records = trace.records
+    mask = ((records["kind"] == OUTPUT) | (records["kind"] == PWM)) & (records["channel"] != trig)
+    return list(zip((records["t_ns"][mask] - trace.mono_ns).tolist(), records["kind"][mask].tolist(),
+                    records["channel"][mask].tolist(), records["value"][mask].tolist()))
+
+
+class ReplayGPIO(FakeGPIO):
+    def __init__(self, trace, trig=TRIG, echo=ECHO):
+        FakeGPIO.__init__(self)
+        self.trig = trig
+        self.echo = echo
+        self._times, self._channels, self._levels = levels(trace, echo)
+        self._pings = pings(trace, trig, echo)
+        self._next = 0
+        self._scheduler = None
+        self._start_ns = None
+        self._spin = None
+        self._spins = 0
+        # Uscite della riesecuzione, come actions(): (ns dall'avvio, tipo, pin, valore)
+        self.actions = []
+        self._outputs = {}
+        self.on_output(trig, self._on_trig)
+
+    # scheduler: quello del simulatore (simulator.install)
+    def start(self, scheduler):
+        self._scheduler = scheduler
+        self._start_ns = self.clock()
+        self._feed()
+        return self
+
+    def elapsed_ns(self):
+        return self.clock() - self._start_ns
+
+    # Applica i livelli dovuti e si riprogramma al prossimo
+    def _feed(self):
+        now = self.elapsed_ns()
+        times = self._times
+        while self._next < len(times) and times[self._next] <= now:
+            self._apply(int(self._channels[self._next]), int(self._levels[self._next]))
+            self._next += 1
+        if self._next < len(times):
+            self._scheduler.at(self._start_ns + int(times[self._next]), self._feed)
+
+    # Trigger: l'eco del ping registrato piu' vicino nel tempo
+    def _on_trig(self, channel, value):
+        if value or not len(self._pings):
+            return
+        now = self.elapsed_ns()
+        index = int(np.searchsorted(self._pings[:, 0], now))
+        if index == len(self._pings) or (index > 0 and now - self._pings[index - 1, 0] < self._pings[index, 0] - now):
+            index -= 1
+        _, delay, width = self._pings[index]
+        if delay >= 0 and width >= 0:
+            self.inject_pulse(self.echo, self.clock() + int(delay), int(width))
+
+    # Uscite registrate come fa RecordingGPIO: la prima scrittura e i cambi
+    def output(self, channel, value):
+        FakeGPIO.output(self, channel, value)
+        value = int(bool(value))
+        if channel != self.trig and self._outputs.get(channel) != value:
+            self._outputs[channel] = value
+            self.actions.append((self.elapsed_ns(), OUTPUT, channel, value))
+
+    def _notify_pwm(self, channel, duty):
+        FakeGPIO._notify_pwm(self, channel, duty)
+        self.actions.append((self.elapsed_ns(), PWM, channel, float(np.float32(duty))))
+
+    def input(self, channel):
+        value = FakeGPIO.input(self, channel)
+        sched = self._scheduler
+        if sched.owns() and not sched.in_callback():
+            # Attesa attiva (es. su ECHO): dopo qualche lettura uguale, una subito
+            # dopo l'altra, si salta al prossimo evento, come nel simulatore
+            spin = (_thread.get_ident(), channel, value, sched.now_ns)
+            self._spins = self._spins + 1 if spin == self._spin else 0
+            wait = INPUT_COST
+            if self._spins >= SPIN_READS:
+                next_ns = sched.next_event_ns()
+                if next_ns is not None:
+                    wait = max(wait, (next_ns - sched.now_ns) / 1e9)
+            sched.sleep(wait)
+            self._spin = spin[:3] + (sched.now_ns,)
+        return value
+
+    # Come RecordingGPIO, che legge il livello di partenza dei pin con i fronti
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        FakeGPIO.add_event_detect(self, channel, edge, callback, bouncetime)
+        self.input(channel)
+
+    def inject(self, channel, level, at_ns=None):
+        self._scheduler.at(self.clock() if at_ns is None else at_ns, lambda: self._apply(channel, int(bool(level))))
+
+    def _ensure_thread(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+# Confronto delle uscite fino a until_ns: quante coincidono nell'ordine,
+# dove divergono e lo scarto di tempo tra le coincidenti.
+# L'arresto in coda alla traccia (Ctrl-C) nella riesecuzione cade in un
+# altro punto del ciclo: si confronta fino a TAIL secondi prima della fine.
+def compare(recorded, replayed, until_ns=None):
+    if until_ns is not None:
+        recorded = [a for a in recorded if a[0] <= until_ns]
+        replayed = [a for a in replayed if a[0] <= until_ns]
+    matched = 0
+    offsets = []
+    for a, b in zip(recorded, replayed):
+        if a[1:] != b[1:]:
+            break
+        matched += 1
+        offsets.append(abs(a[0] - b[0]) / 1e6)
+    divergence = None
+    if matched < max(len(recorded), len(replayed)):
+        divergence = (recorded[matched] if matched < len(recorded) else replayed[matched])[0] / 1e9
+    offsets.sort()
+    return {
+        "recorded": len(recorded),
+        "replayed": len(replayed),
+        "matched": matched,
+        "divergence_s": divergence,
+        "offset_p99_ms": offsets[int(len(offsets) * 0.99)] if offsets else 0.0,
+    }
+
+
+_current = None
+
+
+# Backend per ROVER_GPIO=replay
+def current():
+    return _current
+
+
+# Riesegue un programma di simulate.py sulla traccia; restituisce il
+# ReplayGPIO (con le uscite in actions) e i secondi reali impiegati
+def run(trace, program, realtime=False, seconds=None, verbose=False):
+    global _current
+    import simulate
+    import simulator
+    length = duration(trace) if seconds is None else min(duration(trace), seconds)
+    gpio = _current = ReplayGPIO(trace)
+    os.environ['ROVER_GPIO'] = 'replay'
+    os.environ.pop('ROVER_TRACE', None)
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="rover_replay_"))
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    real_start = time.perf_counter()
+    gpio.start(simulator.install(length, realtime))
+    random.seed(trace.seed)
+    try:
+        with output:
+            try:
+                simulate.run_program(program)
+            except (KeyboardInterrupt, SystemExit):
+                pass
+    finally:
+        simulator.uninstall()
+        gpio.stop()
+        os.chdir(cwd)
+        _current = None
+    return gpio, time.perf_counter() - real_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracce dei sensori e riesecuzione dei programmi del rover")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="contenuto di una traccia")
+    info.add_argument("trace")
+    rerun = sub.add_parser("run", help="riesegue un programma sulla traccia e confronta le uscite")
+    rerun.add_argument("trace")
+    rerun.add_argument("program", choices=("loop_rover", "test_nomqtt", "smart_patrol"))
+    rerun.add_argument("--realtime", action="store_true", help="con l'orologio vero invece del tempo virtuale")
+    rerun.add_argument("--seconds", type=float, help="solo i primi S secondi della traccia")
+    rerun.add_argument("-v", "--verbose", action="store_true", help="mostra l'output del programma")
+    args = parser.parse_args()
+
+    trace = load(args.trace)
+    records = trace.records
+    length = duration(trace) if args.command == "info" or args.seconds is None else min(duration(trace), args.seconds)
+    if args.command == "info":
+        print("{}: {} record, {:.1f} s, registrata il {}".format(
+            args.trace, len(records), length, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(trace.wall_ns / 1e9))))
+        for kind, name in sorted(KIND_NAMES.items()):
+            channels = sorted(set(records["channel"][records["kind"] == kind].tolist()))
+            print("  {:<8} {:8d}  pin {}".format(name, int(np.sum(records["kind"] == kind)), channels))
+        found = pings(trace)
+        print("  ping     {:8d}  senza eco {}".format(len(found), int(np.sum(found[:, 2] < 0)) if len(found) else 0))
+        return
+
+    # gpio_backend cerca la traccia attiva nel modulo replay, non in __main__
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import replay
+    gpio, real = replay.run(trace, args.program, args.realtime, args.seconds, args.verbose)
+    result = compare(actions(trace), gpio.actions, int((length - TAIL) * 1e9))
+    print("{}: {:.1f} s di traccia in {:.2f} s reali ({:.0f}x)".format(args.program, length, real, length / real))
+    print("uscite: {matched} uguali su {recorded} registrate, {replayed} rieseguite; scarto p99 {offset_p99_ms:.2f} ms".format(
+        **result))
+    if result["divergence_s"] is not None:
+        print("prima differenza a {:.3f} s".format(result["divergence_s"]))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
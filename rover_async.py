@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Pattugliamento con runtime asyncio.
+# Stessa logica di ProgettoRover.py (scansione, scelta della direzione con
+# il massimo delle tre distanze, avanzamento con controllo collisioni,
+# sblocco quando e' troppo vicino), ma invece di una catena di time.sleep
+# ci sono task separati:
+#   ranging    porta il filtro al passo con i campioni e interrompe la
+#              manovra in corso se c'e' un ostacolo davanti mentre avanza
+#   decision   sceglie ed esegue le manovre
+#   flame      eventi del sensore di fiamma (flame.FlameDetector), che
+#              interrompono tutto
+#   telemetry  inoltra distanze e allarmi al publisher MQTT
+# Le manovre sono coroutine annullabili: un ostacolo o una fiamma le
+# interrompono subito, con i motori fermati nel finally.
+
+import asyncio
+import logging
+import time
+
+import filters
+import flame
+import leds
+import logpipe
+import motors
+import ranging
+import sampler
+import scanner
+import telemetry
+
+# Motor pins
+ENA = 13
+ENB = 20
+IN1 = 19
+IN2 = 16
+IN3 = 21
+IN4 = 26
+
+# Sensor pins
+FLAME = 6
+TRIG = 17
+ECHO = 4
+
+# Servo pins
+SER_SCAN = 12
+
+# LED pins
+LED0 = 10
+LED1 = 9
+LED2 = 25
+
+# Collision avoidance
+SAFE_DISTANCE = 1.00
+DANGER_DISTANCE = 0.50
+MAX_SPEED = 100
+MEDIUM_SPEED = 50
+FRONT_SECTOR = 20
+
+# Tempi delle manovre (gli stessi sleep di ProgettoRover.py)
+TURN_TIME = 1.0
+DRIVE_TIME = 1.0
+TICK = 0.02         # periodo dei task di controllo
+
+
+class RoverRuntime:
+    def __init__(self, gpio, publisher=None, servo_scan=True):
+        self.gpio = gpio
+        self.publisher = publisher
+        self.servo_scan = servo_scan
+        # Creati da setup(); None finche' non ci arriva (cleanup() li salta)
+        self.motors = None
+        self.motion = None
+        self.ranger = None
+        self.distance_sampler = None
+        self.sweep_scanner = None
+        self.led_engine = None
+        self.flame_detector = None
+        self.front_filter = filters.Pipeline()
+        self.front = None
+        self.speed = 0           # >0 avanti, <0 indietro, 0 fermo o rotazione
+        self.flame = False
+        self.obstacle = False
+        self.scanning = False
+        self.maneuver = None
+        self._preempted = False
+        self._last_sample_ns = 0
+        self.events = None
+        self.preemptions = []    # (motivo, istante monotonic)
+
+    def setup(self):
+        GPIO = self.gpio
+        self.motors = motors.MotorDriver(GPIO, ENA, IN1, IN2, ENB, IN3, IN4)
+        self.motors.setup()
+        self.motion = motors.MotionProfile(self.motors).start()
+
+        GPIO.setup(FLAME, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.setup(TRIG, GPIO.OUT, initial=GPIO.LOW)
+        GPIO.setup(ECHO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.ranger = ranging.UltrasonicRanger(GPIO, TRIG, ECHO)
+        self.ranger.start()
+        self.distance_sampler = sampler.DistanceSampler(self.ranger)
+        self.distance_sampler.start()
+        self.sweep_scanner = scanner.SweepScanner(GPIO, SER_SCAN, self.distance_sampler) if self.servo_scan else None
+
+        GPIO.setup(LED0, GPIO.OUT, initial=GPIO.HIGH)
+        GPIO.setup(LED1, GPIO.OUT, initial=GPIO.HIGH)
+        GPIO.setup(LED2, GPIO.OUT, initial=GPIO.HIGH)
+        self.led_engine = leds.LedEngine(GPIO, (LED0, LED1, LED2))
+        self.led_engine.start()
+        self.flame_detector = flame.FlameDetector(GPIO, FLAME)
+
+    # Va bene anche dopo un setup() fallito a meta': ferma solo quello che
+    # esiste, e un errore in uno stop si scrive nel log senza saltare gli
+    # altri ne' coprire l'eccezione originale
+    def cleanup(self):
+        steps = (
+            ('sweep_scanner', lambda: self.sweep_scanner.stop()),
+            ('distance_sampler', lambda: self.distance_sampler.stop()),
+            ('led_engine', lambda: self.led_engine.stop()),
+            ('motion', self.motor_stop),
+            ('motion', lambda: self.motion.close()),
+            ('motors', lambda: self.motors.close()),
+        )
+        for part, stop in steps:
+            if getattr(self, part) is None:
+                continue
+            try:
+                stop()
+            except Exception:
+                logging.exception("Errore fermando %s", part)
+
+    # --- Motori: impostano la rampa e tornano subito; lo stop e' immediato ---
+
+    def motor_forward(self, speed=MAX_SPEED):
+        self.motion.forward(speed)
+        self.speed = speed
+
+    def motor_backward(self, speed=MAX_SPEED):
+        self.motion.backward(speed)
+        self.speed = -speed
+
+    def motor_turn_left(self):
+        self.motion.turn_left(MAX_SPEED)
+        self.speed = 0
+
+    def motor_turn_right(self):
+        self.motion.turn_right(MAX_SPEED)
+        self.speed = 0
+
+    def motor_stop(self):
+        self.motion.emergency_stop()
+        self.speed = 0
+
+    # --- Manovre ---
+
+    # Esegue una manovra come task; restituisce None se e' stata interrotta
+    async def run_maneuver(self, coro):
+        self.maneuver = asyncio.ensure_future(coro)
+        try:
+            return await self.maneuver
+        except asyncio.CancelledError:
+            if not self._preempted:
+                raise
+            self._preempted = False
+            return None
+        finally:
+            self.maneuver = None
+
+    # Interrompe subito la manovra in corso e ferma i motori
+    def preempt(self, reason):
+        self.motor_stop()
+        self.preemptions.append((reason, time.monotonic()))
+        if self.maneuver is not None and not self.maneuver.done():
+            self._preempted = True
+            self.maneuver.cancel()
+
+    async def turn(self, direction, duration=TURN_TIME):
+        try:
+            if direction == "SINISTRA":
+                self.motor_turn_left()
+            else:
+                self.motor_turn_right()
+            await asyncio.sleep(duration)
+        finally:
+            self.motor_stop()
+
+    # Avanza per duration secondi adattando la velocita' alla distanza
+    async def drive(self, duration=DRIVE_TIME):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + duration
+        while loop.time() < end:
+            distance = self.front
+            if distance is not None and distance <= DANGER_DISTANCE:
+                self.obstacle = True
+                self.motor_stop()
+                return
+            new_speed = MAX_SPEED if distance is not None and distance > SAFE_DISTANCE else MEDIUM_SPEED
+            if new_speed != self.speed:
+                self.motor_forward(new_speed)
+            await asyncio.sleep(TICK)
+
+    # Sblocco davanti a un ostacolo, come il ramo need_stop di where_to_go
+    async def escape(self):
+        try:
+            self.motor_stop()
+            await asyncio.sleep(0.3)
+            self.motor_backward(MEDIUM_SPEED)
+            await asyncio.sleep(1)
+            self.motor_turn_left()
+            await asyncio.sleep(2)
+        finally:
+            self.motor_stop()
+            self.obstacle = False
+
+    # Campioni partiti dopo t_ns finche' bastano per la mediana della
+    # scansione (al piu' count), aspettati senza bloccare il loop
+    async def _samples_after(self, t_ns, count, timeout):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        records = self.distance_sampler.since(t_ns)[:2]
+        while len(records) < count and not scanner.agree(records) and loop.time() < end:
+            await asyncio.sleep(0.005)
+            records = self.distance_sampler.since(t_ns)[:len(records) + 1]
+        return records[:count]
+
+    async def scan(self):
+        if self.sweep_scanner is None:
+            return await self._chassis_scan()
+        sweep = self.sweep_scanner
+        distances = {}
+        # Durante la scansione i campioni non sono frontali: il filtro resta
+        # fermo e il pericolo davanti si controlla qui, come in servo_scan()
+        self.scanning = True
+        try:
+            for angle in sweep.next_pass():
+                await asyncio.sleep(sweep.point(angle))
+                settled = time.monotonic_ns()
+                self.distance_sampler.kick()
+                distance = scanner.angle_distance(
+                    await self._samples_after(settled, sweep.pings, sweep.timeout()))
+                distances[angle] = distance
+                if (self.speed > 0 and distance is not None and distance <= DANGER_DISTANCE
+                        and abs(angle - scanner.SERVO_CENTER) <= FRONT_SECTOR):
+                    self.obstacle = True
+                    self.motor_stop()
+        finally:
+            sweep.point(scanner.SERVO_CENTER)
+            self.front_filter.reset()
+            self._last_sample_ns = time.monotonic_ns()
+            self.scanning = False
+        scan = scanner.PolarScan(time.monotonic_ns(), sweep.angles, [distances[a] for a in sweep.angles], 0.0)
+        return scanner.sectors(scan, FRONT_SECTOR)
+
+    async def _chassis_scan(self):
+        distances = []
+        try:
+            for turn in (self.motor_turn_left, self.motor_turn_right, self.motor_turn_right):
+                turn()
+                await asyncio.sleep(TURN_TIME)
+                distances.append(self.front)
+            self.motor_turn_left()
+            await asyncio.sleep(TURN_TIME)
+        finally:
+            self.motor_stop()
+        return tuple(distances)
+
+    # --- Task ---
+
+    async def ranging_task(self):
+        while True:
+            if self.scanning:
+                await asyncio.sleep(TICK)
+                continue
+            close = False
+            for reading in self.distance_sampler.since(self._last_sample_ns):
+                self.front_filter.update_reading(reading)
+                self._last_sample_ns = reading.t_ns
+                close = reading.distance is not None and reading.distance <= DANGER_DISTANCE
+            estimate = self.front_filter.estimate
+            fresh = estimate.valid and time.monotonic_ns() - estimate.t_ns <= self.front_filter.max_age_ns
+            self.front = estimate.distance if fresh else None
+            if self.speed > 0 and self.front is not None and self.front <= DANGER_DISTANCE:
+                self.obstacle = True
+                self.preempt("ostacolo")
+            elif self.speed > 0 and close:
+                # Un campione vicino che il filtro non ha ancora accettato:
+                # si anticipa il ping successivo per confermarlo prima
+                self.distance_sampler.kick()
+            await asyncio.sleep(TICK)
+
+    # La fiamma ferma il rover e accende la sirena finche' e' presente,
+    # poi il pattugliamento riprende. Chiamata nel loop dal thread del
+    # FlameDetector.
+    def on_flame(self, event):
+        if event.kind == flame.STARTED:
+            self.flame = True
+            self.preempt("fiamma")
+            logging.info("ALLERTA: Rilevata fiamma.")
+            self.led_engine.play("siren", repeat=None)
+        elif event.kind == flame.CLEARED:
+            self.flame = False
+            self.led_engine.stop_alert()
+            logging.info("Fiamma spenta: durata %.1fs, %d accensioni", event.duration, event.count)
+        self.events.put_nowait(("flame", event))
+
+    async def telemetry_task(self):
+        while True:
+            event = await self.events.get()
+            if self.publisher is None:
+                continue
+            if event[0] == "distances":
+                self.publisher.publish_distances(*event[1:])
+            else:
+                flame_event = event[1]
+                status = {flame.STARTED: telemetry.FLAME_ALERT, flame.ONGOING: telemetry.FLAME_ONGOING,
+                          flame.CLEARED: telemetry.FLAME_CLEAR}[flame_event.kind]
+                self.publisher.publish_flame(status, count=flame_event.count, duration=flame_event.duration)
+
+    def choose_direction(self, d_l, d_c, d_r):
+        # Una direzione senza stima valida non viene mai preferita
+        d_l, d_c, d_r = [d if d is not None else 0.0 for d in (d_l, d_c, d_r)]
+        max_distance = max(d_l, d_c, d_r)
+        logging.info("Valutazione - L:%.2fm C:%.2fm R:%.2fm", d_l, d_c, d_r)
+        if max_distance == d_c:
+            direction = "AVANTI"
+        elif max_distance == d_r:
+            direction = "DESTRA"
+        else:
+            direction = "SINISTRA"
+        logging.info("Direzione presa: %s", direction)
+        return direction
+
+    # Ogni manovra interrotta riporta qui, dove si decide di nuovo
+    # guardando lo stato attuale (fiamma, ostacolo)
+    async def decision_task(self):
+        while True:
+            if self.flame:
+                await asyncio.sleep(TICK)
+                continue
+            if self.obstacle:
+                await self.run_maneuver(self.escape())
+                continue
+            distances = await self.run_maneuver(self.scan())
+            if distances is None or self.obstacle:
+                continue
+            self.events.put_nowait(("distances",) + tuple(distances))
+            direction = self.choose_direction(*distances)
+            if direction != "AVANTI":
+                await self.run_maneuver(self.turn(direction))
+                if self.flame or self.obstacle:
+                    continue
+            await self.run_maneuver(self.drive())
+
+    async def run(self):
+        self.events = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self.flame_detector.on_event = lambda event: loop.call_soon_threadsafe(self.on_flame, event)
+        self.flame_detector.start()
+        tasks = [asyncio.ensure_future(t) for t in (self.ranging_task(), self.telemetry_task())]
+        try:
+            await self.decision_task()
+        finally:
+            self.flame_detector.stop()
+            for task in tasks:
+                task.cancel()
+            self.motor_stop()
+
+
+if __name__ == '__main__':
+    from gpio_backend import GPIO
+    import paho.mqtt.client as mqtt
+
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False)
+    # Il file di log lo scrive il thread di logpipe, non il loop asyncio
+    log_pipeline = logpipe.setup('rover_patrol.log')
+
+    print("=== AVVIO ROVER (asyncio) ===")
+    rover = telemetry.rover_id()
+    mqtt_client = mqtt.Client("Rover_" + rover)
+    publisher = telemetry.TelemetryPublisher(mqtt_client, encoding=telemetry.JSON,
+                                             topics=telemetry.rover_topics(rover))
+    runtime = RoverRuntime(GPIO, publisher)
+    try:
+        runtime.setup()
+        publisher.start()
+        mqtt_client.connect_async("broker.emqx.io", 1883, 60)
+        mqtt_client.loop_start()
+        time.sleep(2)
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        print("\n=== ARRESTO ROVER ===")
+    finally:
+        runtime.cleanup()
+        publisher.stop()
+        # GPIO.cleanup() sempre, anche se i LED non sono stati configurati
+        try:
+            mqtt_client.loop_stop()
+            mqtt_client.disconnect()
+            if runtime.led_engine is not None:
+                GPIO.output(LED0, GPIO.HIGH)
+                GPIO.output(LED1, GPIO.HIGH)
+                GPIO.output(LED2, GPIO.HIGH)
+        finally:
+            GPIO.cleanup()
+            logging.info("Rover arrestato")
+            log_pipeline.stop()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Campionamento ultrasonico in background.
+# Un thread fa un ping a cadenza fissa e scrive i record (t_ns, distanza, esito)
+# in un buffer circolare preallocato. I consumatori (collision_avoidance,
+# check_distance_change, loop_rover) leggono l'ultimo valore, gli ultimi N
+# o quelli da un certo istante senza mai bloccare e senza fare altri ping.
+
+import threading
+import time
+from array import array
+
+from ranging import Reading
+
+PERIOD = 0.06   # s, l'HC-SR04 vuole almeno 60ms tra due ping
+MIN_GAP = 0.025  # s, pausa minima per un ping anticipato con kick()
+CAPACITY = 256
+
+
+# Buffer circolare a scrittore singolo.
+# I dati stanno in tre array preallocati; lo scrittore aggiorna lo slot e
+# solo alla fine incrementa il contatore, i lettori non prendono lock:
+# rileggono il contatore dopo la copia e scartano gli slot sovrascritti
+# nel frattempo. Lo slot count % capacity puo' essere a meta' scrittura
+# (il record count - capacity e' gia' in parte sostituito): non si legge
+# mai, quindi al piu' capacity - 1 record per lettura.
+class RingBuffer:
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self._t_ns = array('q', bytes(8 * capacity))
+        self._distance = array('d', bytes(8 * capacity))
+        self._status = array('b', bytes(capacity))
+        self.count = 0        # record scritti in totale
+        self.overwritten = 0  # record persi perche' sovrascritti
+        self.dropped = 0      # campioni non scritti (vedi DistanceSampler)
+
+    def write(self, t_ns, distance, status):
+        i = self.count % self.capacity
+        self._t_ns[i] = t_ns
+        self._distance[i] = distance if distance is not None else float('nan')
+        self._status[i] = status
+        if self.count >= self.capacity:
+            self.overwritten += 1
+        self.count += 1
+
+    def _read(self, n):
+        while True:
+            end = self.count
+            n = min(n, end, self.capacity - 1)
+            out = []
+            for k in range(end - n, end):
+                i = k % self.capacity
+                distance = self._distance[i]
+                out.append(Reading(self._t_ns[i], None if distance != distance else distance, self._status[i]))
+            # Slot riscritti o in scrittura durante la copia: si scartano
+            # quelli vecchi
+            stale = self.count - self.capacity + 1 - (end - n)
+            if stale <= 0:
+                return out
+            if stale < len(out):
+                return out[stale:]
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        out = self._read(1)
+        return out[-1] if out else None
+
+    def last(self, n):
+        return self._read(n)
+
+    # Record con t_ns > t_ns_from, dal piu' vecchio al piu' recente
+    def since(self, t_ns_from):
+        end = self.count
+        n = 0
+        while n < min(end, self.capacity):
+            if self._t_ns[(end - n - 1) % self.capacity] <= t_ns_from:
+                break
+            n += 1
+        return [r for r in self._read(n) if r.t_ns > t_ns_from]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+class DistanceSampler:
+    def __init__(self, ranger, buffer=None, period=PERIOD):
+        self.ranger = ranger
+        self.buffer = buffer if buffer is not None else RingBuffer()
+        self.period = period
+        self.overruns = 0  # cicli durati piu' del periodo
+        self._new_sample = threading.Condition()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="distance-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.clear()
+            reading = self.ranger.measure(timeout=self.period)
+            if reading is None:
+                self.buffer.dropped += 1
+            else:
+                self.buffer.write(reading.t_ns, reading.distance, reading.status)
+                with self._new_sample:
+                    self._new_sample.notify_all()
+            ping_end = time.monotonic()
+            next_tick += self.period
+            delay = next_tick - ping_end
+            if delay < 0:
+                # In ritardo: si salta al prossimo tick invece di recuperare
+                self.overruns += 1
+                next_tick = ping_end
+            elif self._wake.wait(delay) and not self._stop.is_set():
+                # Ping anticipato su richiesta: si rispetta solo la pausa minima
+                gap = ping_end + MIN_GAP - time.monotonic()
+                if gap > 0:
+                    time.sleep(gap)
+                next_tick = time.monotonic()
+
+    # Chiede un ping il prima possibile invece di aspettare il prossimo tick
+    def kick(self):
+        self._wake.set()
+
+    def latest(self):
+        return self.buffer.latest()
+
+    def last(self, n):
+        return self.buffer.last(n)
+
+    def since(self, t_ns):
+        return self.buffer.since(t_ns)
+
+    # Per chi deve aspettare un campione nuovo (es. la scansione col servo):
+    # attende fino a timeout un record piu' recente di t_ns
+    def wait_since(self, t_ns, timeout):
+        with self._new_sample:
+            self._new_sample.wait_for(lambda: self.buffer.count and self.buffer.latest().t_ns > t_ns, timeout)
+        return self.buffer.since(t_ns)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Scansione con il servo orizzontale che porta il sensore ultrasonico.
+# Invece di girare tutto il rover a sinistra/centro/destra (circa 4 s fermi),
+# si ruota solo la testa su un insieme di angoli configurabile e per ogni
+# angolo si chiede un ping anticipato al DistanceSampler e si prendono i
+# campioni partiti a servo fermo: due, e un terzo se i primi due non
+# concordano, ridotti con la mediana. Cosi' un solo ping corto (eco spurio)
+# o perso non decide la distanza dell'angolo. Il rover puo' continuare a
+# muoversi durante la scansione.
+
+import math
+import time
+from collections import namedtuple
+
+import filters
+import ranging
+
+SERVO_FREQUENCY = 50  # Hz, come in wifirobots.py
+SERVO_CENTER = 90     # gradi, sensore rivolto in avanti
+SERVO_SETTLE = 0.015  # s, tempo fisso di assestamento
+SERVO_SPEED = 0.0017  # s per grado (SG90: ~0.1 s / 60 gradi)
+SCAN_ANGLES = (30, 50, 70, 90, 110, 130, 150)  # >90 = verso sinistra
+SCAN_PINGS = 3        # ping massimi per angolo, ridotti con la mediana
+SCAN_AGREE = 0.03     # m, quanto avanza il rover tra due ping: piu' vicini basta cosi'
+
+PolarScan = namedtuple('PolarScan', ['t_ns', 'angles', 'distances', 'duration'])
+
+
+# Duty cycle per l'angolo, stessa formula di SetServo7Angle/SetServo8Angle
+def angle_to_duty(angle):
+    return 2.5 + 10 * angle / 180
+
+
+class SweepScanner:
+    def __init__(self, gpio, servo_pin, distance_sampler, angles=SCAN_ANGLES, pings=SCAN_PINGS):
+        self.gpio = gpio
+        self.distance_sampler = distance_sampler
+        self.angles = tuple(angles)
+        self.pings = pings
+        self.angle = SERVO_CENTER
+        gpio.setup(servo_pin, gpio.OUT)
+        self.servo = gpio.PWM(servo_pin, SERVO_FREQUENCY)
+        self.servo.start(angle_to_duty(SERVO_CENTER))
+        self._forward = True
+
+    # Comanda il servo senza aspettare; restituisce il tempo di assestamento
+    def point(self, angle):
+        delta = abs(angle - self.angle)
+        self.servo.ChangeDutyCycle(angle_to_duty(angle))
+        self.angle = angle
+        return SERVO_SETTLE + SERVO_SPEED * delta if delta else 0.0
+
+    def move_to(self, angle):
+        settle = self.point(angle)
+        if settle:
+            time.sleep(settle)
+
+    # Angoli della prossima passata, alternando il verso (serpentina) per
+    # non riportare ogni volta il servo all'inizio
+    def next_pass(self):
+        angles = self.angles if self._forward else self.angles[::-1]
+        self._forward = not self._forward
+        return angles
+
+    # Attesa massima per i ping di un angolo
+    def timeout(self):
+        return (3 + self.pings) * self.distance_sampler.period
+
+    # Campioni partiti dopo t_ns (servo gia' fermo) finche' bastano per la
+    # mediana, al piu' self.pings, meno se scade il tempo
+    def _samples_after(self, t_ns):
+        deadline = time.monotonic() + self.timeout()
+        records = []
+        while len(records) < self.pings and not agree(records):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.distance_sampler.wait_since(records[-1].t_ns if records else t_ns, remaining)
+            records = self.distance_sampler.since(t_ns)
+        return records[:self.pings]
+
+    # Una passata su tutti gli angoli.
+    # on_reading(angle, distance) viene chiamata appena arriva ogni lettura,
+    # cosi' chi guida puo' fermarsi senza aspettare la fine della scansione.
+    def scan(self, on_reading=None, recenter=True):
+        start = time.monotonic()
+        distances = {}
+        for angle in self.next_pass():
+            self.move_to(angle)
+            settled = time.monotonic_ns()
+            self.distance_sampler.kick()
+            distance = angle_distance(self._samples_after(settled))
+            distances[angle] = distance
+            if on_reading is not None:
+                on_reading(angle, distance)
+        if recenter:
+            self.move_to(SERVO_CENTER)
+        return PolarScan(time.monotonic_ns(), self.angles,
+                         [distances[a] for a in self.angles], time.monotonic() - start)
+
+    def stop(self):
+        self.servo.stop()
+
+
+# Distanza di un campione di scansione, None se in timeout o fuori portata
+def scan_distance(reading):
+    if reading is None or reading.status != ranging.OK:
+        return None
+    if not filters.MIN_RANGE <= reading.distance <= filters.MAX_RANGE:
+        return None
+    return reading.distance
+
+
+# Esattamente due ping che concordano: la mediana con un terzo cadrebbe
+# comunque tra i due
+def agree(readings):
+    if len(readings) != 2:
+        return False
+    first, second = (scan_distance(r) for r in readings)
+    if first is None or second is None:
+        return first is second
+    return abs(first - second) <= SCAN_AGREE
+
+
+# Distanza di un angolo dai suoi ping: mediana (con due ping la maggiore),
+# dove un ping non valido conta come fuori portata, cioe' oltre tutti gli
+# altri; None se la mediana e' fuori portata o non ci sono ping
+def angle_distance(readings):
+    distances = sorted((scan_distance(r) for r in readings), key=lambda d: math.inf if d is None else d)
+    return distances[len(distances) // 2] if distances else None
+
+
+# Distanza dell'ostacolo piu' vicino tra le letture i cui angoli
+# soddisfano inside, None se nessuna lettura valida
+def _closest(scan, inside):
+    values = [d for a, d in zip(scan.angles, scan.distances) if inside(a) and d is not None]
+    return min(values) if values else None
+
+
+# Riduce una scansione polare a settori (sinistra, centro, destra): il
+# centro e' [center - front, center + front], come il controllo "davanti"
+# durante la scansione, i lati sono aperti verso il centro, cosi' ogni
+# lettura finisce in un settore solo
+def sectors(scan, front, center=SERVO_CENTER):
+    return (_closest(scan, lambda a: a > center + front),
+            _closest(scan, lambda a: center - front <= a <= center + front),
+            _closest(scan, lambda a: a < center - front))
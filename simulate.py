@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Esegue un programma del rover nel simulatore, in tempo virtuale, e stampa
+# quanto ha percorso, gli urti e la velocita' rispetto al tempo reale.
+#
+# Programmi:
+#   loop_rover     ProgettoRover.py (senza MQTT)
+#   test_nomqtt    Test_noMqtt.py
+#   smart_patrol   ProgrammaEsempio.py
+#   follow_line    source code/FollowLine.py
+#   avoiding       source code/Avoiding.py
+#   avoid_wave     source code/avoid_wave.py
+#   cruising_line  Cruising_Mod di source code/wifirobots.py, modo 2 (linea)
+#   cruising_ir    Cruising_Mod, modo 3 (ostacoli con l'infrarosso)
+#   cruising_wave  Cruising_Mod, modo 4 (ostacoli con l'ultrasuono)
+# Di wifirobots.py si esegue solo la parte prima del server TCP e poi
+# Cruising_Mod nel thread principale, con il modo gia' scelto.
+# Gli script in "source code" sono Python 2: vengono caricati senza
+# modificarli, convertendo al volo print e tabulazioni.
+#
+# Con --spans (solo loop_rover) le fasi del loop finiscono in una traccia
+# per ui.perfetto.dev (spans.py), nel tempo virtuale.
+#
+# Uso: python3 simulate.py programma [--seconds S] [--profile] [--trace file.csv]
+#                          [--spans file.json] [-v]
+
+import argparse
+import contextlib
+import cProfile
+import io
+import math
+import os
+import pstats
+import re
+import runpy
+import sys
+import tempfile
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+VENDOR = os.path.join(HERE, "source code")
+
+PROGRAMS = {
+    "loop_rover": "ProgettoRover.py",
+    "test_nomqtt": "Test_noMqtt.py",
+    "smart_patrol": "ProgrammaEsempio.py",
+    "follow_line": os.path.join(VENDOR, "FollowLine.py"),
+    "avoiding": os.path.join(VENDOR, "Avoiding.py"),
+    "avoid_wave": os.path.join(VENDOR, "avoid_wave.py"),
+    "cruising_line": os.path.join(VENDOR, "wifirobots.py"),
+    "cruising_ir": os.path.join(VENDOR, "wifirobots.py"),
+    "cruising_wave": os.path.join(VENDOR, "wifirobots.py"),
+}
+CRUISING = {"cruising_line": 2, "cruising_ir": 3, "cruising_wave": 4}
+LINE_PROGRAMS = ("follow_line", "cruising_line")
+
+
+# Quanto basta per eseguire gli script Python 2 del produttore
+def load_python2(path, stop=None):
+    with open(path, encoding='utf-8-sig') as f:
+        source = f.read().expandtabs(8)
+    if stop is not None:
+        source = source[:re.search(stop, source, flags=re.M).start()]
+    source = re.sub(r'^(\s*)print (.*?)\s*$', r'\1print(\2)', source, flags=re.M)
+    return compile(source, path, 'exec')
+
+
+def run_program(name):
+    path = PROGRAMS[name]
+    if name == "loop_rover":
+        import ProgettoRover
+        try:
+            ProgettoRover.setup_gpio()
+            time.sleep(2)
+            ProgettoRover.loop_rover()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ProgettoRover.shutdown()
+    elif name in CRUISING:
+        # Niente luci d'avvio e server TCP: da init_light() in poi
+        code = load_python2(path, stop=r'^init_light\(\)')
+        namespace = {'__name__': 'wifirobots', '__file__': path}
+        exec(code, namespace)
+        namespace['Cruising_Flag'] = CRUISING[name]
+        try:
+            namespace['Cruising_Mod'](u'monitor')
+        except KeyboardInterrupt:
+            pass
+    elif path.startswith(VENDOR):
+        code = load_python2(path)
+        exec(code, {'__name__': '__main__', '__file__': path})
+    else:
+        runpy.run_path(os.path.join(HERE, path), run_name='__main__')
+
+
+# Simulatore con il mondo adatto al programma
+def make_simulator(name):
+    import simulator
+    if name in LINE_PROGRAMS:
+        return simulator.Simulator(simulator.line_world(), simulator.LINE_SENSORS, pose=(2.6, 0.9, math.pi / 2))
+    return simulator.Simulator()
+
+
+# Il GPIO del simulatore al posto di RPi.GPIO per i programmi caricati dopo
+def attach(sim):
+    os.environ['ROVER_GPIO'] = 'sim'
+    gpio_module = types.ModuleType('RPi')
+    gpio_module.GPIO = sim.gpio
+    sys.modules['RPi'] = gpio_module
+    sys.modules['RPi.GPIO'] = sim.gpio
+    # I log dei programmi finiscono in una cartella temporanea
+    os.chdir(tempfile.mkdtemp(prefix="rover_sim_"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulazione del rover in tempo virtuale")
+    parser.add_argument("program", choices=sorted(PROGRAMS))
+    parser.add_argument("--seconds", type=float, default=120.0, help="durata virtuale (s)")
+    parser.add_argument("--profile", action="store_true", help="profilo del thread principale")
+    parser.add_argument("--trace", help="scrive la traiettoria in CSV")
+    parser.add_argument("--spans", help="traccia delle fasi di loop_rover per Perfetto (JSON)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="mostra l'output del programma")
+    args = parser.parse_args()
+
+    if args.spans and args.program != "loop_rover":
+        parser.error("--spans vale solo per loop_rover")
+    sys.path.insert(0, HERE)
+    sim = make_simulator(args.program)
+    attach(sim)
+
+    profiler = cProfile.Profile() if args.profile else None
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    real_start = time.perf_counter()
+    cpu_start = time.process_time()
+    sim.start(args.seconds)
+    try:
+        if args.spans:
+            import ProgettoRover
+            ProgettoRover.enable_spans(args.spans if os.path.isabs(args.spans) else os.path.join(HERE, args.spans))
+        with output:
+            if profiler:
+                profiler.enable()
+            try:
+                run_program(args.program)
+            except SystemExit:
+                pass
+            finally:
+                if profiler:
+                    profiler.disable()
+        virtual = sim.elapsed()
+    finally:
+        sim.stop()
+    real = time.perf_counter() - real_start
+    cpu = time.process_time() - cpu_start
+
+    stats = sim.stats
+    print("Programma:   {}".format(args.program))
+    print("Tempo:       {:.1f} s virtuali in {:.2f} s reali ({:.0f}x), CPU {:.2f} s".format(
+        virtual, real, virtual / real, cpu))
+    print("Percorso:    {:.2f} m  urti {}  distanza minima dagli ostacoli {:.2f} m".format(
+        stats["distance"], stats["collisions"], stats["min_clearance"]))
+    print("Ping sonar:  {}  risvegli dei thread {}".format(stats["pings"], sim.scheduler.wakeups))
+    print("Posa finale: x={:.2f} y={:.2f} rotta={:.0f} gradi".format(sim.x, sim.y, math.degrees(sim.heading) % 360))
+    if args.trace:
+        with open(os.path.join(HERE, args.trace) if not os.path.isabs(args.trace) else args.trace, 'w') as f:
+            f.write("t,x,y,heading\n")
+            for t, x, y, heading in sim.trace:
+                f.write("{:.2f},{:.4f},{:.4f},{:.4f}\n".format(t, x, y, heading))
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,718 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Simulatore del rover in tempo virtuale.
+#
+# SimGPIO ha la stessa interfaccia del GPIO finto (e quindi di RPi.GPIO) ma
+# i pin sono collegati a un modello del robot:
+#   - motori L298 (ENA/ENB/IN1-IN4): IN1/IN2 comandano la ruota destra,
+#     IN3/IN4 la sinistra, ENA/ENB il PWM; cinematica differenziale.
+#     Con traction le ruote non cambiano velocita' di colpo: seguono il
+#     comando con un'accelerazione massima (aderenza) e il tempo in cui il
+#     motore chiede di piu' finisce in stats["slip"]
+#   - HC-SR04: alla discesa di TRIG l'echo arriva con la durata data dal
+#     raggio lanciato nella direzione del servo
+#   - sensori IR (ostacolo o linea) e di fiamma, letti sul mondo 2-D
+#
+# Il tempo e' virtuale e avanza a eventi: install() sostituisce time.sleep,
+# time.time, time.monotonic, ... e le attese di threading (Condition, Event,
+# Queue) per i thread avviati dopo. Quando tutti i thread del programma sono
+# fermi in un'attesa, l'orologio salta al primo evento (un risveglio, un
+# fronte dell'echo, il controllo periodico dei sensori). Un programma che
+# passa il tempo dormendo gira cosi' centinaia di volte piu' veloce del
+# tempo reale, con tempi dell'echo esatti e ripetibili. Con realtime il
+# salto non supera l'orologio vero: stessi eventi nello stesso ordine, ma
+# al ritmo del tempo reale (riesecuzione delle tracce in tempo reale).
+#
+# Limiti: asyncio e i thread che aspettano sui socket (es. paho-mqtt)
+# usano attese reali e non sono supportati.
+
+import _thread
+import heapq
+import itertools
+import math
+import queue
+import threading
+import time
+
+from fake_gpio import FakeGPIO
+
+# Pin del robot (come in ProgettoRover.py)
+ENA = 13
+ENB = 20
+IN1 = 19
+IN2 = 16
+IN3 = 21
+IN4 = 26
+TRIG = 17
+ECHO = 4
+SERVO = 12
+
+# Modello del robot
+WHEEL_SPEED = 0.30     # m/s di una ruota con PWM al 100%
+TRACK = 0.30           # m, carreggiata efficace (le ruote slittano in curva)
+RADIUS = 0.12          # m, ingombro del robot
+SENSOR_OFFSET = 0.10   # m, sensori davanti al centro
+STEP = 0.02            # s, passo massimo di integrazione
+SLIP_GAP = 0.01        # m/s tra comando e ruota oltre cui la ruota slitta (con traction)
+
+# HC-SR04
+ECHO_DELAY = 0.00045   # s tra la discesa di TRIG e la salita di ECHO
+ECHO_NONE = 0.038      # s, durata dell'echo senza ostacoli entro la portata
+SONAR_RANGE = 4.0
+SONAR_BEAM = math.radians(7.5)
+SPEED_OF_SOUND = 340
+
+INPUT_COST = 0.00002   # s virtuali di un giro di attesa su GPIO.input (Python sul Pi)
+SPIN_READS = 3         # letture uguali dello stesso pin prima di saltare al prossimo evento
+SENSOR_TICK = 0.01     # s tra due controlli dei sensori con fronti
+
+
+# --- Tempo virtuale ---
+
+class _Waiter:
+    __slots__ = ('lock', 'done', 'timed_out', 'owner')
+
+    def __init__(self, owner=None):
+        self.lock = _thread.allocate_lock()
+        self.lock.acquire()
+        self.done = False
+        self.timed_out = False
+        self.owner = owner
+
+
+class Scheduler:
+    def __init__(self):
+        self.now_ns = 0
+        self.end_ns = None
+        self._lock = threading.RLock()
+        self._timers = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._threads = set()
+        self._interrupted = set()
+        self._dispatching = False
+        self.realtime = False
+        self.wakeups = 0
+
+    def owns(self):
+        return _thread.get_ident() in self._threads
+
+    # Vero dentro un callback dei fronti: e' istantaneo, non consuma tempo
+    # virtuale
+    def in_callback(self):
+        return self._dispatching
+
+    def register(self):
+        with self._lock:
+            self._threads.add(_thread.get_ident())
+
+    def thread_started(self):
+        with self._lock:
+            self._running += 1
+
+    def thread_finished(self):
+        with self._lock:
+            self._threads.discard(_thread.get_ident())
+            self._running -= 1
+            self._advance()
+
+    # Azione da eseguire all'istante virtuale at_ns
+    def at(self, at_ns, action):
+        with self._lock:
+            heapq.heappush(self._timers, (max(at_ns, self.now_ns), next(self._seq), action))
+
+    def block(self, waiter, deadline_ns=None):
+        with self._lock:
+            if self._dispatching:
+                # Attesa dentro un callback dei fronti: non si puo' fermare
+                # il tempo che sta avanzando, si ritorna subito
+                waiter.done = waiter.timed_out = True
+                return
+            if deadline_ns is not None:
+                heapq.heappush(self._timers, (max(deadline_ns, self.now_ns), next(self._seq), waiter))
+            self._running -= 1
+            self._advance()
+        waiter.lock.acquire()
+
+    def wake(self, waiter):
+        with self._lock:
+            if waiter.done:
+                return
+            waiter.done = True
+            self._running += 1
+            waiter.lock.release()
+
+    # Con tutti i thread fermi si salta al primo evento in coda
+    def _advance(self):
+        while self._running == 0 and self._timers:
+            if self.realtime:
+                # L'orologio virtuale parte da quello vero (install): si
+                # aspetta che il vero arrivi all'evento
+                ahead = self._timers[0][0] - _saved['real_monotonic_ns']()
+                if ahead > 0:
+                    _saved['sleep'](ahead / 1e9)
+                    continue
+            at_ns, _, entry = heapq.heappop(self._timers)
+            self.now_ns = at_ns
+            if isinstance(entry, _Waiter):
+                if entry.done:
+                    continue
+                entry.timed_out = True
+                if entry.owner is not None and entry in entry.owner:
+                    entry.owner.remove(entry)
+                self.wakeups += 1
+                self.wake(entry)
+            else:
+                self._dispatching = True
+                try:
+                    entry()
+                finally:
+                    self._dispatching = False
+
+    # Istante del prossimo evento in coda, None se la coda e' vuota
+    def next_event_ns(self):
+        with self._lock:
+            return self._timers[0][0] if self._timers else None
+
+    def sleep(self, seconds):
+        waiter = _Waiter()
+        self.block(waiter, self.now_ns + int(max(seconds, 0) * 1e9))
+        if self.end_ns is not None and self.now_ns >= self.end_ns:
+            ident = _thread.get_ident()
+            if ident == self.main_thread and ident not in self._interrupted:
+                self._interrupted.add(ident)
+                raise KeyboardInterrupt
+
+
+_scheduler = None
+_saved = {}
+
+
+def _cond_wait(self, timeout=None):
+    if _scheduler is None or not _scheduler.owns():
+        return _saved['wait'](self, timeout)
+    if not self._is_owned():
+        raise RuntimeError("cannot wait on un-acquired lock")
+    waiters = self.__dict__.setdefault('_sim_waiters', [])
+    waiter = _Waiter(waiters)
+    waiters.append(waiter)
+    saved_state = self._release_save()
+    try:
+        deadline = None if timeout is None else _scheduler.now_ns + int(max(timeout, 0) * 1e9)
+        _scheduler.block(waiter, deadline)
+    finally:
+        self._acquire_restore(saved_state)
+    return not waiter.timed_out
+
+
+def _cond_notify(self, n=1):
+    if not self._is_owned():
+        raise RuntimeError("cannot notify on un-acquired lock")
+    waiters = self.__dict__.get('_sim_waiters')
+    if waiters and _scheduler is not None:
+        with _scheduler._lock:
+            while waiters and n > 0:
+                _scheduler.wake(waiters.pop(0))
+                n -= 1
+    if n > 0:
+        _saved['notify'](self, n)
+
+
+def _cond_notify_all(self):
+    _cond_notify(self, len(self._waiters) + len(self.__dict__.get('_sim_waiters', ())))
+
+
+def _thread_start(self):
+    if _scheduler is not None:
+        sched = _scheduler
+        run = self.run
+
+        def sim_run():
+            sched.register()
+            try:
+                run()
+            finally:
+                sched.thread_finished()
+
+        self.run = sim_run
+        sched.thread_started()
+    _saved['start'](self)
+
+
+def _thread_join(self, timeout=None):
+    if _scheduler is None or not _scheduler.owns():
+        return _saved['join'](self, timeout)
+    deadline = None if timeout is None else _scheduler.now_ns + int(timeout * 1e9)
+    while self.is_alive() and (deadline is None or _scheduler.now_ns < deadline):
+        _scheduler.sleep(0.001)
+
+
+def _monotonic_ns():
+    return _scheduler.now_ns
+
+
+def _monotonic():
+    return _scheduler.now_ns / 1e9
+
+
+def _time():
+    return _saved['epoch'] + _scheduler.now_ns / 1e9
+
+
+def _time_ns():
+    return int(_saved['epoch'] * 1e9) + _scheduler.now_ns
+
+
+def _sleep(seconds):
+    if _scheduler is not None and _scheduler.owns():
+        _scheduler.sleep(seconds)
+    else:
+        _saved['sleep'](seconds)
+
+
+# Attiva il tempo virtuale; il thread chiamante diventa il thread principale
+# del programma simulato. duration = s virtuali dopo cui time.sleep nel
+# thread principale solleva KeyboardInterrupt (come un Ctrl-C).
+# realtime: il tempo virtuale avanza al ritmo di quello vero.
+def install(duration=None, realtime=False):
+    global _scheduler
+    if _scheduler is not None:
+        raise RuntimeError("simulatore gia' installato")
+    sched = Scheduler()
+    sched.now_ns = _saved.setdefault('real_monotonic_ns', time.monotonic_ns)()
+    sched.end_ns = None if duration is None else sched.now_ns + int(duration * 1e9)
+    sched.realtime = realtime
+    sched.main_thread = _thread.get_ident()
+    sched.register()
+    sched.thread_started()
+    _saved.update({
+        'epoch': time.time() - sched.now_ns / 1e9,
+        'sleep': time.sleep, 'time': time.time, 'time_ns': time.time_ns,
+        'monotonic': time.monotonic, 'monotonic_ns': time.monotonic_ns,
+        'perf_counter': time.perf_counter, 'perf_counter_ns': time.perf_counter_ns,
+        'wait': threading.Condition.wait, 'notify': threading.Condition.notify,
+        'notify_all': threading.Condition.notify_all,
+        'start': threading.Thread.start, 'join': threading.Thread.join,
+        'threading_time': threading._time, 'queue_time': queue.time,
+    })
+    _scheduler = sched
+    time.sleep = _sleep
+    time.time = _time
+    time.time_ns = _time_ns
+    time.monotonic = time.perf_counter = _monotonic
+    time.monotonic_ns = time.perf_counter_ns = _monotonic_ns
+    threading._time = queue.time = _monotonic
+    threading.Condition.wait = _cond_wait
+    threading.Condition.notify = _cond_notify
+    threading.Condition.notify_all = _cond_notify_all
+    threading.Thread.start = _thread_start
+    threading.Thread.join = _thread_join
+    return sched
+
+
+def uninstall():
+    global _scheduler
+    if _scheduler is None:
+        return
+    _scheduler = None
+    time.sleep = _saved['sleep']
+    time.time = _saved['time']
+    time.time_ns = _saved['time_ns']
+    time.monotonic = _saved['monotonic']
+    time.monotonic_ns = _saved['monotonic_ns']
+    time.perf_counter = _saved['perf_counter']
+    time.perf_counter_ns = _saved['perf_counter_ns']
+    threading._time = _saved['threading_time']
+    queue.time = _saved['queue_time']
+    threading.Condition.wait = _saved['wait']
+    threading.Condition.notify = _saved['notify']
+    threading.Condition.notify_all = _saved['notify_all']
+    threading.Thread.start = _saved['start']
+    threading.Thread.join = _saved['join']
+
+
+def scheduler():
+    return _scheduler
+
+
+_current = None
+
+
+# Simulatore attivo (per gpio_backend con ROVER_GPIO=sim)
+def current():
+    return _current
+
+
+# --- Mondo 2-D ---
+
+def _ray_segment(ox, oy, dx, dy, x1, y1, x2, y2):
+    ex, ey = x2 - x1, y2 - y1
+    den = dx * ey - dy * ex
+    if abs(den) < 1e-12:
+        return None
+    t = ((x1 - ox) * ey - (y1 - oy) * ex) / den
+    u = ((x1 - ox) * dy - (y1 - oy) * dx) / den
+    if t >= 0 and 0 <= u <= 1:
+        return t
+    return None
+
+
+def _ray_circle(ox, oy, dx, dy, cx, cy, r):
+    fx, fy = ox - cx, oy - cy
+    b = fx * dx + fy * dy
+    c = fx * fx + fy * fy - r * r
+    disc = b * b - c
+    if disc < 0:
+        return None
+    t = -b - math.sqrt(disc)
+    return t if t >= 0 else None
+
+
+def _point_segment(px, py, x1, y1, x2, y2):
+    ex, ey = x2 - x1, y2 - y1
+    length = ex * ex + ey * ey
+    u = 0.0 if length == 0 else max(0.0, min(1.0, ((px - x1) * ex + (py - y1) * ey) / length))
+    return math.hypot(px - x1 - u * ex, py - y1 - u * ey)
+
+
+class World:
+    def __init__(self, walls=(), pillars=(), flames=(), line=(), marks=(), line_width=0.02):
+        self.walls = list(walls)        # segmenti (x1, y1, x2, y2)
+        self.pillars = list(pillars)    # cerchi (x, y, raggio)
+        self.flames = list(flames)      # punti (x, y)
+        self.line = list(line)          # spezzata (x, y) da seguire
+        self.marks = list(marks)        # altri tratti neri (x1, y1, x2, y2), es. linee di stop
+        self.line_width = line_width
+
+    def add_box(self, x1, y1, x2, y2):
+        self.walls += [(x1, y1, x2, y1), (x2, y1, x2, y2), (x2, y2, x1, y2), (x1, y2, x1, y1)]
+
+    def ray(self, x, y, heading, max_range=SONAR_RANGE):
+        dx, dy = math.cos(heading), math.sin(heading)
+        best = max_range
+        for wall in self.walls:
+            t = _ray_segment(x, y, dx, dy, *wall)
+            if t is not None and t < best:
+                best = t
+        for pillar in self.pillars:
+            t = _ray_circle(x, y, dx, dy, *pillar)
+            if t is not None and t < best:
+                best = t
+        return best if best < max_range else None
+
+    def clearance(self, x, y):
+        best = float('inf')
+        for wall in self.walls:
+            best = min(best, _point_segment(x, y, *wall))
+        for cx, cy, r in self.pillars:
+            best = min(best, math.hypot(x - cx, y - cy) - r)
+        return best
+
+    # Distanza dalla linea da seguire (inf se non c'e')
+    def line_distance(self, x, y):
+        best = float('inf')
+        for (x1, y1), (x2, y2) in zip(self.line, self.line[1:]):
+            best = min(best, _point_segment(x, y, x1, y1, x2, y2))
+        return best
+
+    def on_line(self, x, y):
+        if self.line_distance(x, y) <= self.line_width / 2:
+            return True
+        for mark in self.marks:
+            if _point_segment(x, y, *mark) <= self.line_width / 2:
+                return True
+        return False
+
+
+# Stanza 4 x 3 m con un tavolo, due pilastri e una fiamma in un angolo
+def default_world():
+    world = World()
+    world.add_box(0.0, 0.0, 4.0, 3.0)
+    world.add_box(1.6, 1.2, 2.2, 1.6)
+    world.pillars += [(0.8, 2.2, 0.10), (3.2, 0.8, 0.15)]
+    world.flames.append((3.6, 2.6))
+    return world
+
+
+# Anello per il line follower: ovale di 2.4 x 1.4 m
+def line_world(points=48):
+    world = World()
+    world.add_box(-0.5, -0.5, 3.3, 2.3)
+    world.line = [(1.4 + 1.2 * math.cos(2 * math.pi * i / points), 0.9 + 0.7 * math.sin(2 * math.pi * i / points))
+                  for i in range(points + 1)]
+    return world
+
+
+# --- Sensori (livello del pin in funzione della posa) ---
+
+class IrObstacle:
+    def __init__(self, angle, reach=0.15):
+        self.angle = math.radians(angle)
+        self.reach = reach
+
+    def level(self, sim):
+        x, y = sim.sensor_origin()
+        hit = sim.world.ray(x, y, sim.heading + self.angle, self.reach)
+        return 0 if hit is not None else 1
+
+
+class LineSensor:
+    # lateral > 0 a sinistra; il pin e' alto sulla linea nera
+    def __init__(self, lateral):
+        self.lateral = lateral
+
+    def level(self, sim):
+        x, y = sim.sensor_origin()
+        x -= self.lateral * math.sin(sim.heading)
+        y += self.lateral * math.cos(sim.heading)
+        return 1 if sim.world.on_line(x, y) else 0
+
+
+class FlameSensor:
+    def __init__(self, reach=1.0, cone=30):
+        self.reach = reach
+        self.cone = math.radians(cone)
+
+    def level(self, sim):
+        x, y = sim.sensor_origin()
+        for fx, fy in sim.world.flames:
+            bearing = math.atan2(fy - y, fx - x) - sim.heading
+            bearing = (bearing + math.pi) % (2 * math.pi) - math.pi
+            if math.hypot(fx - x, fy - y) <= self.reach and abs(bearing) <= self.cone:
+                return 0
+        return 1
+
+
+# Pin dei sensori nei programmi di pattugliamento e nel line follower
+PATROL_SENSORS = {22: IrObstacle(0), 27: IrObstacle(35), 18: IrObstacle(-35), 6: FlameSensor()}
+LINE_SENSORS = {27: LineSensor(0.03), 18: LineSensor(-0.03)}
+
+
+class SimGPIO(FakeGPIO):
+    def __init__(self, sim):
+        FakeGPIO.__init__(self)
+        self.sim = sim
+        self._spin = None
+        self._spins = 0
+
+    def clock(self):
+        return self.sim.scheduler.now_ns
+
+    def output(self, channel, value):
+        if channel in (ENA, ENB):
+            self.sim.set_enable(channel, 100 if value else 0)
+        FakeGPIO.output(self, channel, value)
+
+    def input(self, channel):
+        # I pin con i fronti attivi li aggiorna il controllo periodico
+        if channel in self.sim.sensors and channel not in self._callbacks:
+            self.levels[channel] = self.sim.sensors[channel].level(self.sim)
+        value = FakeGPIO.input(self, channel)
+        sched = self.sim.scheduler
+        if sched.owns() and not sched.in_callback():
+            # Attesa attiva su un pin che cambia solo per eventi in coda (ECHO):
+            # dopo qualche lettura uguale, una subito dopo l'altra, si salta
+            # direttamente al prossimo evento (una lettura ogni tanto non e' un giro)
+            spin = (_thread.get_ident(), channel, value, sched.now_ns)
+            self._spins = self._spins + 1 if spin == self._spin else 0
+            wait = INPUT_COST
+            if self._spins >= SPIN_READS and channel not in self.sim.sensors:
+                next_ns = sched.next_event_ns()
+                if next_ns is not None:
+                    wait = max(wait, (next_ns - sched.now_ns) / 1e9)
+            sched.sleep(wait)
+            self._spin = spin[:3] + (sched.now_ns,)
+        return value
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        FakeGPIO.add_event_detect(self, channel, edge, callback, bouncetime)
+        if channel in self.sim.sensors:
+            self.levels[channel] = self.sim.sensors[channel].level(self.sim)
+            self.sim.watch_sensors()
+
+    def inject(self, channel, level, at_ns=None):
+        self.sim.scheduler.at(self.clock() if at_ns is None else at_ns,
+                              lambda: self._apply(channel, int(bool(level))))
+
+    def _ensure_thread(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class Simulator:
+    # traction: accelerazione massima delle ruote in m/s^2, None = immediata
+    def __init__(self, world=None, sensors=None, pose=(0.5, 0.5, 0.0), servo_pin=SERVO, traction=None):
+        self.world = world or default_world()
+        self.sensors = dict(PATROL_SENSORS if sensors is None else sensors)
+        self.x, self.y, self.heading = pose
+        self.servo_pin = servo_pin
+        self.traction = traction
+        self.scheduler = None
+        self.gpio = SimGPIO(self)
+        self.gpio.on_output(IN1, self._on_bridge)
+        self.gpio.on_output(IN2, self._on_bridge)
+        self.gpio.on_output(IN3, self._on_bridge)
+        self.gpio.on_output(IN4, self._on_bridge)
+        self.gpio.on_output(TRIG, self._on_trig)
+        self.gpio.on_pwm(self._on_pwm)
+        self._motion_hooks = []
+        self._enable = {ENA: 0, ENB: 0}
+        self._v_right = 0.0
+        self._v_left = 0.0
+        self._cmd_right = 0.0
+        self._cmd_left = 0.0
+        self._t_ns = None
+        self._watching = False
+        self._contact = False
+        self.stats = {"distance": 0.0, "collisions": 0, "pings": 0, "min_clearance": float('inf'), "slip": 0.0}
+        self.trace = []
+
+    # Avvia il tempo virtuale (vedi install)
+    def start(self, duration=None):
+        global _current
+        self.scheduler = install(duration)
+        _current = self
+        self._t_ns = self._start_ns = self.scheduler.now_ns
+        self.scheduler.at(self._t_ns, self._trace_tick)
+        return self
+
+    def stop(self):
+        global _current
+        self.update()
+        uninstall()
+        _current = None
+
+    def elapsed(self):
+        return (self.scheduler.now_ns - self._start_ns) / 1e9
+
+    def sensor_origin(self):
+        self.update()
+        return (self.x + SENSOR_OFFSET * math.cos(self.heading),
+                self.y + SENSOR_OFFSET * math.sin(self.heading))
+
+    def servo_angle(self):
+        pwm = self.gpio.pwms.get(self.servo_pin)
+        if pwm is None or not pwm.duty:
+            return 90.0
+        return (pwm.duty - 2.5) * 180 / 10
+
+    # --- Motori ---
+
+    def set_enable(self, channel, duty):
+        self.update()
+        self._enable[channel] = duty
+        self._speeds()
+
+    def _on_pwm(self, channel, duty):
+        if channel in self._enable:
+            self.set_enable(channel, duty)
+
+    def _on_bridge(self, channel, value):
+        self.update()
+        self._speeds()
+
+    def _speeds(self):
+        levels = self.gpio.levels
+
+        def direction(a, b):
+            return (1 if levels.get(a) else 0) - (1 if levels.get(b) else 0)
+
+        v_right = direction(IN1, IN2) * self._enable[ENA] / 100 * WHEEL_SPEED
+        v_left = direction(IN3, IN4) * self._enable[ENB] / 100 * WHEEL_SPEED
+        if (v_left, v_right) != (self._cmd_left, self._cmd_right):
+            self._cmd_right, self._cmd_left = v_right, v_left
+            if self.traction is None:
+                self._v_right, self._v_left = v_right, v_left
+            for hook in self._motion_hooks:
+                hook(v_left, v_right)
+
+    # Registra una funzione chiamata ad ogni cambio di velocita' comandata
+    # delle ruote, con (sinistra, destra) in m/s
+    def on_motion(self, hook):
+        self._motion_hooks.append(hook)
+
+    # Velocita' effettive (con traction possono essere indietro sul comando)
+    def wheel_speeds(self):
+        self.update()
+        return self._v_left, self._v_right
+
+    # Un passo di h secondi delle ruote verso il comando
+    def _follow(self, h):
+        step = self.traction * h
+        self._v_left += max(-step, min(step, self._cmd_left - self._v_left))
+        self._v_right += max(-step, min(step, self._cmd_right - self._v_right))
+        # Il motore alimentato resta indietro sul comando: la ruota slitta
+        if (self._cmd_left and abs(self._cmd_left - self._v_left) > SLIP_GAP) or \
+                (self._cmd_right and abs(self._cmd_right - self._v_right) > SLIP_GAP):
+            self.stats["slip"] += h
+
+    # Porta la posa all'istante attuale integrando a passi di STEP
+    def update(self):
+        if self.scheduler is None:
+            return
+        now = self.scheduler.now_ns
+        dt = (now - self._t_ns) / 1e9
+        self._t_ns = now
+        while dt > 0:
+            h = min(dt, STEP)
+            dt -= h
+            if self.traction is not None:
+                self._follow(h)
+            v = (self._v_right + self._v_left) / 2
+            omega = (self._v_right - self._v_left) / TRACK
+            if not (v or omega):
+                if (self._v_left, self._v_right) == (self._cmd_left, self._cmd_right):
+                    break
+                continue
+            heading = self.heading + omega * h
+            if abs(omega) > 1e-9:
+                nx = self.x + v / omega * (math.sin(heading) - math.sin(self.heading))
+                ny = self.y - v / omega * (math.cos(heading) - math.cos(self.heading))
+            else:
+                nx = self.x + v * h * math.cos(self.heading)
+                ny = self.y + v * h * math.sin(self.heading)
+            self.heading = heading
+            clearance = self.world.clearance(nx, ny) - RADIUS
+            if clearance < 0:
+                # Urto: il robot resta fermo contro l'ostacolo
+                if not self._contact:
+                    self.stats["collisions"] += 1
+                self._contact = True
+                continue
+            self._contact = False
+            self.stats["distance"] += math.hypot(nx - self.x, ny - self.y)
+            self.stats["min_clearance"] = min(self.stats["min_clearance"], clearance)
+            self.x, self.y = nx, ny
+
+    # --- Sensori ---
+
+    def _on_trig(self, channel, value):
+        if value:
+            return
+        self.stats["pings"] += 1
+        x, y = self.sensor_origin()
+        heading = self.heading + math.radians(self.servo_angle() - 90)
+        hits = [self.world.ray(x, y, heading + da) for da in (-SONAR_BEAM, 0, SONAR_BEAM)]
+        hits = [h for h in hits if h is not None]
+        width = min(hits) * 2 / SPEED_OF_SOUND if hits else ECHO_NONE
+        start = self.scheduler.now_ns + int(ECHO_DELAY * 1e9)
+        self.gpio.inject_pulse(ECHO, start, int(width * 1e9))
+
+    # Controllo periodico dei sensori con rilevazione dei fronti attiva
+    def watch_sensors(self):
+        if not self._watching and self.scheduler is not None:
+            self._watching = True
+            self.scheduler.at(self.scheduler.now_ns, self._sensor_tick)
+
+    def _sensor_tick(self):
+        for channel, sensor in self.sensors.items():
+            if channel in self.gpio._callbacks:
+                self.gpio._apply(channel, sensor.level(self))
+        self.scheduler.at(self.scheduler.now_ns + int(SENSOR_TICK * 1e9), self._sensor_tick)
+
+    def _trace_tick(self):
+        self.update()
+        self.trace.append((self.elapsed(), self.x, self.y, self.heading))
+        self.scheduler.at(self.scheduler.now_ns + int(0.1e9), self._trace_tick)
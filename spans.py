@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Tracciamento delle fasi del loop di pattuglia, da guardare in Perfetto
+# (ui.perfetto.dev) o in chrome://tracing.
+# instrument() sostituisce le funzioni scelte di un modulo (o i metodi di un
+# oggetto) con una versione che, all'uscita, scrive un record in un buffer
+# circolare preallocato, come la scatola nera (recorder.py): inizio e durata
+# con l'orologio monotono e la CPU usata dal thread nel frattempo. La
+# differenza e' il tempo passato fermo (sleep, attese di eventi, lock): in
+# ogni fase si vede quanto e' calcolo e quanto e' attesa.
+#   - spento (nessun instrument) non costa nulla: le funzioni restano quelle
+#   - le chiamate interne passano dal nome globale, quindi anche le fasi
+#     annidate (get_distance dentro where_to_go) hanno il loro intervallo
+#   - export() scrive il formato JSON "trace event" di Chrome: un evento
+#     "X" per fase con cpu_ms e blocked_ms negli argomenti, e i nomi dei
+#     thread
+#
+# Esempio:
+#   tracer = spans.Tracer()
+#   tracer.instrument(ProgettoRover, ("get_distance", "where_to_go"))
+#   ...
+#   tracer.export("spans.json")
+#
+# Uso: python3 spans.py spans.json     (riepilogo per fase)
+
+import argparse
+import functools
+import json
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+RECORD = struct.Struct("<qqqIHH")    # inizio, durata, CPU del thread (ns), thread, nome, profondita'
+CAPACITY = 65536                     # intervalli tenuti (2 MB)
+
+Span = namedtuple('Span', ['name', 'thread', 'start_ns', 'wall_ns', 'cpu_ns', 'depth'])
+
+
+class Tracer:
+    def __init__(self, capacity=CAPACITY, clock=None, cpu_clock=None):
+        self.capacity = capacity
+        # Letti qui e non come default, cosi' vale anche il tempo del simulatore
+        self.clock = clock or time.monotonic_ns
+        self.cpu_clock = cpu_clock or time.thread_time_ns
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._local = threading.local()
+        self._names = []
+        self._threads = {}
+        self._originals = []
+        self.start_ns = self.clock()
+
+    def _name_id(self, name):
+        if name not in self._names:
+            self._names.append(name)
+        return self._names.index(name)
+
+    def _record(self, start, wall, cpu, name_id, depth):
+        with self._lock:
+            RECORD.pack_into(self._buffer, (self._count % self.capacity) * RECORD.size,
+                             start, wall, cpu, threading.get_native_id(), name_id, depth)
+            self._count += 1
+
+    def wrap(self, fn, name=None):
+        name_id = self._name_id(name or fn.__name__)
+        clock, cpu_clock, local, record = self.clock, self.cpu_clock, self._local, self._record
+
+        @functools.wraps(fn)
+        def traced(*args, **kwargs):
+            depth = getattr(local, 'depth', None)
+            if depth is None:
+                depth = 0
+                current = threading.current_thread()
+                self._threads[threading.get_native_id()] = current.name
+            local.depth = depth + 1
+            start = clock()
+            cpu = cpu_clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(start, clock() - start, cpu_clock() - cpu, name_id, depth)
+                local.depth = depth
+
+        return traced
+
+    # Avvolge le funzioni names di target (modulo o oggetto); prefix
+    # distingue fasi con lo stesso nome in oggetti diversi
+    def instrument(self, target, names, prefix=""):
+        for name in names:
+            original = getattr(target, name)
+            self._originals.append((target, name, original, name in getattr(target, '__dict__', {})))
+            setattr(target, name, self.wrap(original, prefix + name))
+        return self
+
+    # Rimette le funzioni originali
+    def uninstrument(self):
+        for target, name, original, own in reversed(self._originals):
+            if own:
+                setattr(target, name, original)
+            else:
+                delattr(target, name)
+        self._originals = []
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def overwritten(self):
+        return max(0, self._count - self.capacity)
+
+    # Intervalli dal piu' vecchio (per fine), tempi dall'avvio del Tracer
+    def spans(self):
+        with self._lock:
+            data = bytes(self._buffer)
+            count = self._count
+        if count > self.capacity:
+            start = count % self.capacity
+            data = data[start * RECORD.size:] + data[:start * RECORD.size]
+        else:
+            data = data[:count * RECORD.size]
+        names = list(self._names)
+        return [Span(names[name_id], self._threads.get(thread, str(thread)), start - self.start_ns, wall, cpu, depth)
+                for start, wall, cpu, thread, name_id, depth in RECORD.iter_unpack(data)]
+
+    def export(self, path):
+        write(path, self.spans())
+        return path
+
+
+# JSON trace event di Chrome: tempi in microsecondi, un "tid" per thread
+def write(path, spans):
+    threads = {}
+    for span in spans:
+        threads.setdefault(span.thread, len(threads) + 1)
+    pid = os.getpid()
+    events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+              for thread, tid in threads.items()]
+    for span in spans:
+        events.append({
+            "name": span.name, "cat": "rover", "ph": "X", "pid": pid, "tid": threads[span.thread],
+            "ts": span.start_ns / 1e3, "dur": span.wall_ns / 1e3,
+            "args": {"cpu_ms": round(span.cpu_ns / 1e6, 3),
+                     "blocked_ms": round(max(span.wall_ns - span.cpu_ns, 0) / 1e6, 3),
+                     "depth": span.depth},
+        })
+    with open(path + ".tmp", "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    os.replace(path + ".tmp", path)
+
+
+def load(path):
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    threads = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+    return [Span(event["name"], threads.get(event["tid"], str(event["tid"])), int(event["ts"] * 1e3),
+                 int(event["dur"] * 1e3), int(event["args"]["cpu_ms"] * 1e6), event["args"]["depth"])
+            for event in events if event["ph"] == "X"]
+
+
+# Per fase: chiamate, tempo totale, tempo proprio (senza le fasi annidate),
+# CPU e attesa proprie, in ns
+def summary(spans):
+    totals = {}
+    # Gli intervalli sono nell'ordine in cui sono finiti (quello del buffer):
+    # le fasi annidate finiscono prima di quella che le contiene, che e' la
+    # prima a finire dopo, un livello sopra, nello stesso thread
+    pending = {}
+    for span in spans:
+        own_wall, own_cpu = span.wall_ns, span.cpu_ns
+        for child in pending.pop((span.thread, span.depth + 1), ()):
+            own_wall -= child.wall_ns
+            own_cpu -= child.cpu_ns
+        pending.setdefault((span.thread, span.depth), []).append(span)
+        entry = totals.setdefault(span.name, [0, 0, 0, 0])
+        entry[0] += 1
+        entry[1] += span.wall_ns
+        entry[2] += own_wall
+        entry[3] += own_cpu
+    return {name: {"calls": calls, "wall_ns": wall, "self_ns": own, "cpu_ns": cpu, "blocked_ns": max(own - cpu, 0)}
+            for name, (calls, wall, own, cpu) in totals.items()}
+
+
+# Per thread, la parte della traccia passata dentro una fase (il resto e'
+# codice non tracciato: il loop stesso, le sleep fuori dalle fasi)
+def coverage(spans):
+    if not spans:
+        return {}
+    begin = min(span.start_ns for span in spans)
+    end = max(span.start_ns + span.wall_ns for span in spans)
+    inside = {}
+    for span in spans:
+        if span.depth == 0:
+            inside[span.thread] = inside.get(span.thread, 0) + span.wall_ns
+    return {thread: wall / max(end - begin, 1) for thread, wall in inside.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Riepilogo per fase di una traccia di spans.py")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    spans = load(args.path)
+    stats = summary(spans)
+    print("{}: {} intervalli".format(args.path, len(spans)))
+    print("fase                          chiamate    totale s   propri s     CPU s   attesa s")
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]["self_ns"]):
+        print("  {:<28} {:8d} {:10.3f} {:10.3f} {:9.3f} {:10.3f}".format(
+            name, s["calls"], s["wall_ns"] / 1e9, s["self_ns"] / 1e9, s["cpu_ns"] / 1e9, s["blocked_ns"] / 1e9))
+    for thread, share in coverage(spans).items():
+        print("thread {}: {:.0%} del tempo dentro le fasi".format(thread, share))
+
+
+if __name__ == '__main__':
+    main()
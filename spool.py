@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Coda su disco per la telemetria quando il broker non e' raggiungibile.
+# I messaggi vengono aggiunti in coda a file segmento (append-only) nella
+# cartella dello spool; alla riconnessione si rileggono in ordine dalla
+# posizione salvata nel checkpoint, cosi' dopo un crash si rimanda al piu'
+# l'ultimo gruppo di CHECKPOINT_EVERY messaggi e non tutto lo spool.
+#
+# Record: '<HI' (lunghezza topic, lunghezza payload), topic, payload,
+# '<I' crc32 di topic+payload. Un record troncato o corrotto in coda al
+# segmento (crash durante la scrittura) viene ignorato.
+
+import os
+import struct
+import zlib
+
+SEGMENT_SIZE = 1 << 20   # byte per segmento
+MAX_BYTES = 64 << 20     # occupazione massima dello spool
+CHECKPOINT_EVERY = 20    # messaggi rimandati tra due checkpoint
+
+_HEAD = struct.Struct('<HI')
+_CRC = struct.Struct('<I')
+_CHECKPOINT = struct.Struct('<QQ')
+
+
+def _segment_name(number):
+    return '{:08d}.seg'.format(number)
+
+
+class Spool:
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.seg'))
+        self.read_segment, self.read_offset = self._load_checkpoint()
+        self._since_checkpoint = 0
+        self._reader = None
+        self._next = None
+        self.stats = {"appended": 0, "replayed": 0, "discarded_bytes": 0, "corrupt": 0}
+        # Si scrive sempre in un segmento nuovo: quello vecchio potrebbe
+        # finire con un record troncato
+        self._open_writer((self.segments[-1] + 1) if self.segments else 0)
+
+    def _path(self, number):
+        return os.path.join(self.directory, _segment_name(number))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, 'checkpoint'), 'rb') as f:
+                segment, offset = _CHECKPOINT.unpack(f.read(_CHECKPOINT.size))
+        except (OSError, struct.error):
+            return (self.segments[0] if self.segments else 0), 0
+        if self.segments and segment < self.segments[0]:
+            return self.segments[0], 0
+        return segment, offset
+
+    # Scrittura atomica: file temporaneo e rename
+    def checkpoint(self):
+        path = os.path.join(self.directory, 'checkpoint')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(_CHECKPOINT.pack(self.read_segment, self.read_offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._since_checkpoint = 0
+
+    def _open_writer(self, number):
+        self.write_segment = number
+        self._writer = open(self._path(number), 'ab')
+        self._written = self._writer.tell()
+        if number not in self.segments:
+            self.segments.append(number)
+
+    def _size(self):
+        total = 0
+        for number in self.segments:
+            try:
+                total += os.path.getsize(self._path(number))
+            except OSError:
+                pass
+        return total
+
+    def append(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        topic = topic.encode('utf-8')
+        data = _HEAD.pack(len(topic), len(payload)) + topic + payload + _CRC.pack(zlib.crc32(topic + payload))
+        if self._written and self._written + len(data) > self.segment_size:
+            self._rotate()
+        self._writer.write(data)
+        self._writer.flush()
+        self._written += len(data)
+        self.stats["appended"] += 1
+
+    def _rotate(self):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._open_writer(self.write_segment + 1)
+        # Limite di spazio: si buttano i segmenti piu' vecchi
+        while len(self.segments) > 1 and self._size() > self.max_bytes:
+            oldest = self.segments.pop(0)
+            size = os.path.getsize(self._path(oldest))
+            if oldest == self.read_segment:
+                self.stats["discarded_bytes"] += size - self.read_offset
+                self._close_reader()
+                self.read_segment, self.read_offset = self.segments[0], 0
+                self._next = None
+            elif oldest > self.read_segment:
+                self.stats["discarded_bytes"] += size
+            os.remove(self._path(oldest))
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    # Prossimo messaggio da rimandare (topic, payload), None se non ce ne sono
+    def peek(self):
+        if self._next is not None:
+            return self._next[0]
+        while True:
+            if self._reader is None:
+                if not os.path.exists(self._path(self.read_segment)):
+                    if self.read_segment >= self.write_segment:
+                        return None
+                    self.read_segment, self.read_offset = self.read_segment + 1, 0
+                    continue
+                self._reader = open(self._path(self.read_segment), 'rb')
+            self._reader.seek(self.read_offset)
+            head = self._reader.read(_HEAD.size)
+            if len(head) == _HEAD.size:
+                topic_len, payload_len = _HEAD.unpack(head)
+                body = self._reader.read(topic_len + payload_len + _CRC.size)
+                if len(body) == topic_len + payload_len + _CRC.size:
+                    data = body[:-_CRC.size]
+                    end = self.read_offset + _HEAD.size + len(body)
+                    if _CRC.unpack(body[-_CRC.size:])[0] != zlib.crc32(data):
+                        # Record completo ma corrotto: si salta
+                        self.stats["corrupt"] += 1
+                        self.read_offset = end
+                        continue
+                    record = (data[:topic_len].decode('utf-8'), data[topic_len:])
+                    self._next = (record, end)
+                    return record
+            if self.read_segment >= self.write_segment:
+                return None
+            # Fine del segmento (o coda troncata): si passa al successivo
+            self._finish_segment()
+
+    def _finish_segment(self):
+        self._close_reader()
+        done = self.read_segment
+        self.read_segment, self.read_offset = done + 1, 0
+        self._next = None
+        if done in self.segments:
+            self.segments.remove(done)
+            os.remove(self._path(done))
+        self.checkpoint()
+
+    # Conferma l'invio del messaggio restituito da peek()
+    def advance(self):
+        if self._next is None:
+            return
+        self.read_offset = self._next[1]
+        self._next = None
+        self.stats["replayed"] += 1
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= CHECKPOINT_EVERY:
+            self.checkpoint()
+
+    def pending(self):
+        return self.peek() is not None
+
+    def close(self):
+        self._close_reader()
+        self._writer.close()
+        self.checkpoint()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Telemetria MQTT in background.
+# Il loop di controllo mette i campioni in una coda limitata e torna subito;
+# un thread li raggruppa per topic e pubblica un messaggio quando il lotto
+# e' pieno o e' passato max_delay (gli allarmi partono subito).
+#
+# Codifiche del payload di un lotto:
+#   JSON:    lista degli stessi oggetti pubblicati prima, uno per campione
+#   binaria: intestazione '<BBH' (versione, tipo, numero record) e record
+#            a layout fisso in little endian:
+#              distanze '<dfff' timestamp, sinistra, centro, destra (NaN = n/d)
+#              fiamma   '<dBIf' timestamp, stato, accensioni, durata (s)
+# Un payload binario inizia con BINARY_VERSION, uno JSON con '['.
+#
+# Se e' configurato uno spool (spool.Spool), i lotti che non si possono
+# inviare finiscono su disco e vengono rimandati in ordine, con un limite
+# di messaggi al secondo, appena il client torna connesso.
+#
+# Ogni rover pubblica sotto NAMESPACE/<id>/ (topic()), con l'id da ROVER_ID
+# o dal nome host: piu' rover sullo stesso broker non si mescolano e la
+# stazione a terra (ground_station.py) li distingue dal topic.
+
+import json
+import math
+import os
+import queue
+import re
+import socket
+import struct
+import threading
+import time
+
+JSON = 'json'
+BINARY = 'binary'
+
+BINARY_VERSION = 0xB1
+
+KIND_DISTANCES = 1
+KIND_FLAME = 2
+
+# Stato degli eventi fiamma (flame.FlameDetector): inizio, in corso, fine
+FLAME_CLEAR = 0
+FLAME_ALERT = 1
+FLAME_ONGOING = 2
+
+_FLAME_STATUS = {FLAME_CLEAR: "CLEAR", FLAME_ALERT: "ALERT", FLAME_ONGOING: "ONGOING"}
+
+TOPICS = {
+    KIND_DISTANCES: "distances",
+    KIND_FLAME: "flame",
+}
+
+NAMESPACE = "rover"
+# Anche nome di cartella sulla stazione a terra: niente '/', '.', '+', '#'
+ROVER_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}$')
+
+MAX_BATCH = 20
+MAX_DELAY = 1.0  # s
+QUEUE_SIZE = 1000
+REPLAY_RATE = 20  # messaggi/s rimandati dallo spool dopo una riconnessione
+
+# Contatori di TelemetryPublisher.stats
+STATS = {
+    "samples": "campioni accettati in coda",
+    "dropped": "campioni persi a coda piena",
+    "skipped": "campioni non inviati perche' non connessi",
+    "spooled": "campioni salvati nello spool su disco",
+    "replayed": "messaggi rimandati dallo spool",
+    "messages": "messaggi MQTT pubblicati",
+    "bytes": "byte di payload pubblicati",
+}
+
+_HEADER = struct.Struct('<BBH')
+_RECORDS = {
+    KIND_DISTANCES: struct.Struct('<dfff'),
+    KIND_FLAME: struct.Struct('<dBIf'),
+}
+
+
+# Identificativo di questo rover: ROVER_ID nell'ambiente, altrimenti il
+# nome host senza dominio
+def rover_id():
+    value = os.environ.get('ROVER_ID') or socket.gethostname().split('.')[0]
+    if not ROVER_ID_PATTERN.match(value):
+        raise ValueError("ROVER_ID non valido: {!r}".format(value))
+    return value
+
+
+# Topic "name" del rover ("+" nei filtri per tutti i rover)
+def topic(rover, name):
+    return "{}/{}/{}".format(NAMESPACE, rover, name)
+
+
+def rover_topics(rover):
+    return {kind: topic(rover, name) for kind, name in TOPICS.items()}
+
+
+# (id del rover, nome) di un topic NAMESPACE/<id>/<nome>, None se il topic
+# non e' di un rover o l'id non e' valido
+def parse_topic(value):
+    parts = value.split('/')
+    if len(parts) != 3 or parts[0] != NAMESPACE or not ROVER_ID_PATTERN.match(parts[1]):
+        return None
+    return parts[1], parts[2]
+
+
+def _nan(value):
+    return float('nan') if value is None else value
+
+
+def _none(value):
+    return None if math.isnan(value) else round(value, 3)
+
+
+def _to_dict(kind, record):
+    if kind == KIND_DISTANCES:
+        timestamp, d_l, d_c, d_r = record
+        return {
+            "timestamp": timestamp,
+            "left": None if d_l is None else round(d_l, 3),
+            "center": None if d_c is None else round(d_c, 3),
+            "right": None if d_r is None else round(d_r, 3)
+        }
+    timestamp, status, count, duration = record
+    return {
+        "timestamp": timestamp,
+        "flame_detected": status != FLAME_CLEAR,
+        "status": _FLAME_STATUS[status],
+        "count": count,
+        "duration": round(duration, 3)
+    }
+
+
+def encode(kind, records, encoding=BINARY):
+    if encoding == JSON:
+        return json.dumps([_to_dict(kind, r) for r in records])
+    record = _RECORDS[kind]
+    out = bytearray(_HEADER.size + record.size * len(records))
+    _HEADER.pack_into(out, 0, BINARY_VERSION, kind, len(records))
+    offset = _HEADER.size
+    if kind == KIND_DISTANCES:
+        for timestamp, d_l, d_c, d_r in records:
+            record.pack_into(out, offset, timestamp, _nan(d_l), _nan(d_c), _nan(d_r))
+            offset += record.size
+    else:
+        for r in records:
+            record.pack_into(out, offset, *r)
+            offset += record.size
+    return bytes(out)
+
+
+# Restituisce (tipo, lista di dizionari) per un payload di entrambe le
+# codifiche; il tipo e' None per JSON, dove va dedotto dal topic
+def decode(payload):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if payload[:1] != bytes([BINARY_VERSION]):
+        data = json.loads(payload)
+        return None, data if isinstance(data, list) else [data]
+    version, kind, count = _HEADER.unpack_from(payload, 0)
+    record = _RECORDS[kind]
+    body = memoryview(payload)[_HEADER.size:_HEADER.size + record.size * count]
+    if kind == KIND_DISTANCES:
+        return kind, [{"timestamp": t, "left": _none(l), "center": _none(c), "right": _none(r)}
+                      for t, l, c, r in record.iter_unpack(body)]
+    return kind, [_to_dict(kind, r) for r in record.iter_unpack(body)]
+
+
+class TelemetryPublisher:
+    def __init__(self, client, encoding=BINARY, topics=TOPICS, max_batch=MAX_BATCH,
+                 max_delay=MAX_DELAY, queue_size=QUEUE_SIZE, spool=None, replay_rate=REPLAY_RATE):
+        self.client = client
+        self.spool = spool
+        self.replay_interval = 1.0 / replay_rate
+        self._backlog = spool is not None and spool.pending()
+        self._next_replay = 0.0
+        self.encoding = encoding
+        self.topics = dict(topics)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue(queue_size)
+        self._pending = {kind: [] for kind in self.topics}
+        self._deadline = {kind: None for kind in self.topics}
+        self._thread = None
+        self.stats = dict.fromkeys(STATS, 0)
+
+    # Non bloccante: se la coda e' piena il campione viene scartato
+    def submit(self, kind, record, urgent=False):
+        try:
+            self._queue.put_nowait((kind, record, urgent))
+            self.stats["samples"] += 1
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+
+    def publish_distances(self, d_l, d_c, d_r, timestamp=None):
+        return self.submit(KIND_DISTANCES, (timestamp or time.time(), d_l, d_c, d_r))
+
+    # Inizio e fine di una fiamma partono subito, gli aggiornamenti
+    # intermedi viaggiano a lotti come le distanze
+    def publish_flame(self, status=FLAME_ALERT, timestamp=None, count=1, duration=0.0):
+        return self.submit(KIND_FLAME, (timestamp or time.time(), status, count, duration),
+                           urgent=status != FLAME_ONGOING)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    # Ferma il thread dopo aver pubblicato quello che resta in coda
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _connected(self):
+        return bool(self.client and self.client.is_connected())
+
+    def _run(self):
+        while True:
+            deadlines = [d for d in self._deadline.values() if d is not None]
+            if self._backlog and self._connected():
+                deadlines.append(self._next_replay)
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            if self.spool is not None and timeout is None:
+                # Si ricontrolla la connessione per far ripartire il replay
+                timeout = self.max_delay
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                for kind in self._pending:
+                    self._flush(kind)
+                if self.spool is not None:
+                    self.spool.close()
+                return
+            if item:
+                kind, record, urgent = item
+                self._pending[kind].append(record)
+                if self._deadline[kind] is None:
+                    self._deadline[kind] = time.monotonic() + self.max_delay
+                if urgent or len(self._pending[kind]) >= self.max_batch:
+                    self._flush(kind, urgent)
+            now = time.monotonic()
+            for kind, deadline in self._deadline.items():
+                if deadline is not None and now >= deadline:
+                    self._flush(kind)
+            if self._backlog and now >= self._next_replay and self._connected():
+                self._replay_one()
+                self._next_replay = now + self.replay_interval
+
+    def _flush(self, kind, urgent=False):
+        records = self._pending[kind]
+        self._deadline[kind] = None
+        if not records:
+            return
+        self._pending[kind] = []
+        payload = encode(kind, records, self.encoding)
+        topic = self.topics[kind]
+        # Con lo spool non vuoto anche i messaggi nuovi passano dal disco,
+        # cosi' l'ordine di invio resta quello di arrivo; solo gli allarmi
+        # passano davanti
+        if (urgent or not self._backlog) and self._connected():
+            if self.client.publish(topic, payload).rc == 0:
+                self.stats["messages"] += 1
+                self.stats["bytes"] += len(payload)
+                return
+        if self.spool is None:
+            self.stats["skipped"] += len(records)
+            return
+        self.spool.append(topic, payload)
+        self.stats["spooled"] += len(records)
+        self._backlog = True
+
+    def _replay_one(self):
+        record = self.spool.peek()
+        if record is None:
+            self._backlog = False
+            return
+        topic, payload = record
+        if self.client.publish(topic, payload).rc == 0:
+            self.spool.advance()
+            self.stats["replayed"] += 1
+            self.stats["messages"] += 1
+            self.stats["bytes"] += len(payload)
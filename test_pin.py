@@ -2,7 +2,7 @@
 # -*- coding:utf-8 -*-
 # Test porte - testa LED, motori, sensori IR e ultrasuoni
 
-import RPi.GPIO as GPIO
+from gpio_backend import GPIO
 import time
 
 # Pin Configuration
@@ -0,0 +1,249 @@
+#! /usr/bin/python
+# -*- coding:utf-8 -*-
+
+# Controllo del rover da WiFi (app wifirobots), in Python 3.
+# Stesso protocollo e stessi comandi di "source code/wifirobots.py":
+# - server sulla porta 2001 con piu' controller (wifi_server.ControlServer)
+# - comandi decodificati con la tabella di commands.py invece della catena
+#   di if/elif su stringhe esadecimali
+# - modi di crociera: 2 segui linea, 3 ostacoli con l'infrarosso,
+#   4 ostacoli con l'ultrasuono, 0 comando manuale; li esegue
+#   modes.ModeManager, fermo quando non c'e' un modo attivo
+# - il segui linea e' proporzionale (line_follower.py): PWM diverso sulle
+#   due ruote invece di rotazioni sul posto
+
+from gpio_backend import GPIO
+import time
+import commands
+import line_follower
+import logpipe
+import modes
+import motors
+import ranging
+import sampler
+import wifi_server
+
+print('....WIFIROBOTS START!!!...')
+
+GPIO.setmode(GPIO.BCM)
+GPIO.setwarnings(False)
+
+######## LED Interface #################
+LED0 = 10
+LED1 = 9
+LED2 = 25
+
+######## Motor Drive Interface #################
+ENA = 13
+ENB = 20
+IN1 = 19
+IN2 = 16
+IN3 = 21
+IN4 = 26
+
+######## Servo Interface #################
+SER7 = 6     # Servo verticale
+SER8 = 12    # Servo orizzontale
+
+######## Sensors Interface #################
+ECHO = 4
+TRIG = 17
+IR_R = 18    # Infrarosso destro del segui linea
+IR_L = 27    # Infrarosso sinistro del segui linea
+IR_M = 22    # Infrarosso centrale per gli ostacoli
+
+######## Setup #################
+GPIO.setup(LED0, GPIO.OUT, initial=GPIO.HIGH)
+GPIO.setup(LED1, GPIO.OUT, initial=GPIO.HIGH)
+GPIO.setup(LED2, GPIO.OUT, initial=GPIO.HIGH)
+# Motori e LED scrivono solo i pin che cambiano (motors.py)
+motor_driver = motors.MotorDriver(GPIO, ENA, IN1, IN2, ENB, IN3, IN4)
+motor_driver.setup()
+led_pins = motors.PinShadow(GPIO)
+for led in (LED0, LED1, LED2):
+    led_pins.assume(led, GPIO.HIGH)
+GPIO.setup(IR_R, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+GPIO.setup(IR_L, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+GPIO.setup(IR_M, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+GPIO.setup(TRIG, GPIO.OUT, initial=GPIO.LOW)
+GPIO.setup(ECHO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+GPIO.setup(SER7, GPIO.OUT)
+GPIO.setup(SER8, GPIO.OUT)
+Servo7 = GPIO.PWM(SER7, 50)
+Servo7.start(0)
+Servo8 = GPIO.PWM(SER8, 50)
+Servo8.start(0)
+
+ranger = ranging.UltrasonicRanger(GPIO, TRIG, ECHO)
+# Ping continui in un thread (sampler.py): il modo 4 legge l'ultimo
+# campione e non aspetta mai l'eco
+distance_sampler = sampler.DistanceSampler(ranger)
+
+PORT = 2001
+
+# Giri dei modi di crociera (s); il segui linea reagisce anche ai fronti
+LINE_PERIOD = 0.01
+LINE_DUTY = 60
+IR_PERIOD = 0.01
+WAVE_PERIOD = 0.1
+WAVE_MAX_AGE = 3 * sampler.PERIOD   # s, campione piu' vecchio: come senza echo
+
+
+# Il messaggio si stampa solo quando il moto cambia (i modi di crociera
+# ripetono lo stesso comando ad ogni giro), dalla coda di logpipe
+def Motor_Forward():
+    if motor_driver.forward():
+        logpipe.console.info('motor forward')
+    Set_Leds(False, False)
+
+def Motor_Backward():
+    if motor_driver.backward():
+        logpipe.console.info('motor_backward')
+    Set_Leds(True, False)
+
+def Motor_TurnLeft():
+    if motor_driver.turn_left():
+        logpipe.console.info('motor_turnleft')
+    Set_Leds(False, True)
+
+def Motor_TurnRight():
+    if motor_driver.turn_right():
+        logpipe.console.info('motor_turnright')
+    Set_Leds(False, True)
+
+def Motor_Stop():
+    if motor_driver.stop():
+        logpipe.console.info('motor_stop')
+    Set_Leds(True, True)
+
+# LED1 e LED2 di stato del moto (accesi con il pin basso)
+def Set_Leds(led1, led2):
+    led_pins.output(LED1, led1)
+    led_pins.output(LED2, led2)
+
+# Angolo in gradi gia' convertito dalla tabella dei comandi
+def SetServo7Angle(angle):
+    Servo7.ChangeDutyCycle(2.5 + 10 * angle / 180)
+    led_pins.output(LED0, False)
+    Set_Leds(False, True)
+    time.sleep(0.01)
+    led_pins.output(LED0, True)
+    Set_Leds(True, True)
+
+def SetServo8Angle(angle):
+    Servo8.ChangeDutyCycle(2.5 + 10 * angle / 180)
+    led_pins.output(LED0, False)
+    Set_Leds(True, False)
+    time.sleep(0.01)
+    led_pins.output(LED0, True)
+    Set_Leds(True, True)
+
+# Niente attesa dopo il comando: i comandi girano nel thread del server
+def Open_Light():
+    led_pins.output(LED0, False)
+
+def Close_Light():
+    led_pins.output(LED0, True)
+
+# Luci d'avvio come init_light() del programma originale: tutte accese,
+# poi una spenta per volta (True = spento, anodo a 5V); solo all'avvio,
+# prima di aprire il server
+STARTUP_LIGHTS = ((False, False, False), (True, False, False), (False, True, False),
+                  (False, False, True), (False, False, False))
+STARTUP_STEP = 0.5
+
+def Init_Light():
+    for led0, led1, led2 in STARTUP_LIGHTS:
+        led_pins.output(LED0, led0)
+        Set_Leds(led1, led2)
+        time.sleep(STARTUP_STEP)
+    led_pins.output(LED0, True)
+    Set_Leds(True, True)
+
+# Infrarosso centrale: fermo davanti a un ostacolo, altrimenti avanti
+def Avoiding():
+    if GPIO.input(IR_M) == False:
+        Motor_Stop()
+    else:
+        Motor_Forward()
+
+# Avanti con duty diversi sulle due ruote (0-100)
+def Motor_Drive(left, right):
+    motor_driver.drive(left, right)
+
+follower = line_follower.LineFollower(GPIO, IR_L, IR_R, Motor_Drive, base=LINE_DUTY)
+
+def FollowLine_Stop():
+    follower.stop()
+    Motor_Stop()
+
+# Ultimo campione del sampler: il giro del modo non si blocca sul ping e
+# cambio di modo e on_exit non aspettano l'eco
+def Get_Distence():
+    reading = distance_sampler.latest()
+    if reading is None or time.monotonic_ns() - reading.t_ns > WAVE_MAX_AGE * 1e9:
+        return None
+    return reading.distance
+
+# Senza echo si resta fermi
+def Avoid_wave():
+    dis = Get_Distence()
+    if dis is None or dis < 0.15:
+        Motor_Stop()
+    else:
+        Motor_Forward()
+
+mode_manager = modes.ModeManager()
+mode_manager.register(2, modes.Behavior("segui linea", follower.update, LINE_PERIOD,
+                                        on_enter=follower.start, on_exit=FollowLine_Stop))
+mode_manager.register(3, modes.Behavior("ostacoli IR", Avoiding, IR_PERIOD, on_exit=Motor_Stop))
+mode_manager.register(4, modes.Behavior("ostacoli ultrasuoni", Avoid_wave, WAVE_PERIOD, on_exit=Motor_Stop))
+
+def Set_Cruising(mode):
+    logpipe.console.info('Cruising_Flag change %d', mode)
+    mode_manager.set_mode(mode)
+
+######## Tabella dei comandi #################
+command_table = commands.CommandTable()
+command_table.register(commands.MOTOR, commands.FORWARD, Motor_Forward)
+command_table.register(commands.MOTOR, commands.BACKWARD, Motor_Backward)
+command_table.register(commands.MOTOR, commands.TURN_LEFT, Motor_TurnLeft)
+command_table.register(commands.MOTOR, commands.TURN_RIGHT, Motor_TurnRight)
+command_table.register(commands.MOTOR, commands.STOP, Motor_Stop)
+command_table.register_default(commands.MOTOR, Motor_Stop)
+command_table.register(commands.SERVO, 0x07, SetServo7Angle, decode=commands.angle)
+command_table.register(commands.SERVO, 0x08, SetServo8Angle, decode=commands.angle)
+command_table.register_default(commands.SERVO, lambda: None)
+for mode in (0, 2, 3, 4):
+    command_table.register(commands.CRUISE, mode, lambda mode=mode: Set_Cruising(mode))
+command_table.register_default(commands.CRUISE, lambda: None)
+command_table.register(commands.LIGHT, commands.LIGHT_ON, Open_Light)
+command_table.register(commands.LIGHT, commands.LIGHT_OFF, Close_Light)
+command_table.register_default(commands.LIGHT, lambda: logpipe.console.info('...'))
+
+def Communication_Decode(frame, client):
+    if not command_table.dispatch(frame):
+        logpipe.console.info('...')
+
+
+if __name__ == '__main__':
+    log_pipeline = logpipe.setup()
+    Init_Light()
+    ranger.start()
+    distance_sampler.start()
+    mode_manager.start()
+    server = wifi_server.ControlServer(Communication_Decode, port=PORT)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mode_manager.stop()
+        distance_sampler.stop()
+        ranger.stop()
+        Motor_Stop()
+        motor_driver.close()
+        Servo7.stop()
+        Servo8.stop()
+        GPIO.cleanup()
+        log_pipeline.stop()
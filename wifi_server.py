@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Server TCP della porta di controllo di wifirobots (2001), per piu'
+# controller insieme.
+#
+# Protocollo (invariato): trame FF b0 b1 b2 FF, con 3 byte di dati
+# (tipo, comando, argomento). Come nel loop originale un FF apre la trama,
+# il FF successivo la chiude e la trama vale solo con esattamente 3 byte;
+# i byte fuori da una trama si ignorano.
+#
+# Invece di recv(1) e binascii.b2a_hex per ogni byte, il server legge a
+# blocchi con selectors e FrameParser cerca i delimitatori sul bytearray
+# ricevuto.
+#
+# Piu' controller possono essere connessi; i comandi li esegue solo il
+# proprietario del rover:
+#   - il primo client che manda un comando diventa proprietario
+#   - un client con priorita' piu' alta (priorities: indirizzo IP ->
+#     priorita', predefinita 0) prende il controllo subito
+#   - se il proprietario tace per piu' di lease secondi, il controllo passa
+#     al primo che manda un comando
+#   - lo stop (00 00) vale da chiunque
+#   - quando il proprietario si disconnette il rover viene fermato
+# I comandi rifiutati si contano per client. Se il gestore delle trame
+# solleva un'eccezione l'errore si conta e si scrive nel log e il server
+# continua a servire gli altri comandi e gli altri client.
+#
+# Uso: python3 wifi_server.py [porta]   (stampa le trame ricevute)
+
+import logging
+import selectors
+import socket
+import sys
+import threading
+import time
+
+PORT = 2001
+DELIMITER = 0xFF
+PAYLOAD = 3
+RECV_SIZE = 4096
+LEASE = 2.0         # s di silenzio dopo cui il proprietario perde il controllo
+STOP = b'\x00\x00\x00'
+
+
+class FrameParser:
+    def __init__(self):
+        self._payload = bytearray()
+        self._in_frame = False
+        self.frames = 0
+        self.dropped = 0
+
+    # Trame complete (bytes di 3 byte) contenute in data, anche a cavallo
+    # di piu' chiamate
+    def feed(self, data):
+        frames = []
+        view = memoryview(data)
+        size = len(view)
+        pos = 0
+        payload = self._payload
+        while pos < size:
+            end = data.find(DELIMITER, pos)
+            if not self._in_frame:
+                if end < 0:
+                    break
+                self._in_frame = True
+                del payload[:]
+            else:
+                if end < 0:
+                    # Oltre PAYLOAD byte la trama e' gia' da scartare:
+                    # basta tenere un byte in piu' per saperlo
+                    if len(payload) <= PAYLOAD:
+                        payload += view[pos:min(size, pos + PAYLOAD + 1 - len(payload))]
+                    break
+                if len(payload) + end - pos == PAYLOAD:
+                    payload += view[pos:end]
+                    frames.append(bytes(payload))
+                    self.frames += 1
+                else:
+                    self.dropped += 1
+                self._in_frame = False
+            pos = end + 1
+        return frames
+
+
+class Client:
+    def __init__(self, sock, address, priority=0):
+        self.sock = sock
+        self.address = address
+        self.priority = priority
+        self.parser = FrameParser()
+        self.last_command = 0.0
+        self.accepted = 0
+        self.rejected = 0
+
+    def __repr__(self):
+        return "Client({}:{}, priorita' {})".format(self.address[0], self.address[1], self.priority)
+
+
+class ControlServer:
+    # on_frame(frame, client) riceve le trame accettate; client e' None per
+    # lo stop automatico alla disconnessione del proprietario
+    def __init__(self, on_frame, host='', port=PORT, priorities=None, lease=LEASE, clock=time.monotonic):
+        self.on_frame = on_frame
+        self.host = host
+        self.port = port
+        self.priorities = dict(priorities or {})
+        self.lease = lease
+        self.clock = clock
+        self.clients = []
+        self.owner = None
+        self.bytes_received = 0
+        self.reads = 0
+        self.errors = 0
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._running = False
+        self._thread = None
+
+    def bind(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(8)
+        listener.setblocking(False)
+        self._listener = listener
+        # Con porta 0 il sistema ne sceglie una libera
+        self.port = listener.getsockname()[1]
+        self._selector.register(listener, selectors.EVENT_READ, self._accept)
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        return self
+
+    def serve_forever(self):
+        if self._listener is None:
+            self.bind()
+        self._running = True
+        while self._running:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._wakeup_r.recv(64)
+                elif key.fileobj is self._listener:
+                    self._accept()
+                else:
+                    self._read(key.data)
+        self._close()
+
+    # Server in un thread a parte (per i benchmark e per i programmi che
+    # hanno gia' un loop principale)
+    def start(self):
+        if self._listener is None:
+            self.bind()
+        self._thread = threading.Thread(target=self.serve_forever, name="wifi-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._wakeup_w.send(b'\0')
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = Client(sock, address, self.priorities.get(address[0], 0))
+        self.clients.append(client)
+        self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def _read(self, client):
+        try:
+            data = client.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._disconnect(client)
+            return
+        self.reads += 1
+        self.bytes_received += len(data)
+        for frame in client.parser.feed(data):
+            self._command(client, frame)
+
+    def _command(self, client, frame):
+        now = self.clock()
+        owner = self.owner
+        if frame[:2] != STOP[:2] and owner is not None and owner is not client:
+            expired = now - owner.last_command > self.lease
+            if client.priority <= owner.priority and not expired:
+                client.rejected += 1
+                return
+        if frame[:2] != STOP[:2] or owner is None:
+            self.owner = client
+        client.last_command = now
+        client.accepted += 1
+        self._dispatch(frame, client)
+
+    # Un errore nel gestore non deve fermare il loop di tutti i client
+    def _dispatch(self, frame, client):
+        try:
+            self.on_frame(frame, client)
+        except Exception:
+            self.errors += 1
+            logging.exception("Errore nel gestore della trama %s da %s", frame.hex(' '), client)
+
+    def _disconnect(self, client):
+        self._selector.unregister(client.sock)
+        client.sock.close()
+        self.clients.remove(client)
+        if client is self.owner:
+            self.owner = None
+            self._dispatch(STOP, None)
+
+    def _close(self):
+        for client in list(self.clients):
+            self._selector.unregister(client.sock)
+            client.sock.close()
+        self.clients = []
+        self._selector.unregister(self._listener)
+        self._listener.close()
+        self._listener = None
+        self._selector.unregister(self._wakeup_r)
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+
+    def show(frame, client):
+        print("Got data {} da {}".format(frame.hex(' '), client))
+
+    server = ControlServer(show, port=port)
+    print("in ascolto sulla porta {}".format(server.bind().port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()